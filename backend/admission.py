@@ -0,0 +1,149 @@
+"""
+Admission Control for Nirbani Dairy
+Caps how many heavy requests (reports, exports, bulk uploads) run at once so
+milk entry, shop sales and payments always have capacity left over.
+Requests beyond a lane's limit wait in a bounded queue; when the queue is
+full, or the wait runs too long, they get 429 with Retry-After.
+"""
+import asyncio
+import json
+import logging
+import math
+import os
+import re
+import time
+from typing import List, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+
+class Lane:
+    """A concurrency limit with a bounded wait queue"""
+
+    def __init__(self, name: str, limit: int, max_queue: int, queue_timeout: float):
+        self.name = name
+        self.limit = limit
+        self.max_queue = max_queue
+        self.queue_timeout = queue_timeout
+        self._semaphore = asyncio.Semaphore(limit)
+        self.active = 0
+        self.waiting = 0
+        self.admitted = 0
+        self.rejected = 0
+        self.total_wait = 0.0
+        self.max_wait = 0.0
+        self.total_service = 0.0
+        self.completed = 0
+
+    async def acquire(self) -> bool:
+        if self._semaphore.locked() and self.waiting >= self.max_queue:
+            self.rejected += 1
+            return False
+        began = time.monotonic()
+        self.waiting += 1
+        try:
+            await asyncio.wait_for(self._semaphore.acquire(), timeout=self.queue_timeout)
+        except asyncio.TimeoutError:
+            self.rejected += 1
+            return False
+        finally:
+            self.waiting -= 1
+        waited = time.monotonic() - began
+        self.total_wait += waited
+        self.max_wait = max(self.max_wait, waited)
+        self.admitted += 1
+        self.active += 1
+        return True
+
+    def release(self, service_time: float):
+        self.active -= 1
+        self.completed += 1
+        self.total_service += service_time
+        self._semaphore.release()
+
+    def retry_after(self) -> int:
+        """Rough seconds until the queue ahead of a new request drains"""
+        avg_service = self.total_service / self.completed if self.completed else 1.0
+        return max(1, math.ceil(avg_service * (self.waiting + 1) / self.limit))
+
+    def stats(self) -> dict:
+        return {
+            "limit": self.limit,
+            "max_queue": self.max_queue,
+            "active": self.active,
+            "queue_depth": self.waiting,
+            "admitted": self.admitted,
+            "rejected": self.rejected,
+            "avg_wait_ms": round(self.total_wait / self.admitted * 1000, 2) if self.admitted else 0,
+            "max_wait_ms": round(self.max_wait * 1000, 2),
+            "avg_service_ms": round(self.total_service / self.completed * 1000, 2) if self.completed else 0
+        }
+
+
+def lane_from_env(name: str, limit: int, max_queue: int, queue_timeout: float = 10.0) -> Lane:
+    prefix = f"ADMISSION_{name.upper()}"
+    return Lane(
+        name,
+        limit=int(os.environ.get(f"{prefix}_LIMIT", limit)),
+        max_queue=int(os.environ.get(f"{prefix}_QUEUE", max_queue)),
+        queue_timeout=float(os.environ.get(f"{prefix}_TIMEOUT", queue_timeout))
+    )
+
+
+class AdmissionController:
+    """Maps request paths to lanes; unmatched paths are never limited"""
+
+    def __init__(self, rules: List[Tuple[str, Optional[str], Lane]]):
+        # (path regex, HTTP method or None for any, lane)
+        self.rules = [(re.compile(pattern), method, lane) for pattern, method, lane in rules]
+        self.lanes = {}
+        for _, _, lane in rules:
+            self.lanes[lane.name] = lane
+
+    def classify(self, method: str, path: str) -> Optional[Lane]:
+        for pattern, rule_method, lane in self.rules:
+            if (rule_method is None or rule_method == method) and pattern.match(path):
+                return lane
+        return None
+
+    def stats(self) -> dict:
+        return {name: lane.stats() for name, lane in self.lanes.items()}
+
+
+class AdmissionMiddleware:
+    """Pure ASGI middleware so streaming responses pass through untouched"""
+
+    def __init__(self, app, controller: AdmissionController):
+        self.app = app
+        self.controller = controller
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        lane = self.controller.classify(scope["method"], scope["path"])
+        if lane is None:
+            await self.app(scope, receive, send)
+            return
+
+        if not await lane.acquire():
+            await self._reject(send, lane)
+            return
+        began = time.monotonic()
+        try:
+            await self.app(scope, receive, send)
+        finally:
+            lane.release(time.monotonic() - began)
+
+    async def _reject(self, send, lane: Lane):
+        body = json.dumps({"detail": f"Server busy with {lane.name} requests, please retry shortly"}).encode()
+        await send({
+            "type": "http.response.start",
+            "status": 429,
+            "headers": [
+                (b"content-type", b"application/json"),
+                (b"content-length", str(len(body)).encode()),
+                (b"retry-after", str(lane.retry_after()).encode()),
+            ],
+        })
+        await send({"type": "http.response.body", "body": body})
@@ -0,0 +1,501 @@
+"""
+Archive Service for Nirbani Dairy
+Milk collections, payments and sales from closed periods never change again,
+yet every report and ledger query keeps them in the hot collections' working
+set and indexes. The archival job moves whole months that are both closed
+and older than ARCHIVE_KEEP_MONTHS into one archive collection per month
+(milk_collections_archive_2024_01, ...), created with zstd block compression.
+
+ArchivedCollection is the read facade the handlers and services use: a query
+whose date range reaches archived months runs on the hot collection plus
+those months' archives ($unionWith), anything else goes straight to the hot
+collection. Writes always go to the hot collection; archived dates are
+inside a closed period, so the period lock already rejects them.
+
+    python archive_service.py run [--keep-months 12] [--dry-run]
+    python archive_service.py stats
+
+A month is copied, checked by count and recorded, which switches reads of it
+to the archive. Every API process re-reads the records every
+ARCHIVE_REFRESH_SECONDS (the cache bus only makes that quicker) and reports
+what it has seen in archive_workers; the month leaves the hot collection only
+once every live process has switched, so no worker ever reads it from
+neither place. An interrupted or timed-out run is simply run again.
+"""
+import argparse
+import asyncio
+import logging
+import os
+import time
+import uuid
+from datetime import date, datetime, timedelta, timezone
+from pathlib import Path
+from typing import Callable, Dict, Iterable, List, Optional, Tuple
+
+from pymongo.errors import BulkWriteError
+
+from cache_bus import BUS_COLLECTION
+
+logger = logging.getLogger(__name__)
+
+ARCHIVED_COLLECTIONS = ("milk_collections", "payments", "sales")
+ARCHIVES_COLLECTION = "archives"
+ARCHIVE_KEEP_MONTHS = int(os.environ.get("ARCHIVE_KEEP_MONTHS", "12"))
+ARCHIVE_STORAGE = {"wiredTiger": {"configString": "block_compressor=zstd"}}
+# Indexes of each month's archive: the per-entity ledger lookups and lookups by id
+ARCHIVE_INDEXES = {
+    "milk_collections": [[("farmer_id", 1), ("date", 1)], [("date", 1)]],
+    "payments": [[("farmer_id", 1), ("date", 1)], [("date", 1)]],
+    "sales": [[("customer_id", 1), ("date", 1)], [("date", 1)]],
+}
+COPY_BATCH = 5000
+ARCHIVE_WORKERS_COLLECTION = "archive_workers"
+# Every process re-reads the archive records this often and reports what it has seen
+ARCHIVE_REFRESH_SECONDS = float(os.environ.get("ARCHIVE_REFRESH_SECONDS", "5"))
+# A process that hasn't reported for this long has stopped
+ARCHIVE_WORKER_TTL = 3 * ARCHIVE_REFRESH_SECONDS
+# How long the job waits for every live process to read a newly archived month from its archive
+ARCHIVE_SWITCH_TIMEOUT = float(os.environ.get("ARCHIVE_SWITCH_TIMEOUT", "120"))
+
+
+def archive_name(collection: str, month: str) -> str:
+    """milk_collections, "2024-01" -> milk_collections_archive_2024_01"""
+    return f"{collection}_archive_{month.replace('-', '_')}"
+
+
+def month_end(month: str) -> str:
+    year, mon = int(month[:4]), int(month[5:7])
+    following = date(year + mon // 12, mon % 12 + 1, 1)
+    return date.fromordinal(following.toordinal() - 1).isoformat()
+
+
+def next_month(month: str) -> str:
+    year, mon = int(month[:4]), int(month[5:7])
+    return f"{year + mon // 12}-{mon % 12 + 1:02d}"
+
+
+def previous_month(month: str) -> str:
+    index = int(month[:4]) * 12 + int(month[5:7]) - 2
+    return f"{index // 12}-{index % 12 + 1:02d}"
+
+
+def months_back(today: date, months: int) -> str:
+    """The month `months` before today's, as YYYY-MM"""
+    index = today.year * 12 + today.month - 1 - months
+    return f"{index // 12}-{index % 12 + 1:02d}"
+
+
+# ==================== ARCHIVE STATE ====================
+
+class ArchiveState:
+    """Archived months per collection, kept in every worker"""
+
+    def __init__(self):
+        self.through: Dict[str, str] = {}
+        self.months: Dict[str, List[str]] = {}
+        self.worker_id = f"{os.getpid()}-{uuid.uuid4().hex[:8]}"
+        self._watcher: Optional[asyncio.Task] = None
+
+    def apply(self, record: dict):
+        # A late cache bus message never moves a collection back
+        if record["through"] < self.through.get(record["collection"], ""):
+            return
+        self.through[record["collection"]] = record["through"]
+        self.months[record["collection"]] = sorted(record.get("months", []))
+
+    async def load(self, db):
+        async for record in db[ARCHIVES_COLLECTION].find({}, {"_id": 0}):
+            self.apply(record)
+
+    async def report(self, db):
+        """Record in archive_workers which months this process reads from the archives"""
+        await db[ARCHIVE_WORKERS_COLLECTION].update_one(
+            {"_id": self.worker_id},
+            {"$set": {"through": dict(self.through), "ts": datetime.now(timezone.utc)}},
+            upsert=True
+        )
+
+    async def watch(self, db):
+        """Load the archived months, then keep re-reading them in the background"""
+        await self.load(db)
+        # Records of processes that stopped without removing theirs expire
+        await db[ARCHIVE_WORKERS_COLLECTION].create_index("ts", expireAfterSeconds=86400)
+        await self.report(db)
+        if self._watcher is None:
+            self._watcher = asyncio.get_running_loop().create_task(self._refresh(db))
+
+    async def _refresh(self, db):
+        while True:
+            await asyncio.sleep(ARCHIVE_REFRESH_SECONDS)
+            try:
+                await self.load(db)
+                await self.report(db)
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.warning(f"Could not refresh archived months: {e}")
+
+    async def stop(self, db):
+        if self._watcher:
+            self._watcher.cancel()
+            try:
+                await self._watcher
+            except asyncio.CancelledError:
+                pass
+            self._watcher = None
+            try:
+                await db[ARCHIVE_WORKERS_COLLECTION].delete_one({"_id": self.worker_id})
+            except Exception as e:
+                logger.warning(f"Could not remove archive worker record: {e}")
+
+    def archived_through(self) -> Optional[str]:
+        """Last archived date over all collections"""
+        return max(self.through.values(), default=None)
+
+    def stats(self) -> dict:
+        return {name: {"through": self.through[name], "months": len(self.months.get(name, []))} for name in self.through}
+
+
+archive_state = ArchiveState()
+
+
+# ==================== READ FACADE ====================
+
+def _date_condition(query: Optional[dict]):
+    """The condition on date in a query, looking into top-level $and clauses"""
+    query = query or {}
+    if "date" in query:
+        return query["date"]
+    for clause in query.get("$and", []):
+        condition = _date_condition(clause)
+        if condition is not None:
+            return condition
+    return None
+
+
+def _months_touched(condition, months: List[str]) -> List[str]:
+    """Archived months a date condition can match"""
+    if condition is None:
+        return months
+    if isinstance(condition, str):
+        return [m for m in months if m == condition[:7]]
+    if not isinstance(condition, dict):
+        return months
+    if "$in" in condition:
+        wanted = {value[:7] for value in condition["$in"] if isinstance(value, str)}
+        return [m for m in months if m in wanted]
+    low = condition.get("$gte") or condition.get("$gt")
+    high = condition.get("$lte") or condition.get("$lt")
+    return [m for m in months if (not low or m >= low[:7]) and (not high or m <= high[:7])]
+
+
+def _sort_spec(key, direction=None) -> List[Tuple[str, int]]:
+    if isinstance(key, (list, tuple)):
+        return list(key)
+    return [(key, 1 if direction is None else direction)]
+
+
+class _ArchiveCursor:
+    """find() over the hot collection and archives, run as one aggregation"""
+
+    def __init__(self, facade, query: dict, projection: Optional[dict], archives: List[str]):
+        self._facade = facade
+        self._query = query
+        self._projection = projection
+        self._archives = archives
+        self._sort: List[Tuple[str, int]] = []
+        self._skip = 0
+        self._limit = 0
+
+    def sort(self, key, direction=None):
+        self._sort = _sort_spec(key, direction)
+        return self
+
+    def skip(self, count: int):
+        self._skip = count
+        return self
+
+    def limit(self, count: int):
+        self._limit = count
+        return self
+
+    def _pipeline(self) -> List[dict]:
+        pipeline = self._facade.union_stages(self._query, self._archives)
+        if self._sort:
+            pipeline.append({"$sort": dict(self._sort)})
+        if self._skip:
+            pipeline.append({"$skip": self._skip})
+        if self._limit:
+            pipeline.append({"$limit": self._limit})
+        if self._projection:
+            pipeline.append({"$project": self._projection})
+        return pipeline
+
+    async def to_list(self, length: Optional[int] = None) -> List[dict]:
+        return await self._facade.hot.aggregate(self._pipeline(), allowDiskUse=True).to_list(length)
+
+    def __aiter__(self):
+        return self._facade.hot.aggregate(self._pipeline(), allowDiskUse=True).__aiter__()
+
+
+class ArchivedCollection:
+    """
+    A hot collection plus its monthly archives, read like one collection.
+    Everything except reads is passed to the hot collection.
+    """
+
+    def __init__(self, db, name: str, state: ArchiveState = archive_state):
+        self.db = db
+        self.name = name
+        self.hot = db[name]
+        self.state = state
+
+    def __getattr__(self, attr):
+        return getattr(self.hot, attr)
+
+    def archives_for(self, query: Optional[dict]) -> List[str]:
+        months = self.state.months.get(self.name)
+        if not months:
+            return []
+        return [archive_name(self.name, m) for m in _months_touched(_date_condition(query), months)]
+
+    def hot_query(self, query: Optional[dict]) -> dict:
+        """Only entries after the archived months count from the hot collection"""
+        through = self.state.through.get(self.name)
+        if not through:
+            return query or {}
+        # Leftovers of a month whose delete was interrupted are read from its archive instead
+        return {"$and": [query or {}, {"date": {"$not": {"$lte": through}}}]}
+
+    def union_stages(self, query: Optional[dict], archives: List[str]) -> List[dict]:
+        stages = [{"$match": self.hot_query(query)}]
+        for archive in archives:
+            stages.append({"$unionWith": {"coll": archive, "pipeline": [{"$match": query or {}}]}})
+        return stages
+
+    def find(self, query: Optional[dict] = None, projection: Optional[dict] = None, sort=None, **kwargs):
+        archives = self.archives_for(query)
+        if not archives:
+            cursor = self.hot.find(self.hot_query(query), projection, **kwargs)
+            return cursor.sort(_sort_spec(sort)) if sort else cursor
+        cursor = _ArchiveCursor(self, query or {}, projection, archives)
+        return cursor.sort(sort) if sort else cursor
+
+    async def find_one(self, query: Optional[dict] = None, projection: Optional[dict] = None, sort=None, **kwargs):
+        archives = self.archives_for(query)
+        if not archives or not sort:
+            # Any match will do: the hot collection first, then the archives newest first,
+            # so lookups by id don't fan out over every archived month
+            doc = await self.hot.find_one(self.hot_query(query), projection, sort=sort, **kwargs)
+            for archive in reversed(archives):
+                if doc is not None:
+                    break
+                doc = await self.db[archive].find_one(query or {}, projection, **kwargs)
+            return doc
+        cursor = _ArchiveCursor(self, query or {}, projection, archives)
+        if sort:
+            cursor.sort(sort)
+        docs = await cursor.limit(1).to_list(1)
+        return docs[0] if docs else None
+
+    async def count_documents(self, query: Optional[dict] = None, **kwargs) -> int:
+        count = await self.hot.count_documents(self.hot_query(query), **kwargs)
+        for archive in self.archives_for(query):
+            count += await self.db[archive].count_documents(query or {}, **kwargs)
+        return count
+
+    async def distinct(self, key: str, query: Optional[dict] = None, **kwargs) -> list:
+        values = await self.hot.distinct(key, self.hot_query(query), **kwargs)
+        for archive in self.archives_for(query):
+            values.extend(value for value in await self.db[archive].distinct(key, query or {}, **kwargs) if value not in values)
+        return values
+
+    def aggregate(self, pipeline: List[dict], **kwargs):
+        """The leading $match picks the archives and runs on each of them"""
+        stages = list(pipeline)
+        query = stages.pop(0)["$match"] if stages and "$match" in stages[0] else {}
+        archives = self.archives_for(query)
+        if not archives:
+            return self.hot.aggregate([{"$match": self.hot_query(query)}, *stages], **kwargs)
+        return self.hot.aggregate([*self.union_stages(query, archives), *stages], **kwargs)
+
+
+# ==================== ARCHIVAL JOB ====================
+
+async def collection_stats(db, name: str) -> dict:
+    stats = await db.command("collStats", name)
+    return {
+        "count": stats.get("count", 0),
+        "storage_mb": round(stats.get("storageSize", 0) / 2**20, 2),
+        "index_mb": round(stats.get("totalIndexSize", 0) / 2**20, 2),
+    }
+
+
+async def archive_cutoff(db, keep_months: int, today: Optional[date] = None) -> Optional[str]:
+    """Last month that is both closed and older than keep_months, as YYYY-MM"""
+    from period_service import latest_close
+
+    close = await latest_close(db)
+    if not close or close.get("status") != "closed":
+        return None
+    month = months_back(today or datetime.now(timezone.utc).date(), keep_months + 1)
+    # Only whole months: the close must reach the month's last day
+    while month_end(month) > close["end_date"]:
+        month = previous_month(month)
+    return month
+
+
+async def _ensure_archive(db, collection: str, name: str):
+    if name not in await db.list_collection_names():
+        await db.create_collection(name, storageEngine=ARCHIVE_STORAGE)
+    for keys in ARCHIVE_INDEXES[collection]:
+        await db[name].create_index(keys)
+    await db[name].create_index("id")
+
+
+async def _announce(db, record: dict):
+    """Tell every worker (this job runs in its own process) through the cache bus collection"""
+    try:
+        await db[BUS_COLLECTION].insert_one({
+            "origin": "archive-job", "kind": "archive", "payload": record, "ts": datetime.now(timezone.utc)
+        })
+    except Exception as e:
+        logger.warning(f"Could not announce archived month: {e}")
+
+
+async def workers_switched(db, collection: str, through: str, timeout: Optional[float] = None) -> bool:
+    """Wait until every live process reads collection's months through `through` from the archives"""
+    deadline = time.monotonic() + (ARCHIVE_SWITCH_TIMEOUT if timeout is None else timeout)
+    while True:
+        alive = datetime.now(timezone.utc) - timedelta(seconds=ARCHIVE_WORKER_TTL)
+        lagging = await db[ARCHIVE_WORKERS_COLLECTION].count_documents(
+            {"ts": {"$gte": alive}, f"through.{collection}": {"$not": {"$gte": through}}}
+        )
+        if not lagging:
+            return True
+        if time.monotonic() >= deadline:
+            return False
+        await asyncio.sleep(min(1.0, ARCHIVE_REFRESH_SECONDS))
+
+
+async def archive_month(db, collection: str, month: str, record: dict, progress: Callable[[str], None]) -> int:
+    """Copy one month into its archive, record it, then remove it from the hot collection"""
+    hot = db[collection]
+    month_query = {"date": {"$gte": f"{month}-01", "$lte": month_end(month)}}
+    name = archive_name(collection, month)
+    count = await hot.count_documents(month_query)
+    if count:
+        await _ensure_archive(db, collection, name)
+        batch = []
+        async for doc in hot.find(month_query).sort("_id", 1):
+            batch.append(doc)
+            if len(batch) >= COPY_BATCH:
+                await _copy(db[name], batch)
+                batch = []
+        if batch:
+            await _copy(db[name], batch)
+        # A rerun after an interrupted delete finds only the leftovers in the hot collection
+        archived = await db[name].count_documents(month_query)
+        if archived < count:
+            raise RuntimeError(f"{name} has {archived} entries, {collection} has {count} for {month}")
+
+    months = sorted(set(record.get("months", [])) | ({month} if count else set()))
+    record.update(collection=collection, through=max(record.get("through", ""), month_end(month)), months=months,
+                  switching=month if count else None, updated_at=datetime.now(timezone.utc).isoformat())
+    await db[ARCHIVES_COLLECTION].update_one({"collection": collection}, {"$set": record}, upsert=True)
+    archive_state.apply(record)
+    await _announce(db, record)
+    if count:
+        if not await workers_switched(db, collection, record["through"]):
+            raise RuntimeError(f"Not every worker reads {collection} {month} from its archive yet; "
+                               f"its entries stay in {collection} until the next run")
+        await hot.delete_many(month_query)
+        record["switching"] = None
+        await db[ARCHIVES_COLLECTION].update_one({"collection": collection}, {"$set": {"switching": None}})
+    progress(f"{collection} {month}: {count} archived")
+    return count
+
+
+async def _copy(target, docs: List[dict]):
+    """Insert keeping _id; entries already copied by an interrupted run are skipped"""
+    try:
+        await target.insert_many(docs, ordered=False)
+    except BulkWriteError as e:
+        if any(error.get("code") != 11000 for error in e.details.get("writeErrors", [])):
+            raise
+
+
+async def run(
+    db,
+    keep_months: int = ARCHIVE_KEEP_MONTHS,
+    collections: Iterable[str] = ARCHIVED_COLLECTIONS,
+    dry_run: bool = False,
+    progress: Callable[[str], None] = print,
+) -> Dict[str, int]:
+    """Archive every closed month older than keep_months; returns entries moved per collection"""
+    from collection_store import COLLECTION_LAYOUT
+
+    cutoff = await archive_cutoff(db, keep_months)
+    moved = {}
+    if not cutoff:
+        progress("nothing closed old enough to archive")
+        return moved
+    for collection in collections:
+        if collection == "milk_collections" and COLLECTION_LAYOUT != "documents":
+            progress(f"milk_collections skipped: archival works on the documents layout, not {COLLECTION_LAYOUT}")
+            continue
+        record = await db[ARCHIVES_COLLECTION].find_one({"collection": collection}, {"_id": 0}) or {}
+        moved[collection] = 0
+        if record.get("switching") and not dry_run:
+            # The last run stopped before that month left the hot collection
+            moved[collection] += await archive_month(db, collection, record["switching"], record, progress)
+        if record.get("through"):
+            month = next_month(record["through"][:7])
+        else:
+            oldest = await db[collection].find_one({"date": {"$type": "string"}}, {"_id": 0, "date": 1}, sort=[("date", 1)])
+            if not oldest:
+                continue
+            month = oldest["date"][:7]
+        while month <= cutoff:
+            if dry_run:
+                count = await db[collection].count_documents({"date": {"$gte": f"{month}-01", "$lte": month_end(month)}})
+                progress(f"{collection} {month}: {count} would be archived")
+            else:
+                count = await archive_month(db, collection, month, record, progress)
+            moved[collection] += count
+            month = next_month(month)
+    return moved
+
+
+def main():
+    from dotenv import load_dotenv
+    from motor.motor_asyncio import AsyncIOMotorClient
+
+    parser = argparse.ArgumentParser(description="Move closed months into compressed monthly archives")
+    parser.add_argument("command", choices=["run", "stats"])
+    parser.add_argument("--keep-months", type=int, default=ARCHIVE_KEEP_MONTHS)
+    parser.add_argument("--only", help="comma separated collections")
+    parser.add_argument("--dry-run", action="store_true")
+    args = parser.parse_args()
+
+    load_dotenv(Path(__file__).parent / '.env')
+
+    async def main_async():
+        client = AsyncIOMotorClient(os.environ['MONGO_URL'])
+        db = client[os.environ['DB_NAME']]
+        collections = args.only.split(",") if args.only else ARCHIVED_COLLECTIONS
+        before = {name: await collection_stats(db, name) for name in collections}
+        if args.command == "run":
+            await run(db, args.keep_months, collections, args.dry_run)
+        after = {name: await collection_stats(db, name) for name in collections}
+        for name in collections:
+            print(f"{name:18} before {before[name]}")
+            if args.command == "run" and not args.dry_run:
+                print(f"{'':18} after  {after[name]}")
+        client.close()
+
+    asyncio.run(main_async())
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,254 @@
+"""
+Write Batching for Nirbani Dairy
+Helpers that merge many small writes arriving during a shift burst into
+fewer, larger database operations
+"""
+import asyncio
+import logging
+import os
+import time
+import uuid
+from contextlib import asynccontextmanager
+from datetime import datetime, timedelta, timezone
+from typing import Dict, List, Tuple
+
+from pymongo import UpdateOne
+from pymongo.errors import BulkWriteError, DuplicateKeyError, WriteConcernError, WriteError
+
+logger = logging.getLogger(__name__)
+
+# Running write-behind buffers announce themselves here, so jobs in other
+# processes (reconcile --repair) can tell that totals have deltas in flight
+WRITE_BEHIND_COLLECTION = "write_behind_workers"
+ANNOUNCE_INTERVAL = 10.0
+# A buffer that hasn't announced itself for this long has stopped
+ANNOUNCE_TTL = 3 * ANNOUNCE_INTERVAL
+
+
+async def write_behind_active(db, collection: str) -> bool:
+    """Whether any running process buffers $inc updates for collection"""
+    alive = datetime.now(timezone.utc) - timedelta(seconds=ANNOUNCE_TTL)
+    return bool(await db[WRITE_BEHIND_COLLECTION].count_documents({"collection": collection, "ts": {"$gte": alive}}))
+
+
+class IncrementCoalescer:
+    """
+    Write-behind buffer for $inc updates
+
+    Deltas for the same document are merged in memory and flushed with one
+    bulk_write every `flush_interval` seconds, or sooner once `max_pending`
+    increments have been buffered. Readers that need exact values read inside
+    `consistent_read()` and pass documents through `apply_pending()`.
+
+    Buffered deltas are lost if the process is killed without a shutdown;
+    the source rows are already stored, so the ledger reconciliation can
+    rebuild the totals. While running, the buffer announces itself in
+    `registry` (a WRITE_BEHIND_COLLECTION) if one is given.
+    """
+
+    def __init__(self, collection, key_field: str = "id", flush_interval: float = 0.3, max_pending: int = 200,
+                 registry=None):
+        self.collection = collection
+        self.registry = registry
+        self.worker_id = f"{os.getpid()}-{uuid.uuid4().hex[:8]}"
+        self._announced = 0.0
+        self.key_field = key_field
+        self.flush_interval = flush_interval
+        self.max_pending = max_pending
+        self._pending: Dict[str, Dict[str, float]] = {}
+        self._pending_count = 0
+        self._flush_lock = asyncio.Lock()
+        self._wakeup = asyncio.Event()
+        self._task = None
+        self.flushes = 0
+        self.merged_increments = 0
+
+    def add(self, key: str, deltas: Dict[str, float]):
+        """Buffer an $inc for one document"""
+        merged = self._pending.setdefault(key, {})
+        for field, value in deltas.items():
+            merged[field] = merged.get(field, 0) + value
+        self._pending_count += 1
+        self.merged_increments += 1
+        if self._pending_count >= self.max_pending:
+            self._wakeup.set()
+
+    def pending(self, key: str) -> Dict[str, float]:
+        return dict(self._pending.get(key, {}))
+
+    def pending_total(self, field: str) -> float:
+        return sum(deltas.get(field, 0) for deltas in self._pending.values())
+
+    def apply_pending(self, doc: dict) -> dict:
+        """Return the document with its not yet flushed deltas added"""
+        if not doc:
+            return doc
+        deltas = self._pending.get(doc.get(self.key_field))
+        if not deltas:
+            return doc
+        doc = dict(doc)
+        for field, value in deltas.items():
+            if field in doc:
+                doc[field] = round((doc[field] or 0) + value, 2)
+        return doc
+
+    @asynccontextmanager
+    async def consistent_read(self):
+        """Hold off flushes so a read never sees a delta both stored and pending"""
+        async with self._flush_lock:
+            yield
+
+    async def flush(self):
+        async with self._flush_lock:
+            if not self._pending:
+                return
+            batch, self._pending = self._pending, {}
+            self._pending_count = 0
+            operations = [
+                UpdateOne({self.key_field: key}, {"$inc": deltas})
+                for key, deltas in batch.items()
+            ]
+            try:
+                await self.collection.bulk_write(operations, ordered=False)
+                self.flushes += 1
+            except Exception as e:
+                # Put the deltas back so the next flush retries them
+                logger.error(f"Flushing {len(operations)} buffered increments failed: {e}")
+                for key, deltas in batch.items():
+                    merged = self._pending.setdefault(key, {})
+                    for field, value in deltas.items():
+                        merged[field] = merged.get(field, 0) + value
+                self._pending_count += len(batch)
+                raise
+
+    async def _announce(self):
+        if self.registry is None or time.monotonic() - self._announced < ANNOUNCE_INTERVAL:
+            return
+        try:
+            await self.registry.update_one(
+                {"_id": self.worker_id},
+                {"$set": {"collection": self.collection.name, "ts": datetime.now(timezone.utc)}},
+                upsert=True
+            )
+            self._announced = time.monotonic()
+        except Exception as e:
+            logger.warning(f"Could not announce write-behind buffer: {e}")
+
+    async def _run(self):
+        while True:
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), timeout=self.flush_interval)
+            except asyncio.TimeoutError:
+                pass
+            self._wakeup.clear()
+            try:
+                await self.flush()
+            except Exception:
+                pass
+            await self._announce()
+
+    async def start(self):
+        if self._task is None:
+            await self._announce()
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self, attempts: int = 3):
+        """Stop the flush loop and write out everything still buffered"""
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        for attempt in range(attempts):
+            try:
+                await self.flush()
+                break
+            except Exception:
+                await asyncio.sleep(0.5 * (attempt + 1))
+        else:
+            logger.error(f"Shutting down with {len(self._pending)} unflushed documents")
+        if self.registry is not None:
+            try:
+                await self.registry.delete_one({"_id": self.worker_id})
+            except Exception as e:
+                logger.warning(f"Could not remove write-behind announcement: {e}")
+
+
+class GroupCommitQueue:
+    """
+    Group commit for single-document inserts
+
+    Inserts arriving within `max_wait` seconds of each other (or until
+    `max_batch` documents are queued) are written with one unordered
+    insert_many. Each caller gets back its own document, or the same
+    DuplicateKeyError/WriteError that insert_one would have raised.
+    """
+
+    def __init__(self, collection, max_wait: float = 0.005, max_batch: int = 100):
+        self.collection = collection
+        self.max_wait = max_wait
+        self.max_batch = max_batch
+        self._queue: List[Tuple[dict, asyncio.Future]] = []
+        self._timer = None
+        self._inflight = set()
+        self.batches = 0
+        self.documents = 0
+
+    async def insert(self, doc: dict) -> dict:
+        loop = asyncio.get_running_loop()
+        future = loop.create_future()
+        self._queue.append((doc, future))
+        if len(self._queue) >= self.max_batch:
+            self._dispatch()
+        elif self._timer is None:
+            self._timer = loop.call_later(self.max_wait, self._dispatch)
+        return await future
+
+    def _dispatch(self):
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+        if not self._queue:
+            return
+        batch, self._queue = self._queue, []
+        task = asyncio.create_task(self._commit(batch))
+        self._inflight.add(task)
+        task.add_done_callback(self._inflight.discard)
+
+    async def _commit(self, batch: List[Tuple[dict, asyncio.Future]]):
+        docs = [doc for doc, _ in batch]
+        write_errors = {}
+        batch_error = None
+        try:
+            await self.collection.insert_many(docs, ordered=False)
+        except BulkWriteError as e:
+            write_errors = {err["index"]: err for err in e.details.get("writeErrors", [])}
+            concern_errors = e.details.get("writeConcernErrors") or []
+            if concern_errors:
+                batch_error = WriteConcernError(concern_errors[0].get("errmsg", ""), concern_errors[0].get("code"), concern_errors[0])
+        except Exception as e:
+            batch_error = e
+
+        self.batches += 1
+        self.documents += len(batch)
+
+        for index, (doc, future) in enumerate(batch):
+            if future.done():
+                # Caller went away; its document was still written
+                continue
+            err = write_errors.get(index)
+            if err is not None:
+                error_cls = DuplicateKeyError if err.get("code") == 11000 else WriteError
+                future.set_exception(error_cls(err.get("errmsg", ""), err.get("code"), err))
+            elif batch_error is not None:
+                future.set_exception(batch_error)
+            else:
+                future.set_result(doc)
+
+    async def drain(self):
+        """Write out anything queued and wait for in-flight batches"""
+        self._dispatch()
+        if self._inflight:
+            await asyncio.gather(*self._inflight, return_exceptions=True)
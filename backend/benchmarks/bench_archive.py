@@ -0,0 +1,121 @@
+"""
+Archival Benchmark for Nirbani Dairy
+Seeds a scratch database with several years of milk collections and payments,
+closes everything but the current month, archives all but the last
+--keep-months, then compares the hot collections' size and index footprint
+before and after, and times a recent and a historical ledger read through
+the archive facade.
+
+Usage (from backend/, needs MONGO_URL and MongoDB 4.4+; writes only to <DB_NAME>_bench_archive):
+    python benchmarks/bench_archive.py --farmers 1000 --years 3
+"""
+import argparse
+import asyncio
+import os
+import random
+import statistics
+import sys
+import time
+import uuid
+from datetime import date, datetime, timedelta, timezone
+from pathlib import Path
+
+from dotenv import load_dotenv
+from motor.motor_asyncio import AsyncIOMotorClient
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
+import archive_service  # noqa: E402
+from archive_service import ArchivedCollection, archive_state, collection_stats  # noqa: E402
+
+INSERT_BATCH = 10000
+
+
+async def seed(db, farmers: int, days: int, rng: random.Random) -> list:
+    await db.client.drop_database(db.name)
+    await db.milk_collections.create_index([("farmer_id", 1), ("date", 1), ("shift", 1), ("milk_type", 1)], unique=True)
+    await db.payments.create_index([("farmer_id", 1), ("date", 1)])
+    farmer_ids = [str(uuid.uuid4()) for _ in range(farmers)]
+    today = datetime.now(timezone.utc).date()
+    collections, payments = [], []
+    for day in range(days, 0, -1):
+        date_str = (today - timedelta(days=day)).isoformat()
+        for farmer_id in farmer_ids:
+            for shift in ("morning", "evening"):
+                quantity = round(rng.uniform(1, 20), 1)
+                collections.append({
+                    "id": str(uuid.uuid4()), "farmer_id": farmer_id, "farmer_name": f"Farmer {farmer_id[:6]}",
+                    "shift": shift, "milk_type": "cow", "quantity": quantity, "fat": round(rng.uniform(3, 7), 1),
+                    "snf": 8.5, "rate": 45.0, "amount": round(quantity * 45, 2), "date": date_str,
+                    "created_at": f"{date_str}T06:30:00+00:00"
+                })
+            if day % 10 == 0:
+                payments.append({"id": str(uuid.uuid4()), "farmer_id": farmer_id, "amount": 500.0,
+                                 "payment_type": "payment", "date": date_str})
+        if len(collections) >= INSERT_BATCH:
+            await db.milk_collections.insert_many(collections, ordered=False)
+            collections = []
+    for docs, name in ((collections, "milk_collections"), (payments, "payments")):
+        if docs:
+            await db[name].insert_many(docs, ordered=False)
+    # Everything before the current month is closed
+    end = date(today.year, today.month, 1) - timedelta(days=1)
+    await db.period_closes.insert_one({"id": "bench", "period_type": "month", "period": end.isoformat()[:7],
+                                       "start_date": "2000-01-01", "end_date": end.isoformat(), "status": "closed"})
+    return farmer_ids
+
+
+async def ledger_ms(db, farmer_ids: list, start: str, end: str, runs: int, rng: random.Random) -> float:
+    collection = ArchivedCollection(db, "milk_collections")
+    timings = []
+    for _ in range(runs):
+        query = {"farmer_id": rng.choice(farmer_ids), "date": {"$gte": start, "$lte": end}}
+        began = time.perf_counter()
+        await collection.find(query, {"_id": 0}).sort("date", 1).to_list(None)
+        timings.append((time.perf_counter() - began) * 1000)
+    return statistics.median(timings)
+
+
+async def run(args):
+    load_dotenv(Path(__file__).resolve().parents[1] / '.env')
+    client = AsyncIOMotorClient(os.environ['MONGO_URL'])
+    db = client[os.environ.get('DB_NAME', 'nirbani') + "_bench_archive"]
+    rng = random.Random(42)
+    today = datetime.now(timezone.utc).date()
+    recent = ((today - timedelta(days=30)).isoformat(), today.isoformat())
+    old = ((today - timedelta(days=args.years * 365 - 30)).isoformat(), (today - timedelta(days=args.years * 365 - 60)).isoformat())
+    try:
+        began = time.perf_counter()
+        farmer_ids = await seed(db, args.farmers, args.years * 365, rng)
+        print(f"seeded {args.farmers} farmers over {args.years} years in {time.perf_counter() - began:.1f}s")
+        before = {name: await collection_stats(db, name) for name in ("milk_collections", "payments")}
+        timings_before = [await ledger_ms(db, farmer_ids, *window, args.runs, rng) for window in (recent, old)]
+
+        began = time.perf_counter()
+        moved = await archive_service.run(db, args.keep_months, ("milk_collections", "payments"), progress=lambda message: None)
+        print(f"archived {moved} in {time.perf_counter() - began:.1f}s")
+        after = {name: await collection_stats(db, name) for name in ("milk_collections", "payments")}
+        timings_after = [await ledger_ms(db, farmer_ids, *window, args.runs, rng) for window in (recent, old)]
+    finally:
+        await client.drop_database(db.name)
+        client.close()
+
+    for name in before:
+        print(f"{name:18} before {before[name]}")
+        print(f"{'':18} after  {after[name]}")
+    print(f"ledger month, recent:     {timings_before[0]:.1f} ms -> {timings_after[0]:.1f} ms")
+    print(f"ledger month, historical: {timings_before[1]:.1f} ms -> {timings_after[1]:.1f} ms")
+    print(f"archived months: {archive_state.stats()}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark cold-data archival")
+    parser.add_argument("--farmers", type=int, default=1000)
+    parser.add_argument("--years", type=int, default=3)
+    parser.add_argument("--keep-months", type=int, default=12)
+    parser.add_argument("--runs", type=int, default=20, help="ledger reads per measurement")
+    args = parser.parse_args()
+    asyncio.run(run(args))
+
+
+if __name__ == "__main__":
+    main()
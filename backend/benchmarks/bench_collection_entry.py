@@ -0,0 +1,81 @@
+"""
+Collection Entry Latency Benchmark for Nirbani Dairy
+Measures POST /api/collections latency against a running backend on local Mongo
+
+Usage:
+    REACT_APP_BACKEND_URL=http://localhost:8001 python benchmarks/bench_collection_entry.py --entries 500
+
+Target: p99 under 20 ms for a single entry.
+"""
+import argparse
+import os
+import statistics
+import time
+import uuid
+from datetime import date, timedelta
+
+import httpx
+
+BASE_URL = os.environ.get('REACT_APP_BACKEND_URL', 'http://localhost:8001').rstrip('/')
+TARGET_P99_MS = 20.0
+
+
+def percentile(samples, pct):
+    ordered = sorted(samples)
+    index = min(len(ordered) - 1, int(round(pct / 100 * (len(ordered) - 1))))
+    return ordered[index]
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark single collection entry latency")
+    parser.add_argument("--entries", type=int, default=500)
+    parser.add_argument("--warmup", type=int, default=20)
+    parser.add_argument("--email", default="test@test.com")
+    parser.add_argument("--password", default="test123")
+    args = parser.parse_args()
+
+    with httpx.Client(base_url=BASE_URL, timeout=30) as http:
+        token = http.post("/api/auth/login", json={"email": args.email, "password": args.password}).json()["access_token"]
+        http.headers["Authorization"] = f"Bearer {token}"
+
+        farmer = http.post("/api/farmers", json={
+            "name": f"Bench Farmer {uuid.uuid4().hex[:8]}",
+            "phone": f"9{uuid.uuid4().int % 10**9:09d}",
+            "milk_type": "cow"
+        }).json()
+
+        # Every entry lands on its own historical date so none are duplicates
+        start = date(2000, 1, 1)
+        created = []
+        latencies = []
+        try:
+            for i in range(args.warmup + args.entries):
+                payload = {
+                    "farmer_id": farmer["id"],
+                    "shift": "morning",
+                    "quantity": 5.0,
+                    "fat": 4.2,
+                    "date": (start + timedelta(days=i)).isoformat()
+                }
+                began = time.perf_counter()
+                res = http.post("/api/collections", json=payload)
+                elapsed_ms = (time.perf_counter() - began) * 1000
+                res.raise_for_status()
+                created.append(res.json()["id"])
+                if i >= args.warmup:
+                    latencies.append(elapsed_ms)
+        finally:
+            for collection_id in created:
+                http.delete(f"/api/collections/{collection_id}")
+            http.delete(f"/api/farmers/{farmer['id']}")
+
+    p99 = percentile(latencies, 99)
+    print(f"entries: {len(latencies)}")
+    print(f"mean:    {statistics.mean(latencies):.2f} ms")
+    print(f"p50:     {percentile(latencies, 50):.2f} ms")
+    print(f"p95:     {percentile(latencies, 95):.2f} ms")
+    print(f"p99:     {p99:.2f} ms (target < {TARGET_P99_MS:.0f} ms) {'PASS' if p99 < TARGET_P99_MS else 'FAIL'}")
+
+
+if __name__ == "__main__":
+    main()
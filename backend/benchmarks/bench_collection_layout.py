@@ -0,0 +1,161 @@
+"""
+Milk Collection Layout Benchmark for Nirbani Dairy
+Seeds a scratch database with milk collections in the current document
+layout, copies them to the time-series and compact layouts, then compares
+storage size, index size, average document size (the working set per entry),
+the range scans reports and bills run, and how far the summed amounts drift
+from the exact total.
+
+Usage (from backend/, needs MONGO_URL and MongoDB 7.0+; writes only to <DB_NAME>_bench_layout):
+    python benchmarks/bench_collection_layout.py --farmers 2000 --days 365
+"""
+import argparse
+import asyncio
+import os
+import random
+import statistics
+import sys
+import time
+import uuid
+from datetime import date, timedelta
+from decimal import Decimal
+from pathlib import Path
+
+from dotenv import load_dotenv
+from motor.motor_asyncio import AsyncIOMotorClient
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
+from collection_store import (  # noqa: E402
+    COMPACT_COLLECTION, TIMESERIES_COLLECTION, CompactCollection, TimeSeriesCollection, migrate
+)
+
+INSERT_BATCH = 10000
+START = date(2024, 1, 1)
+
+
+async def seed(db, farmers: int, days: int, rng: random.Random):
+    await db.client.drop_database(db.name)
+    await db.milk_collections.create_index(
+        [("farmer_id", 1), ("date", 1), ("shift", 1), ("milk_type", 1)], unique=True
+    )
+    farmer_ids = [str(uuid.uuid4()) for _ in range(farmers)]
+    await db.farmers.insert_many([{"id": farmer_id, "name": f"Farmer {farmer_id[:6]}"} for farmer_id in farmer_ids])
+    await db.farmers.create_index("id")
+    exact = Decimal(0)
+    batch = []
+    for day in range(days):
+        date_str = (START + timedelta(days=day)).isoformat()
+        for farmer_id in farmer_ids:
+            for shift in ("morning", "evening"):
+                quantity = round(rng.uniform(1, 20), 1)
+                fat = round(rng.uniform(3, 7), 1)
+                rate = round(rng.uniform(35, 55), 2)
+                amount = round(quantity * rate, 2)
+                exact += Decimal(str(amount))
+                batch.append({
+                    "id": str(uuid.uuid4()), "farmer_id": farmer_id, "farmer_name": f"Farmer {farmer_id[:6]}",
+                    "shift": shift, "milk_type": "cow", "quantity": quantity, "fat": fat, "snf": 8.5,
+                    "rate": rate, "amount": amount, "date": date_str, "branch_id": "",
+                    "created_at": f"{date_str}T06:30:00+00:00"
+                })
+                if len(batch) >= INSERT_BATCH:
+                    await db.milk_collections.insert_many(batch, ordered=False)
+                    batch = []
+    if batch:
+        await db.milk_collections.insert_many(batch, ordered=False)
+    return farmer_ids, exact
+
+
+async def sizes(db, name: str) -> dict:
+    stats = await db.command("collStats", name)
+    return {
+        "storage_mb": stats["storageSize"] / 2**20,
+        "index_mb": stats["totalIndexSize"] / 2**20,
+        # Time-series collections report buckets, not entries
+        "avg_doc_bytes": stats.get("avgObjSize", 0),
+    }
+
+
+async def money_error(collection, amount, exact: Decimal) -> float:
+    """Paise between the database's $sum of every amount and the exact total"""
+    rows = await collection.aggregate([{"$group": {"_id": None, "total": {"$sum": amount}}}]).to_list(1)
+    total = rows[0]["total"]
+    if amount == "$amount_p":
+        return float(abs(Decimal(total) - exact * 100))
+    return float(abs(Decimal(repr(total)) - exact) * 100)
+
+
+async def timed(runs: int, func) -> float:
+    """Median milliseconds of func() over runs"""
+    timings = []
+    for _ in range(runs):
+        began = time.perf_counter()
+        await func()
+        timings.append((time.perf_counter() - began) * 1000)
+    return statistics.median(timings)
+
+
+async def scans(collection, farmer_ids: list, days: int, runs: int, rng: random.Random) -> dict:
+    month_start = START + timedelta(days=min(days - 1, 150))
+    month = {"$gte": month_start.isoformat(), "$lte": (month_start + timedelta(days=29)).isoformat()}
+    day = (START + timedelta(days=days // 2)).isoformat()
+    return {
+        "farmer_month": await timed(runs, lambda: collection.find(
+            {"farmer_id": rng.choice(farmer_ids), "date": month}, {"_id": 0}
+        ).sort("date", 1).to_list(None)),
+        "day": await timed(runs, lambda: collection.find({"date": day}, {"_id": 0}).to_list(None)),
+        "month_by_farmer": await timed(runs, lambda: collection.aggregate([
+            {"$match": {"date": month}},
+            {"$group": {"_id": "$farmer_id", "quantity": {"$sum": "$quantity"}, "amount": {"$sum": "$amount"}}}
+        ]).to_list(None)),
+    }
+
+
+async def run(args):
+    load_dotenv(Path(__file__).resolve().parents[1] / '.env')
+    client = AsyncIOMotorClient(os.environ['MONGO_URL'])
+    db = client[os.environ.get('DB_NAME', 'nirbani') + "_bench_layout"]
+    rng = random.Random(42)
+    try:
+        began = time.perf_counter()
+        farmer_ids, exact = await seed(db, args.farmers, args.days, rng)
+        print(f"seeded {args.farmers * args.days * 2} entries in {time.perf_counter() - began:.1f}s")
+        began = time.perf_counter()
+        for layout in ("timeseries", "compact"):
+            await migrate(db, layout, progress=lambda message: None)
+        print(f"copied to both layouts in {time.perf_counter() - began:.1f}s")
+
+        layouts = {
+            "documents": ("milk_collections", db.milk_collections, "$amount"),
+            "timeseries": (TIMESERIES_COLLECTION, TimeSeriesCollection(db), "$amount"),
+            "compact": (COMPACT_COLLECTION, CompactCollection(db), "$amount_p"),
+        }
+        results = {}
+        for layout, (name, collection, amount) in layouts.items():
+            results[layout] = {
+                **await sizes(db, name),
+                **await scans(collection, farmer_ids, args.days, args.runs, rng),
+                "money_error_paise": await money_error(db[name], amount, exact),
+            }
+    finally:
+        await client.drop_database(db.name)
+        client.close()
+
+    units = {"storage_mb": "MB", "index_mb": "MB", "avg_doc_bytes": "B", "money_error_paise": "p"}
+    print(f"{'':18}" + "".join(f"{layout:>12}" for layout in results))
+    for metric in ("storage_mb", "index_mb", "avg_doc_bytes", "farmer_month", "day", "month_by_farmer", "money_error_paise"):
+        unit = units.get(metric, "ms")
+        print(f"{metric:18}" + "".join(f"{result[metric]:>10.2f}{unit:2}" for result in results.values()))
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Compare milk collection storage layouts")
+    parser.add_argument("--farmers", type=int, default=2000)
+    parser.add_argument("--days", type=int, default=365)
+    parser.add_argument("--runs", type=int, default=20, help="repetitions per scan")
+    args = parser.parse_args()
+    asyncio.run(run(args))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,85 @@
+"""
+Event Loop Lag Benchmark for Nirbani Dairy
+Measures GET /api/health latency while bills and CSV exports render in the
+background. With rendering on the worker pool, health checks should stay
+fast; with CPU_WORKERS=0 and IO_THREADS=1 the difference shows up in p99.
+
+Usage:
+    REACT_APP_BACKEND_URL=http://localhost:8001 python benchmarks/bench_loop_lag.py --seconds 20
+
+Target: health p99 under 50 ms while heavy requests are running.
+"""
+import argparse
+import asyncio
+import os
+import statistics
+import time
+
+import httpx
+
+BASE_URL = os.environ.get('REACT_APP_BACKEND_URL', 'http://localhost:8001').rstrip('/')
+TARGET_P99_MS = 50.0
+
+
+def percentile(samples, pct):
+    ordered = sorted(samples)
+    index = min(len(ordered) - 1, int(round(pct / 100 * (len(ordered) - 1))))
+    return ordered[index]
+
+
+async def heavy_load(http, paths, deadline, counts):
+    while time.monotonic() < deadline:
+        for path in paths:
+            res = await http.get(path)
+            counts[res.status_code] = counts.get(res.status_code, 0) + 1
+
+
+async def probe(http, deadline, interval):
+    latencies = []
+    while time.monotonic() < deadline:
+        began = time.perf_counter()
+        res = await http.get("/api/health")
+        latencies.append((time.perf_counter() - began) * 1000)
+        res.raise_for_status()
+        await asyncio.sleep(interval)
+    return latencies
+
+
+async def run(args):
+    async with httpx.AsyncClient(base_url=BASE_URL, timeout=60) as http:
+        token = (await http.post("/api/auth/login", json={"email": args.email, "password": args.password})).json()["access_token"]
+        http.headers["Authorization"] = f"Bearer {token}"
+
+        farmers = (await http.get("/api/farmers")).json()
+        paths = ["/api/export/collections?start_date=2000-01-01", "/api/export/farmers"]
+        paths += [f"/api/bills/a4/{f['id']}?start_date=2000-01-01" for f in farmers[:5]]
+
+        deadline = time.monotonic() + args.seconds
+        counts = {}
+        workers = [heavy_load(http, paths, deadline, counts) for _ in range(args.concurrency)]
+        latencies, *_ = await asyncio.gather(probe(http, deadline, args.interval), *workers)
+    return latencies, counts
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark event loop lag under rendering load")
+    parser.add_argument("--seconds", type=float, default=20)
+    parser.add_argument("--concurrency", type=int, default=4)
+    parser.add_argument("--interval", type=float, default=0.05)
+    parser.add_argument("--email", default="test@test.com")
+    parser.add_argument("--password", default="test123")
+    args = parser.parse_args()
+
+    latencies, counts = asyncio.run(run(args))
+
+    p99 = percentile(latencies, 99)
+    print(f"heavy requests: {sum(counts.values())} {dict(sorted(counts.items()))}")
+    print(f"health probes:  {len(latencies)}")
+    print(f"mean:    {statistics.mean(latencies):.2f} ms")
+    print(f"p50:     {percentile(latencies, 50):.2f} ms")
+    print(f"p95:     {percentile(latencies, 95):.2f} ms")
+    print(f"p99:     {p99:.2f} ms (target < {TARGET_P99_MS:.0f} ms) {'PASS' if p99 < TARGET_P99_MS else 'FAIL'}")
+
+
+if __name__ == "__main__":
+    main()
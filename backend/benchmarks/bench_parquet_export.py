@@ -0,0 +1,105 @@
+"""
+Parquet Export Benchmark for Nirbani Dairy
+Seeds a scratch database with millions of milk collections spread over
+--months months, exports them to month-partitioned Parquet, and reports
+throughput, peak memory before and after the export (which should stay flat
+as --rows grows), output size against the BSON size, and a read-back check
+of the row count and column types.
+
+Usage (from backend/, needs MONGO_URL; writes only to <DB_NAME>_bench_parquet and a temp dir):
+    python benchmarks/bench_parquet_export.py --rows 2000000 --months 36
+"""
+import argparse
+import asyncio
+import os
+import random
+import resource
+import shutil
+import sys
+import tempfile
+import time
+import uuid
+from datetime import datetime, timedelta, timezone
+from pathlib import Path
+
+from dotenv import load_dotenv
+from motor.motor_asyncio import AsyncIOMotorClient
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
+import pyarrow.parquet as pq  # noqa: E402
+from parquet_export import export_collection  # noqa: E402
+
+INSERT_BATCH = 10000
+
+
+def peak_rss_mb() -> float:
+    # ru_maxrss is in KiB on Linux
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+async def seed(db, rows: int, months: int, rng: random.Random):
+    await db.client.drop_database(db.name)
+    await db.milk_collections.create_index([("date", 1)])
+    farmer_ids = [str(uuid.uuid4()) for _ in range(max(rows // (months * 60), 1))]
+    today = datetime.now(timezone.utc).date()
+    days = months * 30
+    docs = []
+    for index in range(rows):
+        date_str = (today - timedelta(days=index * days // rows)).isoformat()
+        farmer_id = farmer_ids[index % len(farmer_ids)]
+        quantity = round(rng.uniform(1, 20), 1)
+        docs.append({
+            "id": str(uuid.uuid4()), "farmer_id": farmer_id, "farmer_name": f"Farmer {farmer_id[:6]}",
+            "shift": ("morning", "evening")[index % 2], "milk_type": "cow", "quantity": quantity,
+            "fat": round(rng.uniform(3, 7), 1), "snf": 8.5, "rate": 45.0, "amount": round(quantity * 45, 2),
+            "date": date_str, "created_at": f"{date_str}T06:30:00+00:00"
+        })
+        if len(docs) >= INSERT_BATCH:
+            await db.milk_collections.insert_many(docs, ordered=False)
+            docs = []
+    if docs:
+        await db.milk_collections.insert_many(docs, ordered=False)
+
+
+async def run(args):
+    load_dotenv(Path(__file__).resolve().parents[1] / '.env')
+    client = AsyncIOMotorClient(os.environ['MONGO_URL'])
+    db = client[os.environ.get('DB_NAME', 'nirbani') + "_bench_parquet"]
+    out_dir = Path(tempfile.mkdtemp(prefix="bench_parquet_"))
+    try:
+        began = time.perf_counter()
+        await seed(db, args.rows, args.months, random.Random(42))
+        print(f"seeded {args.rows} collections over {args.months} months in {time.perf_counter() - began:.1f}s")
+        bson_mb = (await db.command("collStats", "milk_collections"))["size"] / 1024 ** 2
+
+        rss_before = peak_rss_mb()
+        began = time.perf_counter()
+        result = await export_collection(db, "milk_collections", out_dir, batch_rows=args.batch,
+                                         progress=lambda message: None)
+        elapsed = time.perf_counter() - began
+        rss_after = peak_rss_mb()
+        parquet_mb = sum(path.stat().st_size for path in result["files"]) / 1024 ** 2
+        table = pq.read_table(out_dir / "milk_collections", columns=["date", "quantity", "created_at"])
+    finally:
+        await client.drop_database(db.name)
+        client.close()
+        shutil.rmtree(out_dir, ignore_errors=True)
+
+    print(f"exported {result['rows']} rows into {result['months']} partitions in {elapsed:.1f}s "
+          f"({result['rows'] / elapsed:.0f} rows/s, batch {args.batch})")
+    print(f"peak RSS: {rss_before:.0f} MB before export, {rss_after:.0f} MB after")
+    print(f"size: {bson_mb:.1f} MB BSON -> {parquet_mb:.1f} MB Parquet")
+    print(f"read back: {table.num_rows} rows, {', '.join(f'{field.name}: {field.type}' for field in table.schema)}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark month-partitioned Parquet export")
+    parser.add_argument("--rows", type=int, default=2000000)
+    parser.add_argument("--months", type=int, default=36)
+    parser.add_argument("--batch", type=int, default=50000, help="rows per record batch")
+    args = parser.parse_args()
+    asyncio.run(run(args))
+
+
+if __name__ == "__main__":
+    main()
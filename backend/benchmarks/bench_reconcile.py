@@ -0,0 +1,107 @@
+"""
+Reconciliation Benchmark for Nirbani Dairy
+Seeds a scratch database with N farmers and their collections and payments,
+corrupts the stored totals of a few, then times a full reconcile and repair.
+
+Usage (from backend/, needs MONGO_URL; writes only to <DB_NAME>_bench_reconcile):
+    python benchmarks/bench_reconcile.py --farmers 100000 --entries 20
+
+Target: 100k farmers reconciled in under 60 s, every corrupted farmer found.
+"""
+import argparse
+import asyncio
+import os
+import random
+import sys
+import time
+import uuid
+from pathlib import Path
+
+from dotenv import load_dotenv
+from motor.motor_asyncio import AsyncIOMotorClient
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
+from reconcile_service import reconcile  # noqa: E402
+
+TARGET_SECONDS = 60.0
+INSERT_BATCH = 10000
+
+
+async def flush(db, batches):
+    for name, docs in batches.items():
+        if docs:
+            await db[name].insert_many(docs, ordered=False)
+            docs.clear()
+
+
+async def seed(db, farmers: int, entries: int, corrupt: int, rng: random.Random):
+    await db.client.drop_database(db.name)
+    corrupted = set(rng.sample(range(farmers), corrupt))
+    batches = {"farmers": [], "milk_collections": [], "payments": []}
+    for n in range(farmers):
+        farmer_id = str(uuid.uuid4())
+        totals = {"total_milk": 0.0, "total_due": 0.0, "total_paid": 0.0, "balance": 0.0}
+        for i in range(entries):
+            quantity = round(rng.uniform(1, 20), 1)
+            amount = round(quantity * 45, 2)
+            batches["milk_collections"].append({
+                "id": str(uuid.uuid4()), "farmer_id": farmer_id, "quantity": quantity,
+                "amount": amount, "date": f"2024-{1 + i % 12:02d}-{1 + i % 28:02d}"
+            })
+            totals["total_milk"] += quantity
+            totals["total_due"] += amount
+            totals["balance"] += amount
+        amount = round(rng.uniform(0, totals["balance"]), 2)
+        batches["payments"].append({
+            "id": str(uuid.uuid4()), "farmer_id": farmer_id, "amount": amount,
+            "payment_type": "payment", "date": "2024-12-31"
+        })
+        totals["total_paid"] += amount
+        totals["balance"] -= amount
+        if n in corrupted:
+            totals["balance"] += 100
+        batches["farmers"].append({"id": farmer_id, **{k: round(v, 2) for k, v in totals.items()}})
+        if len(batches["milk_collections"]) >= INSERT_BATCH:
+            await flush(db, batches)
+    await flush(db, batches)
+    await db.farmers.create_index("id")
+
+
+async def run(args):
+    load_dotenv(Path(__file__).resolve().parents[1] / '.env')
+    client = AsyncIOMotorClient(os.environ['MONGO_URL'])
+    db = client[os.environ.get('DB_NAME', 'nirbani') + "_bench_reconcile"]
+    try:
+        began = time.perf_counter()
+        await seed(db, args.farmers, args.entries, args.corrupt, random.Random(42))
+        print(f"seeded {args.farmers} farmers, {args.farmers * args.entries} collections in {time.perf_counter() - began:.1f}s")
+
+        began = time.perf_counter()
+        report = (await reconcile(db, repair=False, entity_types=["farmer"]))["farmer"]
+        check_seconds = time.perf_counter() - began
+        began = time.perf_counter()
+        repaired = (await reconcile(db, repair=True, entity_types=["farmer"]))["farmer"]
+        repair_seconds = time.perf_counter() - began
+        after = (await reconcile(db, repair=False, entity_types=["farmer"]))["farmer"]
+    finally:
+        await client.drop_database(db.name)
+        client.close()
+
+    print(f"check:   {check_seconds:.2f}s  mismatched {report['mismatched']} (corrupted {args.corrupt})")
+    print(f"repair:  {repair_seconds:.2f}s  repaired {repaired['repaired']}")
+    print(f"after:   mismatched {after['mismatched']}")
+    ok = check_seconds < TARGET_SECONDS and report["mismatched"] == args.corrupt and after["mismatched"] == 0
+    print(f"target < {TARGET_SECONDS:.0f}s, all corrupted found and fixed: {'PASS' if ok else 'FAIL'}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark ledger reconciliation")
+    parser.add_argument("--farmers", type=int, default=100000)
+    parser.add_argument("--entries", type=int, default=20, help="collections per farmer")
+    parser.add_argument("--corrupt", type=int, default=100)
+    args = parser.parse_args()
+    asyncio.run(run(args))
+
+
+if __name__ == "__main__":
+    main()
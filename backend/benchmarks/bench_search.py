@@ -0,0 +1,74 @@
+"""
+Search Benchmark for Nirbani Dairy
+Builds the in-memory search index over N synthetic farmers (mixed Hindi and
+English names, villages and phone numbers) and times autocomplete queries.
+Runs entirely in-process, no database needed.
+
+Usage (from backend/):
+    python benchmarks/bench_search.py --farmers 50000 --queries 5000
+
+Target: p99 query latency under 5 ms at 50k farmers.
+"""
+import argparse
+import random
+import sys
+import time
+import uuid
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
+from search_service import SearchIndex  # noqa: E402
+
+TARGET_P99_MS = 5.0
+
+FIRST = ["Ramesh", "Suresh", "Mahesh", "Sunita", "Kamla", "Bhagwan", "Rajesh", "Geeta", "Mohan", "Shyam",
+         "रमेश", "सुरेश", "महेश", "सुनीता", "कमला", "भगवान", "राजेश", "गीता", "मोहन", "श्याम"]
+LAST = ["Singh", "Yadav", "Sharma", "Patel", "Gurjar", "Meena", "सिंह", "यादव", "शर्मा", "पटेल", "गुर्जर", "मीणा"]
+VILLAGES = ["Rampur", "Sultanpur", "Bhilwara", "Kishangarh", "रामपुर", "सुल्तानपुर", "भीलवाड़ा", "किशनगढ़"]
+QUERIES = ["ram", "ramesh", "रमे", "suni", "kamla sing", "bhagwan", "geeta y", "श्याम", "kishan", "9876", "98", "sh"]
+
+
+def build(farmers: int, rng: random.Random) -> SearchIndex:
+    index = SearchIndex()
+    index.load([
+        {
+            "id": str(uuid.uuid4()),
+            "name": f"{rng.choice(FIRST)} {rng.choice(LAST)}",
+            "phone": f"9{rng.randrange(10**9):09d}",
+            "village": rng.choice(VILLAGES),
+        }
+        for _ in range(farmers)
+    ])
+    return index
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark farmer autocomplete")
+    parser.add_argument("--farmers", type=int, default=50000)
+    parser.add_argument("--queries", type=int, default=5000)
+    args = parser.parse_args()
+    rng = random.Random(42)
+
+    began = time.perf_counter()
+    index = build(args.farmers, rng)
+    print(f"indexed {len(index)} farmers in {time.perf_counter() - began:.2f}s")
+
+    timings = []
+    for i in range(args.queries):
+        query = QUERIES[i % len(QUERIES)] if i % 3 else f"{rng.randrange(10**4):04d}"
+        began = time.perf_counter()
+        index.search(query, limit=10)
+        timings.append((time.perf_counter() - began) * 1000)
+    timings.sort()
+    p50, p99 = timings[len(timings) // 2], timings[int(len(timings) * 0.99)]
+    print(f"queries: {len(timings)}  p50 {p50:.2f}ms  p99 {p99:.2f}ms  max {timings[-1]:.2f}ms")
+
+    began = time.perf_counter()
+    for _ in range(1000):
+        index.upsert({"id": str(uuid.uuid4()), "name": f"{rng.choice(FIRST)} {rng.choice(LAST)}", "phone": "", "village": ""})
+    print(f"upsert: {(time.perf_counter() - began):.3f}ms per farmer")
+    print(f"target p99 < {TARGET_P99_MS:.0f}ms: {'PASS' if p99 < TARGET_P99_MS else 'FAIL'}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,97 @@
+"""
+Worker Scaling Benchmark for Nirbani Dairy
+Starts the backend under gunicorn with 1, 2, ... N uvicorn workers on local
+Mongo and measures request throughput for a read-heavy mix at each size.
+
+Usage (from backend/):
+    python benchmarks/bench_worker_scaling.py --workers 1,2,4 --seconds 15
+
+Target: throughput grows roughly linearly until workers reach the core count.
+"""
+import argparse
+import asyncio
+import os
+import subprocess
+import sys
+import time
+
+import httpx
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+PATHS = ["/api/farmers", "/api/collections", "/api/dashboard/stats", "/api/customers"]
+
+
+def start_server(workers: int, port: int) -> subprocess.Popen:
+    env = {**os.environ, "WEB_CONCURRENCY": str(workers), "BIND": f"127.0.0.1:{port}"}
+    return subprocess.Popen(
+        [sys.executable, "-m", "gunicorn", "server:app", "--config", "gunicorn.conf.py"],
+        cwd=BACKEND_DIR, env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL
+    )
+
+
+def wait_healthy(base_url: str, timeout: float = 60):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        try:
+            if httpx.get(f"{base_url}/api/health", timeout=2).status_code == 200:
+                return
+        except httpx.HTTPError:
+            pass
+        time.sleep(0.5)
+    raise RuntimeError("backend did not become healthy")
+
+
+async def load(base_url: str, token: str, concurrency: int, seconds: float) -> int:
+    completed = 0
+    deadline = time.monotonic() + seconds
+    limits = httpx.Limits(max_connections=concurrency)
+    async with httpx.AsyncClient(base_url=base_url, timeout=30, limits=limits,
+                                 headers={"Authorization": f"Bearer {token}"}) as http:
+        async def client(offset: int):
+            nonlocal completed
+            i = offset
+            while time.monotonic() < deadline:
+                res = await http.get(PATHS[i % len(PATHS)])
+                res.raise_for_status()
+                completed += 1
+                i += 1
+
+        await asyncio.gather(*(client(n) for n in range(concurrency)))
+    return completed
+
+
+def run_size(workers: int, args) -> float:
+    base_url = f"http://127.0.0.1:{args.port}"
+    server = start_server(workers, args.port)
+    try:
+        wait_healthy(base_url)
+        token = httpx.post(f"{base_url}/api/auth/login",
+                           json={"email": args.email, "password": args.password}).json()["access_token"]
+        asyncio.run(load(base_url, token, args.concurrency, 2))  # warm up every worker
+        completed = asyncio.run(load(base_url, token, args.concurrency, args.seconds))
+        return completed / args.seconds
+    finally:
+        server.terminate()
+        server.wait(timeout=30)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark throughput against worker count")
+    parser.add_argument("--workers", default=f"1,2,{os.cpu_count() or 1}")
+    parser.add_argument("--seconds", type=float, default=15)
+    parser.add_argument("--concurrency", type=int, default=64)
+    parser.add_argument("--port", type=int, default=8011)
+    parser.add_argument("--email", default="test@test.com")
+    parser.add_argument("--password", default="test123")
+    args = parser.parse_args()
+
+    sizes = sorted({int(n) for n in args.workers.split(",")})
+    baseline = None
+    for workers in sizes:
+        rps = run_size(workers, args)
+        baseline = baseline or rps
+        print(f"workers: {workers:>2}  {rps:8.1f} req/s  ({rps / baseline:.2f}x)")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,114 @@
+"""
+Write Isolation Benchmark for Nirbani Dairy
+Measures POST /api/collections latency while month-long reports, exports
+and bills run concurrently. Run it once against the monolith and once with
+the reporting service split out (SERVE_REPORTS=0 + reporting_server.py behind
+nginx) to compare write p99.
+
+Usage:
+    REACT_APP_BACKEND_URL=http://localhost python benchmarks/bench_write_isolation.py --entries 300 --report-clients 8
+
+Target: p99 under 20 ms for a single entry, as with no report load.
+"""
+import argparse
+import asyncio
+import os
+import statistics
+import time
+import uuid
+from datetime import date, timedelta
+
+import httpx
+
+BASE_URL = os.environ.get('REACT_APP_BACKEND_URL', 'http://localhost:8001').rstrip('/')
+TARGET_P99_MS = 20.0
+
+
+def percentile(samples, pct):
+    ordered = sorted(samples)
+    index = min(len(ordered) - 1, int(round(pct / 100 * (len(ordered) - 1))))
+    return ordered[index]
+
+
+async def report_load(http, farmer_ids, stop: asyncio.Event, counts):
+    paths = [
+        "/api/reports/monthly-summary",
+        "/api/reports/farmer-ranking?start_date=2000-01-01",
+        "/api/dairy/profit-report?start_date=2000-01-01",
+        "/api/export/collections?start_date=2000-01-01",
+    ] + [f"/api/bills/a4/{farmer_id}?start_date=2000-01-01" for farmer_id in farmer_ids]
+    i = 0
+    while not stop.is_set():
+        res = await http.get(paths[i % len(paths)])
+        counts[res.status_code] = counts.get(res.status_code, 0) + 1
+        i += 1
+
+
+async def write_load(http, farmer_id, entries, warmup):
+    # Every entry lands on its own historical date so none are duplicates
+    start = date(2001, 1, 1)
+    created, latencies = [], []
+    for i in range(warmup + entries):
+        began = time.perf_counter()
+        res = await http.post("/api/collections", json={
+            "farmer_id": farmer_id, "shift": "evening", "quantity": 5.0, "fat": 4.2,
+            "date": (start + timedelta(days=i)).isoformat()
+        })
+        elapsed_ms = (time.perf_counter() - began) * 1000
+        res.raise_for_status()
+        created.append(res.json()["id"])
+        if i >= warmup:
+            latencies.append(elapsed_ms)
+    return created, latencies
+
+
+async def run(args):
+    async with httpx.AsyncClient(base_url=BASE_URL, timeout=120) as http:
+        token = (await http.post("/api/auth/login", json={"email": args.email, "password": args.password})).json()["access_token"]
+        http.headers["Authorization"] = f"Bearer {token}"
+
+        farmer = (await http.post("/api/farmers", json={
+            "name": f"Bench Farmer {uuid.uuid4().hex[:8]}",
+            "phone": f"9{uuid.uuid4().int % 10**9:09d}",
+            "milk_type": "cow"
+        })).json()
+        farmer_ids = [f["id"] for f in (await http.get("/api/farmers")).json()[:5]]
+
+        stop = asyncio.Event()
+        counts = {}
+        readers = [asyncio.create_task(report_load(http, farmer_ids, stop, counts)) for _ in range(args.report_clients)]
+        created = []
+        try:
+            await asyncio.sleep(1)  # let the report load build up
+            created, latencies = await write_load(http, farmer["id"], args.entries, args.warmup)
+        finally:
+            stop.set()
+            await asyncio.gather(*readers, return_exceptions=True)
+            for collection_id in created:
+                await http.delete(f"/api/collections/{collection_id}")
+            await http.delete(f"/api/farmers/{farmer['id']}")
+    return latencies, counts
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark write latency under concurrent report load")
+    parser.add_argument("--entries", type=int, default=300)
+    parser.add_argument("--warmup", type=int, default=20)
+    parser.add_argument("--report-clients", type=int, default=8)
+    parser.add_argument("--email", default="test@test.com")
+    parser.add_argument("--password", default="test123")
+    args = parser.parse_args()
+
+    latencies, counts = asyncio.run(run(args))
+
+    p99 = percentile(latencies, 99)
+    print(f"report requests: {sum(counts.values())} {dict(sorted(counts.items()))}")
+    print(f"entries: {len(latencies)}")
+    print(f"mean:    {statistics.mean(latencies):.2f} ms")
+    print(f"p50:     {percentile(latencies, 50):.2f} ms")
+    print(f"p95:     {percentile(latencies, 95):.2f} ms")
+    print(f"p99:     {p99:.2f} ms (target < {TARGET_P99_MS:.0f} ms) {'PASS' if p99 < TARGET_P99_MS else 'FAIL'}")
+
+
+if __name__ == "__main__":
+    main()
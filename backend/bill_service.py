@@ -3,7 +3,7 @@ PDF Bill Generation Service for Nirbani Dairy
 Generates farmer bills and collection reports
 """
 import io
-from datetime import datetime
+from datetime import datetime, timezone
 from typing import List, Dict, Optional
 
 
@@ -445,3 +445,397 @@ def generate_daily_report_html(
     """
     
     return html
+
+
+def generate_customer_thermal_bill_html(
+    customer: Dict,
+    sales: List[Dict],
+    payments: List[Dict],
+    start_date: str,
+    end_date: str,
+    dairy_name: str = "Nirbani Dairy",
+    dairy_phone: str = ""
+) -> str:
+    """Generate 58mm thermal printer bill for a customer"""
+    total_amount = sum(s["amount"] for s in sales)
+    total_paid = sum(p["amount"] for p in payments)
+    balance = total_amount - total_paid
+    
+    rows = ""
+    for s in sales:
+        rows += f"<tr><td>{s['date'][5:]}</td><td>{s['product']}</td><td>{s['quantity']}</td><td>{s['rate']}</td><td style='text-align:right'>{s['amount']:.0f}</td></tr>\n"
+    
+    pay_rows = ""
+    for p in payments:
+        pay_rows += f"<tr><td>{p['date'][5:]}</td><td>{p['payment_mode']}</td><td style='text-align:right'>{p['amount']:.0f}</td></tr>\n"
+    
+    ctype = "Wholesale" if customer.get("customer_type") == "wholesale" else "Retail"
+    
+    html = f"""<!DOCTYPE html><html><head><meta charset="utf-8"><meta name="viewport" content="width=58mm">
+<style>
+*{{margin:0;padding:0;box-sizing:border-box}}
+body{{font-family:'Courier New',monospace;font-size:11px;width:58mm;padding:2mm;color:#000}}
+.center{{text-align:center}}.bold{{font-weight:bold}}.line{{border-top:1px dashed #000;margin:3px 0}}
+table{{width:100%;border-collapse:collapse}}
+td,th{{padding:1px 2px;font-size:10px;vertical-align:top}}
+th{{text-align:left;border-bottom:1px solid #000}}
+.right{{text-align:right}}.big{{font-size:14px}}
+@media print{{@page{{size:58mm auto;margin:0}}body{{width:58mm}}}}
+</style></head><body>
+<div class="center bold big">{dairy_name}</div>
+<div class="center" style="font-size:9px">{dairy_phone}</div>
+<div class="line"></div>
+<div class="bold">{customer['name']} ({ctype})</div>
+<div style="font-size:9px">Ph: {customer['phone']}</div>
+{f'<div style="font-size:9px">GST: {customer["gst_number"]}</div>' if customer.get("gst_number") else ''}
+<div style="font-size:9px">{start_date} to {end_date}</div>
+<div class="line"></div>
+<table><tr><th>Date</th><th>Item</th><th>Qty</th><th>Rate</th><th class="right">Amt</th></tr>
+{rows}</table>
+<div class="line"></div>
+<table>
+<tr><td class="bold">Total:</td><td class="right bold">Rs.{total_amount:.0f}</td></tr>
+<tr><td class="bold">Paid:</td><td class="right bold">Rs.{total_paid:.0f}</td></tr>
+<tr><td class="bold">Balance:</td><td class="right bold">Rs.{balance:.0f}</td></tr>
+</table>
+{f'<div class="line"></div><div class="bold" style="font-size:9px">Payments:</div><table><tr><th>Date</th><th>Mode</th><th class="right">Amt</th></tr>{pay_rows}</table>' if payments else ''}
+<div class="line"></div>
+<div class="center" style="font-size:9px;margin-top:3px">Thank You / धन्यवाद</div>
+<div class="center" style="font-size:8px">Printed: {datetime.now(timezone.utc).strftime("%d-%m-%Y %H:%M")}</div>
+</body></html>"""
+    return html
+
+
+def generate_customer_invoice_html(
+    customer: Dict,
+    sales: List[Dict],
+    payments: List[Dict],
+    start_date: str,
+    end_date: str,
+    dairy_name: str = "Nirbani Dairy",
+    dairy_phone: str = "",
+    dairy_address: str = ""
+) -> str:
+    """Generate A4 invoice for a customer"""
+    total_amount = sum(s["amount"] for s in sales)
+    total_paid = sum(p["amount"] for p in payments)
+    balance = total_amount - total_paid
+    ctype = "Wholesale / थोक" if customer.get("customer_type") == "wholesale" else "Retail / खुदरा"
+    invoice_no = f"CINV-{customer['id'][:8].upper()}-{datetime.now(timezone.utc).strftime('%Y%m%d')}"
+    
+    sale_rows = ""
+    for i, s in enumerate(sales, 1):
+        sale_rows += f"<tr><td>{i}</td><td>{s['date']}</td><td>{s['product'].title()}</td><td>{s['quantity']}</td><td>{s['rate']:.2f}</td><td class='right'>{s['amount']:.2f}</td></tr>"
+    
+    pay_rows = ""
+    for p in payments:
+        pay_rows += f"<tr><td>{p['date']}</td><td>{p.get('payment_mode','cash').upper()}</td><td>{p.get('notes','')}</td><td class='right'>{p['amount']:.2f}</td></tr>"
+    
+    html = f"""<!DOCTYPE html><html><head><meta charset="utf-8">
+<style>
+*{{margin:0;padding:0;box-sizing:border-box}}
+body{{font-family:'Segoe UI',Arial,sans-serif;font-size:12px;color:#1a1a1a;padding:15mm 20mm;max-width:210mm}}
+.header{{display:flex;justify-content:space-between;align-items:flex-start;border-bottom:3px solid #15803d;padding-bottom:12px;margin-bottom:15px}}
+.dairy-name{{font-size:24px;font-weight:bold;color:#15803d}}.dairy-info{{font-size:10px;color:#666;margin-top:4px}}
+.invoice-box{{text-align:right}}.invoice-title{{font-size:20px;color:#15803d;font-weight:bold}}.invoice-no{{font-size:11px;color:#666;margin-top:2px}}
+.info-grid{{display:grid;grid-template-columns:1fr 1fr;gap:15px;margin-bottom:15px}}
+.info-card{{background:#f8faf8;border:1px solid #e5e7eb;border-radius:6px;padding:10px}}
+.info-label{{font-size:9px;color:#888;text-transform:uppercase;letter-spacing:0.5px}}.info-value{{font-size:13px;font-weight:600;margin-top:2px}}
+table{{width:100%;border-collapse:collapse;margin-bottom:15px}}
+th{{background:#15803d;color:white;padding:6px 8px;text-align:left;font-size:10px;text-transform:uppercase}}
+td{{padding:5px 8px;border-bottom:1px solid #eee;font-size:11px}}.right{{text-align:right}}
+tr:nth-child(even){{background:#f9fafb}}
+.summary-grid{{display:grid;grid-template-columns:1fr 1fr 1fr;gap:10px;margin:15px 0}}
+.summary-box{{background:#f0fdf4;border:1px solid #bbf7d0;border-radius:6px;padding:10px;text-align:center}}
+.summary-box.due{{background:#fef2f2;border-color:#fecaca}}
+.summary-label{{font-size:9px;color:#666;text-transform:uppercase}}.summary-value{{font-size:18px;font-weight:bold;color:#15803d;margin-top:2px}}
+.summary-box.due .summary-value{{color:#dc2626}}
+.footer{{margin-top:20px;border-top:2px solid #15803d;padding-top:10px;display:flex;justify-content:space-between;font-size:10px;color:#666}}
+.sig-box{{border-top:1px solid #333;width:150px;text-align:center;padding-top:5px;margin-top:40px;font-size:10px}}
+h3{{color:#15803d;font-size:13px;margin-bottom:8px;padding-bottom:4px;border-bottom:1px solid #d1fae5}}
+@media print{{@page{{size:A4;margin:10mm}}body{{padding:0}}}}
+</style></head><body>
+<div class="header">
+  <div><div class="dairy-name">{dairy_name}</div><div class="dairy-info">{dairy_address}<br>{dairy_phone}</div></div>
+  <div class="invoice-box"><div class="invoice-title">CUSTOMER INVOICE / ग्राहक बिल</div><div class="invoice-no">{invoice_no}</div><div class="invoice-no">{start_date} to {end_date}</div></div>
+</div>
+<div class="info-grid">
+  <div class="info-card"><div class="info-label">Customer / ग्राहक</div><div class="info-value">{customer['name']}</div><div style="font-size:10px;color:#666">Ph: {customer['phone']} | {ctype}</div></div>
+  <div class="info-card"><div class="info-label">Address / पता</div><div class="info-value">{customer.get('address','N/A')}</div>{f'<div style="font-size:10px;color:#666">GST: {customer["gst_number"]}</div>' if customer.get("gst_number") else ''}</div>
+</div>
+<div class="summary-grid">
+  <div class="summary-box"><div class="summary-label">Total Purchase / कुल खरीद</div><div class="summary-value">₹{total_amount:.0f}</div></div>
+  <div class="summary-box"><div class="summary-label">Total Paid / कुल भुगतान</div><div class="summary-value">₹{total_paid:.0f}</div></div>
+  <div class="summary-box {'due' if balance > 0 else ''}"><div class="summary-label">Balance / बकाया</div><div class="summary-value">₹{balance:.0f}</div></div>
+</div>
+<h3>Sales Details / बिक्री विवरण</h3>
+<table><tr><th>#</th><th>Date</th><th>Product</th><th>Qty</th><th>Rate ₹</th><th class="right">Amount ₹</th></tr>
+{sale_rows}
+<tr style="background:#15803d;color:white;font-weight:bold"><td colspan="5">TOTAL</td><td class="right">₹{total_amount:.2f}</td></tr>
+</table>
+{f'<h3>Payments / भुगतान</h3><table><tr><th>Date</th><th>Mode</th><th>Notes</th><th class="right">Amount ₹</th></tr>{pay_rows}<tr style="background:#15803d;color:white;font-weight:bold"><td colspan="3">TOTAL PAID</td><td class="right">₹{total_paid:.2f}</td></tr></table>' if payments else ''}
+<div style="display:flex;justify-content:flex-end;gap:40px;margin-top:30px">
+  <div class="sig-box">Dairy Stamp / डेयरी मुहर</div>
+  <div class="sig-box">Authorized Signature / हस्ताक्षर</div>
+</div>
+<div class="footer"><div>Generated: {datetime.now(timezone.utc).strftime("%d-%m-%Y %H:%M UTC")}</div><div>{dairy_name} | {dairy_phone}</div></div>
+</body></html>"""
+    return html
+
+
+def generate_thermal_bill_html(
+    farmer: Dict,
+    collections: List[Dict],
+    payments: List[Dict],
+    start_date: str,
+    end_date: str,
+    dairy_name: str = "Nirbani Dairy",
+    dairy_phone: str = ""
+) -> str:
+    """Generate 58mm thermal printer bill for a farmer"""
+    total_milk = sum(c["quantity"] for c in collections)
+    total_amount = sum(c["amount"] for c in collections)
+    total_paid = sum(p["amount"] for p in payments)
+    balance = total_amount - total_paid
+    
+    rows = ""
+    for c in collections:
+        shift = "AM" if c["shift"] == "morning" else "PM"
+        rows += f"<tr><td>{c['date'][5:]}</td><td>{shift}</td><td>{c['quantity']}</td><td>{c['fat']}</td><td>{c['rate']}</td><td style='text-align:right'>{c['amount']:.0f}</td></tr>\n"
+    
+    pay_rows = ""
+    for p in payments:
+        pay_rows += f"<tr><td>{p['date'][5:]}</td><td>{p['payment_mode']}</td><td style='text-align:right'>{p['amount']:.0f}</td></tr>\n"
+    
+    html = f"""<!DOCTYPE html><html><head><meta charset="utf-8"><meta name="viewport" content="width=58mm">
+<style>
+*{{margin:0;padding:0;box-sizing:border-box}}
+body{{font-family:'Courier New',monospace;font-size:11px;width:58mm;padding:2mm;color:#000}}
+.center{{text-align:center}}.bold{{font-weight:bold}}.line{{border-top:1px dashed #000;margin:3px 0}}
+table{{width:100%;border-collapse:collapse}}
+td,th{{padding:1px 2px;font-size:10px;vertical-align:top}}
+th{{text-align:left;border-bottom:1px solid #000}}
+.right{{text-align:right}}.big{{font-size:14px}}
+@media print{{@page{{size:58mm auto;margin:0}}body{{width:58mm}}}}
+</style></head><body>
+<div class="center bold big">{dairy_name}</div>
+<div class="center" style="font-size:9px">{dairy_phone}</div>
+<div class="line"></div>
+<div class="bold">{farmer['name']}</div>
+<div style="font-size:9px">Ph: {farmer['phone']}</div>
+<div style="font-size:9px">{start_date} to {end_date}</div>
+<div class="line"></div>
+<table><tr><th>Date</th><th>S</th><th>Qty</th><th>Fat</th><th>Rate</th><th class="right">Amt</th></tr>
+{rows}</table>
+<div class="line"></div>
+<table>
+<tr><td class="bold">Total Milk:</td><td class="right bold">{total_milk:.1f} L</td></tr>
+<tr><td class="bold">Total Amt:</td><td class="right bold">Rs.{total_amount:.0f}</td></tr>
+<tr><td class="bold">Paid:</td><td class="right bold">Rs.{total_paid:.0f}</td></tr>
+<tr><td class="bold">Balance:</td><td class="right bold">Rs.{balance:.0f}</td></tr>
+</table>
+{f'<div class="line"></div><div class="bold" style="font-size:9px">Payments:</div><table><tr><th>Date</th><th>Mode</th><th class="right">Amt</th></tr>{pay_rows}</table>' if payments else ''}
+<div class="line"></div>
+<div class="center" style="font-size:9px;margin-top:3px">Thank You / धन्यवाद</div>
+<div class="center" style="font-size:8px">Printed: {datetime.now(timezone.utc).strftime("%d-%m-%Y %H:%M")}</div>
+</body></html>"""
+    return html
+
+
+def generate_farmer_invoice_html(
+    farmer: Dict,
+    collections: List[Dict],
+    payments: List[Dict],
+    start_date: str,
+    end_date: str,
+    dairy_name: str = "Nirbani Dairy",
+    dairy_phone: str = "",
+    dairy_address: str = ""
+) -> str:
+    """Generate A4 invoice for a farmer"""
+    total_milk = sum(c["quantity"] for c in collections)
+    total_amount = sum(c["amount"] for c in collections)
+    avg_fat = sum(c["fat"] * c["quantity"] for c in collections) / total_milk if total_milk > 0 else 0
+    avg_snf = sum(c["snf"] * c["quantity"] for c in collections) / total_milk if total_milk > 0 else 0
+    total_paid = sum(p["amount"] for p in payments)
+    balance = total_amount - total_paid
+    invoice_no = f"INV-{farmer['id'][:8].upper()}-{datetime.now(timezone.utc).strftime('%Y%m%d')}"
+    
+    coll_rows = ""
+    for i, c in enumerate(collections, 1):
+        shift_label = "Morning / सुबह" if c["shift"] == "morning" else "Evening / शाम"
+        coll_rows += f"""<tr><td>{i}</td><td>{c['date']}</td><td>{shift_label}</td><td>{c['quantity']:.1f}</td><td>{c['fat']:.1f}</td><td>{c['snf']:.1f}</td><td>{c['rate']:.2f}</td><td class="right">{c['amount']:.2f}</td></tr>"""
+    
+    pay_rows = ""
+    for p in payments:
+        mode = p.get("payment_mode", "cash").upper()
+        pay_rows += f"<tr><td>{p['date']}</td><td>{mode}</td><td>{p.get('notes','')}</td><td class='right'>{p['amount']:.2f}</td></tr>"
+    
+    html = f"""<!DOCTYPE html><html><head><meta charset="utf-8">
+<style>
+*{{margin:0;padding:0;box-sizing:border-box}}
+body{{font-family:'Segoe UI',Arial,sans-serif;font-size:12px;color:#1a1a1a;padding:15mm 20mm;max-width:210mm}}
+.header{{display:flex;justify-content:space-between;align-items:flex-start;border-bottom:3px solid #15803d;padding-bottom:12px;margin-bottom:15px}}
+.dairy-name{{font-size:24px;font-weight:bold;color:#15803d}}.dairy-info{{font-size:10px;color:#666;margin-top:4px}}
+.invoice-box{{text-align:right}}.invoice-title{{font-size:20px;color:#15803d;font-weight:bold}}.invoice-no{{font-size:11px;color:#666;margin-top:2px}}
+.info-grid{{display:grid;grid-template-columns:1fr 1fr;gap:15px;margin-bottom:15px}}
+.info-card{{background:#f8faf8;border:1px solid #e5e7eb;border-radius:6px;padding:10px}}
+.info-label{{font-size:9px;color:#888;text-transform:uppercase;letter-spacing:0.5px}}.info-value{{font-size:13px;font-weight:600;margin-top:2px}}
+table{{width:100%;border-collapse:collapse;margin-bottom:15px}}
+th{{background:#15803d;color:white;padding:6px 8px;text-align:left;font-size:10px;text-transform:uppercase}}
+td{{padding:5px 8px;border-bottom:1px solid #eee;font-size:11px}}.right{{text-align:right}}
+tr:nth-child(even){{background:#f9fafb}}
+.summary-grid{{display:grid;grid-template-columns:1fr 1fr 1fr 1fr;gap:10px;margin:15px 0}}
+.summary-box{{background:#f0fdf4;border:1px solid #bbf7d0;border-radius:6px;padding:10px;text-align:center}}
+.summary-box.due{{background:#fef2f2;border-color:#fecaca}}
+.summary-label{{font-size:9px;color:#666;text-transform:uppercase}}.summary-value{{font-size:18px;font-weight:bold;color:#15803d;margin-top:2px}}
+.summary-box.due .summary-value{{color:#dc2626}}
+.footer{{margin-top:20px;border-top:2px solid #15803d;padding-top:10px;display:flex;justify-content:space-between;font-size:10px;color:#666}}
+.sig-box{{border-top:1px solid #333;width:150px;text-align:center;padding-top:5px;margin-top:40px;font-size:10px}}
+h3{{color:#15803d;font-size:13px;margin-bottom:8px;padding-bottom:4px;border-bottom:1px solid #d1fae5}}
+@media print{{@page{{size:A4;margin:10mm}}body{{padding:0}}}}
+</style></head><body>
+<div class="header">
+  <div><div class="dairy-name">{dairy_name}</div><div class="dairy-info">{dairy_address}<br>{dairy_phone}</div></div>
+  <div class="invoice-box"><div class="invoice-title">INVOICE / बिल</div><div class="invoice-no">{invoice_no}</div><div class="invoice-no">{start_date} to {end_date}</div></div>
+</div>
+<div class="info-grid">
+  <div class="info-card"><div class="info-label">Farmer / किसान</div><div class="info-value">{farmer['name']}</div><div style="font-size:10px;color:#666">Ph: {farmer['phone']}{f" | Village: {farmer.get('village','')}" if farmer.get('village') else ''}</div></div>
+  <div class="info-card"><div class="info-label">Account / Bank</div><div class="info-value">{farmer.get('bank_account','N/A')}</div><div style="font-size:10px;color:#666">IFSC: {farmer.get('ifsc_code','N/A')}</div></div>
+</div>
+<div class="summary-grid">
+  <div class="summary-box"><div class="summary-label">Total Milk / कुल दूध</div><div class="summary-value">{total_milk:.1f} L</div></div>
+  <div class="summary-box"><div class="summary-label">Avg Fat / औसत फैट</div><div class="summary-value">{avg_fat:.1f}%</div></div>
+  <div class="summary-box"><div class="summary-label">Total Amount / कुल राशि</div><div class="summary-value">₹{total_amount:.0f}</div></div>
+  <div class="summary-box {'due' if balance > 0 else ''}"><div class="summary-label">Balance / बकाया</div><div class="summary-value">₹{balance:.0f}</div></div>
+</div>
+<h3>Milk Collection Details / दूध संग्रह विवरण</h3>
+<table><tr><th>#</th><th>Date</th><th>Shift / पाली</th><th>Qty (L)</th><th>Fat %</th><th>SNF %</th><th>Rate ₹/L</th><th class="right">Amount ₹</th></tr>
+{coll_rows}
+<tr style="background:#15803d;color:white;font-weight:bold"><td colspan="3">TOTAL</td><td>{total_milk:.1f}</td><td>{avg_fat:.1f}</td><td>{avg_snf:.1f}</td><td></td><td class="right">₹{total_amount:.2f}</td></tr>
+</table>
+{f'<h3>Payments / भुगतान</h3><table><tr><th>Date</th><th>Mode</th><th>Notes</th><th class="right">Amount ₹</th></tr>{pay_rows}<tr style="background:#15803d;color:white;font-weight:bold"><td colspan="3">TOTAL PAID</td><td class="right">₹{total_paid:.2f}</td></tr></table>' if payments else ''}
+<div style="display:flex;justify-content:flex-end;gap:40px;margin-top:30px">
+  <div class="sig-box">Dairy Stamp / डेयरी मुहर</div>
+  <div class="sig-box">Authorized Signature / हस्ताक्षर</div>
+</div>
+<div class="footer"><div>Generated: {datetime.now(timezone.utc).strftime("%d-%m-%Y %H:%M UTC")}</div><div>{dairy_name} | {dairy_phone}</div></div>
+</body></html>"""
+    return html
+
+
+def generate_dispatch_bill_html(
+    dispatch: Dict,
+    dairy_name: str = "Nirbani Dairy",
+    dairy_phone: str = "",
+    dairy_address: str = ""
+) -> str:
+    """Generate printable bill for a tanker dispatch"""
+    d = dispatch
+    ded_rows = ""
+    for ded in d.get("deductions", []):
+        ded_rows += f"<tr><td>{ded['type'].replace('_',' ').title()}</td><td class='right'>-₹{ded['amount']:.2f}</td></tr>"
+    slip_section = ""
+    if d.get("slip_matched"):
+        slip_section = f"""<h3>Dairy Slip Comparison / डेयरी स्लिप तुलना</h3>
+        <table><tr><th></th><th>Your / आपका</th><th>Dairy Slip / डेयरी स्लिप</th><th>Diff / अंतर</th></tr>
+        <tr><td>FAT %</td><td>{d['avg_fat']}</td><td>{d.get('slip_fat','N/A')}</td><td>{d.get('fat_difference',0)}</td></tr>
+        <tr><td>Amount / राशि</td><td>₹{d['net_receivable']:.2f}</td><td>₹{d.get('slip_amount',0):.2f}</td><td>₹{d.get('amount_difference',0):.2f}</td></tr></table>"""
+    html = f"""<!DOCTYPE html><html><head><meta charset="utf-8"><style>
+*{{margin:0;padding:0;box-sizing:border-box}}body{{font-family:'Segoe UI',Arial,sans-serif;font-size:12px;color:#1a1a1a;padding:15mm 20mm;max-width:210mm}}
+.header{{display:flex;justify-content:space-between;align-items:flex-start;border-bottom:3px solid #15803d;padding-bottom:12px;margin-bottom:15px}}
+.dairy-name{{font-size:24px;font-weight:bold;color:#15803d}}.dairy-info{{font-size:10px;color:#666;margin-top:4px}}
+.invoice-box{{text-align:right}}.invoice-title{{font-size:20px;color:#15803d;font-weight:bold}}
+.info-grid{{display:grid;grid-template-columns:1fr 1fr;gap:15px;margin-bottom:15px}}
+.info-card{{background:#f8faf8;border:1px solid #e5e7eb;border-radius:6px;padding:10px}}
+.info-label{{font-size:9px;color:#888;text-transform:uppercase}}.info-value{{font-size:13px;font-weight:600;margin-top:2px}}
+table{{width:100%;border-collapse:collapse;margin-bottom:15px}}
+th{{background:#15803d;color:white;padding:6px 8px;text-align:left;font-size:10px}}td{{padding:5px 8px;border-bottom:1px solid #eee;font-size:11px}}.right{{text-align:right}}
+.summary-grid{{display:grid;grid-template-columns:1fr 1fr 1fr 1fr;gap:10px;margin:15px 0}}
+.summary-box{{background:#f0fdf4;border:1px solid #bbf7d0;border-radius:6px;padding:10px;text-align:center}}
+.summary-label{{font-size:9px;color:#666;text-transform:uppercase}}.summary-value{{font-size:18px;font-weight:bold;color:#15803d;margin-top:2px}}
+h3{{color:#15803d;font-size:13px;margin:12px 0 8px;padding-bottom:4px;border-bottom:1px solid #d1fae5}}
+.sig-box{{border-top:1px solid #333;width:150px;text-align:center;padding-top:5px;margin-top:40px;font-size:10px}}
+@media print{{@page{{size:A4;margin:10mm}}body{{padding:0}}}}
+</style></head><body>
+<div class="header"><div><div class="dairy-name">{dairy_name}</div><div class="dairy-info">{dairy_address}<br>{dairy_phone}</div></div>
+<div class="invoice-box"><div class="invoice-title">DISPATCH BILL / डिस्पैच बिल</div><div style="font-size:11px;color:#666;margin-top:2px">{d['date']}</div></div></div>
+<div class="info-grid">
+<div class="info-card"><div class="info-label">Dairy Plant / डेयरी प्लांट</div><div class="info-value">{d['dairy_plant_name']}</div></div>
+<div class="info-card"><div class="info-label">Tanker / टैंकर</div><div class="info-value">{d.get('tanker_number','N/A')}</div></div>
+</div>
+<div class="summary-grid">
+<div class="summary-box"><div class="summary-label">Quantity / मात्रा</div><div class="summary-value">{d['quantity_kg']} KG</div></div>
+<div class="summary-box"><div class="summary-label">FAT %</div><div class="summary-value">{d['avg_fat']}%</div></div>
+<div class="summary-box"><div class="summary-label">SNF %</div><div class="summary-value">{d['avg_snf']}%</div></div>
+<div class="summary-box"><div class="summary-label">Rate / दर</div><div class="summary-value">₹{d['rate_per_kg']}/KG</div></div>
+</div>
+<h3>Amount Calculation / राशि गणना</h3>
+<table><tr><td>Gross Amount / कुल राशि</td><td class="right" style="font-weight:bold">₹{d['gross_amount']:.2f}</td></tr>
+{ded_rows}
+<tr style="background:#15803d;color:white;font-weight:bold"><td>Net Receivable / शुद्ध प्राप्य</td><td class="right">₹{d['net_receivable']:.2f}</td></tr></table>
+{slip_section}
+<div style="display:flex;justify-content:flex-end;gap:40px;margin-top:30px">
+<div class="sig-box">Dairy Stamp / डेयरी मुहर</div><div class="sig-box">Signature / हस्ताक्षर</div></div>
+</body></html>"""
+    return html
+
+
+def generate_dairy_statement_html(
+    plant: Dict,
+    dispatches: List[Dict],
+    payments: List[Dict],
+    start_date: str,
+    end_date: str,
+    dairy_name: str = "Nirbani Dairy",
+    dairy_phone: str = "",
+    dairy_address: str = ""
+) -> str:
+    """Generate account statement for a dairy plant"""
+    total_supplied = sum(d["quantity_kg"] for d in dispatches)
+    total_amount = sum(d["net_receivable"] for d in dispatches)
+    total_paid = sum(p["amount"] for p in payments)
+    balance = total_amount - total_paid
+    disp_rows = ""
+    for i, d in enumerate(dispatches, 1):
+        disp_rows += f"<tr><td>{i}</td><td>{d['date']}</td><td>{d.get('tanker_number','')}</td><td>{d['quantity_kg']}</td><td>{d['avg_fat']}%</td><td>₹{d['rate_per_kg']}</td><td class='right'>-₹{d['total_deduction']:.0f}</td><td class='right'>₹{d['net_receivable']:.2f}</td></tr>"
+    pay_rows = ""
+    for p in payments:
+        pay_rows += f"<tr><td>{p['date']}</td><td>{p['payment_mode'].upper()}</td><td>{p.get('reference_number','')}</td><td class='right'>₹{p['amount']:.2f}</td></tr>"
+    html = f"""<!DOCTYPE html><html><head><meta charset="utf-8"><style>
+*{{margin:0;padding:0;box-sizing:border-box}}body{{font-family:'Segoe UI',Arial,sans-serif;font-size:12px;color:#1a1a1a;padding:15mm 20mm;max-width:210mm}}
+.header{{display:flex;justify-content:space-between;align-items:flex-start;border-bottom:3px solid #15803d;padding-bottom:12px;margin-bottom:15px}}
+.dairy-name{{font-size:24px;font-weight:bold;color:#15803d}}.dairy-info{{font-size:10px;color:#666;margin-top:4px}}
+.invoice-box{{text-align:right}}.invoice-title{{font-size:20px;color:#15803d;font-weight:bold}}
+.info-card{{background:#f8faf8;border:1px solid #e5e7eb;border-radius:6px;padding:10px;margin-bottom:15px}}
+.info-label{{font-size:9px;color:#888;text-transform:uppercase}}.info-value{{font-size:13px;font-weight:600;margin-top:2px}}
+table{{width:100%;border-collapse:collapse;margin-bottom:15px}}
+th{{background:#15803d;color:white;padding:6px 8px;text-align:left;font-size:10px}}td{{padding:5px 8px;border-bottom:1px solid #eee;font-size:11px}}.right{{text-align:right}}
+.summary-grid{{display:grid;grid-template-columns:1fr 1fr 1fr 1fr;gap:10px;margin:15px 0}}
+.summary-box{{background:#f0fdf4;border:1px solid #bbf7d0;border-radius:6px;padding:10px;text-align:center}}
+.summary-box.due{{background:#fef2f2;border-color:#fecaca}}
+.summary-label{{font-size:9px;color:#666;text-transform:uppercase}}.summary-value{{font-size:18px;font-weight:bold;color:#15803d;margin-top:2px}}
+.summary-box.due .summary-value{{color:#dc2626}}
+h3{{color:#15803d;font-size:13px;margin:12px 0 8px;padding-bottom:4px;border-bottom:1px solid #d1fae5}}
+.sig-box{{border-top:1px solid #333;width:150px;text-align:center;padding-top:5px;margin-top:40px;font-size:10px}}
+@media print{{@page{{size:A4;margin:10mm}}body{{padding:0}}}}
+</style></head><body>
+<div class="header"><div><div class="dairy-name">{dairy_name}</div><div class="dairy-info">{dairy_address}<br>{dairy_phone}</div></div>
+<div class="invoice-box"><div class="invoice-title">DAIRY STATEMENT / डेयरी विवरण</div><div style="font-size:11px;color:#666;margin-top:2px">{start_date} to {end_date}</div></div></div>
+<div class="info-card"><div class="info-label">Dairy Plant / डेयरी प्लांट</div><div class="info-value">{plant['name']}</div>
+<div style="font-size:10px;color:#666">{plant.get('address','')}{f" | Ph: {plant.get('phone','')}" if plant.get('phone') else ''}</div></div>
+<div class="summary-grid">
+<div class="summary-box"><div class="summary-label">Total Supplied / कुल आपूर्ति</div><div class="summary-value">{total_supplied:.1f} KG</div></div>
+<div class="summary-box"><div class="summary-label">Total Amount / कुल राशि</div><div class="summary-value">₹{total_amount:.0f}</div></div>
+<div class="summary-box"><div class="summary-label">Total Paid / कुल भुगतान</div><div class="summary-value">₹{total_paid:.0f}</div></div>
+<div class="summary-box {'due' if balance > 0 else ''}"><div class="summary-label">Balance / बकाया</div><div class="summary-value">₹{balance:.0f}</div></div>
+</div>
+<h3>Dispatch Details / डिस्पैच विवरण</h3>
+<table><tr><th>#</th><th>Date</th><th>Tanker</th><th>Qty KG</th><th>FAT</th><th>Rate</th><th class="right">Deductions</th><th class="right">Net ₹</th></tr>
+{disp_rows}
+<tr style="background:#15803d;color:white;font-weight:bold"><td colspan="3">TOTAL</td><td>{total_supplied:.1f}</td><td></td><td></td><td></td><td class="right">₹{total_amount:.2f}</td></tr></table>
+{f'<h3>Payments / भुगतान</h3><table><tr><th>Date</th><th>Mode</th><th>Reference</th><th class="right">Amount ₹</th></tr>{pay_rows}<tr style="background:#15803d;color:white;font-weight:bold"><td colspan="3">TOTAL PAID</td><td class="right">₹{total_paid:.2f}</td></tr></table>' if payments else ''}
+<div style="display:flex;justify-content:flex-end;gap:40px;margin-top:30px">
+<div class="sig-box">Dairy Stamp / डेयरी मुहर</div><div class="sig-box">Signature / हस्ताक्षर</div></div>
+</body></html>"""
+    return html
@@ -0,0 +1,148 @@
+"""
+Cache Invalidation Bus for Nirbani Dairy
+When the backend runs as several worker processes, each keeps its own
+in-memory caches. Writes publish a small message to a capped collection;
+every other worker picks it up and evicts the same entries (and forwards
+live dashboard events to its own SSE clients).
+
+Messages are read with a change stream when MongoDB is a replica set
+(a single-node one is enough) and by tailing the capped collection otherwise.
+"""
+import asyncio
+import logging
+import os
+import uuid
+from datetime import datetime, timezone
+from typing import Callable, Dict, Optional
+
+from pymongo import CursorType
+from pymongo.errors import CollectionInvalid, PyMongoError
+
+logger = logging.getLogger(__name__)
+
+BUS_COLLECTION = "cache_bus"
+BUS_SIZE_BYTES = 16 * 1024 * 1024
+RETRY_DELAY = 1.0
+
+
+class CacheBus:
+    """Cross-process broadcast of cache invalidations"""
+
+    def __init__(self, db, collection: str = BUS_COLLECTION, size_bytes: int = BUS_SIZE_BYTES):
+        self.db = db
+        self.collection_name = collection
+        self.size_bytes = size_bytes
+        self.origin = f"{os.getpid()}-{uuid.uuid4().hex[:8]}"
+        self.mode: Optional[str] = None
+        self._handlers: Dict[str, Callable[[dict], None]] = {}
+        self._listener: Optional[asyncio.Task] = None
+        self._pending = set()
+        self.sent = 0
+        self.received = 0
+        self.send_errors = 0
+
+    @property
+    def collection(self):
+        return self.db[self.collection_name]
+
+    def on(self, kind: str, handler: Callable[[dict], None]):
+        """Run handler(payload) for messages of this kind from other workers"""
+        self._handlers[kind] = handler
+
+    def publish(self, kind: str, payload: dict):
+        """Broadcast to the other workers; the caller has already updated its own caches"""
+        if self._listener is None:
+            return
+        message = {
+            "origin": self.origin,
+            "kind": kind,
+            "payload": payload,
+            "ts": datetime.now(timezone.utc)
+        }
+        task = asyncio.get_running_loop().create_task(self._send(message))
+        self._pending.add(task)
+        task.add_done_callback(self._pending.discard)
+
+    async def _send(self, message: dict):
+        try:
+            await self.collection.insert_one(message)
+            self.sent += 1
+        except PyMongoError as e:
+            self.send_errors += 1
+            logger.warning(f"Cache bus publish failed ({message['kind']}): {e}")
+
+    async def start(self, change_streams: bool):
+        try:
+            await self.db.create_collection(self.collection_name, capped=True, size=self.size_bytes)
+        except CollectionInvalid:
+            pass  # another worker created it first
+        self.mode = "change_stream" if change_streams else "tailing"
+        listen = self._watch if change_streams else self._tail
+        self._listener = asyncio.get_running_loop().create_task(listen())
+        logger.info(f"Cache bus listening via {self.mode}")
+
+    async def stop(self):
+        if self._pending:
+            await asyncio.gather(*self._pending, return_exceptions=True)
+        if self._listener:
+            self._listener.cancel()
+            try:
+                await self._listener
+            except asyncio.CancelledError:
+                pass
+            self._listener = None
+
+    def _dispatch(self, message: dict):
+        if message.get("origin") == self.origin:
+            return
+        handler = self._handlers.get(message.get("kind"))
+        if handler is None:
+            return
+        self.received += 1
+        try:
+            handler(message.get("payload") or {})
+        except Exception as e:
+            logger.warning(f"Cache bus handler for {message.get('kind')} failed: {e}")
+
+    async def _watch(self):
+        resume_token = None
+        pipeline = [{"$match": {"operationType": "insert"}}]
+        while True:
+            try:
+                async with self.collection.watch(pipeline, resume_after=resume_token) as stream:
+                    async for change in stream:
+                        resume_token = stream.resume_token
+                        self._dispatch(change["fullDocument"])
+            except asyncio.CancelledError:
+                raise
+            except PyMongoError as e:
+                logger.warning(f"Cache bus change stream interrupted: {e}")
+                await asyncio.sleep(RETRY_DELAY)
+
+    async def _tail(self):
+        # Start after the newest message so a restarting worker doesn't replay history
+        last = await self.collection.find_one({}, sort=[("$natural", -1)])
+        last_id = last["_id"] if last else None
+        while True:
+            try:
+                query = {"_id": {"$gt": last_id}} if last_id else {}
+                cursor = self.collection.find(query, cursor_type=CursorType.TAILABLE_AWAIT)
+                while cursor.alive:
+                    async for message in cursor:
+                        last_id = message["_id"]
+                        self._dispatch(message)
+                    await asyncio.sleep(0.1)
+            except asyncio.CancelledError:
+                raise
+            except PyMongoError as e:
+                logger.warning(f"Cache bus tailing interrupted: {e}")
+            # Tailable cursors die on an empty collection; wait and reopen
+            await asyncio.sleep(RETRY_DELAY)
+
+    def stats(self) -> dict:
+        return {
+            "mode": self.mode,
+            "sent": self.sent,
+            "received": self.received,
+            "send_errors": self.send_errors
+        }
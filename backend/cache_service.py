@@ -0,0 +1,252 @@
+"""
+In-process Cache Service for Nirbani Dairy
+Keeps rarely changing reference data (farmer rate fields, default rate chart,
+settings, products, branches, dairy plants) in memory so the write path and
+the bill routes don't re-read it on every request
+"""
+import asyncio
+import logging
+import os
+from collections import OrderedDict
+from typing import Dict, Iterable, List, Optional
+
+logger = logging.getLogger(__name__)
+
+# Only fields that never change as a side effect of collections or payments.
+# Balances and totals are deliberately excluded so they are always read from the database.
+FARMER_STATIC_FIELDS = (
+    "id", "name", "phone", "village", "address", "milk_type",
+    "fixed_rate", "cow_rate", "buffalo_rate", "bank_account", "ifsc_code", "is_active"
+)
+FARMER_CACHE_SIZE = int(os.environ.get("FARMER_CACHE_SIZE", "50000"))
+
+
+class FarmerCache:
+    """
+    Static farmer fields keyed by farmer id and phone, least recently used
+    dropped first. A load that an invalidation overtook is returned but not
+    kept, as in ReferenceCache.
+    """
+
+    def __init__(self, max_size: int = FARMER_CACHE_SIZE):
+        self.max_size = max_size
+        self._by_id: "OrderedDict[str, dict]" = OrderedDict()
+        self._by_phone: Dict[str, str] = {}
+        # Bumped by every invalidation
+        self._version = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def _remember(self, farmer: dict):
+        self._by_id[farmer["id"]] = farmer
+        self._by_id.move_to_end(farmer["id"])
+        if farmer.get("phone"):
+            self._by_phone[farmer["phone"]] = farmer["id"]
+        while len(self._by_id) > self.max_size:
+            _, evicted = self._by_id.popitem(last=False)
+            self._forget_phone(evicted)
+            self.evictions += 1
+
+    def _forget_phone(self, farmer: dict):
+        if self._by_phone.get(farmer.get("phone")) == farmer["id"]:
+            del self._by_phone[farmer["phone"]]
+
+    async def _load(self, db, query: dict) -> Optional[dict]:
+        self.misses += 1
+        projection = {field: 1 for field in FARMER_STATIC_FIELDS}
+        projection["_id"] = 0
+        version = self._version
+        farmer = await db.farmers.find_one(query, projection)
+        if farmer and self._version == version:
+            self._remember(farmer)
+        return farmer
+
+    async def get(self, db, farmer_id: str) -> Optional[dict]:
+        """Return static fields for a farmer, loading from the database on a miss"""
+        farmer = self._by_id.get(farmer_id)
+        if farmer is not None:
+            self.hits += 1
+            self._by_id.move_to_end(farmer_id)
+            return farmer
+        return await self._load(db, {"id": farmer_id})
+
+    async def get_by_phone(self, db, phone: str) -> Optional[dict]:
+        """Same as get, by phone number (bulk uploads identify farmers by phone)"""
+        farmer_id = self._by_phone.get(phone)
+        if farmer_id is not None and farmer_id in self._by_id:
+            self.hits += 1
+            self._by_id.move_to_end(farmer_id)
+            return self._by_id[farmer_id]
+        return await self._load(db, {"phone": phone})
+
+    async def get_many(self, db, farmer_ids: Iterable[str]) -> Dict[str, dict]:
+        """Static fields of several farmers, misses loaded with one query"""
+        found, missing = {}, []
+        for farmer_id in set(farmer_ids):
+            farmer = self._by_id.get(farmer_id)
+            if farmer is None:
+                missing.append(farmer_id)
+                continue
+            self.hits += 1
+            self._by_id.move_to_end(farmer_id)
+            found[farmer_id] = farmer
+        if missing:
+            self.misses += len(missing)
+            projection = {field: 1 for field in FARMER_STATIC_FIELDS}
+            projection["_id"] = 0
+            version = self._version
+            async for farmer in db.farmers.find({"id": {"$in": missing}}, projection):
+                found[farmer["id"]] = farmer
+            if self._version == version:
+                for farmer_id in missing:
+                    if farmer_id in found:
+                        self._remember(found[farmer_id])
+        return found
+
+    def invalidate(self, farmer_id: Optional[str] = None):
+        """Drop one farmer, or everything when no id is given"""
+        self._version += 1
+        if farmer_id is None:
+            self._by_id.clear()
+            self._by_phone.clear()
+            return
+        farmer = self._by_id.pop(farmer_id, None)
+        if farmer is not None:
+            self._forget_phone(farmer)
+
+    def stats(self) -> dict:
+        return {
+            "hits": self.hits, "misses": self.misses, "evictions": self.evictions,
+            "size": len(self._by_id), "max_size": self.max_size
+        }
+
+
+class RateChartCache:
+    """Entries of the default rate chart; a load an invalidation overtook isn't kept"""
+
+    def __init__(self):
+        self._entries: Optional[List[dict]] = None
+        self._loaded = False
+        self._version = 0
+
+    async def entries(self, db) -> Optional[List[dict]]:
+        if self._loaded:
+            return self._entries
+        version = self._version
+        chart = await db.rate_charts.find_one({"is_default": True}, {"_id": 0, "entries": 1})
+        entries = (chart or {}).get("entries")
+        if self._version == version:
+            self._entries = entries
+            self._loaded = True
+        return entries
+
+    def invalidate(self):
+        self._version += 1
+        self._entries = None
+        self._loaded = False
+
+
+# name -> (collection, key field, cached fields or None for the whole document).
+# Fields other writes move (product stock, plant totals) are left out, so they
+# are always read from the database.
+REFERENCE_COLLECTIONS = {
+    "settings": ("settings", "type", None),
+    "products": ("products", "id", ("id", "name", "unit", "min_stock", "rate")),
+    "branches": ("branches", "id", None),
+    "dairy_plants": ("dairy_plants", "id", ("id", "name", "code", "address", "phone", "contact_person", "is_active")),
+}
+REFERENCE_LIMIT = 1000
+
+
+class ReferenceSnapshot:
+    """The reference tables as they were when the snapshot was taken"""
+
+    def __init__(self, tables: Dict[str, Dict[str, dict]]):
+        self._tables = tables
+
+    def get(self, name: str, key: str) -> Optional[dict]:
+        return self._tables[name].get(key)
+
+    def all(self, name: str) -> List[dict]:
+        return list(self._tables[name].values())
+
+    def settings(self, settings_type: str = "dairy_info") -> dict:
+        return self._tables["settings"].get(settings_type) or {}
+
+
+class ReferenceCache:
+    """
+    Whole reference collections, read through on first use and dropped by
+    their write handlers. A table is replaced rather than edited, so a
+    snapshot taken before an invalidation keeps seeing the old one. Cached
+    documents are shared; treat them as read-only.
+    """
+
+    def __init__(self):
+        self._tables: Dict[str, Dict[str, dict]] = {}
+        self._versions: Dict[str, int] = dict.fromkeys(REFERENCE_COLLECTIONS, 0)
+        self._locks: Dict[str, asyncio.Lock] = {}
+        self.hits = 0
+        self.loads = 0
+
+    async def table(self, db, name: str) -> Dict[str, dict]:
+        """Documents of one reference collection keyed by id (settings by type)"""
+        table = self._tables.get(name)
+        if table is not None:
+            self.hits += 1
+            return table
+        lock = self._locks.setdefault(name, asyncio.Lock())
+        async with lock:
+            table = self._tables.get(name)
+            if table is not None:
+                self.hits += 1
+                return table
+            version = self._versions[name]
+            collection, key, fields = REFERENCE_COLLECTIONS[name]
+            projection = {field: 1 for field in fields} if fields else {}
+            projection["_id"] = 0
+            docs = await db[collection].find({}, projection).to_list(REFERENCE_LIMIT)
+            if len(docs) >= REFERENCE_LIMIT:
+                logger.warning(f"Reference collection {collection} has {REFERENCE_LIMIT}+ documents; only the first are cached")
+            table = {doc[key]: doc for doc in docs if doc.get(key)}
+            self.loads += 1
+            # An invalidation during the read means this copy may already be stale
+            if self._versions[name] == version:
+                self._tables[name] = table
+            return table
+
+    async def get(self, db, name: str, key: str) -> Optional[dict]:
+        return (await self.table(db, name)).get(key)
+
+    async def find(self, db, table: str, **fields) -> Optional[dict]:
+        """First document whose fields equal the given values"""
+        for doc in (await self.table(db, table)).values():
+            if all(doc.get(field) == value for field, value in fields.items()):
+                return doc
+        return None
+
+    async def settings(self, db, settings_type: str = "dairy_info") -> dict:
+        return await self.get(db, "settings", settings_type) or {}
+
+    async def snapshot(self, db, names: Iterable[str] = REFERENCE_COLLECTIONS) -> ReferenceSnapshot:
+        """One consistent view of the given tables for the length of a request"""
+        return ReferenceSnapshot({name: await self.table(db, name) for name in names})
+
+    async def warm(self, db):
+        for name in REFERENCE_COLLECTIONS:
+            await self.table(db, name)
+
+    def invalidate(self, name: Optional[str] = None):
+        """Drop one table, or all of them when no name is given"""
+        for table in ([name] if name else list(REFERENCE_COLLECTIONS)):
+            self._versions[table] += 1
+            self._tables.pop(table, None)
+
+    def stats(self) -> dict:
+        return {"hits": self.hits, "loads": self.loads, "cached": sorted(self._tables)}
+
+
+farmer_cache = FarmerCache()
+rate_chart_cache = RateChartCache()
+reference_cache = ReferenceCache()
@@ -0,0 +1,684 @@
+"""
+Milk Collection Store for Nirbani Dairy
+Milk collections are an append-mostly stream of measurements (quantity, fat,
+SNF per farmer per shift) and by far the largest collection. COLLECTION_LAYOUT
+picks how they are stored:
+
+- documents (default): the existing milk_collections documents
+- timeseries: a MongoDB time-series collection, milk_collections_ts, with a
+  native datetime time field (the shift's hour on the entry date) and
+  farmer_id/branch_id as metadata, stored in compressed per-farmer buckets
+- compact: milk_collections_compact, schema version 2 of the document - the
+  date as an integer day number, rate and amount as int64 paise, created_at
+  as a native datetime (plus created_us for the microseconds BSON drops) and
+  no copy of the farmer's name, which is resolved from the farmer cache on
+  read. Entries made under an earlier name of the farmer, or of a deleted
+  farmer, keep that name (CompactCollection.keep_farmer_name)
+
+TimeSeriesCollection and CompactCollection keep the plain-document interface
+the handlers and services use: filters, projections, sorts and updates are
+rewritten to the stored fields, and documents read back (and documents entering
+an aggregation after its leading $match) have the plain fields again, so API
+responses don't change.
+
+    python collection_store.py migrate --layout compact   # copy milk_collections (resumable)
+    python collection_store.py verify --layout compact    # compare counts and sums with milk_collections
+
+Run the migration with the app stopped, verify, then set COLLECTION_LAYOUT.
+Months already moved to archives (archive_service) are copied too, so the
+layout's collection holds the whole history; the archival job leaves milk
+collections alone in the other layouts.
+milk_collections is left as it was, so going back is unsetting the variable
+(entries made in the meantime stay in the other collection). The time-series
+layout needs MongoDB 7.0+, which allows deletes by any field on time-series
+collections.
+"""
+import argparse
+import asyncio
+import heapq
+import os
+from datetime import date, datetime, timedelta, timezone
+from pathlib import Path
+from types import SimpleNamespace
+from typing import Any, Dict, List, Optional
+
+from bson import Int64, ObjectId
+
+from archive_service import ARCHIVED_COLLECTIONS, ARCHIVES_COLLECTION, ArchivedCollection, ArchiveState, archive_name
+from cache_service import farmer_cache
+
+COLLECTION_LAYOUT = os.environ.get("COLLECTION_LAYOUT", "documents").lower()
+UNIQUE_INDEX_NAME = "uniq_farmer_date_shift_type"
+TIMESERIES_COLLECTION = "milk_collections_ts"
+TIMESERIES_OPTIONS = {"timeField": "ts", "metaField": "meta", "granularity": "hours"}
+META_FIELDS = ("farmer_id", "branch_id")
+# Time of day stored for each shift, so a farmer's two entries of a day sort in order
+SHIFT_HOURS = {"morning": 6, "evening": 18}
+COMPACT_COLLECTION = "milk_collections_compact"
+SCHEMA_VERSION = 2
+MIGRATE_BATCH = 5000
+ONE_DAY = timedelta(days=1)
+EPOCH = datetime(1970, 1, 1, tzinfo=timezone.utc)
+EPOCH_ORDINAL = EPOCH.toordinal()
+MS_PER_DAY = Int64(86400000)
+
+
+def day_start(date_str: str) -> datetime:
+    return datetime.strptime(date_str, "%Y-%m-%d").replace(tzinfo=timezone.utc)
+
+
+# ==================== TIME-SERIES MAPPING ====================
+
+def to_measurement(doc: dict) -> dict:
+    """A milk_collections document as a time-series measurement"""
+    measurement = {key: value for key, value in doc.items() if key not in META_FIELDS and key != "date"}
+    measurement["meta"] = {field: doc[field] for field in META_FIELDS if field in doc}
+    measurement["ts"] = day_start(doc["date"]) + timedelta(hours=SHIFT_HOURS.get(doc.get("shift"), 0))
+    return measurement
+
+
+def from_measurement(measurement: dict) -> dict:
+    """Back to the milk_collections document shape"""
+    doc = dict(measurement)
+    doc.update(doc.pop("meta", None) or {})
+    ts = doc.pop("ts", None)
+    if ts is not None:
+        doc["date"] = ts.strftime("%Y-%m-%d")
+    return doc
+
+
+def translate_field(field: str) -> str:
+    if field in META_FIELDS:
+        return f"meta.{field}"
+    return "ts" if field == "date" else field
+
+
+def _ts_range(condition) -> dict:
+    """A date condition ("2024-01-05" or {"$gte": ..., "$lte": ...}) as a ts range"""
+    if isinstance(condition, str):
+        return {"$gte": day_start(condition), "$lt": day_start(condition) + ONE_DAY}
+    ts = {}
+    for op, value in condition.items():
+        if op == "$gte":
+            ts["$gte"] = day_start(value)
+        elif op == "$gt":
+            ts["$gte"] = day_start(value) + ONE_DAY
+        elif op == "$lte":
+            ts["$lt"] = day_start(value) + ONE_DAY
+        elif op == "$lt":
+            ts["$lt"] = day_start(value)
+        else:
+            raise ValueError(f"Unsupported date condition on the time-series layout: {op}")
+    return ts
+
+
+def translate_filter(query: Optional[dict]) -> dict:
+    """Rewrite a milk_collections filter for the time-series collection"""
+    out, extra = {}, []
+    for key, condition in (query or {}).items():
+        if key in ("$and", "$or", "$nor"):
+            out[key] = [translate_filter(clause) for clause in condition]
+        elif key == "date":
+            if isinstance(condition, dict) and "$in" in condition:
+                extra.append({"$or": [{"ts": _ts_range(date)} for date in condition["$in"]]})
+            else:
+                out["ts"] = _ts_range(condition)
+        else:
+            out[translate_field(key)] = condition
+    return {"$and": [out, *extra]} if extra else out
+
+
+def translate_projection(projection: Optional[dict]) -> Optional[dict]:
+    if not projection:
+        return projection
+    out = {}
+    for field, value in projection.items():
+        target = "meta" if field in META_FIELDS else translate_field(field)
+        out[target] = value
+    return out
+
+
+# Puts documents back in the plain shape inside aggregation pipelines
+FLATTEN_STAGE = {"$addFields": {
+    **{field: f"$meta.{field}" for field in META_FIELDS},
+    "date": {"$dateToString": {"format": "%Y-%m-%d", "date": "$ts"}},
+}}
+
+
+# ==================== COMPACT MAPPING ====================
+
+def day_number(date_str: str) -> int:
+    """"2024-01-05" as days since 1970-01-01"""
+    return date.fromisoformat(date_str[:10]).toordinal() - EPOCH_ORDINAL
+
+
+def day_string(day: int) -> str:
+    return date.fromordinal(day + EPOCH_ORDINAL).isoformat()
+
+
+def to_paise(amount) -> Int64:
+    return Int64(round(float(amount) * 100))
+
+
+def from_paise(paise: int) -> float:
+    return paise / 100
+
+
+def parse_timestamp(value) -> datetime:
+    return value if isinstance(value, datetime) else datetime.fromisoformat(value)
+
+
+def format_timestamp(value: datetime) -> str:
+    """Stored datetimes come back naive (UTC), written as the ISO strings the API always returned"""
+    if value.tzinfo is None:
+        value = value.replace(tzinfo=timezone.utc)
+    return value.isoformat()
+
+
+# Plain field: (stored field, to stored value, to plain value)
+COMPACT_FIELDS = {
+    "date": ("day", day_number, day_string),
+    "rate": ("rate_p", to_paise, from_paise),
+    "amount": ("amount_p", to_paise, from_paise),
+    "created_at": ("created_at", parse_timestamp, format_timestamp),
+}
+COMPACT_STORED = {stored: (field, decode) for field, (stored, _, decode) in COMPACT_FIELDS.items()}
+COMPARISONS = ("$eq", "$ne", "$gt", "$gte", "$lt", "$lte")
+
+
+def to_compact(doc: dict, current_name: Optional[str] = None) -> dict:
+    """
+    A milk_collections document in schema version 2. farmer_name is dropped
+    unless current_name is given and differs (the entry predates a rename)
+    """
+    stored = {"v": SCHEMA_VERSION}
+    for key, value in doc.items():
+        if key == "farmer_name":
+            if current_name is not None and value != current_name:
+                stored[key] = value
+            continue
+        if key in COMPACT_FIELDS and value is not None:
+            target, encode, _ = COMPACT_FIELDS[key]
+            stored[target] = encode(value)
+            if key == "created_at" and stored[target].microsecond % 1000:
+                # BSON datetimes keep milliseconds
+                stored["created_us"] = stored[target].microsecond % 1000
+        else:
+            stored[key] = value
+    return stored
+
+
+def from_compact(stored: dict, names: Dict[str, str]) -> dict:
+    """Back to the milk_collections document shape, farmer_name looked up in names"""
+    doc = {}
+    for key, value in stored.items():
+        if key == "created_at" and isinstance(value, datetime):
+            value = value.replace(microsecond=value.microsecond // 1000 * 1000 + stored.get("created_us", 0))
+        if key in COMPACT_STORED and value is not None:
+            field, decode = COMPACT_STORED[key]
+            doc[field] = decode(value)
+        elif key not in ("v", "created_us"):
+            doc[key] = value
+    # Entries of renamed or deleted farmers keep their name (see CompactCollection.keep_farmer_name)
+    if "farmer_id" in doc and "farmer_name" not in doc:
+        doc["farmer_name"] = names.get(doc["farmer_id"], "")
+    return doc
+
+
+def compact_field(field: str) -> str:
+    return COMPACT_FIELDS[field][0] if field in COMPACT_FIELDS else field
+
+
+def _compact_condition(field: str, condition):
+    encode = COMPACT_FIELDS[field][1]
+    if not isinstance(condition, dict):
+        return None if condition is None else encode(condition)
+    out = {}
+    for op, value in condition.items():
+        if op in ("$in", "$nin"):
+            out[op] = [None if item is None else encode(item) for item in value]
+        elif op in COMPARISONS:
+            out[op] = None if value is None else encode(value)
+        elif op == "$exists":
+            out[op] = value
+        else:
+            raise ValueError(f"Unsupported condition on {field} in the compact layout: {op}")
+    return out
+
+
+def compact_filter(query: Optional[dict]) -> dict:
+    """Rewrite a milk_collections filter for the compact collection"""
+    out = {}
+    for key, condition in (query or {}).items():
+        if key in ("$and", "$or", "$nor"):
+            out[key] = [compact_filter(clause) for clause in condition]
+        elif key in COMPACT_FIELDS:
+            out[compact_field(key)] = _compact_condition(key, condition)
+        elif key == "farmer_name":
+            raise ValueError("farmer_name is not stored in the compact layout, filter by farmer_id")
+        else:
+            out[key] = condition
+    return out
+
+
+def compact_projection(projection: Optional[dict]) -> Optional[dict]:
+    if not projection:
+        return projection
+    out = {}
+    for field, value in projection.items():
+        if field == "farmer_name":
+            # The name is resolved from farmer_id
+            out["farmer_id"] = out["farmer_name"] = value
+        elif field == "created_at":
+            out["created_at"] = out["created_us"] = value
+        else:
+            out[compact_field(field)] = value
+    return out
+
+
+COMPACT_FLATTEN_STAGE = {"$addFields": {
+    "date": {"$dateToString": {"format": "%Y-%m-%d", "date": {"$add": [EPOCH, {"$multiply": ["$day", MS_PER_DAY]}]}}},
+    "rate": {"$divide": ["$rate_p", 100]},
+    "amount": {"$divide": ["$amount_p", 100]},
+}}
+
+
+# ==================== STORED COLLECTIONS ====================
+
+class _Cursor:
+    """Motor cursor whose documents come back in the plain shape"""
+
+    def __init__(self, store, cursor):
+        self._store = store
+        self._cursor = cursor
+
+    def sort(self, key, direction=None):
+        self._cursor = self._cursor.sort(self._store.translate_sort(key, direction))
+        return self
+
+    def skip(self, count: int):
+        self._cursor = self._cursor.skip(count)
+        return self
+
+    def limit(self, count: int):
+        self._cursor = self._cursor.limit(count)
+        return self
+
+    async def to_list(self, length: Optional[int] = None) -> List[dict]:
+        return await self._store.decode(await self._cursor.to_list(length))
+
+    def __aiter__(self):
+        return self._iterate()
+
+    async def _iterate(self):
+        async for doc in self._cursor:
+            yield (await self._store.decode([doc]))[0]
+
+
+class _StoredCollection:
+    """
+    milk_collections kept in another shape, used like the plain collection.
+    Subclasses map fields, filters, projections and documents both ways.
+    """
+
+    name = "milk_collections"
+    flatten_stage: dict = {}
+
+    def translate_field(self, field: str) -> str:
+        return field
+
+    def translate_filter(self, query: Optional[dict]) -> dict:
+        return query or {}
+
+    def translate_projection(self, projection: Optional[dict]) -> Optional[dict]:
+        return projection
+
+    def encode(self, doc: dict) -> dict:
+        return dict(doc)
+
+    async def decode(self, docs: List[dict]) -> List[dict]:
+        return docs
+
+    def plain_value(self, field: str, value):
+        """A stored value of field as the plain documents hold it"""
+        return value
+
+    def translate_sort(self, key, direction=None):
+        if isinstance(key, (list, tuple)):
+            return [(self.translate_field(field), order) for field, order in key]
+        return [(self.translate_field(key), 1 if direction is None else direction)]
+
+    def find(self, query: Optional[dict] = None, projection: Optional[dict] = None, sort=None, **kwargs) -> _Cursor:
+        cursor = _Cursor(self, self.collection.find(self.translate_filter(query), self.translate_projection(projection), **kwargs))
+        return cursor.sort(sort) if sort else cursor
+
+    async def find_one(self, query: Optional[dict] = None, projection: Optional[dict] = None, sort=None, **kwargs) -> Optional[dict]:
+        if sort:
+            kwargs["sort"] = self.translate_sort(sort)
+        doc = await self.collection.find_one(self.translate_filter(query), self.translate_projection(projection), **kwargs)
+        return (await self.decode([doc]))[0] if doc else None
+
+    async def insert_one(self, doc: dict, **kwargs):
+        stored = self.encode(doc)
+        try:
+            return await self.collection.insert_one(stored, **kwargs)
+        finally:
+            # Same side effect as on a plain collection: the caller's dict gains its _id
+            if "_id" in stored:
+                doc["_id"] = stored["_id"]
+
+    async def insert_many(self, docs: List[dict], **kwargs):
+        stored = [self.encode(doc) for doc in docs]
+        try:
+            return await self.collection.insert_many(stored, **kwargs)
+        finally:
+            for doc, stored_doc in zip(docs, stored):
+                if "_id" in stored_doc:
+                    doc["_id"] = stored_doc["_id"]
+
+    async def delete_one(self, query: dict, **kwargs):
+        return await self.collection.delete_one(self.translate_filter(query), **kwargs)
+
+    async def delete_many(self, query: dict, **kwargs):
+        return await self.collection.delete_many(self.translate_filter(query), **kwargs)
+
+    async def count_documents(self, query: Optional[dict] = None, **kwargs) -> int:
+        return await self.collection.count_documents(self.translate_filter(query), **kwargs)
+
+    async def distinct(self, key: str, query: Optional[dict] = None, **kwargs) -> list:
+        values = await self.collection.distinct(self.translate_field(key), self.translate_filter(query), **kwargs)
+        if key == "date":
+            return sorted({self.plain_value(key, value) for value in values})
+        return [self.plain_value(key, value) for value in values]
+
+    def aggregate(self, pipeline: List[dict], **kwargs):
+        """Leading $match runs on the stored fields (so it can use indexes), the rest on plain documents"""
+        stages = list(pipeline)
+        head = []
+        if stages and "$match" in stages[0]:
+            head.append({"$match": self.translate_filter(stages.pop(0)["$match"])})
+        return self.collection.aggregate([*head, self.flatten_stage, *stages], **kwargs)
+
+    async def create_index(self, keys, **kwargs):
+        if isinstance(keys, str):
+            keys = [(keys, 1)]
+        return await self.collection.create_index([(self.translate_field(field), order) for field, order in keys], **kwargs)
+
+
+class TimeSeriesCollection(_StoredCollection):
+    """milk_collections stored as time-series measurements"""
+
+    flatten_stage = FLATTEN_STAGE
+
+    def __init__(self, db):
+        self.collection = db[TIMESERIES_COLLECTION]
+
+    def translate_field(self, field: str) -> str:
+        return translate_field(field)
+
+    def translate_filter(self, query: Optional[dict]) -> dict:
+        return translate_filter(query)
+
+    def translate_projection(self, projection: Optional[dict]) -> Optional[dict]:
+        return translate_projection(projection)
+
+    def encode(self, doc: dict) -> dict:
+        return to_measurement(doc)
+
+    async def decode(self, docs: List[dict]) -> List[dict]:
+        return [from_measurement(doc) for doc in docs]
+
+    def plain_value(self, field: str, value):
+        return value.strftime("%Y-%m-%d") if field == "date" else value
+
+    async def update_one(self, query: dict, update: Dict[str, dict], **kwargs):
+        """
+        $set/$inc on one entry. Measurements are re-inserted rather than edited in
+        place, and the new copy is written before the old one is removed, so a
+        failure in between leaves a duplicate for reconcile to find, never a loss.
+        """
+        unsupported = set(update) - {"$set", "$inc"}
+        if unsupported:
+            raise ValueError(f"Unsupported update on the time-series layout: {', '.join(unsupported)}")
+        current = await self.collection.find_one(translate_filter(query))
+        if current is None:
+            return SimpleNamespace(matched_count=0, modified_count=0, upserted_id=None)
+        doc = from_measurement(current)
+        doc.update(update.get("$set", {}))
+        for field, amount in update.get("$inc", {}).items():
+            doc[field] = (doc.get(field) or 0) + amount
+        doc["_id"] = ObjectId()
+        await self.collection.insert_one(to_measurement(doc), **kwargs)
+        await self.collection.delete_one({"_id": current["_id"]}, **kwargs)
+        return SimpleNamespace(matched_count=1, modified_count=1, upserted_id=None)
+
+
+class CompactCollection(_StoredCollection):
+    """milk_collections stored in the compact schema (version 2)"""
+
+    flatten_stage = COMPACT_FLATTEN_STAGE
+
+    def __init__(self, db):
+        self.db = db
+        self.collection = db[COMPACT_COLLECTION]
+
+    def translate_field(self, field: str) -> str:
+        return compact_field(field)
+
+    def translate_filter(self, query: Optional[dict]) -> dict:
+        return compact_filter(query)
+
+    def translate_projection(self, projection: Optional[dict]) -> Optional[dict]:
+        return compact_projection(projection)
+
+    def encode(self, doc: dict) -> dict:
+        return to_compact(doc)
+
+    async def decode(self, docs: List[dict]) -> List[dict]:
+        farmer_ids = {doc["farmer_id"] for doc in docs if "farmer_id" in doc and "farmer_name" not in doc}
+        farmers = await farmer_cache.get_many(self.db, farmer_ids) if farmer_ids else {}
+        names = {farmer_id: farmer.get("name", "") for farmer_id, farmer in farmers.items()}
+        return [from_compact(doc, names) for doc in docs]
+
+    def plain_value(self, field: str, value):
+        if field in COMPACT_FIELDS and value is not None:
+            return COMPACT_FIELDS[field][2](value)
+        return value
+
+    async def update_one(self, query: dict, update: Dict[str, dict], **kwargs):
+        """$set/$inc/$unset with values converted to the stored types, in place"""
+        stored = {}
+        for op, fields in update.items():
+            if op not in ("$set", "$inc", "$unset"):
+                raise ValueError(f"Unsupported update on the compact layout: {op}")
+            for field, value in fields.items():
+                if field == "farmer_name":
+                    continue
+                if field in COMPACT_FIELDS and op != "$unset" and value is not None:
+                    value = COMPACT_FIELDS[field][1](value)
+                stored.setdefault(op, {})[compact_field(field)] = value
+        return await self.collection.update_one(compact_filter(query), stored or {"$set": {"v": SCHEMA_VERSION}}, **kwargs)
+
+    async def keep_farmer_name(self, farmer_id: str, name: str):
+        """
+        Store the name on a farmer's entries that don't carry one yet, before
+        the farmer is renamed or deleted, so they keep the name they were made under
+        """
+        await self.collection.update_many(
+            {"farmer_id": farmer_id, "farmer_name": {"$exists": False}}, {"$set": {"farmer_name": name}}
+        )
+
+
+def collection_store(db):
+    """
+    The milk collections of db in the configured layout. Documents read their
+    archived months through the archive facade; the other layouts hold them in
+    their own collection (migrate copies the archives)
+    """
+    if COLLECTION_LAYOUT == "timeseries":
+        return TimeSeriesCollection(db)
+    if COLLECTION_LAYOUT == "compact":
+        return CompactCollection(db)
+    return ArchivedCollection(db, "milk_collections")
+
+
+def source_collection(db, name: str):
+    """db[name], with milk_collections in the configured layout and archived months included"""
+    if name == "milk_collections":
+        return collection_store(db)
+    return ArchivedCollection(db, name) if name in ARCHIVED_COLLECTIONS else db[name]
+
+
+# ==================== MIGRATION ====================
+
+async def ensure_timeseries(db):
+    """Create milk_collections_ts and its indexes if they don't exist yet"""
+    if TIMESERIES_COLLECTION not in await db.list_collection_names():
+        await db.create_collection(TIMESERIES_COLLECTION, timeseries=TIMESERIES_OPTIONS)
+    collection = db[TIMESERIES_COLLECTION]
+    await collection.create_index([("meta.farmer_id", 1), ("ts", 1)])
+    await collection.create_index([("ts", 1)])
+    await collection.create_index("id")
+
+
+async def ensure_compact(db):
+    """Indexes of milk_collections_compact (the unique one under the name server.py uses)"""
+    collection = db[COMPACT_COLLECTION]
+    await collection.create_index(
+        [("farmer_id", 1), ("day", 1), ("shift", 1), ("milk_type", 1)], unique=True, name=UNIQUE_INDEX_NAME
+    )
+    await collection.create_index([("day", 1)])
+    await collection.create_index("id")
+
+
+async def ensure_layout(db, layout: str = COLLECTION_LAYOUT):
+    if layout == "timeseries":
+        await ensure_timeseries(db)
+    elif layout == "compact":
+        await ensure_compact(db)
+
+
+# Target collection and document mapping of each layout migrate() copies into
+TARGETS = {
+    "timeseries": (TIMESERIES_COLLECTION, to_measurement),
+    "compact": (COMPACT_COLLECTION, to_compact),
+}
+
+
+async def _sources(db) -> List[tuple]:
+    """(collection, query) of every milk collection: each archived month, then the hot entries"""
+    record = await db[ARCHIVES_COLLECTION].find_one({"collection": "milk_collections"}) or {}
+    sources = [(archive_name("milk_collections", month), {}) for month in record.get("months", [])]
+    # Leftovers of a month whose delete was interrupted are copied from its archive
+    hot = {"date": {"$not": {"$lte": record["through"]}}} if record.get("through") else {}
+    return sources + [("milk_collections", hot)]
+
+
+async def _merged_by_id(cursors):
+    """Documents of several _id-sorted cursors, in one _id order"""
+    iterators = [cursor.__aiter__() for cursor in cursors]
+    heads = []
+    for index, iterator in enumerate(iterators):
+        doc = await anext(iterator, None)
+        if doc is not None:
+            heapq.heappush(heads, (doc["_id"], index, doc))
+    while heads:
+        _, index, doc = heapq.heappop(heads)
+        yield doc
+        following = await anext(iterators[index], None)
+        if following is not None:
+            heapq.heappush(heads, (following["_id"], index, following))
+
+
+async def _converted(db, layout: str, docs: List[dict]) -> List[dict]:
+    """A batch in the layout's shape; compact copies keep names the farmer no longer has"""
+    if layout != "compact":
+        return [TARGETS[layout][1](doc) for doc in docs]
+    farmer_ids = list({doc["farmer_id"] for doc in docs if doc.get("farmer_name")})
+    farmers = await db.farmers.find({"id": {"$in": farmer_ids}}, {"_id": 0, "id": 1, "name": 1}).to_list(None)
+    names = {farmer["id"]: farmer.get("name", "") for farmer in farmers}
+    # Entries of farmers deleted before the migration keep their name too
+    return [to_compact(doc, names.get(doc.get("farmer_id"), "")) for doc in docs]
+
+
+async def migrate(db, layout: str = "timeseries", batch_size: int = MIGRATE_BATCH, progress=print) -> int:
+    """
+    Copy milk_collections, archived months included, into the layout's
+    collection in _id order. Copies keep their source _id, so a rerun
+    continues after the last one copied.
+    """
+    await ensure_layout(db, layout)
+    name, _ = TARGETS[layout]
+    target = db[name]
+    last = await target.find_one({}, {"_id": 1}, sort=[("_id", -1)])
+    sources = await _sources(db)
+    total = 0
+    cursors = []
+    for source, query in sources:
+        total += await db[source].count_documents(query)
+        if last:
+            query = {"$and": [query, {"_id": {"$gt": last["_id"]}}]} if query else {"_id": {"$gt": last["_id"]}}
+        cursors.append(db[source].find(query).sort("_id", 1))
+    copied = await target.count_documents({})
+    batch = []
+    async for doc in _merged_by_id(cursors):
+        if not doc.get("date"):
+            continue
+        batch.append(doc)
+        if len(batch) >= batch_size:
+            await target.insert_many(await _converted(db, layout, batch), ordered=True)
+            copied += len(batch)
+            batch = []
+            progress(f"copied {copied}/{total}")
+    if batch:
+        await target.insert_many(await _converted(db, layout, batch), ordered=True)
+        copied += len(batch)
+    progress(f"copied {copied}/{total}")
+    return copied
+
+
+async def verify(db, layout: str = "timeseries") -> Dict[str, Any]:
+    """Entry counts and quantity/amount sums of milk_collections (archives included) and the layout's collection"""
+    amount = {"timeseries": "$amount", "compact": {"$divide": ["$amount_p", 100]}}[layout]
+    state = ArchiveState()
+    await state.load(db)
+    documents = ArchivedCollection(db, "milk_collections", state)
+    result = {}
+    for label, collection, summed in (("documents", documents, "$amount"), (layout, db[TARGETS[layout][0]], amount)):
+        group = {"$group": {"_id": None, "count": {"$sum": 1}, "quantity": {"$sum": "$quantity"}, "amount": {"$sum": summed}}}
+        rows = await collection.aggregate([group]).to_list(1)
+        row = rows[0] if rows else {"count": 0, "quantity": 0, "amount": 0}
+        result[label] = {"count": row["count"], "quantity": round(row["quantity"], 2), "amount": round(row["amount"], 2)}
+    result["match"] = result["documents"] == result[layout]
+    return result
+
+
+def main():
+    from dotenv import load_dotenv
+    from motor.motor_asyncio import AsyncIOMotorClient
+
+    parser = argparse.ArgumentParser(description="Copy milk collections into another storage layout")
+    parser.add_argument("command", choices=["migrate", "verify"])
+    parser.add_argument("--layout", choices=sorted(TARGETS),
+                        default=COLLECTION_LAYOUT if COLLECTION_LAYOUT in TARGETS else "timeseries")
+    parser.add_argument("--batch", type=int, default=MIGRATE_BATCH)
+    args = parser.parse_args()
+
+    load_dotenv(Path(__file__).parent / '.env')
+
+    async def run():
+        client = AsyncIOMotorClient(os.environ['MONGO_URL'])
+        db = client[os.environ['DB_NAME']]
+        if args.command == "migrate":
+            await migrate(db, args.layout, args.batch)
+        result = await verify(db, args.layout)
+        print(f"documents:  {result['documents']}")
+        print(f"{args.layout + ':':11} {result[args.layout]}")
+        print("layouts match" if result["match"] else "layouts differ")
+        client.close()
+
+    asyncio.run(run())
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,74 @@
+"""
+Event Bus for Nirbani Dairy
+In-process publish/subscribe used to push small change events to open
+dashboard and collection screens over Server-Sent Events
+"""
+import asyncio
+import json
+import logging
+from datetime import datetime, timezone
+from typing import Callable, Optional, Set
+
+from fastapi.encoders import jsonable_encoder
+
+logger = logging.getLogger(__name__)
+
+SUBSCRIBER_QUEUE_SIZE = 256
+
+
+class EventBus:
+    """Fan-out of events to every subscriber queue"""
+
+    def __init__(self, queue_size: int = SUBSCRIBER_QUEUE_SIZE):
+        self.queue_size = queue_size
+        self._subscribers: Set[asyncio.Queue] = set()
+        self.published = 0
+        self.resyncs = 0
+        # Set when running several worker processes, to forward events to the others
+        self.relay: Optional[Callable[[dict], None]] = None
+
+    @property
+    def subscriber_count(self) -> int:
+        return len(self._subscribers)
+
+    def subscribe(self) -> asyncio.Queue:
+        queue = asyncio.Queue(maxsize=self.queue_size)
+        self._subscribers.add(queue)
+        return queue
+
+    def unsubscribe(self, queue: asyncio.Queue):
+        self._subscribers.discard(queue)
+
+    def publish(self, event_type: str, data: dict):
+        """Queue an event for every subscriber; never blocks the publisher"""
+        # insert_one adds the ObjectId to documents; it never goes to clients
+        data = {k: v for k, v in data.items() if k != "_id"}
+        event = {
+            "type": event_type,
+            "data": jsonable_encoder(data),
+            "ts": datetime.now(timezone.utc).isoformat()
+        }
+        self.published += 1
+        self.deliver(event)
+        if self.relay:
+            self.relay(event)
+
+    def deliver(self, event: dict):
+        """Hand an already encoded event to this process's subscribers"""
+        for queue in list(self._subscribers):
+            try:
+                queue.put_nowait(event)
+            except asyncio.QueueFull:
+                # Slow client: drop its backlog and tell it to reload instead
+                while not queue.empty():
+                    queue.get_nowait()
+                queue.put_nowait({"type": "resync", "data": {}, "ts": event["ts"]})
+                self.resyncs += 1
+
+
+def format_sse(event: dict) -> str:
+    """Serialize an event in text/event-stream format"""
+    return f"event: {event['type']}\ndata: {json.dumps(event['data'], ensure_ascii=False)}\n\n"
+
+
+event_bus = EventBus()
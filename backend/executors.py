@@ -0,0 +1,78 @@
+"""
+Worker Pools for Nirbani Dairy
+CPU-heavy work (bill HTML, CSV exports, spreadsheet parsing) runs in a
+process pool so it never stalls the event loop that serves milk entry.
+Blocking calls that release the GIL run in a thread pool instead.
+
+CPU_WORKERS sets the process count (0 runs CPU work in threads, e.g. on
+hosts where fork/spawn is unavailable); IO_THREADS sizes the thread pool.
+"""
+import asyncio
+import functools
+import logging
+import multiprocessing
+import os
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from typing import Optional
+
+logger = logging.getLogger(__name__)
+
+# Split the cores between the web workers so N workers don't each start a full pool
+_cores_per_web_worker = (os.cpu_count() or 1) // int(os.environ.get("WEB_CONCURRENCY", "1"))
+CPU_WORKERS = int(os.environ.get("CPU_WORKERS", max(1, min(4, _cores_per_web_worker))))
+IO_THREADS = int(os.environ.get("IO_THREADS", 8))
+
+_threads = ThreadPoolExecutor(max_workers=IO_THREADS, thread_name_prefix="io")
+_processes: Optional[ProcessPoolExecutor] = None
+_stats = {"cpu_tasks": 0, "thread_tasks": 0, "process_fallbacks": 0}
+
+
+def _process_pool() -> Optional[ProcessPoolExecutor]:
+    global _processes
+    if CPU_WORKERS <= 0:
+        return None
+    if _processes is None:
+        # spawn: forking a process that holds Motor sockets and an event loop is unsafe
+        _processes = ProcessPoolExecutor(max_workers=CPU_WORKERS, mp_context=multiprocessing.get_context("spawn"))
+    return _processes
+
+
+async def run_in_thread(func, *args, **kwargs):
+    """Run a blocking call on the I/O thread pool"""
+    _stats["thread_tasks"] += 1
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(_threads, functools.partial(func, *args, **kwargs))
+
+
+async def run_cpu(func, *args, **kwargs):
+    """
+    Run a CPU-bound call in a worker process. func and its arguments must be
+    picklable (module-level functions over plain dicts/lists).
+    """
+    global _processes
+    pool = _process_pool()
+    if pool is None:
+        return await run_in_thread(func, *args, **kwargs)
+    _stats["cpu_tasks"] += 1
+    loop = asyncio.get_running_loop()
+    try:
+        return await loop.run_in_executor(pool, functools.partial(func, *args, **kwargs))
+    except BrokenProcessPool:
+        # A worker died (OOM kill etc.); rebuild the pool next time and finish this call in a thread
+        logger.warning("Process pool broken, running %s in a thread", func.__name__)
+        _processes = None
+        _stats["process_fallbacks"] += 1
+        return await run_in_thread(func, *args, **kwargs)
+
+
+def stats() -> dict:
+    return {"cpu_workers": CPU_WORKERS, "io_threads": IO_THREADS, **_stats}
+
+
+def shutdown():
+    global _processes
+    if _processes is not None:
+        _processes.shutdown(wait=True, cancel_futures=True)
+        _processes = None
+    _threads.shutdown(wait=True, cancel_futures=True)
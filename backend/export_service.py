@@ -0,0 +1,79 @@
+"""
+Spreadsheet Service for Nirbani Dairy
+CSV exports and bulk-upload parsing. These are plain functions over lists of
+dicts so they can run in a worker process, off the event loop.
+"""
+import csv
+import io
+from typing import Dict, List
+
+
+def render_csv(header: List[str], rows: List[list]) -> bytes:
+    """CSV with a BOM so Excel opens Hindi names correctly"""
+    output = io.StringIO()
+    writer = csv.writer(output)
+    writer.writerow(header)
+    writer.writerows(rows)
+    return output.getvalue().encode("utf-8-sig")
+
+
+def collections_csv(collections: List[Dict]) -> bytes:
+    return render_csv(
+        ["Date", "Farmer", "Shift", "Quantity(L)", "Fat%", "SNF%", "Rate", "Amount"],
+        [[c["date"], c["farmer_name"], c["shift"], c["quantity"], c["fat"], c["snf"], c["rate"], c["amount"]]
+         for c in collections]
+    )
+
+
+def payments_csv(payments: List[Dict]) -> bytes:
+    return render_csv(
+        ["Date", "Farmer", "Amount", "Mode", "Type", "Notes"],
+        [[p["date"], p["farmer_name"], p["amount"], p["payment_mode"], p.get("payment_type", "payment"), p.get("notes", "")]
+         for p in payments]
+    )
+
+
+def farmers_csv(farmers: List[Dict]) -> bytes:
+    return render_csv(
+        ["Name", "Phone", "Village", "Address", "Total Milk(L)", "Total Due", "Total Paid", "Balance", "Active"],
+        [[f["name"], f["phone"], f.get("village", ""), f.get("address", ""),
+          f["total_milk"], f["total_due"], f["total_paid"], f["balance"], f.get("is_active", True)]
+         for f in farmers]
+    )
+
+
+def sales_csv(sales: List[Dict]) -> bytes:
+    return render_csv(
+        ["Date", "Customer", "Product", "Quantity", "Rate", "Amount"],
+        [[s["date"], s["customer_name"], s["product"], s["quantity"], s["rate"], s["amount"]] for s in sales]
+    )
+
+
+def expenses_csv(expenses: List[Dict]) -> bytes:
+    return render_csv(
+        ["Date", "Category", "Amount", "Description", "Payment Mode"],
+        [[e["date"], e["category"], e["amount"], e.get("description", ""), e["payment_mode"]] for e in expenses]
+    )
+
+
+def parse_upload_rows(content: bytes, ext: str) -> List[Dict[str, str]]:
+    """Read an uploaded CSV/Excel file into row dicts keyed by header"""
+    rows = []
+    if ext == "csv":
+        text = content.decode("utf-8-sig")
+        reader = csv.DictReader(io.StringIO(text))
+        rows = [dict(row) for row in reader]
+    elif ext in ("xlsx", "xls"):
+        import openpyxl
+        wb = openpyxl.load_workbook(io.BytesIO(content), read_only=True)
+        ws = wb.active
+        headers = [str(cell.value or "").strip().lower() for cell in next(ws.iter_rows(min_row=1, max_row=1))]
+        for row in ws.iter_rows(min_row=2, values_only=True):
+            row_dict = {}
+            for i, val in enumerate(row):
+                if i < len(headers) and headers[i]:
+                    row_dict[headers[i]] = str(val).strip() if val is not None else ""
+            if any(row_dict.values()):
+                rows.append(row_dict)
+        wb.close()
+    return rows
@@ -0,0 +1,24 @@
+"""
+Query Fan-out for Nirbani Dairy
+Runs a handler's independent database queries at the same time, so its
+latency is the slowest query rather than the sum of all of them
+"""
+import asyncio
+from typing import Awaitable, List
+
+
+async def gather_queries(*queries: Awaitable) -> List:
+    """
+    Await independent queries concurrently and return their results in order.
+    Errors behave as if the queries were awaited one after another: the first
+    failure propagates unchanged and the remaining queries are cancelled
+    instead of being left running in the background.
+    """
+    tasks = [asyncio.ensure_future(query) for query in queries]
+    try:
+        return await asyncio.gather(*tasks)
+    except BaseException:
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+        raise
@@ -0,0 +1,19 @@
+"""
+Gunicorn settings for Nirbani Dairy
+Runs server:app as several uvicorn worker processes. Workers share caches
+through the cache bus (cache_bus.py), which needs WEB_CONCURRENCY set so
+each worker knows it is not alone. FARMER_WRITE_BEHIND is ignored here, and
+whenever reports run in reporting_server.py (SERVE_REPORTS=0): buffered farmer
+balances are only visible inside the process holding them.
+"""
+import multiprocessing
+import os
+
+workers = int(os.environ.setdefault("WEB_CONCURRENCY", str(multiprocessing.cpu_count())))
+worker_class = "uvicorn.workers.UvicornWorker"
+bind = os.environ.get("BIND", "0.0.0.0:8001")
+
+# Month-long bills and exports can take a while; SSE streams stay open indefinitely
+timeout = int(os.environ.get("WORKER_TIMEOUT", "120"))
+graceful_timeout = 30
+keepalive = 5
@@ -0,0 +1,127 @@
+"""
+Idempotency Service for Nirbani Dairy
+Remembers client-supplied idempotency keys so that writes retried by
+offline devices replay the original response instead of running twice.
+Keys belong to the user who sent them, and each remembers a hash of its
+request body: the same key with a different body is refused rather than
+answered with another request's response.
+"""
+import hashlib
+import json
+import os
+import logging
+from datetime import datetime, timezone, timedelta
+from typing import Awaitable, Callable, Optional
+
+from fastapi.encoders import jsonable_encoder
+from pymongo.errors import DuplicateKeyError, OperationFailure
+
+logger = logging.getLogger(__name__)
+
+# Keys are kept long enough to cover a device being offline over a weekend
+IDEMPOTENCY_TTL_HOURS = int(os.environ.get('IDEMPOTENCY_TTL_HOURS', '72'))
+
+# A "pending" key older than this is treated as abandoned (worker crashed mid-request)
+PENDING_TIMEOUT_SECONDS = 60
+
+
+class IdempotencyConflict(Exception):
+    """Raised when the same key is still being processed by another request"""
+
+
+class IdempotencyMismatch(Exception):
+    """Raised when a key is reused with a different request body"""
+
+
+def request_hash(payload) -> str:
+    """Hash of a request body, independent of field order"""
+    encoded = json.dumps(jsonable_encoder(payload), sort_keys=True, separators=(",", ":"))
+    return hashlib.sha256(encoded.encode()).hexdigest()
+
+
+async def ensure_indexes(db):
+    """Create the unique key index and the TTL index used for expiry"""
+    try:
+        # Keys used to be unique per scope across all users
+        await db.idempotency_keys.drop_index("scope_1_key_1")
+    except OperationFailure:
+        pass
+    await db.idempotency_keys.create_index([("user_id", 1), ("scope", 1), ("key", 1)], unique=True)
+    await db.idempotency_keys.create_index(
+        "created_at", expireAfterSeconds=IDEMPOTENCY_TTL_HOURS * 3600
+    )
+
+
+async def run_once(
+    db,
+    scope: str,
+    key: Optional[str],
+    operation: Callable[[], Awaitable],
+    user_id: Optional[str] = None,
+    payload=None
+):
+    """
+    Run a write operation at most once per (user, scope, key)
+
+    Args:
+        db: Motor database handle
+        scope: Logical endpoint name, e.g. "collections"
+        key: Client supplied idempotency key (operation runs normally if empty)
+        operation: Zero-argument coroutine factory performing the write
+        user_id: User sending the request; other users' keys are never matched
+        payload: Request body, hashed to refuse a key reused for another request
+
+    Returns:
+        The operation result, or the stored response when the key was seen before.
+        Failed operations release the key so the client can retry them.
+
+    Raises:
+        IdempotencyConflict: the key is still being processed
+        IdempotencyMismatch: the key was used with a different body
+    """
+    if not key:
+        return await operation()
+
+    now = datetime.now(timezone.utc)
+    body_hash = request_hash(payload)
+    key_filter = {"user_id": user_id, "scope": scope, "key": key}
+    try:
+        await db.idempotency_keys.insert_one({
+            **key_filter,
+            "request_hash": body_hash,
+            "status": "pending",
+            "created_at": now
+        })
+    except DuplicateKeyError:
+        record = await db.idempotency_keys.find_one(key_filter, {"_id": 0})
+        if record and record.get("request_hash", body_hash) != body_hash:
+            raise IdempotencyMismatch(f"Request {key} for {scope} was sent before with a different body")
+        if record and record.get("status") == "completed":
+            return record["response"]
+
+        # Take over a pending key whose original request never finished
+        stale_before = now - timedelta(seconds=PENDING_TIMEOUT_SECONDS)
+        taken = await db.idempotency_keys.find_one_and_update(
+            {**key_filter, "status": "pending", "created_at": {"$lt": stale_before}},
+            {"$set": {"created_at": now, "request_hash": body_hash}}
+        )
+        if not taken:
+            raise IdempotencyConflict(f"Request {key} for {scope} is still being processed")
+        logger.warning(f"Taking over abandoned idempotency key {scope}/{key}")
+
+    try:
+        result = await operation()
+    except BaseException:
+        await db.idempotency_keys.delete_one({**key_filter, "status": "pending"})
+        raise
+
+    response = jsonable_encoder(result)
+    await db.idempotency_keys.update_one(
+        key_filter,
+        {"$set": {
+            "status": "completed",
+            "response": response,
+            "completed_at": datetime.now(timezone.utc)
+        }}
+    )
+    return response
@@ -0,0 +1,294 @@
+"""
+Data Migration Runner for Nirbani Dairy
+Backfills over large collections run as numbered migrations. Each one walks
+its collection in _id order, in batches, and writes one bulk update per
+batch. After every batch the last _id and running counts are checkpointed
+in the migrations collection, so a crashed or stopped run continues where it
+left off, and a pause between batches keeps the load low enough to run while
+the app serves traffic. Updates carry the migration's filter, so a document
+changed by the app in the meantime is simply skipped. Collections with
+archived months (archive_service) are walked archive by archive after the
+hot collection, so history is migrated too. Migrations of milk_collections
+update the collection of the configured COLLECTION_LAYOUT and declare the
+layouts they can run in; in any other layout they are skipped and stay pending.
+
+    python migrations.py status
+    python migrations.py run [--dry-run] [--through 2] [--batch 1000] [--pause 0.1]
+
+A dry run walks the same batches and reports how many documents would
+change without writing anything, checkpoints included.
+
+An update that would duplicate a unique key (a legacy entry without a milk
+type next to a cow entry for the same farmer, date and shift) is skipped:
+the document is left as it was, its _id is recorded in the migration's
+conflicts for someone to resolve, and the run carries on.
+"""
+import argparse
+import asyncio
+import os
+import time
+import uuid
+from datetime import datetime, timedelta, timezone
+from pathlib import Path
+from typing import Any, Callable, Dict, List, Optional, Tuple, Union
+
+from pymongo import ReturnDocument, UpdateOne
+from pymongo.errors import BulkWriteError, DuplicateKeyError
+
+from archive_service import ARCHIVED_COLLECTIONS, ARCHIVES_COLLECTION, archive_name
+from collection_store import COLLECTION_LAYOUT, COMPACT_COLLECTION
+
+MIGRATIONS_COLLECTION = "migrations"
+MIGRATION_BATCH = 1000
+MIGRATION_PAUSE = 0.1  # seconds between batches
+# A running migration whose checkpoint is older than this is taken to have crashed
+LEASE_SECONDS = 300
+DUPLICATE_KEY = 11000
+# Where milk collections are stored per layout; time-series measurements can't be updated by _id in bulk
+MILK_COLLECTION_TARGETS = {"documents": "milk_collections", "compact": COMPACT_COLLECTION}
+
+
+class Migration:
+    """
+    A numbered backfill: documents of collection matching query get update,
+    a fixed update document or a function of the document (None = leave it).
+    A milk_collections migration lists the layouts whose stored documents
+    its query and update fit (fields the layout keeps as they are).
+    """
+
+    def __init__(self, number: int, name: str, collection: str, query: dict,
+                 update: Union[dict, Callable[[dict], Optional[dict]]], layouts: Tuple[str, ...] = ("documents",)):
+        self.number = number
+        self.name = name
+        self.collection = collection
+        self.query = query
+        self.update = update
+        self.layouts = layouts
+
+    def supported(self) -> bool:
+        """Whether it can run in the configured milk collection layout"""
+        return self.collection != "milk_collections" or (
+            COLLECTION_LAYOUT in self.layouts and COLLECTION_LAYOUT in MILK_COLLECTION_TARGETS
+        )
+
+    def operations(self, docs: List[dict]) -> Tuple[List[Any], List[UpdateOne]]:
+        """_ids of the documents to update and their updates, in the same order"""
+        ids, ops = [], []
+        for doc in docs:
+            update = self.update(doc) if callable(self.update) else self.update
+            if update:
+                ids.append(doc["_id"])
+                ops.append(UpdateOne({"_id": doc["_id"], **self.query}, update))
+        return ids, ops
+
+
+# Append only: numbers are recorded in the migrations collection and never reused
+MIGRATIONS = [
+    # Entries from before milk types were recorded (the API already reads them as cow)
+    Migration(1, "milk_collections_milk_type", "milk_collections",
+              {"milk_type": {"$exists": False}}, {"$set": {"milk_type": "cow"}}, layouts=("documents", "compact")),
+    Migration(2, "farmers_milk_type", "farmers",
+              {"milk_type": {"$exists": False}}, {"$set": {"milk_type": "cow"}}),
+    # Payments from before advances and deductions existed were all plain payments
+    Migration(3, "payments_payment_type", "payments",
+              {"payment_type": {"$exists": False}}, {"$set": {"payment_type": "payment"}}),
+]
+
+
+def _now() -> str:
+    return datetime.now(timezone.utc).isoformat()
+
+
+async def status(db) -> List[dict]:
+    """Every registered migration with its recorded state"""
+    records = {doc["_id"]: doc async for doc in db[MIGRATIONS_COLLECTION].find({})}
+    result = []
+    for migration in MIGRATIONS:
+        record = records.get(migration.number, {})
+        result.append({
+            "number": migration.number,
+            "name": migration.name,
+            "collection": migration.collection,
+            "status": record.get("status", "pending"),
+            "processed": record.get("processed", 0),
+            "changed": record.get("changed", 0),
+            "conflicts": len(record.get("conflicts", [])),
+            "started_at": record.get("started_at"),
+            "updated_at": record.get("updated_at"),
+            "finished_at": record.get("finished_at"),
+        })
+    return result
+
+
+async def _claim(db, migration: Migration, owner: str) -> Optional[dict]:
+    """Mark the migration running for this runner, unless another live runner has it"""
+    stale = (datetime.now(timezone.utc) - timedelta(seconds=LEASE_SECONDS)).isoformat()
+    now = _now()
+    try:
+        return await db[MIGRATIONS_COLLECTION].find_one_and_update(
+            {"_id": migration.number, "$or": [{"status": "stopped"}, {"updated_at": {"$lt": stale}}]},
+            {"$set": {"name": migration.name, "status": "running", "owner": owner, "updated_at": now},
+             "$setOnInsert": {"processed": 0, "changed": 0, "started_at": now}},
+            upsert=True, return_document=ReturnDocument.AFTER
+        )
+    except DuplicateKeyError:
+        # The upsert collides with the record another runner holds
+        return None
+
+
+async def collection_parts(db, collection: str) -> List[str]:
+    """The collection itself (milk collections in the configured layout), then its monthly archives"""
+    if collection == "milk_collections" and COLLECTION_LAYOUT != "documents":
+        # The layout's collection holds the archived months too
+        return [MILK_COLLECTION_TARGETS[COLLECTION_LAYOUT]]
+    if collection not in ARCHIVED_COLLECTIONS:
+        return [collection]
+    record = await db[ARCHIVES_COLLECTION].find_one({"collection": collection}) or {}
+    return [collection] + [archive_name(collection, month) for month in sorted(record.get("months", []))]
+
+
+async def run_migration(
+    db,
+    migration: Migration,
+    dry_run: bool = False,
+    batch_size: int = MIGRATION_BATCH,
+    pause: float = MIGRATION_PAUSE,
+    progress: Callable[[str], None] = print,
+) -> dict:
+    """Run one migration from its checkpoint to the end; returns processed/changed/conflicts counts"""
+    if not migration.supported():
+        raise RuntimeError(f"Migration {migration.number} does not support the {COLLECTION_LAYOUT} collection layout")
+    record = {"processed": 0, "changed": 0}
+    owner = str(uuid.uuid4())
+    if not dry_run:
+        record = await _claim(db, migration, owner)
+        if record is None:
+            raise RuntimeError(f"Migration {migration.number} is being run by another process")
+    parts = await collection_parts(db, migration.collection)
+    total = 0
+    for part in parts:
+        total += await db[part].estimated_document_count()
+    # Checkpoints from before archives were walked have no part: they are in the collection itself
+    part = record.get("part") or migration.collection
+    last_id = record.get("last_id")
+    processed, changed = record["processed"], record["changed"]
+    conflicts = len(record.get("conflicts", []))
+    began = time.monotonic()
+    try:
+        for part in parts[parts.index(part) if part in parts else 0:]:
+            collection = db[part]
+            while True:
+                query = {**migration.query, "_id": {"$gt": last_id}} if last_id is not None else dict(migration.query)
+                docs = await collection.find(query).sort("_id", 1).limit(batch_size).to_list(batch_size)
+                if not docs:
+                    break
+                ids, ops = migration.operations(docs)
+                batch_conflicts = []
+                if dry_run:
+                    changed += len(ops)
+                elif ops:
+                    try:
+                        result = await collection.bulk_write(ops, ordered=False)
+                        changed += result.modified_count
+                    except BulkWriteError as e:
+                        errors = e.details.get("writeErrors", [])
+                        if any(error.get("code") != DUPLICATE_KEY for error in errors):
+                            raise
+                        # The other updates of the batch went through
+                        changed += e.details.get("nModified", 0)
+                        batch_conflicts = [ids[error["index"]] for error in errors]
+                        conflicts += len(batch_conflicts)
+                        progress(f"{migration.number} {migration.name}: {len(batch_conflicts)} left unchanged, "
+                                 f"the update would duplicate a unique key: {batch_conflicts}")
+                last_id = docs[-1]["_id"]
+                # Only matching documents are read, so processed counts those (of `total` in the collection)
+                processed += len(docs)
+                if not dry_run:
+                    checkpoint = await db[MIGRATIONS_COLLECTION].update_one(
+                        {"_id": migration.number, "owner": owner},
+                        {"$set": {"part": part, "last_id": last_id, "processed": processed, "changed": changed,
+                                  "updated_at": _now()},
+                         "$push": {"conflicts": {"$each": [{"part": part, "_id": _id} for _id in batch_conflicts]}}}
+                    )
+                    if not checkpoint.matched_count:
+                        # Stalled past the lease and another runner took over
+                        raise RuntimeError(f"Migration {migration.number} was taken over by another process")
+                rate = processed / max(time.monotonic() - began, 1e-6)
+                progress(f"{migration.number} {migration.name}: {processed} matched of {total}, {changed} changed, {rate:.0f}/s")
+                if len(docs) < batch_size:
+                    break
+                await asyncio.sleep(pause)
+            last_id = None
+    except BaseException:
+        # Interrupted or failed: release it at once so a rerun resumes from the checkpoint
+        if not dry_run:
+            await db[MIGRATIONS_COLLECTION].update_one(
+                {"_id": migration.number, "owner": owner}, {"$set": {"status": "stopped", "updated_at": _now()}}
+            )
+        raise
+    if not dry_run:
+        await db[MIGRATIONS_COLLECTION].update_one(
+            {"_id": migration.number, "owner": owner},
+            {"$set": {"status": "done", "updated_at": _now(), "finished_at": _now()}}
+        )
+    return {"processed": processed, "changed": changed, "conflicts": conflicts}
+
+
+async def run(
+    db,
+    through: Optional[int] = None,
+    dry_run: bool = False,
+    batch_size: int = MIGRATION_BATCH,
+    pause: float = MIGRATION_PAUSE,
+    progress: Callable[[str], None] = print,
+) -> Dict[int, dict]:
+    """Run pending migrations in number order, up to and including `through`"""
+    done = {doc["_id"] async for doc in db[MIGRATIONS_COLLECTION].find({"status": "done"}, {"_id": 1})}
+    results = {}
+    for migration in MIGRATIONS:
+        if through is not None and migration.number > through:
+            break
+        if migration.number in done:
+            continue
+        if not migration.supported():
+            progress(f"{migration.number} {migration.name}: skipped, not supported in the {COLLECTION_LAYOUT} layout")
+            continue
+        results[migration.number] = await run_migration(db, migration, dry_run, batch_size, pause, progress)
+    return results
+
+
+def main():
+    from dotenv import load_dotenv
+    from motor.motor_asyncio import AsyncIOMotorClient
+
+    parser = argparse.ArgumentParser(description="Run numbered data migrations")
+    parser.add_argument("command", choices=["status", "run"])
+    parser.add_argument("--dry-run", action="store_true", help="report what would change, write nothing")
+    parser.add_argument("--through", type=int, help="last migration number to run")
+    parser.add_argument("--batch", type=int, default=MIGRATION_BATCH)
+    parser.add_argument("--pause", type=float, default=MIGRATION_PAUSE, help="seconds to wait between batches")
+    args = parser.parse_args()
+
+    load_dotenv(Path(__file__).parent / '.env')
+
+    async def main_async():
+        client = AsyncIOMotorClient(os.environ['MONGO_URL'])
+        db = client[os.environ['DB_NAME']]
+        if args.command == "run":
+            results = await run(db, args.through, args.dry_run, args.batch, args.pause)
+            verb = "would change" if args.dry_run else "changed"
+            for number, result in results.items():
+                print(f"migration {number}: {result['processed']} matched, {result['changed']} {verb}, "
+                      f"{result['conflicts']} left unchanged (unique key conflicts)")
+            if not results:
+                print("nothing to run")
+        else:
+            for row in await status(db):
+                print(f"{row['number']:>4}  {row['name']:32} {row['status']:8} {row['processed']:>10} matched {row['changed']:>10} changed {row['conflicts']:>6} conflicts")
+        client.close()
+
+    asyncio.run(main_async())
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,292 @@
+"""
+Parquet Export Service for Nirbani Dairy
+Columnar snapshots of the ledger collections for notebooks and other
+analytics tools. A collection is exported one month at a time, each month
+read with a single date-range cursor (archived months and the configured
+milk collection layout included) and written as Arrow record batches into a
+Hive-style partition:
+
+    <out>/<collection>/month=YYYY-MM/part-0.parquet
+
+Columns are typed: dates as date32, timestamps as UTC timestamps, money,
+quantities and fat/SNF as float64. Only one month's writer and one batch of
+EXPORT_BATCH_ROWS rows are held at a time, so memory stays flat however many
+rows the collection has. stream_zip sends the partitions as one zip, each
+month going out as soon as it is written.
+
+    python parquet_export.py milk_collections --out exports/ [--start 2024-01-01] [--end 2024-12-31]
+"""
+import argparse
+import asyncio
+import os
+import shutil
+import tempfile
+import time
+import zipfile
+from datetime import date, datetime, timezone
+from pathlib import Path
+from typing import AsyncIterator, Callable, Dict, List, Optional, Tuple
+
+import pyarrow as pa
+import pyarrow.parquet as pq
+
+from archive_service import ArchivedCollection, archive_state, month_end, next_month
+from collection_store import source_collection
+from executors import run_in_thread
+
+EXPORT_BATCH_ROWS = 50000
+EXPORT_COMPRESSION = "zstd"
+
+ARROW_TYPES = {
+    "string": pa.string(),
+    "float": pa.float64(),
+    "bool": pa.bool_(),
+    "date": pa.date32(),
+    "timestamp": pa.timestamp("us", tz="UTC"),
+}
+
+# Exported columns per collection; fields not listed (nested deductions, _id) are left out
+EXPORT_FIELDS: Dict[str, List[Tuple[str, str]]] = {
+    "milk_collections": [
+        ("id", "string"), ("date", "date"), ("shift", "string"), ("milk_type", "string"),
+        ("farmer_id", "string"), ("farmer_name", "string"), ("quantity", "float"), ("fat", "float"),
+        ("snf", "float"), ("rate", "float"), ("amount", "float"), ("created_at", "timestamp"),
+    ],
+    "payments": [
+        ("id", "string"), ("date", "date"), ("farmer_id", "string"), ("farmer_name", "string"),
+        ("amount", "float"), ("payment_mode", "string"), ("payment_type", "string"), ("notes", "string"),
+        ("created_at", "timestamp"),
+    ],
+    "sales": [
+        ("id", "string"), ("date", "date"), ("customer_id", "string"), ("customer_name", "string"),
+        ("product", "string"), ("quantity", "float"), ("rate", "float"), ("amount", "float"),
+        ("notes", "string"), ("created_at", "timestamp"),
+    ],
+    "expenses": [
+        ("id", "string"), ("date", "date"), ("category", "string"), ("amount", "float"),
+        ("description", "string"), ("payment_mode", "string"), ("created_at", "timestamp"),
+    ],
+    "dispatches": [
+        ("id", "string"), ("date", "date"), ("dairy_plant_id", "string"), ("dairy_plant_name", "string"),
+        ("tanker_number", "string"), ("quantity_kg", "float"), ("avg_fat", "float"), ("avg_snf", "float"),
+        ("clr", "float"), ("rate_per_kg", "float"), ("gross_amount", "float"), ("total_deduction", "float"),
+        ("net_receivable", "float"), ("slip_fat", "float"), ("slip_snf", "float"), ("slip_amount", "float"),
+        ("fat_difference", "float"), ("amount_difference", "float"), ("slip_matched", "bool"),
+        ("created_at", "timestamp"),
+    ],
+}
+
+
+def export_schema(collection: str) -> pa.Schema:
+    return pa.schema([(field, ARROW_TYPES[kind]) for field, kind in EXPORT_FIELDS[collection]])
+
+
+def convert(kind: str, value):
+    """A stored value as the column's Python type; missing or malformed values become null"""
+    if value is None or value == "":
+        return None
+    try:
+        if kind == "float":
+            return float(value)
+        if kind == "date":
+            if isinstance(value, datetime):
+                return value.date()
+            return value if isinstance(value, date) else date.fromisoformat(value[:10])
+        if kind == "timestamp":
+            stamp = value if isinstance(value, datetime) else datetime.fromisoformat(value)
+            return stamp if stamp.tzinfo else stamp.replace(tzinfo=timezone.utc)
+        if kind == "bool":
+            return bool(value)
+        return str(value)
+    except (TypeError, ValueError):
+        return None
+
+
+def record_batch(collection: str, schema: pa.Schema, docs: List[dict]) -> pa.RecordBatch:
+    """Column-wise conversion of one batch of documents"""
+    arrays = [
+        pa.array([convert(kind, doc.get(field)) for doc in docs], type=ARROW_TYPES[kind])
+        for field, kind in EXPORT_FIELDS[collection]
+    ]
+    return pa.RecordBatch.from_arrays(arrays, schema=schema)
+
+
+def write_batch(writer: pq.ParquetWriter, collection: str, docs: List[dict]):
+    writer.write_batch(record_batch(collection, writer.schema, docs))
+
+
+async def date_bounds(db, collection: str) -> Optional[Tuple[str, str]]:
+    """
+    Earliest and latest date in the collection, or None when it's empty.
+    Archived months count as whole months, taken from the archives record
+    rather than read; the hot entries cost two index-backed reads.
+    """
+    source = source_collection(db, collection)
+    query: dict = {}
+    months: List[str] = []
+    if isinstance(source, ArchivedCollection):
+        query = source.hot_query(None)
+        months = source.state.months.get(collection) or []
+        source = source.hot
+    dates = []
+    for direction in (1, -1):
+        doc = await source.find_one(query, {"_id": 0, "date": 1}, sort=[("date", direction)])
+        if doc and doc.get("date"):
+            dates.append(doc["date"])
+    if months:
+        dates += [f"{min(months)}-01", month_end(max(months))]
+    if not dates:
+        return None
+    return min(dates), max(dates)
+
+
+async def export_month(db, collection: str, month: str, start_date: str, end_date: str, out_dir: Path,
+                       batch_rows: int = EXPORT_BATCH_ROWS) -> Tuple[int, Optional[Path]]:
+    """Write one month's partition; returns (rows, file), file None when the month has no rows"""
+    cursor = source_collection(db, collection).find(
+        {"date": {"$gte": start_date, "$lte": end_date}}, {"_id": 0}
+    )
+    path = out_dir / collection / f"month={month}" / "part-0.parquet"
+    writer = None
+    rows = 0
+    docs: List[dict] = []
+
+    async def flush():
+        nonlocal writer, rows
+        if writer is None:
+            path.parent.mkdir(parents=True, exist_ok=True)
+            writer = await run_in_thread(pq.ParquetWriter, path, export_schema(collection),
+                                         compression=EXPORT_COMPRESSION)
+        await run_in_thread(write_batch, writer, collection, docs)
+        rows += len(docs)
+
+    try:
+        async for doc in cursor:
+            docs.append(doc)
+            if len(docs) >= batch_rows:
+                await flush()
+                docs = []
+        if docs:
+            await flush()
+    finally:
+        if writer is not None:
+            await run_in_thread(writer.close)
+    return rows, (path if writer is not None else None)
+
+
+async def export_months(
+    db,
+    collection: str,
+    out_dir: Path,
+    start_date: Optional[str] = None,
+    end_date: Optional[str] = None,
+    batch_rows: int = EXPORT_BATCH_ROWS,
+) -> AsyncIterator[Tuple[str, int, Path]]:
+    """(month, rows, file) of each month with entries, as it is written"""
+    if collection not in EXPORT_FIELDS:
+        raise ValueError(f"Unknown export collection: {collection}")
+    bounds = await date_bounds(db, collection)
+    if not bounds:
+        return
+    start_date = max(start_date or bounds[0], bounds[0])
+    end_date = min(end_date or bounds[1], bounds[1])
+    month = start_date[:7]
+    while month <= end_date[:7]:
+        rows, path = await export_month(
+            db, collection, month, max(start_date, f"{month}-01"), min(end_date, month_end(month)),
+            out_dir, batch_rows
+        )
+        if path:
+            yield month, rows, path
+        month = next_month(month)
+
+
+async def export_collection(
+    db,
+    collection: str,
+    out_dir,
+    start_date: Optional[str] = None,
+    end_date: Optional[str] = None,
+    batch_rows: int = EXPORT_BATCH_ROWS,
+    progress: Callable[[str], None] = print,
+) -> dict:
+    """Export collection (optionally a date range) to month partitions under out_dir/collection"""
+    files: List[Path] = []
+    rows = 0
+    began = time.monotonic()
+    async for month, month_rows, path in export_months(db, collection, Path(out_dir), start_date, end_date, batch_rows):
+        rows += month_rows
+        files.append(path)
+        rate = rows / max(time.monotonic() - began, 1e-6)
+        progress(f"{collection} {month}: {month_rows} rows ({rows} total, {rate:.0f}/s)")
+    return {"collection": collection, "rows": rows, "months": len(files), "files": files}
+
+
+class ZipSink:
+    """Write-only target for a zip being streamed; zipfile sees it can't seek and writes data descriptors"""
+
+    def __init__(self):
+        self.chunks: List[bytes] = []
+
+    def write(self, data) -> int:
+        self.chunks.append(bytes(data))
+        return len(data)
+
+    def flush(self):
+        pass
+
+    def take(self) -> bytes:
+        data = b"".join(self.chunks)
+        self.chunks = []
+        return data
+
+
+async def stream_zip(db, collection: str, start_date: Optional[str] = None,
+                     end_date: Optional[str] = None) -> AsyncIterator[bytes]:
+    """
+    The month partitions as one zip (paths kept, stored as-is since Parquet is
+    already compressed), yielded a month at a time. Each month's file is removed
+    once sent, so the disk holds at most one partition.
+    """
+    work_dir = Path(tempfile.mkdtemp(prefix="parquet_export_"))
+    sink = ZipSink()
+    archive = zipfile.ZipFile(sink, "w", compression=zipfile.ZIP_STORED)
+    try:
+        async for _, _, path in export_months(db, collection, work_dir, start_date, end_date):
+            await run_in_thread(archive.write, path, path.relative_to(work_dir).as_posix())
+            path.unlink()
+            yield sink.take()
+        await run_in_thread(archive.close)
+        yield sink.take()
+    finally:
+        shutil.rmtree(work_dir, ignore_errors=True)
+
+
+def main():
+    from dotenv import load_dotenv
+    from motor.motor_asyncio import AsyncIOMotorClient
+
+    parser = argparse.ArgumentParser(description="Export a collection to month-partitioned Parquet files")
+    parser.add_argument("collection", choices=sorted(EXPORT_FIELDS))
+    parser.add_argument("--out", required=True, help="output directory")
+    parser.add_argument("--start", help="first date (YYYY-MM-DD)")
+    parser.add_argument("--end", help="last date (YYYY-MM-DD)")
+    parser.add_argument("--batch", type=int, default=EXPORT_BATCH_ROWS, help="rows per record batch")
+    args = parser.parse_args()
+
+    load_dotenv(Path(__file__).parent / '.env')
+
+    async def main_async():
+        client = AsyncIOMotorClient(os.environ['MONGO_URL'])
+        db = client[os.environ['DB_NAME']]
+        # Outside the server nothing loads which months are archived
+        await archive_state.load(db)
+        result = await export_collection(db, args.collection, args.out, args.start, args.end, args.batch)
+        print(f"{result['rows']} rows in {result['months']} month partitions under {Path(args.out) / args.collection}")
+        client.close()
+
+    asyncio.run(main_async())
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,296 @@
+"""
+Period Close Service for Nirbani Dairy
+Closing a day or month stores each farmer's, customer's and dairy plant's
+cumulative totals as of the period end in balance_snapshots, and records
+the close in period_closes so entries dated on or before it can no longer
+be changed. An opening balance is then one snapshot read plus the entries
+between the snapshot and the requested date.
+
+Each close only aggregates entries after the previous close, and only
+writes snapshots for entities that had entries in that window; an
+entity's latest snapshot stays valid until it has new entries.
+"""
+import uuid
+from calendar import monthrange
+from datetime import datetime, timedelta, timezone
+from typing import Awaitable, Callable, Dict, List, Optional, Tuple
+
+from pymongo import DESCENDING, UpdateOne
+
+from collection_store import source_collection
+
+ENTITY_TYPES = ("farmer", "customer", "dairy_plant")
+
+# Cumulative fields kept per entity type, named as on the entity documents
+TOTAL_FIELDS = {
+    "farmer": ("total_milk", "total_due", "total_paid", "balance"),
+    "customer": ("total_purchase", "total_paid", "balance"),
+    "dairy_plant": ("total_milk_supplied", "total_amount", "total_paid", "balance"),
+    "walkin_customer": ("pending_amount", "total_paid"),
+}
+
+# What each payment type does to a farmer (same rules as record_payment)
+FARMER_PAYMENT_EFFECTS = {
+    "advance": {"total_paid": 1, "balance": 1},
+    "deduction": {"total_due": -1, "balance": -1},
+    "payment": {"total_paid": 1, "balance": -1},
+}
+
+
+def farmer_payment_effect(payment_type: Optional[str], amount: float) -> Dict[str, float]:
+    """$inc a farmer gets from one payment; unknown types count as normal payments"""
+    signs = FARMER_PAYMENT_EFFECTS.get(payment_type, FARMER_PAYMENT_EFFECTS["payment"])
+    return {field: sign * amount for field, sign in signs.items()}
+
+
+def _signed_amount(field: str):
+    """$group expression summing a payment's effect on `field` by payment type"""
+    branches = [
+        {"case": {"$eq": ["$payment_type", payment_type]}, "then": {"$multiply": ["$amount", signs.get(field, 0)]}}
+        for payment_type, signs in FARMER_PAYMENT_EFFECTS.items() if payment_type != "payment"
+    ]
+    default = {"$multiply": ["$amount", FARMER_PAYMENT_EFFECTS["payment"].get(field, 0)]}
+    return {"$sum": {"$switch": {"branches": branches, "default": default}}}
+
+
+# Plant receivable per dispatch: the dairy's slip amount once matched, our own figure before that
+DISPATCH_RECEIVABLE = {"$cond": [{"$eq": ["$slip_matched", True]}, {"$ifNull": ["$slip_amount", 0]}, "$net_receivable"]}
+
+
+def _sources(entity_type: str, customer_ids: List[str]) -> List[Tuple[str, str, dict, dict]]:
+    """(collection, entity key, extra $match, $group fields) contributing to an entity type"""
+    if entity_type == "farmer":
+        return [
+            ("milk_collections", "farmer_id", {}, {
+                "total_milk": {"$sum": "$quantity"},
+                "total_due": {"$sum": "$amount"},
+                "balance": {"$sum": "$amount"},
+            }),
+            # Customer payments share the payments collection (keyed by farmer_id)
+            ("payments", "farmer_id", {"farmer_id": {"$nin": customer_ids}}, {
+                field: _signed_amount(field) for field in ("total_due", "total_paid", "balance")
+            }),
+        ]
+    if entity_type == "customer":
+        return [
+            ("sales", "customer_id", {"is_shop_sale": {"$ne": True}}, {
+                "total_purchase": {"$sum": "$amount"},
+                "balance": {"$sum": "$amount"},
+            }),
+            ("payments", "farmer_id", {"farmer_id": {"$in": customer_ids}}, {
+                "total_paid": {"$sum": "$amount"},
+                "balance": {"$sum": {"$multiply": ["$amount", -1]}},
+            }),
+        ]
+    if entity_type == "dairy_plant":
+        return [
+            ("dispatches", "dairy_plant_id", {}, {
+                "total_milk_supplied": {"$sum": "$quantity_kg"},
+                "total_amount": {"$sum": DISPATCH_RECEIVABLE},
+                "balance": {"$sum": DISPATCH_RECEIVABLE},
+            }),
+            ("dairy_payments", "dairy_plant_id", {}, {
+                "total_paid": {"$sum": "$amount"},
+                "balance": {"$sum": {"$multiply": ["$amount", -1]}},
+            }),
+        ]
+    if entity_type == "walkin_customer":
+        return [
+            ("sales", "customer_id", {"is_udhar": True}, {
+                "pending_amount": {"$sum": "$amount"},
+            }),
+            ("udhar_payments", "walkin_customer_id", {}, {
+                "pending_amount": {"$sum": {"$multiply": ["$amount", -1]}},
+                "total_paid": {"$sum": "$amount"},
+            }),
+        ]
+    raise ValueError(f"Unknown entity type {entity_type}")
+
+
+def date_filter(after: Optional[str] = None, through: Optional[str] = None) -> dict:
+    """Entries dated after `after` (exclusive) and up to `through` (inclusive)"""
+    dates = {}
+    if after:
+        dates["$gt"] = after
+    if through:
+        dates["$lte"] = through
+    return {"date": dates} if dates else {}
+
+
+async def customer_ids(db) -> List[str]:
+    return await db.customers.distinct("id")
+
+
+async def entity_totals(
+    db,
+    entity_type: str,
+    after: Optional[str] = None,
+    through: Optional[str] = None,
+    entity_ids: Optional[List[str]] = None,
+    customers: Optional[List[str]] = None,
+) -> Dict[str, Dict[str, float]]:
+    """
+    Sum every entity's totals over a date window (no bounds = all history),
+    one $group aggregation per source collection
+    """
+    if customers is None:
+        if entity_ids is None:
+            customers = await customer_ids(db)
+        else:
+            # Farmer and customer ids never overlap, so the given ids settle which payments count
+            customers = entity_ids if entity_type == "customer" else []
+    totals: Dict[str, Dict[str, float]] = {}
+    for collection, key, extra, fields in _sources(entity_type, customers):
+        match = {**date_filter(after, through), **extra}
+        if entity_ids is not None:
+            match = {"$and": [match, {key: {"$in": entity_ids}}]}
+        pipeline = [{"$match": match}, {"$group": {"_id": f"${key}", **fields}}]
+        async for row in source_collection(db, collection).aggregate(pipeline, allowDiskUse=True):
+            if row["_id"] is None:
+                continue
+            entity = totals.setdefault(row["_id"], dict.fromkeys(TOTAL_FIELDS[entity_type], 0.0))
+            for field in fields:
+                entity[field] += row[field] or 0
+    return totals
+
+
+def period_bounds(period_type: str, period: str) -> Tuple[str, str]:
+    """First and last date of a "day" (YYYY-MM-DD) or "month" (YYYY-MM) period"""
+    if period_type == "day":
+        datetime.strptime(period, "%Y-%m-%d")
+        return period, period
+    if period_type == "month":
+        month = datetime.strptime(period, "%Y-%m")
+        last = monthrange(month.year, month.month)[1]
+        return f"{period}-01", f"{period}-{last:02d}"
+    raise ValueError("period_type must be 'day' or 'month'")
+
+
+def previous_day(date: str) -> str:
+    return (datetime.strptime(date, "%Y-%m-%d") - timedelta(days=1)).strftime("%Y-%m-%d")
+
+
+async def latest_close(db) -> Optional[dict]:
+    return await db.period_closes.find_one({}, {"_id": 0}, sort=[("end_date", DESCENDING)])
+
+
+async def latest_snapshots(db, entity_type: str, entity_ids: List[str], before: Optional[str] = None) -> Dict[str, dict]:
+    """Each entity's most recent snapshot (strictly before `before`, if given)"""
+    match = {"entity_type": entity_type, "entity_id": {"$in": entity_ids}}
+    if before:
+        match["period_end"] = {"$lt": before}
+    pipeline = [
+        {"$match": match},
+        {"$sort": {"entity_id": 1, "period_end": -1}},
+        {"$group": {"_id": "$entity_id", "snapshot": {"$first": "$$ROOT"}}},
+    ]
+    return {row["_id"]: row["snapshot"] async for row in db.balance_snapshots.aggregate(pipeline)}
+
+
+async def close_period(
+    db,
+    period_type: str,
+    period: str,
+    closed_by: str,
+    lock: Optional[Callable[[Optional[str]], Awaitable[None]]] = None,
+) -> dict:
+    """
+    Close everything up to the end of the period. `await lock(end_date)` runs
+    right after the close is recorded and before any totals are aggregated,
+    so the caller can stop accepting entries in the period (in every worker)
+    first. If the close fails, its record and snapshots are removed and
+    `lock` is moved back to the previous close.
+    """
+    start_date, end_date = period_bounds(period_type, period)
+    previous = await latest_close(db)
+    after = previous["end_date"] if previous else None
+    if after and end_date <= after:
+        raise ValueError(f"Already closed through {after}")
+
+    close_doc = {
+        "id": str(uuid.uuid4()),
+        "period_type": period_type,
+        "period": period,
+        "start_date": start_date,
+        "end_date": end_date,
+        "previous_end_date": after,
+        "status": "closing",
+        "closed_by": closed_by,
+        "closed_at": datetime.now(timezone.utc).isoformat(),
+    }
+    await db.period_closes.insert_one(close_doc)
+    close_doc.pop("_id", None)
+    try:
+        if lock:
+            await lock(end_date)
+
+        customers = await customer_ids(db)
+        counts = {}
+        for entity_type in ENTITY_TYPES:
+            window = await entity_totals(db, entity_type, after, end_date, customers=customers)
+            previous_snapshots = await latest_snapshots(db, entity_type, list(window))
+            ops = []
+            for entity_id, deltas in window.items():
+                opening = previous_snapshots.get(entity_id, {})
+                closing = {field: round(opening.get(field, 0) + deltas[field], 2) for field in TOTAL_FIELDS[entity_type]}
+                ops.append(UpdateOne(
+                    {"entity_type": entity_type, "entity_id": entity_id, "period_end": end_date},
+                    {"$set": {**closing, "close_id": close_doc["id"]}},
+                    upsert=True
+                ))
+            if ops:
+                await db.balance_snapshots.bulk_write(ops, ordered=False)
+            counts[entity_type] = len(ops)
+    except Exception:
+        await db.balance_snapshots.delete_many({"close_id": close_doc["id"]})
+        await db.period_closes.delete_one({"id": close_doc["id"]})
+        if lock:
+            await lock(after)
+        raise
+
+    await db.period_closes.update_one({"id": close_doc["id"]}, {"$set": {"status": "closed", "snapshots": counts}})
+    close_doc.update(status="closed", snapshots=counts)
+    return close_doc
+
+
+async def reopen_latest(db) -> Optional[dict]:
+    """Undo the most recent close and drop its snapshots"""
+    close_doc = await latest_close(db)
+    if not close_doc:
+        return None
+    await db.balance_snapshots.delete_many({"close_id": close_doc["id"]})
+    await db.period_closes.delete_one({"id": close_doc["id"]})
+    return close_doc
+
+
+async def opening_totals(db, entity_type: str, entity_id: str, start_date: Optional[str]) -> Dict[str, float]:
+    """
+    An entity's cumulative totals at the end of the day before start_date:
+    the latest snapshot before it plus the entries since that snapshot
+    """
+    zero = dict.fromkeys(TOTAL_FIELDS[entity_type], 0.0)
+    if not start_date:
+        return zero
+    snapshot = await db.balance_snapshots.find_one(
+        {"entity_type": entity_type, "entity_id": entity_id, "period_end": {"$lt": start_date}},
+        {"_id": 0}, sort=[("period_end", DESCENDING)]
+    )
+    gap = await entity_totals(
+        db, entity_type, after=snapshot["period_end"] if snapshot else None,
+        through=previous_day(start_date), entity_ids=[entity_id]
+    )
+    totals = gap.get(entity_id, zero)
+    return {field: round((snapshot or {}).get(field, 0) + totals[field], 2) for field in TOTAL_FIELDS[entity_type]}
+
+
+async def ensure_indexes(db):
+    await db.balance_snapshots.create_index(
+        [("entity_type", 1), ("entity_id", 1), ("period_end", -1)], unique=True
+    )
+    await db.balance_snapshots.create_index("close_id")
+    await db.period_closes.create_index("end_date", unique=True)
+    # Opening balances read one entity's entries since its snapshot
+    await db.payments.create_index([("farmer_id", 1), ("date", 1)])
+    await db.sales.create_index([("customer_id", 1), ("date", 1)])
+    await db.dispatches.create_index([("dairy_plant_id", 1), ("date", 1)])
+    await db.dairy_payments.create_index([("dairy_plant_id", 1), ("date", 1)])
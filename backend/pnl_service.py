@@ -0,0 +1,247 @@
+"""
+Daily P&L Service for Nirbani Dairy
+Keeps one daily_pnl row per date with the sums the profit report needs
+(dispatch income, farmer cost, deductions, expenses, retail sales, fat
+totals). Write handlers apply each change as an $inc, so a profit report
+over any range reads one small row per day instead of every raw entry.
+
+Rebuild the rows from raw data (e.g. after a crash between a write and its
+$inc, or on first deploy):
+
+    python pnl_service.py rebuild [--start YYYY-MM-DD] [--end YYYY-MM-DD]
+"""
+import argparse
+import asyncio
+import os
+from collections import defaultdict
+from pathlib import Path
+from typing import Dict, Iterable, List, Optional
+
+from pymongo import UpdateOne
+
+from collection_store import source_collection
+
+SOURCES = ("milk_collections", "sales", "expenses", "dispatches")
+CATEGORY_PREFIX = "expense_by_category."
+
+
+def category_key(category: Optional[str]) -> str:
+    # Field names can't contain dots or start with $
+    return (category or "other").replace(".", "_").lstrip("$") or "other"
+
+
+def contribution(source: str, doc: dict) -> Dict[str, float]:
+    """What one raw document adds to its day's row"""
+    if source == "milk_collections":
+        quantity = doc.get("quantity", 0)
+        return {
+            "collection_amount": doc.get("amount", 0),
+            "collection_liters": quantity,
+            "collection_fat_liters": doc.get("fat", 0) * quantity,
+            "collection_snf_liters": doc.get("snf", 0) * quantity,
+            "collection_count": 1,
+        }
+    if source == "dispatches":
+        quantity_kg = doc.get("quantity_kg", 0)
+        return {
+            "dispatch_amount": doc.get("net_receivable", 0),
+            "dispatch_kg": quantity_kg,
+            "dispatch_fat_kg": (doc.get("avg_fat") or 0) * quantity_kg,
+            "dispatch_deductions": doc.get("total_deduction", 0),
+            "dispatch_count": 1,
+        }
+    if source == "sales":
+        amount = doc.get("amount", 0)
+        return {
+            "sales_amount": amount,
+            "sales_milk_amount": amount if doc.get("product") == "milk" else 0,
+            "sales_count": 1,
+        }
+    if source == "expenses":
+        amount = doc.get("amount", 0)
+        return {
+            "expense_amount": amount,
+            CATEGORY_PREFIX + category_key(doc.get("category")): amount,
+            "expense_count": 1,
+        }
+    raise ValueError(f"No P&L contribution for {source}")
+
+
+def changes(source: str, before: Iterable[dict] = (), after: Iterable[dict] = ()) -> Dict[str, Dict[str, float]]:
+    """Per-date $inc deltas for documents replaced by others (insert: no before; delete: no after)"""
+    deltas: Dict[str, Dict[str, float]] = defaultdict(lambda: defaultdict(float))
+    for sign, docs in ((-1, before), (1, after)):
+        for doc in docs:
+            for field, value in contribution(source, doc).items():
+                deltas[doc["date"]][field] += sign * value
+    return {
+        date: {field: value for field, value in fields.items() if value}
+        for date, fields in deltas.items()
+        if any(fields.values())
+    }
+
+
+async def apply_changes(db, source: str, before: Iterable[dict] = (), after: Iterable[dict] = ()):
+    deltas = changes(source, before, after)
+    if deltas:
+        await db.daily_pnl.bulk_write(
+            [UpdateOne({"date": date}, {"$inc": inc}, upsert=True) for date, inc in deltas.items()],
+            ordered=False
+        )
+
+
+def sum_rows(rows: Iterable[dict]) -> Dict[str, float]:
+    totals: Dict[str, float] = defaultdict(float)
+    by_category: Dict[str, float] = defaultdict(float)
+    for row in rows:
+        for field, value in row.items():
+            if field in ("_id", "date"):
+                continue
+            if field == "expense_by_category":
+                for category, amount in value.items():
+                    by_category[category] += amount
+            else:
+                totals[field] += value
+    # $inc on floats leaves residue like 1e-13 after an entry is added and removed
+    totals = defaultdict(float, {field: round(value, 4) for field, value in totals.items()})
+    totals["expense_by_category"] = {k: round(v, 4) for k, v in by_category.items() if round(v, 2)}
+    return totals
+
+
+async def range_totals(db, start_date: str, end_date: str) -> Dict[str, float]:
+    rows = await db.daily_pnl.find({"date": {"$gte": start_date, "$lte": end_date}}, {"_id": 0}).to_list(None)
+    return sum_rows(rows)
+
+
+def profit_report(totals: Dict[str, float], start_date: str, end_date: str) -> dict:
+    """Profit report response built from summed day rows"""
+    total_dispatch_amount = totals.get("dispatch_amount", 0)
+    total_dispatch_kg = totals.get("dispatch_kg", 0)
+    avg_selling_rate = round(total_dispatch_amount / total_dispatch_kg, 2) if total_dispatch_kg > 0 else 0
+    avg_dispatch_fat = round(totals.get("dispatch_fat_kg", 0) / total_dispatch_kg, 2) if total_dispatch_kg > 0 else 0
+
+    total_farmer_amount = totals.get("collection_amount", 0)
+    total_collection_liters = totals.get("collection_liters", 0)
+    total_collection_kg = round(total_collection_liters * 1.03, 2)  # Convert liters to KG
+    avg_buying_rate = round(total_farmer_amount / total_collection_liters, 2) if total_collection_liters > 0 else 0
+    avg_collection_fat = round(totals.get("collection_fat_liters", 0) / total_collection_liters, 2) if total_collection_liters > 0 else 0
+    avg_collection_snf = round(totals.get("collection_snf_liters", 0) / total_collection_liters, 2) if total_collection_liters > 0 else 0
+
+    milk_difference_kg = round(total_collection_kg - total_dispatch_kg, 2)
+    milk_loss_percent = round((milk_difference_kg / total_collection_kg) * 100, 2) if total_collection_kg > 0 else 0
+
+    total_expenses = totals.get("expense_amount", 0)
+    total_retail_sales = totals.get("sales_amount", 0)
+    retail_milk_sales = totals.get("sales_milk_amount", 0)
+
+    total_income = total_dispatch_amount + total_retail_sales
+    gross_profit = round(total_income - total_farmer_amount, 2)
+
+    return {
+        "period": {"start_date": start_date, "end_date": end_date},
+        "dispatch": {
+            "total_kg": total_dispatch_kg,
+            "total_amount": total_dispatch_amount,
+            "avg_rate": avg_selling_rate,
+            "avg_fat": avg_dispatch_fat,
+            "total_deductions": totals.get("dispatch_deductions", 0),
+            "count": int(totals.get("dispatch_count", 0)),
+        },
+        "collection": {
+            "total_liters": total_collection_liters,
+            "total_kg": total_collection_kg,
+            "total_amount": total_farmer_amount,
+            "avg_rate": avg_buying_rate,
+            "avg_fat": avg_collection_fat,
+            "avg_snf": avg_collection_snf,
+            "count": int(totals.get("collection_count", 0)),
+        },
+        "retail_sales": {
+            "total_amount": total_retail_sales,
+            "milk_sales": retail_milk_sales,
+            "other_sales": total_retail_sales - retail_milk_sales,
+            "count": int(totals.get("sales_count", 0)),
+        },
+        "milk_tracking": {
+            "collected_kg": total_collection_kg,
+            "dispatched_kg": total_dispatch_kg,
+            "difference_kg": milk_difference_kg,
+            "loss_percent": milk_loss_percent,
+            "alert": milk_loss_percent > 1,
+        },
+        "fat_analysis": {
+            "collection_avg_fat": avg_collection_fat,
+            "dispatch_avg_fat": avg_dispatch_fat,
+            "fat_deviation": round(avg_collection_fat - avg_dispatch_fat, 2),
+        },
+        "expenses": {
+            "total": total_expenses,
+            "by_category": totals.get("expense_by_category", {}),
+        },
+        "profit": {
+            "total_income": total_income,
+            "gross_margin_per_unit": round(avg_selling_rate - avg_buying_rate, 2),
+            "gross_profit": gross_profit,
+            "net_profit": round(gross_profit - total_expenses, 2),
+        },
+    }
+
+
+async def ensure_indexes(db):
+    await db.daily_pnl.create_index("date", unique=True)
+
+
+async def rebuild(db, start_date: Optional[str] = None, end_date: Optional[str] = None) -> int:
+    """
+    Recompute day rows from raw entries. Writes made while this runs can be
+    lost or counted twice, so run it when nobody is entering data.
+    """
+    date_query = {}
+    if start_date:
+        date_query["$gte"] = start_date
+    if end_date:
+        date_query["$lte"] = end_date
+    query = {"date": date_query} if date_query else {}
+
+    rows: Dict[str, Dict[str, float]] = defaultdict(lambda: defaultdict(float))
+    for source in SOURCES:
+        async for doc in source_collection(db, source).find(query, {"_id": 0}):
+            if not doc.get("date"):
+                continue
+            for field, value in contribution(source, doc).items():
+                rows[doc["date"]][field] += value
+
+    await db.daily_pnl.delete_many(query)
+    if rows:
+        await db.daily_pnl.bulk_write(
+            [UpdateOne({"date": date}, {"$inc": dict(fields)}, upsert=True) for date, fields in rows.items()],
+            ordered=False
+        )
+    return len(rows)
+
+
+def main():
+    from dotenv import load_dotenv
+    from motor.motor_asyncio import AsyncIOMotorClient
+
+    parser = argparse.ArgumentParser(description="Daily P&L fact table maintenance")
+    parser.add_argument("command", choices=["rebuild"])
+    parser.add_argument("--start", help="first date to rebuild (YYYY-MM-DD)")
+    parser.add_argument("--end", help="last date to rebuild (YYYY-MM-DD)")
+    args = parser.parse_args()
+
+    load_dotenv(Path(__file__).parent / '.env')
+
+    async def run():
+        client = AsyncIOMotorClient(os.environ['MONGO_URL'])
+        db = client[os.environ['DB_NAME']]
+        await ensure_indexes(db)
+        days = await rebuild(db, args.start, args.end)
+        print(f"Rebuilt daily_pnl for {days} days")
+        client.close()
+
+    asyncio.run(run())
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,152 @@
+"""
+Ledger Reconciliation Service for Nirbani Dairy
+Farmer, customer, walk-in customer and dairy plant totals are kept up to
+date by $inc on every write, so a handler that fails halfway leaves them
+wrong. This recomputes them from the source entries (one $group
+aggregation per source collection), reports every entity whose stored
+totals differ, and can write the computed values back.
+
+    python reconcile_service.py [--repair] [--only farmer,customer]
+
+Repairs only apply to entities whose stored totals still match what was
+read at the start; anything changed by a concurrent write is reported as
+skipped, so rerun the job (ideally outside entry hours) to pick it up.
+
+That guard needs every total change to reach the database together with
+its source row. A write-behind buffer (FARMER_WRITE_BEHIND) holds the $inc
+back while the row is already stored, so a repair would count the row and
+the flush would add it again: farmer repairs are refused while any process
+runs one.
+"""
+import argparse
+import asyncio
+import os
+import time
+from pathlib import Path
+from typing import Dict, List, Optional
+
+from pymongo import UpdateOne
+
+from batching import write_behind_active
+from period_service import TOTAL_FIELDS, customer_ids, entity_totals
+
+# Entity type -> collection holding its stored totals
+ENTITY_COLLECTIONS = {
+    "farmer": "farmers",
+    "customer": "customers",
+    "walkin_customer": "walkin_customers",
+    "dairy_plant": "dairy_plants",
+}
+TOLERANCE = 0.005
+BATCH_SIZE = 1000
+MAX_SAMPLES = 50
+
+
+async def reconcile_entity_type(db, entity_type: str, repair: bool = False, customers: Optional[List[str]] = None) -> dict:
+    """Diff (and optionally fix) the stored totals of one entity type"""
+    fields = TOTAL_FIELDS[entity_type]
+    collection = db[ENTITY_COLLECTIONS[entity_type]]
+    began = time.perf_counter()
+
+    # Read stored values before computing: a write whose row and $inc both land
+    # in between changes the stored value, so its conditional repair misses
+    # instead of double counting (see the module docstring for buffered $inc)
+    stored = {
+        doc["id"]: doc async for doc in collection.find({}, {"_id": 0, "id": 1, **{field: 1 for field in fields}})
+        if doc.get("id")
+    }
+    computed = await entity_totals(db, entity_type, customers=customers)
+
+    mismatches, samples, ops = 0, [], []
+    repaired = skipped = 0
+    for entity_id, doc in stored.items():
+        expected = computed.get(entity_id, dict.fromkeys(fields, 0.0))
+        diff = {
+            field: {"stored": doc.get(field), "computed": round(expected[field], 2)}
+            for field in fields
+            if abs((doc.get(field) or 0) - expected[field]) > TOLERANCE
+        }
+        if not diff:
+            continue
+        mismatches += 1
+        if len(samples) < MAX_SAMPLES:
+            samples.append({"id": entity_id, "fields": diff})
+        if repair:
+            ops.append(UpdateOne(
+                {"id": entity_id, **{field: doc.get(field) for field in fields}},
+                {"$set": {field: round(expected[field], 2) for field in fields}}
+            ))
+            if len(ops) >= BATCH_SIZE:
+                result = await collection.bulk_write(ops, ordered=False)
+                repaired += result.modified_count
+                skipped += len(ops) - result.matched_count
+                ops = []
+    if ops:
+        result = await collection.bulk_write(ops, ordered=False)
+        repaired += result.modified_count
+        skipped += len(ops) - result.matched_count
+
+    return {
+        "checked": len(stored),
+        "mismatched": mismatches,
+        "repaired": repaired,
+        "skipped": skipped,
+        "seconds": round(time.perf_counter() - began, 2),
+        "samples": samples,
+    }
+
+
+async def repair_blocked(db, entity_types: Optional[List[str]] = None) -> Optional[str]:
+    """Why totals of these entity types can't be repaired right now, or None"""
+    if "farmer" in (entity_types or ENTITY_COLLECTIONS) and await write_behind_active(db, ENTITY_COLLECTIONS["farmer"]):
+        return "Farmer totals are being written behind (FARMER_WRITE_BEHIND); repair them with write-behind off"
+    return None
+
+
+async def reconcile(db, repair: bool = False, entity_types: Optional[List[str]] = None) -> Dict[str, dict]:
+    """Reconcile every entity type (or the given ones)"""
+    if repair:
+        reason = await repair_blocked(db, entity_types)
+        if reason:
+            raise RuntimeError(reason)
+    customers = await customer_ids(db)
+    return {
+        entity_type: await reconcile_entity_type(db, entity_type, repair, customers)
+        for entity_type in (entity_types or ENTITY_COLLECTIONS)
+    }
+
+
+def main():
+    from dotenv import load_dotenv
+    from motor.motor_asyncio import AsyncIOMotorClient
+
+    parser = argparse.ArgumentParser(description="Recompute farmer, customer and dairy plant totals from entries")
+    parser.add_argument("--repair", action="store_true", help="write computed totals back (default: report only)")
+    parser.add_argument("--only", help="comma-separated entity types: " + ",".join(ENTITY_COLLECTIONS))
+    args = parser.parse_args()
+
+    load_dotenv(Path(__file__).parent / '.env')
+
+    async def run():
+        client = AsyncIOMotorClient(os.environ['MONGO_URL'])
+        db = client[os.environ['DB_NAME']]
+        try:
+            report = await reconcile(db, args.repair, args.only.split(",") if args.only else None)
+        except RuntimeError as e:
+            print(e)
+            client.close()
+            return
+        for entity_type, result in report.items():
+            print(
+                f"{entity_type:16} checked {result['checked']:>7}  mismatched {result['mismatched']:>6}  "
+                f"repaired {result['repaired']:>6}  skipped {result['skipped']:>4}  {result['seconds']:.2f}s"
+            )
+            for sample in result["samples"][:5]:
+                print(f"    {sample['id']}: {sample['fields']}")
+        client.close()
+
+    asyncio.run(run())
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,179 @@
+"""
+Report Cache for Nirbani Dairy
+Caches report results by report name and date range. Write handlers report
+which dates they changed so only the affected reports are dropped.
+"""
+import asyncio
+import functools
+import logging
+import time
+from collections import OrderedDict, deque
+from datetime import datetime, timezone
+from typing import Callable, Iterable, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+
+def utc_today() -> str:
+    return datetime.now(timezone.utc).strftime("%Y-%m-%d")
+
+
+class _Entry:
+    __slots__ = ("value", "start", "end", "sources", "stored_at")
+
+    def __init__(self, value, start: str, end: str, sources: Tuple[str, ...]):
+        self.value = value
+        self.start = start
+        self.end = end
+        self.sources = sources
+        self.stored_at = time.monotonic()
+
+
+class ReportCache:
+    """
+    Any write that touches a date inside a cached range drops that entry, so
+    reads always see completed writes. Ranges inside a locked (closed)
+    period, up to `locked_through()`, can't be written to and are otherwise
+    kept indefinitely. Every other range, past ones included, is fresh for
+    `today_ttl` seconds (a guard against writes nobody reported, such as a
+    missed message from another worker); after that the old result is served
+    while one background refresh runs, for up to `max_stale` seconds.
+
+    When reports read from replica set secondaries, `replica_settle` is how
+    long a secondary may take to see a write; results for ranges written to
+    within that window are returned but not stored.
+    """
+
+    def __init__(self, today_ttl: float = 30.0, max_stale: float = 300.0, max_entries: int = 500,
+                 replica_settle: float = 0.0, locked_through: Callable[[], Optional[str]] = lambda: None):
+        self.today_ttl = today_ttl
+        self.locked_through = locked_through
+        self.max_stale = max_stale
+        self.max_entries = max_entries
+        self.replica_settle = replica_settle
+        self._recent_writes = deque()  # (monotonic time, source, dates or None)
+        self._entries: "OrderedDict[tuple, _Entry]" = OrderedDict()
+        self._refreshing = set()
+        self._version = 0
+        self.hits = 0
+        self.stale_hits = 0
+        self.misses = 0
+        self.invalidations = 0
+
+    def cached(self, name: str, sources: Iterable[str], period: Callable[..., Tuple[str, str]],
+               exclude: Iterable[str] = ("current_user",)):
+        """
+        Decorator for async report handlers. `period(**params)` must resolve the
+        handler's parameters (including defaults) to the inclusive date range it reads;
+        `sources` are the collections the report reads.
+        """
+        sources = tuple(sources)
+        excluded = set(exclude)
+
+        def decorator(handler):
+            @functools.wraps(handler)
+            async def wrapper(*args, **kwargs):
+                params = {k: v for k, v in kwargs.items() if k not in excluded}
+                start, end = period(**params)
+                key = (name, start, end, tuple(sorted((k, repr(v)) for k, v in params.items())))
+                return await self.get_or_compute(key, start, end, sources, lambda: handler(*args, **kwargs))
+            return wrapper
+
+        return decorator
+
+    async def get_or_compute(self, key: tuple, start: str, end: str, sources: Tuple[str, ...], compute):
+        entry = self._entries.get(key)
+        if entry is not None:
+            age = time.monotonic() - entry.stored_at
+            if self._locked(entry.end) or age < self.today_ttl:
+                self.hits += 1
+                self._entries.move_to_end(key)
+                return entry.value
+            if age < self.max_stale:
+                self.stale_hits += 1
+                self._refresh(key, start, end, sources, compute)
+                return entry.value
+
+        self.misses += 1
+        return await self._compute_and_store(key, start, end, sources, compute)
+
+    async def _compute_and_store(self, key, start, end, sources, compute):
+        version = self._version
+        value = await compute()
+        if version != self._version:
+            # A write landed while computing; the result may already be out of date
+            return value
+        if self._settling(start, end, sources):
+            return value
+        self._entries[key] = _Entry(value, start, end, sources)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+        return value
+
+    def _locked(self, end: str) -> bool:
+        """Checked on every read, so reopening a period ends the indefinite caching of its ranges"""
+        locked = self.locked_through()
+        return bool(locked) and end <= locked
+
+    def _settling(self, start: str, end: str, sources: Tuple[str, ...]) -> bool:
+        """A recent write to this range may not have reached the secondary the report read from"""
+        if not self.replica_settle:
+            return False
+        self._prune_recent_writes()
+        return any(
+            source in sources and (dates is None or any(start <= d <= end for d in dates))
+            for _, source, dates in self._recent_writes
+        )
+
+    def _prune_recent_writes(self):
+        cutoff = time.monotonic() - self.replica_settle
+        while self._recent_writes and self._recent_writes[0][0] < cutoff:
+            self._recent_writes.popleft()
+
+    def _refresh(self, key, start, end, sources, compute):
+        if key in self._refreshing:
+            return
+
+        async def run():
+            try:
+                await self._compute_and_store(key, start, end, sources, compute)
+            except Exception as e:
+                logger.warning(f"Refreshing report {key[0]} failed: {e}")
+            finally:
+                self._refreshing.discard(key)
+
+        self._refreshing.add(key)
+        asyncio.get_running_loop().create_task(run())
+
+    def invalidate(self, source: str, dates: Optional[Iterable[Optional[str]]] = None):
+        """A write changed `source` on `dates`; unknown dates (None) affect every range"""
+        self._version += 1
+        dates = None if dates is None else [d for d in dates]
+        if dates is not None and any(d is None for d in dates):
+            dates = None
+        if self.replica_settle:
+            self._prune_recent_writes()
+            self._recent_writes.append((time.monotonic(), source, dates))
+        for key, entry in list(self._entries.items()):
+            if source not in entry.sources:
+                continue
+            if dates is not None and not any(entry.start <= d <= entry.end for d in dates):
+                continue
+            self.invalidations += 1
+            del self._entries[key]
+
+    def clear(self):
+        self._entries.clear()
+
+    def stats(self) -> dict:
+        return {
+            "entries": len(self._entries),
+            "hits": self.hits,
+            "stale_hits": self.stale_hits,
+            "misses": self.misses,
+            "invalidations": self.invalidations
+        }
+
+
+report_cache = ReportCache()
@@ -0,0 +1,61 @@
+"""
+Reporting Service for Nirbani Dairy
+Runs the reports, exports and bills routes (server.reports_router) as their
+own ASGI app, sharing models, auth and the database layer with server.py.
+Start it next to the main backend, which then runs with SERVE_REPORTS=0:
+
+    BIND=0.0.0.0:8002 gunicorn reporting_server:app --config gunicorn.conf.py
+
+nginx sends report paths here and everything else to the main backend.
+Cache invalidations from the main backend arrive over the cache bus; the
+period lock and archived months are loaded at startup exactly as server.py
+does (server.load_shared_state).
+"""
+from datetime import datetime, timezone
+
+from fastapi import FastAPI
+from starlette.middleware.cors import CORSMiddleware
+
+import executors
+import server
+from admission import AdmissionMiddleware
+
+app = FastAPI(title="Nirbani Dairy Reporting Service")
+app.include_router(server.reports_router)
+
+
+@app.get("/api/health")
+async def health_check():
+    return {"status": "healthy", "service": "reports", "timestamp": datetime.now(timezone.utc).isoformat()}
+
+
+app.add_middleware(AdmissionMiddleware, controller=server.admission)
+
+app.add_middleware(
+    CORSMiddleware,
+    allow_credentials=True,
+    allow_origins=[],
+    allow_origin_regex=r".*",
+    allow_methods=["*"],
+    allow_headers=["*"],
+    expose_headers=["*"],
+)
+
+
+@app.on_event("startup")
+async def load_state():
+    await server.load_shared_state()
+
+
+@app.on_event("startup")
+async def start_cache_bus():
+    await server.detect_replica_set()
+    await server.cache_bus.start(change_streams=server.transactions_supported)
+
+
+@app.on_event("shutdown")
+async def shutdown_db_client():
+    await server.archive_state.stop(server.db)
+    await server.cache_bus.stop()
+    executors.shutdown()
+    server.client.close()
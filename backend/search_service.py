@@ -0,0 +1,329 @@
+"""
+Search Service for Nirbani Dairy
+In-memory prefix index over farmer and customer names, villages and phone
+numbers. Every name is indexed under its spelling and under a phonetic key
+that Devanagari and Latin spellings share (रमेश and Ramesh both become
+"rmes"), so names typed on either keyboard find each other. Phone numbers
+match by prefix and by their last four digits.
+
+Terms live in one sorted list per kind, so a prefix lookup is a bisect plus
+the matching terms, and each term keeps its people sorted by name, so the
+top results come from merging a few lists rather than scoring every match.
+The index is loaded at startup and kept current by the write handlers.
+"""
+import bisect
+import heapq
+import re
+import unicodedata
+from collections import defaultdict
+from typing import Dict, List, Optional, Set, Tuple
+
+KINDS = ("farmer", "customer")
+INDEXED_FIELDS = ("id", "name", "phone", "village")
+PHONE_SUFFIX_DIGITS = 4
+MIN_PHONETIC_KEY = 2
+
+# ==================== TRANSLITERATION ====================
+
+_VOWELS = {
+    "अ": "a", "आ": "aa", "इ": "i", "ई": "ii", "उ": "u", "ऊ": "uu", "ऋ": "ri",
+    "ए": "e", "ऐ": "ai", "ओ": "o", "औ": "au", "ऑ": "o",
+}
+_MATRAS = {
+    "ा": "aa", "ि": "i", "ी": "ii", "ु": "u", "ू": "uu", "ृ": "ri",
+    "े": "e", "ै": "ai", "ो": "o", "ौ": "au", "ॉ": "o",
+}
+_CONSONANTS = {
+    "क": "k", "ख": "kh", "ग": "g", "घ": "gh", "ङ": "n",
+    "च": "ch", "छ": "chh", "ज": "j", "झ": "jh", "ञ": "n",
+    "ट": "t", "ठ": "th", "ड": "d", "ढ": "dh", "ण": "n",
+    "त": "t", "थ": "th", "द": "d", "ध": "dh", "न": "n",
+    "प": "p", "फ": "ph", "ब": "b", "भ": "bh", "म": "m",
+    "य": "y", "र": "r", "ल": "l", "व": "v", "ळ": "l",
+    "श": "sh", "ष": "sh", "स": "s", "ह": "h",
+    "क़": "q", "ख़": "kh", "ग़": "g", "ज़": "z", "ड़": "r", "ढ़": "rh", "फ़": "f", "य़": "y",
+}
+# Nukta letters are stored decomposed after NFC, so key the table the same way
+_CONSONANTS = {unicodedata.normalize("NFC", letter): latin for letter, latin in _CONSONANTS.items()}
+_SIGNS = {"ं": "n", "ँ": "n", "ः": "h"}
+_VIRAMA = "्"
+_NUKTA = "़"
+_DIGITS = {chr(0x0966 + i): str(i) for i in range(10)}
+
+
+def transliterate(text: str) -> str:
+    """Romanize Devanagari (roughly ITRANS); other characters pass through"""
+    text = unicodedata.normalize("NFC", text)
+    out: List[str] = []
+    pending_a = False  # a consonant's inherent vowel not yet written
+    for i, char in enumerate(text):
+        if char == _NUKTA:
+            continue
+        letter = char + _NUKTA if text[i + 1:i + 2] == _NUKTA else char
+        if letter in _CONSONANTS or char in _CONSONANTS:
+            if pending_a:
+                out.append("a")
+            out.append(_CONSONANTS.get(letter) or _CONSONANTS[char])
+            pending_a = True
+            continue
+        if char in _MATRAS:
+            out.append(_MATRAS[char])
+        elif char == _VIRAMA:
+            pass
+        elif char in _SIGNS:
+            if pending_a:
+                out.append("a")
+            out.append(_SIGNS[char])
+        else:
+            if pending_a and not char.isspace():
+                out.append("a")
+            out.append(_VOWELS.get(char) or _DIGITS.get(char) or char)
+        pending_a = False
+    # The inherent vowel at the end of a word is never written out: राम -> "ram"
+    return "".join(out)
+
+
+_ASPIRATED = re.compile(r"([bcdgjkpst])h+")
+_DOUBLED = re.compile(r"(.)\1+")
+
+
+def phonetic_key(token: str) -> str:
+    """Spelling-insensitive key shared by Hindi and English spellings of a name"""
+    key = transliterate(token).lower()
+    key = "".join(c for c in unicodedata.normalize("NFKD", key) if not unicodedata.combining(c))
+    key = re.sub(r"[^a-z0-9]", "", key)
+    for old, new in (("ngh", "nh"), ("ee", "i"), ("oo", "u"), ("ph", "f"), ("w", "v"), ("z", "j"), ("q", "k"), ("ck", "k")):
+        key = key.replace(old, new)
+    key = _ASPIRATED.sub(r"\1", key)
+    key = _DOUBLED.sub(r"\1", key)
+    # Whether a short "a" is written varies between spellings (Bhagwan / भगवान = bhagavaan,
+    # Kamla / कमला = kamalaa), so only the first letter keeps it
+    return key[:1] + key[1:].replace("a", "")
+
+
+def text_tokens(text: Optional[str]) -> List[str]:
+    return [token for token in re.split(r"[\s.,/()-]+", (text or "").lower()) if token]
+
+
+def digits(text: Optional[str]) -> str:
+    return re.sub(r"\D", "", text or "")
+
+
+# ==================== INDEX ====================
+
+# Rank of each kind of match, best first
+EXACT, PREFIX, PHONETIC, PHONE_EXACT, PHONE_SUFFIX, PHONE_PREFIX = 6, 4, 3, 10, 5, 4
+
+
+class Posting:
+    """People sharing one term: a set for intersecting, a name-sorted list for ranking"""
+    __slots__ = ("ids", "by_name")
+
+    def __init__(self):
+        self.ids: Set[str] = set()
+        self.by_name: List[Tuple[str, str]] = []  # (lowercase name, id)
+
+    def add(self, sort_name: str, doc_id: str, sort: bool = True):
+        self.ids.add(doc_id)
+        if sort:
+            bisect.insort(self.by_name, (sort_name, doc_id))
+        else:
+            self.by_name.append((sort_name, doc_id))
+
+    def discard(self, sort_name: str, doc_id: str):
+        if doc_id in self.ids:
+            self.ids.discard(doc_id)
+            i = bisect.bisect_left(self.by_name, (sort_name, doc_id))
+            del self.by_name[i]
+
+
+class SearchIndex:
+    """Prefix index over the people of one kind (farmers or customers)"""
+
+    def __init__(self):
+        self.docs: Dict[str, dict] = {}
+        self._sort_names: Dict[str, str] = {}
+        self._terms: List[str] = []  # distinct terms, sorted
+        # term -> people with the term in their name, and people with it elsewhere (village, phone)
+        self._in_name: Dict[str, Posting] = {}
+        self._in_other: Dict[str, Posting] = {}
+        self._terms_by_id: Dict[str, List[str]] = {}
+        self._phone_suffix: Dict[str, Posting] = defaultdict(Posting)
+
+    def __len__(self):
+        return len(self.docs)
+
+    @staticmethod
+    def _terms_for(doc: dict) -> Dict[str, bool]:
+        terms: Dict[str, bool] = {}
+        for field in ("village", "name"):
+            for token in text_tokens(doc.get(field)):
+                for term in (token, "~" + phonetic_key(token)):
+                    terms[term] = field == "name"
+        phone = digits(doc.get("phone"))
+        if phone:
+            terms["#" + phone] = False
+        return terms
+
+    def _add(self, doc: dict, sort: bool = True):
+        doc = {field: doc.get(field) for field in INDEXED_FIELDS}
+        doc_id = doc["id"]
+        sort_name = self._sort_names[doc_id] = (doc.get("name") or "").lower()
+        self.docs[doc_id] = doc
+        terms = self._terms_for(doc)
+        self._terms_by_id[doc_id] = list(terms)
+        for term, in_name in terms.items():
+            if term not in self._in_name:
+                self._in_name[term], self._in_other[term] = Posting(), Posting()
+                if sort:
+                    bisect.insort(self._terms, term)
+            (self._in_name if in_name else self._in_other)[term].add(sort_name, doc_id, sort)
+        phone = digits(doc.get("phone"))
+        if len(phone) >= PHONE_SUFFIX_DIGITS:
+            self._phone_suffix[phone[-PHONE_SUFFIX_DIGITS:]].add(sort_name, doc_id, sort)
+
+    def load(self, docs: List[dict]):
+        """Replace the index contents in one pass"""
+        self.docs, self._sort_names, self._terms_by_id = {}, {}, {}
+        self._in_name, self._in_other = {}, {}
+        self._phone_suffix = defaultdict(Posting)
+        for doc in docs:
+            self._add(doc, sort=False)
+        self._terms = sorted(self._in_name)
+        for posting in (*self._in_name.values(), *self._in_other.values(), *self._phone_suffix.values()):
+            posting.by_name.sort()
+
+    def upsert(self, doc: dict):
+        """Add a person, or re-index one whose name, phone or village changed"""
+        self.remove(doc["id"])
+        self._add(doc)
+
+    def remove(self, doc_id: str):
+        doc = self.docs.pop(doc_id, None)
+        if doc is None:
+            return
+        sort_name = self._sort_names.pop(doc_id)
+        for term in self._terms_by_id.pop(doc_id, []):
+            self._in_name[term].discard(sort_name, doc_id)
+            self._in_other[term].discard(sort_name, doc_id)
+            if not self._in_name[term].ids and not self._in_other[term].ids:
+                del self._in_name[term], self._in_other[term]
+                i = bisect.bisect_left(self._terms, term)
+                if i < len(self._terms) and self._terms[i] == term:
+                    del self._terms[i]
+        phone = digits(doc.get("phone"))
+        if len(phone) >= PHONE_SUFFIX_DIGITS:
+            self._phone_suffix[phone[-PHONE_SUFFIX_DIGITS:]].discard(sort_name, doc_id)
+
+    def _prefix(self, prefix: str, limit: int) -> List[str]:
+        start = bisect.bisect_left(self._terms, prefix)
+        matches = []
+        for term in self._terms[start:start + limit]:
+            if not term.startswith(prefix):
+                break
+            matches.append(term)
+        return matches
+
+    def _tiers(self, terms: List[str], exact: Optional[str], exact_score: int, prefix_score: int, name_bonus: int):
+        """(score, postings) for the exact term and for the other prefix matches, name matches ranked higher"""
+        tiers = []
+        if exact in self._in_name:
+            tiers += [(exact_score + name_bonus, [self._in_name[exact]]), (exact_score, [self._in_other[exact]])]
+        rest = [term for term in terms if term != exact]
+        if rest:
+            tiers.append((prefix_score + name_bonus, [self._in_name[term] for term in rest]))
+            tiers.append((prefix_score, [self._in_other[term] for term in rest]))
+        return tiers
+
+    def _word_tiers(self, word: str, scan_limit: int):
+        tiers = self._tiers(self._prefix(word, scan_limit), word, EXACT, PREFIX, 1)
+        key = "~" + phonetic_key(word)
+        # A one-letter key would match half the index
+        if len(key) > MIN_PHONETIC_KEY:
+            tiers += self._tiers(self._prefix(key, scan_limit), None, PHONETIC, PHONETIC, 1)
+        return sorted(tiers, key=lambda tier: -tier[0])
+
+    @staticmethod
+    def _top(tiers, limit: int) -> List[Tuple[float, str]]:
+        """Best `limit` ids of score-ordered tiers, each id at its best score, ties by name"""
+        ranked, seen = [], set()
+        for score, postings in tiers:
+            for _, doc_id in heapq.merge(*(posting.by_name for posting in postings if posting.by_name)):
+                if doc_id not in seen:
+                    seen.add(doc_id)
+                    ranked.append((score, doc_id))
+                    if len(ranked) >= limit:
+                        return ranked
+        return ranked
+
+    def search(self, query: str, limit: int = 10, scan_limit: int = 2000) -> List[Tuple[float, dict]]:
+        """Best matches as (score, doc); every query word must match a word of the person"""
+        number = digits(query)
+        if number and len(number) == len(re.sub(r"\s", "", query)):
+            exact = "#" + number
+            tiers = [(PHONE_EXACT, [self._in_other[exact]])] if exact in self._in_other else []
+            if len(number) == PHONE_SUFFIX_DIGITS and number in self._phone_suffix:
+                tiers.append((PHONE_SUFFIX, [self._phone_suffix[number]]))
+            # Longer numbers starting with the query, in number order
+            tiers += [(PHONE_PREFIX, [self._in_other[term]]) for term in self._prefix(exact, limit + 1) if term != exact]
+            ranked = self._top(tiers, limit)
+        else:
+            words = [self._word_tiers(word, scan_limit) for word in text_tokens(query)]
+            if not words:
+                return []
+            if len(words) == 1:
+                ranked = self._top(words[0], limit)
+            else:
+                # Only people matching every word are scored
+                matched = [[(score, set().union(*(posting.ids for posting in postings))) for score, postings in tiers] for tiers in words]
+                candidates = set.intersection(*(set().union(*(ids for _, ids in tiers)) for tiers in matched))
+                scores = dict.fromkeys(candidates, 0)
+                for tiers in matched:
+                    for doc_id in candidates:
+                        scores[doc_id] += next(score for score, ids in tiers if doc_id in ids)
+                ranked = [
+                    (score, doc_id) for doc_id, score in heapq.nsmallest(
+                        limit, scores.items(), key=lambda item: (-item[1], self._sort_names[item[0]])
+                    )
+                ]
+        return [(score, self.docs[doc_id]) for score, doc_id in ranked]
+
+
+class SearchService:
+    """One index per kind of person"""
+
+    def __init__(self):
+        self.indexes = {kind: SearchIndex() for kind in KINDS}
+        self.ready = False
+
+    async def load(self, db):
+        projection = {field: 1 for field in INDEXED_FIELDS}
+        projection["_id"] = 0
+        for kind, collection in (("farmer", db.farmers), ("customer", db.customers)):
+            self.indexes[kind].load(await collection.find({}, projection).to_list(None))
+        self.ready = True
+
+    def upsert(self, kind: str, doc: dict):
+        self.indexes[kind].upsert(doc)
+
+    def remove(self, kind: str, doc_id: str):
+        self.indexes[kind].remove(doc_id)
+
+    def search(self, query: str, kinds=KINDS, limit: int = 10) -> List[dict]:
+        results = []
+        for kind in kinds:
+            results.extend(
+                {"kind": kind, **doc, "score": score}
+                for score, doc in self.indexes[kind].search(query, limit)
+            )
+        results.sort(key=lambda r: (-r["score"], (r.get("name") or "").lower()))
+        return results[:limit]
+
+    def ids(self, kind: str, query: str, limit: int = 1000) -> List[str]:
+        return [doc["id"] for _, doc in self.indexes[kind].search(query, limit)]
+
+    def stats(self) -> dict:
+        return {"ready": self.ready, **{kind: len(index) for kind, index in self.indexes.items()}}
+
+
+search_service = SearchService()
@@ -1,13 +1,20 @@
-from fastapi import FastAPI, APIRouter, HTTPException, Depends, status, UploadFile, File
+from fastapi import FastAPI, APIRouter, HTTPException, Depends, status, UploadFile, File, Header, BackgroundTasks, Request
 from fastapi.security import HTTPBearer, HTTPAuthorizationCredentials
 from fastapi.responses import HTMLResponse, StreamingResponse
 from dotenv import load_dotenv
 from starlette.middleware.cors import CORSMiddleware
 from motor.motor_asyncio import AsyncIOMotorClient
+from pymongo import UpdateOne
+from pymongo.read_preferences import SecondaryPreferred
+from pymongo.errors import BulkWriteError, DuplicateKeyError
 import os
+import asyncio
 import logging
+import io
+import re
 from pathlib import Path
-from pydantic import BaseModel, Field, ConfigDict, EmailStr
+from contextlib import nullcontext
+from pydantic import BaseModel, Field, ConfigDict, EmailStr, ValidationError
 from typing import List, Optional
 import uuid
 from datetime import datetime, timezone, timedelta
@@ -16,8 +23,36 @@ import bcrypt
 from bson import ObjectId
 
 # Import services
-from sms_service import send_collection_sms, send_payment_sms
-from bill_service import generate_farmer_bill_html, generate_daily_report_html
+from sms_service import sms_service, send_collection_sms, send_payment_sms, send_collection_sms_batch
+from bill_service import (
+    generate_farmer_bill_html, generate_daily_report_html,
+    generate_customer_thermal_bill_html, generate_customer_invoice_html,
+    generate_thermal_bill_html, generate_farmer_invoice_html,
+    generate_dispatch_bill_html, generate_dairy_statement_html
+)
+from export_service import collections_csv, payments_csv, farmers_csv, sales_csv, expenses_csv, parse_upload_rows
+from cache_service import farmer_cache, rate_chart_cache, reference_cache
+from batching import IncrementCoalescer, GroupCommitQueue, WRITE_BEHIND_COLLECTION
+from events import event_bus, format_sse
+from singleflight import singleflight
+from fanout import gather_queries
+from pnl_service import ensure_indexes as ensure_pnl_indexes, apply_changes, range_totals, profit_report
+from period_service import (
+    ensure_indexes as ensure_period_indexes, close_period, reopen_latest, latest_close,
+    opening_totals, farmer_payment_effect, period_bounds
+)
+from reconcile_service import ENTITY_COLLECTIONS, reconcile, repair_blocked
+from migrations import status as migration_status
+from search_service import search_service, INDEXED_FIELDS, KINDS as SEARCH_KINDS
+from report_cache import report_cache, utc_today
+from admission import AdmissionController, AdmissionMiddleware, lane_from_env
+from cache_bus import CacheBus
+from archive_service import ArchivedCollection, archive_state
+from parquet_export import EXPORT_FIELDS as PARQUET_COLLECTIONS, stream_zip as stream_parquet_zip
+from collection_store import COLLECTION_LAYOUT, UNIQUE_INDEX_NAME, TimeSeriesCollection, collection_store, ensure_layout
+import executors
+from executors import run_cpu, run_in_thread
+from idempotency_service import run_once, ensure_indexes as ensure_idempotency_indexes, IdempotencyConflict, IdempotencyMismatch
 
 ROOT_DIR = Path(__file__).parent
 load_dotenv(ROOT_DIR / '.env')
@@ -26,17 +61,41 @@ load_dotenv(ROOT_DIR / '.env')
 mongo_url = os.environ['MONGO_URL']
 client = AsyncIOMotorClient(mongo_url)
 db = client[os.environ['DB_NAME']]
+# Range scans for reports, exports and bills go to secondaries when the replica set has any.
+# Point lookups and farmer totals stay on the primary. 90 s is the smallest staleness bound MongoDB accepts.
+REPORT_MAX_STALENESS = int(os.environ.get("REPORT_MAX_STALENESS_SECONDS", "90"))
+db_read = client.get_database(
+    os.environ['DB_NAME'],
+    read_preference=SecondaryPreferred(max_staleness=REPORT_MAX_STALENESS)
+)
+# Milk collections in the layout chosen by COLLECTION_LAYOUT (plain documents, time-series or compact)
+milk_collections = collection_store(db)
+milk_collections_read = collection_store(db_read)
+# Payments and sales together with their archived months (see archive_service)
+payments_collection = ArchivedCollection(db, "payments")
+payments_collection_read = ArchivedCollection(db_read, "payments")
+sales_collection = ArchivedCollection(db, "sales")
+sales_collection_read = ArchivedCollection(db_read, "sales")
+
+# Write path capabilities, detected at startup
+collection_unique_index = False  # unique (farmer_id, date, shift, milk_type) index is in place
+transactions_supported = False  # connected to a replica set
 
 # JWT Settings
 JWT_SECRET = os.environ.get('JWT_SECRET', 'nirbani-dairy-secret-key-2026')
 JWT_ALGORITHM = "HS256"
 JWT_EXPIRATION_HOURS = 24
+# Stream tickets end up in the stream URL (and so in access logs): keep them short-lived
+STREAM_TICKET_SECONDS = 60
 
 # Create the main app
 app = FastAPI(title="Nirbani Dairy Management System")
 
 # Create a router with the /api prefix
 api_router = APIRouter(prefix="/api")
+# Reports, exports and bills: long-running reads that can be served by a separate
+# process (reporting_server.py) so they never share an event loop with the write path
+reports_router = APIRouter(prefix="/api")
 
 # Security
 security = HTTPBearer()
@@ -151,6 +210,10 @@ class MilkCollectionResponse(BaseModel):
     date: str
     created_at: str
 
+class MilkCollectionBatchCreate(BaseModel):
+    entries: List[MilkCollectionCreate]
+    date: Optional[str] = None  # default date for entries without their own date
+
 # Rate Chart Models
 class RateChartEntry(BaseModel):
     fat: float
@@ -349,6 +412,20 @@ class BulkCollectionUpload(BaseModel):
     entries: List[BulkCollectionEntry]
     branch_id: Optional[str] = None
 
+# Offline Sync Models
+class SyncOperation(BaseModel):
+    idempotency_key: str
+    type: str  # collection, sale, shop_sale, payment
+    payload: dict
+
+class SyncUpload(BaseModel):
+    operations: List[SyncOperation]
+
+# Period Close Models
+class PeriodCloseCreate(BaseModel):
+    period_type: str = "month"  # day, month
+    period: str  # YYYY-MM-DD for a day, YYYY-MM for a month
+
 # Dashboard Models
 class DashboardStats(BaseModel):
     total_farmers: int
@@ -487,11 +564,19 @@ def create_access_token(user_id: str, email: str, role: str) -> str:
     return jwt.encode(payload, JWT_SECRET, algorithm=JWT_ALGORITHM)
 
 async def get_current_user(credentials: HTTPAuthorizationCredentials = Depends(security)):
+    return await user_from_token(credentials.credentials)
+
+def create_stream_ticket(user_id: str) -> str:
+    """Short-lived token that only opens the live event stream"""
+    expiration = datetime.now(timezone.utc) + timedelta(seconds=STREAM_TICKET_SECONDS)
+    return jwt.encode({"sub": user_id, "purpose": "stream", "exp": expiration}, JWT_SECRET, algorithm=JWT_ALGORITHM)
+
+async def user_from_token(token: str, purpose: Optional[str] = None) -> dict:
+    """The user of a token (access tokens have no purpose claim, stream tickets purpose=stream)"""
     try:
-        token = credentials.credentials
         payload = jwt.decode(token, JWT_SECRET, algorithms=[JWT_ALGORITHM])
         user_id = payload.get("sub")
-        if user_id is None:
+        if user_id is None or payload.get("purpose") != purpose:
             raise HTTPException(status_code=401, detail="Invalid token")
         
         user = await db.users.find_one({"id": user_id}, {"_id": 0})
@@ -508,13 +593,15 @@ async def get_current_user(credentials: HTTPAuthorizationCredentials = Depends(s
 async def get_milk_rate(fat: float, snf: float) -> float:
     """Calculate milk rate based on fat and SNF using default rate chart"""
     rate_chart = await db.rate_charts.find_one({"is_default": True}, {"_id": 0})
-    
-    if not rate_chart or not rate_chart.get("entries"):
+    return rate_from_chart((rate_chart or {}).get("entries"), fat, snf)
+
+def rate_from_chart(entries: Optional[list], fat: float, snf: float) -> float:
+    """Price fat/SNF against already-loaded rate chart entries"""
+    if not entries:
         # Default formula: Rate = Fat * 6 + SNF * 2 (base formula for Indian dairy)
         return round(fat * 6 + snf * 2, 2)
-    
+
     # Find closest matching rate from chart
-    entries = rate_chart["entries"]
     closest_rate = None
     min_diff = float('inf')
     
@@ -526,11 +613,192 @@ async def get_milk_rate(fat: float, snf: float) -> float:
     
     return closest_rate if closest_rate else round(fat * 6 + snf * 2, 2)
 
+def farmer_fixed_rate(farmer: dict, milk_type: str) -> Optional[float]:
+    """Farmer's own per-litre rate for this milk type, if one is set"""
+    if milk_type == "buffalo" and farmer.get("buffalo_rate") and farmer["buffalo_rate"] > 0:
+        return farmer["buffalo_rate"]
+    if milk_type == "cow" and farmer.get("cow_rate") and farmer["cow_rate"] > 0:
+        return farmer["cow_rate"]
+    if farmer.get("fixed_rate") and farmer["fixed_rate"] > 0:
+        return farmer["fixed_rate"]
+    return None
+
 def calculate_snf(fat: float) -> float:
     """Calculate SNF from Fat using standard formula"""
     # Standard formula: SNF = 8.5 + (Fat / 4)
     return round(8.5 + (fat / 4), 2)
 
+# ==================== FARMER TOTALS ====================
+
+# SERVE_REPORTS=0 when reporting_server.py runs alongside and nginx routes report
+# paths to it. That process can't see this one's write-behind buffer, so
+# FARMER_WRITE_BEHIND is ignored then, as it is with several workers.
+SERVE_REPORTS = os.environ.get("SERVE_REPORTS", "1").lower() in ("1", "true", "yes")
+
+# Optional write-behind buffer (FARMER_WRITE_BEHIND=1) that merges farmer $inc
+# updates during shift bursts. Single process only: exact balance reads (SMS,
+# billing, payments) add the pending deltas of their own process's buffer, never
+# another's, so it stays off with several workers or a separate reporting service.
+farmer_balance_buffer = None
+if os.environ.get("FARMER_WRITE_BEHIND", "").lower() in ("1", "true", "yes"):
+    if int(os.environ.get("WEB_CONCURRENCY", "1")) > 1:
+        logger.warning("FARMER_WRITE_BEHIND ignored: it needs WEB_CONCURRENCY=1, other workers can't see buffered balances")
+    elif not SERVE_REPORTS:
+        logger.warning("FARMER_WRITE_BEHIND ignored: reports are served by reporting_server.py, which can't see buffered balances")
+    else:
+        farmer_balance_buffer = IncrementCoalescer(
+            db.farmers,
+            flush_interval=int(os.environ.get("FARMER_FLUSH_INTERVAL_MS", "300")) / 1000,
+            max_pending=int(os.environ.get("FARMER_FLUSH_MAX_PENDING", "200")),
+            registry=db[WRITE_BEHIND_COLLECTION]
+        )
+
+async def inc_farmer(farmer_id: str, deltas: dict):
+    """Apply an $inc to a farmer's totals, through the write-behind buffer when enabled"""
+    if farmer_balance_buffer:
+        farmer_balance_buffer.add(farmer_id, deltas)
+    else:
+        await db.farmers.update_one({"id": farmer_id}, {"$inc": deltas})
+
+def farmer_reads():
+    """Wrap farmer reads whose totals must include buffered deltas"""
+    return farmer_balance_buffer.consistent_read() if farmer_balance_buffer else nullcontext()
+
+def with_pending(farmer: Optional[dict]) -> Optional[dict]:
+    """Add buffered (not yet flushed) deltas to a farmer document"""
+    return farmer_balance_buffer.apply_pending(farmer) if farmer_balance_buffer else farmer
+
+def farmer_balance_change(collections: List[dict], payments: List[dict]) -> float:
+    """How much a farmer's balance moves over these entries"""
+    return (
+        sum(c.get("amount", 0) for c in collections)
+        + sum(farmer_payment_effect(p.get("payment_type"), p.get("amount", 0))["balance"] for p in payments)
+    )
+
+async def find_farmer_with_totals(farmer_id: str) -> Optional[dict]:
+    """One farmer document, totals including buffered deltas"""
+    async with farmer_reads():
+        return with_pending(await db.farmers.find_one({"id": farmer_id}, {"_id": 0}))
+
+# ==================== CACHE BUS ====================
+
+# With several worker processes, local cache evictions are broadcast to the other workers
+WEB_CONCURRENCY = int(os.environ.get("WEB_CONCURRENCY", "1"))
+cache_bus = CacheBus(db)
+cache_bus.on("farmer", lambda payload: farmer_cache.invalidate(payload.get("id")))
+cache_bus.on("rate_chart", lambda payload: rate_chart_cache.invalidate())
+cache_bus.on("report", lambda payload: report_cache.invalidate(payload["source"], payload.get("dates") or None))
+cache_bus.on("event", event_bus.deliver)
+cache_bus.on("reference", lambda payload: reference_cache.invalidate(payload.get("name")))
+cache_bus.on("search", lambda payload: search_service.upsert(payload["kind"], payload["doc"])
+             if payload.get("doc") else search_service.remove(payload["kind"], payload["id"]))
+
+def farmer_changed(farmer_id: str):
+    """Evict a farmer's cached static fields in every worker"""
+    farmer_cache.invalidate(farmer_id)
+    cache_bus.publish("farmer", {"id": farmer_id})
+
+def person_changed(kind: str, doc: Optional[dict] = None, doc_id: Optional[str] = None):
+    """Re-index a farmer or customer (doc) or drop it (doc_id) in every worker's search index"""
+    if doc:
+        doc = {field: doc.get(field) for field in INDEXED_FIELDS}
+        search_service.upsert(kind, doc)
+        cache_bus.publish("search", {"kind": kind, "doc": doc})
+    else:
+        search_service.remove(kind, doc_id)
+        cache_bus.publish("search", {"kind": kind, "id": doc_id})
+
+def reference_changed(name: str):
+    """Drop a cached reference table (settings, products, branches, dairy_plants) in every worker"""
+    reference_cache.invalidate(name)
+    cache_bus.publish("reference", {"name": name})
+
+def rate_chart_changed():
+    """Evict the cached default rate chart in every worker"""
+    rate_chart_cache.invalidate()
+    cache_bus.publish("rate_chart", {})
+
+# ==================== DAILY P&L ====================
+
+async def pnl_changed(source: str, before=(), after=()):
+    """Move the daily_pnl rows by what a write removed (`before`) and added (`after`)"""
+    await apply_changes(db, source, before, after)
+
+# ==================== PERIOD LOCK ====================
+
+# Entries dated on or before this date belong to a closed period and can't be changed
+closed_through: Optional[str] = None
+# How long a close waits for the lock to reach the other workers over the cache bus
+PERIOD_LOCK_SETTLE_SECONDS = float(os.environ.get("PERIOD_LOCK_SETTLE_SECONDS", "2"))
+
+def set_closed_through(date: Optional[str]):
+    global closed_through
+    closed_through = date
+
+# Reports over locked periods can't change, so only those are cached without a TTL
+report_cache.locked_through = lambda: closed_through
+
+cache_bus.on("period", lambda payload: set_closed_through(payload.get("closed_through")))
+cache_bus.on("archive", archive_state.apply)
+
+def period_lock_changed(date: Optional[str]):
+    """Move the lock in every worker"""
+    set_closed_through(date)
+    cache_bus.publish("period", {"closed_through": date})
+
+async def lock_period(date: Optional[str]):
+    """Move the lock for a period close, then give the other workers time to hear of it before totals are taken"""
+    period_lock_changed(date)
+    if cache_bus.mode:
+        await asyncio.sleep(PERIOD_LOCK_SETTLE_SECONDS)
+
+def ensure_open(*dates: Optional[str]):
+    """Reject a write that adds, changes or removes an entry in a closed period"""
+    if closed_through and any(date and date <= closed_through for date in dates):
+        raise HTTPException(status_code=400, detail=f"Period closed through {closed_through}. Reopen it to change entries.")
+
+# ==================== REPORT CACHE ====================
+
+def dates_changed(source: str, *dates: Optional[str]):
+    """Tell the report cache that a write changed `source` on these dates (none given = unknown)"""
+    report_cache.invalidate(source, dates or None)
+    cache_bus.publish("report", {"source": source, "dates": list(dates)})
+
+# Date ranges read by each cached report, resolved the same way the handlers resolve defaults
+def day_period(date: Optional[str] = None, **_):
+    day = date or utc_today()
+    return day, day
+
+def month_period(month: Optional[str] = None, **_):
+    month = month or utc_today()[:7]
+    year, mon = (int(part) for part in month.split("-"))
+    next_month = datetime(year + mon // 12, mon % 12 + 1, 1)
+    return f"{month}-01", (next_month - timedelta(days=1)).strftime("%Y-%m-%d")
+
+def month_to_date_period(start_date: Optional[str] = None, end_date: Optional[str] = None, **_):
+    return start_date or utc_today()[:8] + "01", end_date or utc_today()
+
+def last_30_days_period(start_date: Optional[str] = None, end_date: Optional[str] = None, **_):
+    default_start = (datetime.now(timezone.utc) - timedelta(days=30)).strftime("%Y-%m-%d")
+    return start_date or default_start, end_date or utc_today()
+
+def profit_period(date: Optional[str] = None, start_date: Optional[str] = None, end_date: Optional[str] = None, **_):
+    if date:
+        return date, date
+    start_date = start_date or utc_today()
+    return start_date, end_date or start_date
+
+# ==================== IDEMPOTENCY ====================
+
+async def run_idempotent(scope: str, idempotency_key: Optional[str], user: dict, payload: BaseModel, operation):
+    """Run a write once per user and Idempotency-Key; replays of the same body return the stored response"""
+    try:
+        return await run_once(db, scope, idempotency_key, operation, user_id=user["id"], payload=payload)
+    except IdempotencyConflict:
+        raise HTTPException(status_code=409, detail="A request with this Idempotency-Key is still being processed")
+    except IdempotencyMismatch:
+        raise HTTPException(status_code=422, detail="This Idempotency-Key was already used with a different request body")
+
 # ==================== AUTH ROUTES ====================
 
 @api_router.post("/auth/register", response_model=TokenResponse)
@@ -743,6 +1011,8 @@ async def create_farmer(farmer: FarmerCreate, current_user: dict = Depends(get_c
     }
     
     await db.farmers.insert_one(farmer_doc)
+    person_changed("farmer", farmer_doc)
+    event_bus.publish("farmer.created", {"id": farmer_id, "is_active": True})
     
     return FarmerResponse(**farmer_doc)
 
@@ -753,21 +1023,26 @@ async def get_farmers(
     current_user: dict = Depends(get_current_user)
 ):
     query = {}
-    if search:
+    if search and search_service.ready:
+        query["id"] = {"$in": search_service.ids("farmer", search)}
+    elif search:
         query["$or"] = [
-            {"name": {"$regex": search, "$options": "i"}},
-            {"phone": {"$regex": search, "$options": "i"}},
-            {"village": {"$regex": search, "$options": "i"}}
+            {"name": {"$regex": re.escape(search), "$options": "i"}},
+            {"phone": {"$regex": re.escape(search), "$options": "i"}},
+            {"village": {"$regex": re.escape(search), "$options": "i"}}
         ]
     if is_active is not None:
         query["is_active"] = is_active
     
-    farmers = await db.farmers.find(query, {"_id": 0}).sort("name", 1).collation({"locale": "en", "strength": 2}).to_list(1000)
+    async with farmer_reads():
+        farmers = await db.farmers.find(query, {"_id": 0}).sort("name", 1).collation({"locale": "en", "strength": 2}).to_list(1000)
+        farmers = [with_pending(f) for f in farmers]
     return [FarmerResponse(**f) for f in farmers]
 
 @api_router.get("/farmers/{farmer_id}", response_model=FarmerResponse)
 async def get_farmer(farmer_id: str, current_user: dict = Depends(get_current_user)):
-    farmer = await db.farmers.find_one({"id": farmer_id}, {"_id": 0})
+    async with farmer_reads():
+        farmer = with_pending(await db.farmers.find_one({"id": farmer_id}, {"_id": 0}))
     if not farmer:
         raise HTTPException(status_code=404, detail="Farmer not found")
     return FarmerResponse(**farmer)
@@ -795,17 +1070,31 @@ async def update_farmer(
         if dup:
             raise HTTPException(status_code=400, detail=f"Farmer with phone '{update_data['phone']}' already exists")
     
+    if COLLECTION_LAYOUT == "compact" and update_data.get("name", farmer["name"]) != farmer["name"]:
+        # Entries made so far keep the old name, as the stored copies do in the other layouts
+        await milk_collections.keep_farmer_name(farmer_id, farmer["name"])
     if update_data:
         await db.farmers.update_one({"id": farmer_id}, {"$set": update_data})
+        farmer_changed(farmer_id)
+        person_changed("farmer", {**farmer, **update_data})
     
-    updated_farmer = await db.farmers.find_one({"id": farmer_id}, {"_id": 0})
+    async with farmer_reads():
+        updated_farmer = with_pending(await db.farmers.find_one({"id": farmer_id}, {"_id": 0}))
     return FarmerResponse(**updated_farmer)
 
 @api_router.delete("/farmers/{farmer_id}")
 async def delete_farmer(farmer_id: str, current_user: dict = Depends(get_current_user)):
+    if COLLECTION_LAYOUT == "compact":
+        # Compact entries get farmer_name from the farmer record, so it is kept on them first
+        farmer = await farmer_cache.get(db, farmer_id)
+        if farmer:
+            await milk_collections.keep_farmer_name(farmer_id, farmer["name"])
     result = await db.farmers.delete_one({"id": farmer_id})
     if result.deleted_count == 0:
         raise HTTPException(status_code=404, detail="Farmer not found")
+    farmer_changed(farmer_id)
+    person_changed("farmer", doc_id=farmer_id)
+    event_bus.publish("farmer.deleted", {"id": farmer_id})
     return {"message": "Farmer deleted successfully"}
 
 @api_router.get("/farmers/{farmer_id}/ledger")
@@ -815,11 +1104,7 @@ async def get_farmer_ledger(
     end_date: Optional[str] = None,
     current_user: dict = Depends(get_current_user)
 ):
-    farmer = await db.farmers.find_one({"id": farmer_id}, {"_id": 0})
-    if not farmer:
-        raise HTTPException(status_code=404, detail="Farmer not found")
-    
-    # Get collections
+    # Collection filter
     collection_query = {"farmer_id": farmer_id}
     if start_date:
         collection_query["date"] = {"$gte": start_date}
@@ -829,9 +1114,7 @@ async def get_farmer_ledger(
         else:
             collection_query["date"] = {"$lte": end_date}
     
-    collections = await db.milk_collections.find(collection_query, {"_id": 0}).sort("date", -1).to_list(1000)
-    
-    # Get payments
+    # Payment filter
     payment_query = {"farmer_id": farmer_id}
     if start_date:
         payment_query["date"] = {"$gte": start_date}
@@ -841,7 +1124,14 @@ async def get_farmer_ledger(
         else:
             payment_query["date"] = {"$lte": end_date}
     
-    payments = await db.payments.find(payment_query, {"_id": 0}).sort("date", -1).to_list(1000)
+    farmer, collections, payments, opening = await gather_queries(
+        find_farmer_with_totals(farmer_id),
+        milk_collections.find(collection_query, {"_id": 0}).sort("date", -1).to_list(1000),
+        payments_collection.find(payment_query, {"_id": 0}).sort("date", -1).to_list(1000),
+        opening_totals(db, "farmer", farmer_id, start_date)
+    )
+    if not farmer:
+        raise HTTPException(status_code=404, detail="Farmer not found")
     
     return {
         "farmer": FarmerResponse(**farmer),
@@ -851,7 +1141,9 @@ async def get_farmer_ledger(
             "total_milk": farmer["total_milk"],
             "total_due": farmer["total_due"],
             "total_paid": farmer["total_paid"],
-            "balance": farmer["balance"]
+            "balance": farmer["balance"],
+            "opening_balance": opening["balance"],
+            "closing_balance": round(opening["balance"] + farmer_balance_change(collections, payments), 2)
         }
     }
 
@@ -860,48 +1152,46 @@ async def get_farmer_ledger(
 @api_router.post("/collections", response_model=MilkCollectionResponse)
 async def create_collection(
     collection: MilkCollectionCreate,
-    current_user: dict = Depends(get_current_user)
+    current_user: dict = Depends(get_current_user),
+    idempotency_key: Optional[str] = Header(None)
 ):
-    # Get farmer
-    farmer = await db.farmers.find_one({"id": collection.farmer_id}, {"_id": 0})
+    return await run_idempotent("collections", idempotency_key, current_user, collection, lambda: record_collection(collection))
+
+async def record_collection(collection: MilkCollectionCreate) -> MilkCollectionResponse:
+    # Get farmer (static fields only - balances are never read from the cache)
+    farmer = await farmer_cache.get(db, collection.farmer_id)
     if not farmer:
         raise HTTPException(status_code=404, detail="Farmer not found")
     
     # Use provided date or default to today
     date_str = collection.date if collection.date else datetime.now(timezone.utc).strftime("%Y-%m-%d")
-    
-    # Duplicate entry protection - check if entry already exists for this farmer, date, shift AND milk_type
+    ensure_open(date_str)
     milk_type = collection.milk_type or farmer.get("milk_type", "cow")
-    existing = await db.milk_collections.find_one({
-        "farmer_id": collection.farmer_id,
-        "date": date_str,
-        "shift": collection.shift,
-        "milk_type": milk_type
-    }, {"_id": 0})
-    
-    if existing:
-        raise HTTPException(
-            status_code=400, 
-            detail=f"Entry already exists for this farmer ({milk_type}) in {collection.shift} shift on {date_str}. Delete existing entry first."
-        )
+    duplicate_detail = f"Entry already exists for this farmer ({milk_type}) in {collection.shift} shift on {date_str}. Delete existing entry first."
+    
+    # Duplicate entry protection - the unique index on (farmer, date, shift, milk_type)
+    # rejects duplicates on insert; fall back to a lookup if the index could not be built
+    if not collection_unique_index:
+        existing = await milk_collections.find_one({
+            "farmer_id": collection.farmer_id,
+            "date": date_str,
+            "shift": collection.shift,
+            "milk_type": milk_type
+        }, {"_id": 0, "id": 1})
+        if existing:
+            raise HTTPException(status_code=400, detail=duplicate_detail)
     
     # Calculate SNF if not provided
     snf = collection.snf if collection.snf else calculate_snf(collection.fat)
     
     # Use provided rate override, or calculate from farmer/rate chart
-    milk_type = collection.milk_type or farmer.get("milk_type", "cow")
     rate = None
     if collection.rate and collection.rate > 0:
         rate = collection.rate
     else:
-        if milk_type == "buffalo" and farmer.get("buffalo_rate") and farmer["buffalo_rate"] > 0:
-            rate = farmer["buffalo_rate"]
-        elif milk_type == "cow" and farmer.get("cow_rate") and farmer["cow_rate"] > 0:
-            rate = farmer["cow_rate"]
-        elif farmer.get("fixed_rate") and farmer["fixed_rate"] > 0:
-            rate = farmer["fixed_rate"]
+        rate = farmer_fixed_rate(farmer, milk_type)
         if not rate:
-            rate = await get_milk_rate(collection.fat, snf)
+            rate = rate_from_chart(await rate_chart_cache.entries(db), collection.fat, snf)
     
     # Calculate amount
     amount = round(collection.quantity * rate, 2)
@@ -923,37 +1213,212 @@ async def create_collection(
         "date": date_str,
         "created_at": now.isoformat()
     }
+    farmer_inc = {
+        "total_milk": collection.quantity,
+        "total_due": amount,
+        "balance": amount
+    }
     
-    await db.milk_collections.insert_one(collection_doc)
-    
-    # Update farmer totals
-    await db.farmers.update_one(
-        {"id": collection.farmer_id},
-        {
-            "$inc": {
-                "total_milk": collection.quantity,
-                "total_due": amount,
-                "balance": amount
-            }
-        }
-    )
-    
-    # Send SMS notification (async, don't block on failure)
     try:
-        send_collection_sms(
-            farmer_name=farmer["name"],
-            farmer_phone=farmer["phone"],
-            quantity=collection.quantity,
-            fat=collection.fat,
-            rate=rate,
-            amount=amount,
-            shift=collection.shift
-        )
-    except Exception as e:
-        logger.warning(f"Failed to send collection SMS: {e}")
+        await store_collection(collection_doc, farmer_inc)
+    except DuplicateKeyError:
+        raise HTTPException(status_code=400, detail=duplicate_detail)
+    collection_doc.pop("_id", None)
+    await pnl_changed("milk_collections", after=[collection_doc])
+    dates_changed("milk_collections", date_str)
+    event_bus.publish("collection.created", collection_doc)
+    
+    # Send SMS notification off the event loop (don't block on failure)
+    run_in_background(
+        send_collection_sms,
+        farmer_name=farmer["name"],
+        farmer_phone=farmer["phone"],
+        quantity=collection.quantity,
+        fat=collection.fat,
+        rate=rate,
+        amount=amount,
+        shift=collection.shift
+    )
     
     return MilkCollectionResponse(**collection_doc)
 
+# Optional group commit: concurrent single-entry inserts share one insert_many
+collection_insert_queue = None
+if os.environ.get("COLLECTION_GROUP_COMMIT", "").lower() in ("1", "true", "yes"):
+    collection_insert_queue = GroupCommitQueue(
+        milk_collections,
+        max_wait=int(os.environ.get("COLLECTION_GROUP_COMMIT_MS", "5")) / 1000,
+        max_batch=int(os.environ.get("COLLECTION_GROUP_COMMIT_MAX", "100"))
+    )
+
+async def insert_collection(collection_doc: dict):
+    if collection_insert_queue:
+        await collection_insert_queue.insert(collection_doc)
+    else:
+        await milk_collections.insert_one(collection_doc)
+
+async def store_collection(collection_doc: dict, farmer_inc: dict):
+    """Insert a collection and apply its farmer totals (in one transaction where the server and layout allow it)"""
+    farmer_filter = {"id": collection_doc["farmer_id"]}
+    
+    if farmer_balance_buffer:
+        # Totals are buffered; only the insert goes to the database now
+        await insert_collection(collection_doc)
+        farmer_balance_buffer.add(collection_doc["farmer_id"], farmer_inc)
+        return
+    
+    # Time-series collections can't be written inside a transaction
+    if transactions_supported and not isinstance(milk_collections, TimeSeriesCollection):
+        async with await client.start_session() as session:
+            async with session.start_transaction():
+                await milk_collections.insert_one(collection_doc, session=session)
+                await db.farmers.update_one(farmer_filter, {"$inc": farmer_inc}, session=session)
+        return
+    
+    # Otherwise the $inc only follows an insert that went in, so a rejected
+    # duplicate never shows up in the farmer's totals, even for a moment
+    await insert_collection(collection_doc)
+    await db.farmers.update_one(farmer_filter, {"$inc": farmer_inc})
+
+def run_in_background(func, *args, **kwargs):
+    """Run a blocking notification call in the default thread pool and log failures"""
+    def call():
+        try:
+            func(*args, **kwargs)
+        except Exception as e:
+            logger.warning(f"Background task {func.__name__} failed: {e}")
+    asyncio.get_running_loop().run_in_executor(None, call)
+
+MAX_BATCH_ENTRIES = 1000
+
+@api_router.post("/collections/batch")
+async def create_collection_batch(
+    batch: MilkCollectionBatchCreate,
+    background_tasks: BackgroundTasks,
+    current_user: dict = Depends(get_current_user)
+):
+    """Enter a whole shift at once: bulk pricing, one insert_many and one bulk_write"""
+    if not batch.entries:
+        raise HTTPException(status_code=400, detail="No entries provided")
+    if len(batch.entries) > MAX_BATCH_ENTRIES:
+        raise HTTPException(status_code=400, detail=f"At most {MAX_BATCH_ENTRIES} entries per batch")
+
+    today = datetime.now(timezone.utc).strftime("%Y-%m-%d")
+    default_date = batch.date or today
+
+    # Load everything the shift needs in three queries instead of four per entry
+    farmer_ids = list({e.farmer_id for e in batch.entries})
+    entry_dates = list({e.date or default_date for e in batch.entries})
+    farmers = await db.farmers.find({"id": {"$in": farmer_ids}}, {"_id": 0}).to_list(len(farmer_ids))
+    farmers_by_id = {f["id"]: f for f in farmers}
+
+    existing = await milk_collections.find(
+        {"farmer_id": {"$in": farmer_ids}, "date": {"$in": entry_dates}},
+        {"_id": 0, "farmer_id": 1, "date": 1, "shift": 1, "milk_type": 1}
+    ).to_list(None)
+    taken = {(c["farmer_id"], c["date"], c["shift"], c.get("milk_type")) for c in existing}
+
+    chart_entries = await rate_chart_cache.entries(db)
+
+    results = [None] * len(batch.entries)
+    docs = []
+    doc_rows = []  # batch index of each doc
+    now = datetime.now(timezone.utc).isoformat()
+
+    for i, entry in enumerate(batch.entries):
+        farmer = farmers_by_id.get(entry.farmer_id)
+        if not farmer:
+            results[i] = {"index": i, "status": "error", "detail": "Farmer not found"}
+            continue
+
+        date_str = entry.date or default_date
+        if closed_through and date_str <= closed_through:
+            results[i] = {"index": i, "status": "error", "detail": f"Period closed through {closed_through}"}
+            continue
+        milk_type = entry.milk_type or farmer.get("milk_type", "cow")
+        dup_key = (entry.farmer_id, date_str, entry.shift, milk_type)
+        if dup_key in taken:
+            results[i] = {
+                "index": i, "status": "error",
+                "detail": f"Entry already exists for this farmer ({milk_type}) in {entry.shift} shift on {date_str}"
+            }
+            continue
+        taken.add(dup_key)
+
+        snf = entry.snf if entry.snf else calculate_snf(entry.fat)
+        if entry.rate and entry.rate > 0:
+            rate = entry.rate
+        else:
+            rate = farmer_fixed_rate(farmer, milk_type) or rate_from_chart(chart_entries, entry.fat, snf)
+        amount = round(entry.quantity * rate, 2)
+
+        docs.append({
+            "id": str(uuid.uuid4()),
+            "farmer_id": entry.farmer_id,
+            "farmer_name": farmer["name"],
+            "shift": entry.shift,
+            "quantity": entry.quantity,
+            "fat": entry.fat,
+            "snf": snf,
+            "rate": rate,
+            "amount": amount,
+            "milk_type": milk_type,
+            "date": date_str,
+            "created_at": now
+        })
+        doc_rows.append(i)
+
+    failed_docs = {}
+    if docs:
+        try:
+            await milk_collections.insert_many(docs, ordered=False)
+        except BulkWriteError as e:
+            for err in e.details.get("writeErrors", []):
+                failed_docs[err["index"]] = err.get("errmsg", "Insert failed")
+
+    # One $inc per farmer, merged across all of the farmer's inserted entries
+    farmer_incs = {}
+    sms_notifications = []
+    for pos, doc in enumerate(docs):
+        i = doc_rows[pos]
+        doc.pop("_id", None)
+        if pos in failed_docs:
+            results[i] = {"index": i, "status": "error", "detail": failed_docs[pos]}
+            continue
+        inc = farmer_incs.setdefault(doc["farmer_id"], {"total_milk": 0.0, "total_due": 0.0, "balance": 0.0})
+        inc["total_milk"] += doc["quantity"]
+        inc["total_due"] += doc["amount"]
+        inc["balance"] += doc["amount"]
+        results[i] = {"index": i, "status": "ok", "collection": MilkCollectionResponse(**doc)}
+        event_bus.publish("collection.created", doc)
+        sms_notifications.append({
+            "farmer_name": doc["farmer_name"],
+            "farmer_phone": farmers_by_id[doc["farmer_id"]]["phone"],
+            "quantity": doc["quantity"],
+            "fat": doc["fat"],
+            "rate": doc["rate"],
+            "amount": doc["amount"],
+            "shift": doc["shift"]
+        })
+
+    if farmer_incs:
+        await pnl_changed("milk_collections", after=[doc for pos, doc in enumerate(docs) if pos not in failed_docs])
+        dates_changed("milk_collections", *{doc["date"] for doc in docs})
+        if farmer_balance_buffer:
+            for fid, inc in farmer_incs.items():
+                farmer_balance_buffer.add(fid, inc)
+        else:
+            await db.farmers.bulk_write(
+                [UpdateOne({"id": fid}, {"$inc": inc}) for fid, inc in farmer_incs.items()],
+                ordered=False
+            )
+
+    if sms_notifications:
+        background_tasks.add_task(send_collection_sms_batch, sms_notifications)
+
+    success = sum(1 for r in results if r["status"] == "ok")
+    return {"success": success, "failed": len(results) - success, "results": results}
+
 @api_router.get("/collections", response_model=List[MilkCollectionResponse])
 async def get_collections(
     date: Optional[str] = None,
@@ -969,7 +1434,7 @@ async def get_collections(
     if shift:
         query["shift"] = shift
     
-    collections = await db.milk_collections.find(query, {"_id": 0}).sort("created_at", -1).to_list(1000)
+    collections = await milk_collections.find(query, {"_id": 0}).sort("created_at", -1).to_list(1000)
     return [MilkCollectionResponse(**c) for c in collections]
 
 @api_router.get("/collections/today", response_model=List[MilkCollectionResponse])
@@ -982,33 +1447,32 @@ async def get_today_collections(
     if shift:
         query["shift"] = shift
     
-    collections = await db.milk_collections.find(query, {"_id": 0}).sort("created_at", -1).to_list(1000)
+    collections = await milk_collections.find(query, {"_id": 0}).sort("created_at", -1).to_list(1000)
     return [MilkCollectionResponse(**c) for c in collections]
 
 @api_router.delete("/collections/{collection_id}")
 async def delete_collection(collection_id: str, current_user: dict = Depends(get_current_user)):
-    collection = await db.milk_collections.find_one({"id": collection_id}, {"_id": 0})
+    collection = await milk_collections.find_one({"id": collection_id}, {"_id": 0})
     if not collection:
         raise HTTPException(status_code=404, detail="Collection not found")
+    ensure_open(collection["date"])
     
     # Revert farmer totals
-    await db.farmers.update_one(
-        {"id": collection["farmer_id"]},
-        {
-            "$inc": {
-                "total_milk": -collection["quantity"],
-                "total_due": -collection["amount"],
-                "balance": -collection["amount"]
-            }
-        }
-    )
+    await inc_farmer(collection["farmer_id"], {
+        "total_milk": -collection["quantity"],
+        "total_due": -collection["amount"],
+        "balance": -collection["amount"]
+    })
     
-    await db.milk_collections.delete_one({"id": collection_id})
+    await milk_collections.delete_one({"id": collection_id})
+    await pnl_changed("milk_collections", before=[collection])
+    dates_changed("milk_collections", collection["date"])
+    event_bus.publish("collection.deleted", collection)
     return {"message": "Collection deleted successfully"}
 
 @api_router.put("/collections/{collection_id}")
 async def update_collection(collection_id: str, updates: dict, current_user: dict = Depends(get_current_user)):
-    collection = await db.milk_collections.find_one({"id": collection_id}, {"_id": 0})
+    collection = await milk_collections.find_one({"id": collection_id}, {"_id": 0})
     if not collection:
         raise HTTPException(status_code=404, detail="Collection not found")
     
@@ -1017,6 +1481,7 @@ async def update_collection(collection_id: str, updates: dict, current_user: dic
     
     allowed = {"date", "shift", "milk_type", "quantity", "fat", "snf", "rate"}
     update_data = {k: v for k, v in updates.items() if k in allowed and v is not None}
+    ensure_open(collection["date"], update_data.get("date"))
     
     qty = float(update_data.get("quantity", collection["quantity"]))
     rate = float(update_data.get("rate", collection["rate"]))
@@ -1025,19 +1490,30 @@ async def update_collection(collection_id: str, updates: dict, current_user: dic
     update_data["quantity"] = qty
     update_data["rate"] = rate
     
-    await db.milk_collections.update_one({"id": collection_id}, {"$set": update_data})
+    if not collection_unique_index and {"date", "shift", "milk_type"} & update_data.keys():
+        slot = {field: update_data.get(field, collection.get(field)) for field in ("date", "shift", "milk_type")}
+        if await milk_collections.find_one({"farmer_id": collection["farmer_id"], **slot, "id": {"$ne": collection_id}}, {"_id": 0, "id": 1}):
+            raise HTTPException(status_code=400, detail="Another entry already exists for this farmer, date, shift and milk type")
+    
+    try:
+        await milk_collections.update_one({"id": collection_id}, {"$set": update_data})
+    except DuplicateKeyError:
+        raise HTTPException(status_code=400, detail="Another entry already exists for this farmer, date, shift and milk type")
     
-    await db.farmers.update_one(
-        {"id": collection["farmer_id"]},
-        {"$inc": {"total_milk": qty - old_qty, "total_due": amount - old_amount, "balance": amount - old_amount}}
+    await inc_farmer(
+        collection["farmer_id"],
+        {"total_milk": qty - old_qty, "total_due": amount - old_amount, "balance": amount - old_amount}
     )
     
-    updated = await db.milk_collections.find_one({"id": collection_id}, {"_id": 0})
+    updated = await milk_collections.find_one({"id": collection_id}, {"_id": 0})
+    await pnl_changed("milk_collections", before=[collection], after=[updated])
+    dates_changed("milk_collections", collection["date"], updated["date"])
+    event_bus.publish("collection.updated", {"before": collection, "after": updated})
     return updated
 
 @api_router.put("/sales/{sale_id}")
 async def update_sale(sale_id: str, updates: dict, current_user: dict = Depends(get_current_user)):
-    sale = await db.sales.find_one({"id": sale_id}, {"_id": 0})
+    sale = await sales_collection.find_one({"id": sale_id}, {"_id": 0})
     if not sale:
         raise HTTPException(status_code=404, detail="Sale not found")
     
@@ -1045,6 +1521,7 @@ async def update_sale(sale_id: str, updates: dict, current_user: dict = Depends(
     
     allowed = {"date", "product", "quantity", "rate", "direct_amount"}
     update_data = {k: v for k, v in updates.items() if k in allowed and v is not None}
+    ensure_open(sale["date"], update_data.get("date"))
     
     direct_amount = update_data.get("direct_amount")
     if direct_amount and float(direct_amount) > 0:
@@ -1058,14 +1535,16 @@ async def update_sale(sale_id: str, updates: dict, current_user: dict = Depends(
         update_data["quantity"] = qty
         update_data["rate"] = rate
     
-    await db.sales.update_one({"id": sale_id}, {"$set": update_data})
+    await sales_collection.update_one({"id": sale_id}, {"$set": update_data})
+    await pnl_changed("sales", before=[sale], after=[{**sale, **update_data}])
+    dates_changed("sales", sale["date"], update_data.get("date", sale["date"]))
     
     await db.customers.update_one(
         {"id": sale["customer_id"]},
         {"$inc": {"total_purchase": amount - old_amount, "balance": amount - old_amount}}
     )
     
-    updated = await db.sales.find_one({"id": sale_id}, {"_id": 0})
+    updated = await sales_collection.find_one({"id": sale_id}, {"_id": 0})
     return updated
 
 # ==================== RATE CHART ROUTES ====================
@@ -1094,6 +1573,7 @@ async def create_rate_chart(
     }
     
     await db.rate_charts.insert_one(chart_doc)
+    rate_chart_changed()
     return RateChartResponse(**chart_doc)
 
 @api_router.get("/rate-charts", response_model=List[RateChartResponse])
@@ -1136,6 +1616,7 @@ async def update_rate_chart(
         }
     )
     
+    rate_chart_changed()
     updated = await db.rate_charts.find_one({"id": chart_id}, {"_id": 0})
     return RateChartResponse(**updated)
 
@@ -1144,6 +1625,7 @@ async def delete_rate_chart(chart_id: str, current_user: dict = Depends(get_curr
     result = await db.rate_charts.delete_one({"id": chart_id})
     if result.deleted_count == 0:
         raise HTTPException(status_code=404, detail="Rate chart not found")
+    rate_chart_changed()
     return {"message": "Rate chart deleted successfully"}
 
 @api_router.post("/rate-charts/calculate-rate")
@@ -1162,15 +1644,21 @@ async def calculate_rate(
 @api_router.post("/payments", response_model=PaymentResponse)
 async def create_payment(
     payment: PaymentCreate,
-    current_user: dict = Depends(get_current_user)
+    current_user: dict = Depends(get_current_user),
+    idempotency_key: Optional[str] = Header(None)
 ):
-    farmer = await db.farmers.find_one({"id": payment.farmer_id}, {"_id": 0})
+    return await run_idempotent("payments", idempotency_key, current_user, payment, lambda: record_payment(payment))
+
+async def record_payment(payment: PaymentCreate) -> PaymentResponse:
+    # Static fields only - the balance for the SMS is read after the update below
+    farmer = await farmer_cache.get(db, payment.farmer_id)
     if not farmer:
         raise HTTPException(status_code=404, detail="Farmer not found")
     
     payment_id = str(uuid.uuid4())
     now = datetime.now(timezone.utc)
     date_str = now.strftime("%Y-%m-%d")
+    ensure_open(date_str)
     
     payment_doc = {
         "id": payment_id,
@@ -1184,40 +1672,29 @@ async def create_payment(
         "created_at": now.isoformat()
     }
     
-    await db.payments.insert_one(payment_doc)
+    await payments_collection.insert_one(payment_doc)
+    dates_changed("payments", date_str)
     
-    # Update farmer totals based on payment type
-    if payment.payment_type == "advance":
-        # Advance increases balance (farmer owes us)
-        await db.farmers.update_one(
-            {"id": payment.farmer_id},
-            {"$inc": {"total_paid": payment.amount, "balance": payment.amount}}
-        )
-    elif payment.payment_type == "deduction":
-        # Deduction reduces from due amount
-        await db.farmers.update_one(
-            {"id": payment.farmer_id},
-            {"$inc": {"total_due": -payment.amount, "balance": -payment.amount}}
-        )
-    else:
-        # Normal payment
-        await db.farmers.update_one(
-            {"id": payment.farmer_id},
-            {"$inc": {"total_paid": payment.amount, "balance": -payment.amount}}
-        )
+    # Update farmer totals based on payment type: an advance increases the balance
+    # (farmer owes us), a deduction reduces the due amount, a payment settles it
+    farmer_inc = farmer_payment_effect(payment.payment_type, payment.amount)
+    await inc_farmer(payment.farmer_id, farmer_inc)
+    event_bus.publish("payment.created", {**payment_doc, "balance_delta": farmer_inc["balance"]})
     
-    # Calculate new balance and send SMS
-    new_balance = farmer["balance"] - payment.amount
-    try:
-        send_payment_sms(
-            farmer_name=farmer["name"],
-            farmer_phone=farmer["phone"],
-            amount=payment.amount,
-            payment_mode=payment.payment_mode,
-            new_balance=new_balance
-        )
-    except Exception as e:
-        logger.warning(f"Failed to send payment SMS: {e}")
+    # Read the new balance and send SMS
+    if sms_service.enabled:
+        try:
+            async with farmer_reads():
+                totals = with_pending(await db.farmers.find_one({"id": payment.farmer_id}, {"_id": 0, "id": 1, "balance": 1}))
+            send_payment_sms(
+                farmer_name=farmer["name"],
+                farmer_phone=farmer["phone"],
+                amount=payment.amount,
+                payment_mode=payment.payment_mode,
+                new_balance=(totals or {}).get("balance", 0)
+            )
+        except Exception as e:
+            logger.warning(f"Failed to send payment SMS: {e}")
     
     return PaymentResponse(**payment_doc)
 
@@ -1233,27 +1710,23 @@ async def get_payments(
     if date:
         query["date"] = date
     
-    payments = await db.payments.find(query, {"_id": 0}).sort("created_at", -1).to_list(1000)
+    payments = await payments_collection.find(query, {"_id": 0}).sort("created_at", -1).to_list(1000)
     return [PaymentResponse(**p) for p in payments]
 
 @api_router.delete("/payments/{payment_id}")
 async def delete_payment(payment_id: str, current_user: dict = Depends(get_current_user)):
-    payment = await db.payments.find_one({"id": payment_id}, {"_id": 0})
+    payment = await payments_collection.find_one({"id": payment_id}, {"_id": 0})
     if not payment:
         raise HTTPException(status_code=404, detail="Payment not found")
+    ensure_open(payment["date"])
     
-    # Revert farmer totals
-    await db.farmers.update_one(
-        {"id": payment["farmer_id"]},
-        {
-            "$inc": {
-                "total_paid": -payment["amount"],
-                "balance": payment["amount"]
-            }
-        }
-    )
+    # Revert farmer totals the way the payment's type applied them
+    reverse = {field: -value for field, value in farmer_payment_effect(payment.get("payment_type"), payment["amount"]).items()}
+    await inc_farmer(payment["farmer_id"], reverse)
     
-    await db.payments.delete_one({"id": payment_id})
+    await payments_collection.delete_one({"id": payment_id})
+    dates_changed("payments", payment["date"])
+    event_bus.publish("payment.deleted", {**payment, "balance_delta": reverse["balance"]})
     return {"message": "Payment deleted successfully"}
 
 # ==================== CUSTOMER ROUTES ====================
@@ -1294,6 +1767,7 @@ async def create_customer(customer: CustomerCreate, current_user: dict = Depends
     }
     
     await db.customers.insert_one(customer_doc)
+    person_changed("customer", customer_doc)
     return CustomerResponse(**customer_doc)
 
 @api_router.get("/customers", response_model=List[CustomerResponse])
@@ -1303,10 +1777,12 @@ async def get_customers(
     current_user: dict = Depends(get_current_user)
 ):
     query = {}
-    if search:
+    if search and search_service.ready:
+        query["id"] = {"$in": search_service.ids("customer", search)}
+    elif search:
         query["$or"] = [
-            {"name": {"$regex": search, "$options": "i"}},
-            {"phone": {"$regex": search, "$options": "i"}}
+            {"name": {"$regex": re.escape(search), "$options": "i"}},
+            {"phone": {"$regex": re.escape(search), "$options": "i"}}
         ]
     if customer_type:
         query["customer_type"] = customer_type
@@ -1345,6 +1821,7 @@ async def update_customer(
     
     if update_data:
         await db.customers.update_one({"id": customer_id}, {"$set": update_data})
+        person_changed("customer", {**customer, **update_data})
     updated = await db.customers.find_one({"id": customer_id}, {"_id": 0})
     return CustomerResponse(**updated)
 
@@ -1353,15 +1830,28 @@ async def delete_customer(customer_id: str, current_user: dict = Depends(get_cur
     customer = await db.customers.find_one({"id": customer_id}, {"_id": 0})
     if not customer:
         raise HTTPException(status_code=404, detail="Customer not found")
+    if closed_through and await sales_collection.find_one({"customer_id": customer_id, "date": {"$lte": closed_through}}, {"_id": 1}):
+        raise HTTPException(status_code=400, detail=f"Customer has sales in periods closed through {closed_through}")
     await db.customers.delete_one({"id": customer_id})
-    await db.sales.delete_many({"customer_id": customer_id})
+    person_changed("customer", doc_id=customer_id)
+    sales = await sales_collection.find({"customer_id": customer_id}, {"_id": 0}).to_list(None)
+    await sales_collection.delete_many({"customer_id": customer_id})
+    await pnl_changed("sales", before=sales)
+    dates_changed("sales", *{sale["date"] for sale in sales})
     return {"message": "Customer deleted successfully"}
 
 
 # ==================== SALES ROUTES ====================
 
 @api_router.post("/sales", response_model=SaleResponse)
-async def create_sale(sale: SaleCreate, current_user: dict = Depends(get_current_user)):
+async def create_sale(
+    sale: SaleCreate,
+    current_user: dict = Depends(get_current_user),
+    idempotency_key: Optional[str] = Header(None)
+):
+    return await run_idempotent("sales", idempotency_key, current_user, sale, lambda: record_sale(sale))
+
+async def record_sale(sale: SaleCreate) -> SaleResponse:
     customer = await db.customers.find_one({"id": sale.customer_id}, {"_id": 0})
     if not customer:
         raise HTTPException(status_code=404, detail="Customer not found")
@@ -1369,6 +1859,7 @@ async def create_sale(sale: SaleCreate, current_user: dict = Depends(get_current
     sale_id = str(uuid.uuid4())
     now = datetime.now(timezone.utc)
     date_str = sale.date if sale.date else now.strftime("%Y-%m-%d")
+    ensure_open(date_str)
     
     if sale.direct_amount and sale.direct_amount > 0:
         amount = round(sale.direct_amount, 2)
@@ -1392,7 +1883,9 @@ async def create_sale(sale: SaleCreate, current_user: dict = Depends(get_current
         "created_at": now.isoformat()
     }
     
-    await db.sales.insert_one(sale_doc)
+    await sales_collection.insert_one(sale_doc)
+    await pnl_changed("sales", after=[sale_doc])
+    dates_changed("sales", date_str)
     
     # Update customer totals
     await db.customers.update_one(
@@ -1401,11 +1894,11 @@ async def create_sale(sale: SaleCreate, current_user: dict = Depends(get_current
     )
     
     # Update product stock if exists
-    await db.products.update_one(
-        {"name": sale.product},
-        {"$inc": {"stock": -sale.quantity}}
-    )
+    product = await reference_cache.find(db, "products", name=sale.product)
+    if product:
+        await db.products.update_one({"id": product["id"]}, {"$inc": {"stock": -sale.quantity}})
     
+    event_bus.publish("sale.created", sale_doc)
     return SaleResponse(**sale_doc)
 
 @api_router.get("/sales", response_model=List[SaleResponse])
@@ -1423,14 +1916,15 @@ async def get_sales(
     if product:
         query["product"] = product
     
-    sales = await db.sales.find(query, {"_id": 0}).sort("created_at", -1).to_list(1000)
+    sales = await sales_collection.find(query, {"_id": 0}).sort("created_at", -1).to_list(1000)
     return [SaleResponse(**s) for s in sales]
 
 @api_router.delete("/sales/{sale_id}")
 async def delete_sale(sale_id: str, current_user: dict = Depends(get_current_user)):
-    sale = await db.sales.find_one({"id": sale_id}, {"_id": 0})
+    sale = await sales_collection.find_one({"id": sale_id}, {"_id": 0})
     if not sale:
         raise HTTPException(status_code=404, detail="Sale not found")
+    ensure_open(sale["date"])
     
     # Revert customer totals
     await db.customers.update_one(
@@ -1438,13 +1932,16 @@ async def delete_sale(sale_id: str, current_user: dict = Depends(get_current_use
         {"$inc": {"total_purchase": -sale["amount"], "balance": -sale["amount"]}}
     )
     
-    await db.sales.delete_one({"id": sale_id})
+    await sales_collection.delete_one({"id": sale_id})
+    await pnl_changed("sales", before=[sale])
+    dates_changed("sales", sale["date"])
+    event_bus.publish("sale.deleted", sale)
     return {"message": "Sale deleted successfully"}
 
 @api_router.get("/sales/today")
 async def get_today_sales(current_user: dict = Depends(get_current_user)):
     today = datetime.now(timezone.utc).strftime("%Y-%m-%d")
-    sales = await db.sales.find({"date": today}, {"_id": 0}).to_list(1000)
+    sales = await sales_collection.find({"date": today}, {"_id": 0}).to_list(1000)
     
     total_amount = sum(s["amount"] for s in sales)
     by_product = {}
@@ -1463,11 +1960,19 @@ async def get_today_sales(current_user: dict = Depends(get_current_user)):
     }
 
 @api_router.post("/sales/shop")
-async def create_shop_sale(sale: ShopSaleCreate, current_user: dict = Depends(get_current_user)):
+async def create_shop_sale(
+    sale: ShopSaleCreate,
+    current_user: dict = Depends(get_current_user),
+    idempotency_key: Optional[str] = Header(None)
+):
     """Quick shop/counter milk sale - supports udhar (credit) and direct amount"""
+    return await run_idempotent("sales_shop", idempotency_key, current_user, sale, lambda: record_shop_sale(sale))
+
+async def record_shop_sale(sale: ShopSaleCreate) -> dict:
     sale_id = str(uuid.uuid4())
     now = datetime.now(timezone.utc)
     date_str = now.strftime("%Y-%m-%d")
+    ensure_open(date_str)
     
     if sale.direct_amount and sale.direct_amount > 0:
         amount = round(sale.direct_amount, 2)
@@ -1500,8 +2005,10 @@ async def create_shop_sale(sale: ShopSaleCreate, current_user: dict = Depends(ge
         "date": date_str,
         "created_at": now.isoformat()
     }
-    await db.sales.insert_one(sale_doc)
+    await sales_collection.insert_one(sale_doc)
     del sale_doc["_id"]
+    await pnl_changed("sales", after=[sale_doc])
+    dates_changed("sales", date_str)
     
     # Update walk-in customer balance if udhar
     if sale.is_udhar and sale.walkin_customer_id:
@@ -1510,6 +2017,7 @@ async def create_shop_sale(sale: ShopSaleCreate, current_user: dict = Depends(ge
             {"$inc": {"pending_amount": amount}}
         )
     
+    event_bus.publish("sale.created", sale_doc)
     return sale_doc
 
 # ==================== WALK-IN CUSTOMER & UDHAR ROUTES ====================
@@ -1548,7 +2056,7 @@ async def get_walkin_customer_detail(customer_id: str, current_user: dict = Depe
         raise HTTPException(status_code=404, detail="Customer not found")
     
     # Get all udhar sales
-    sales = await db.sales.find(
+    sales = await sales_collection.find(
         {"customer_id": customer_id, "is_udhar": True},
         {"_id": 0}
     ).sort("created_at", -1).to_list(1000)
@@ -1573,6 +2081,7 @@ async def record_udhar_payment(payment: UdharPaymentCreate, current_user: dict =
     
     payment_id = str(uuid.uuid4())
     now = datetime.now(timezone.utc)
+    ensure_open(now.strftime("%Y-%m-%d"))
     doc = {
         "id": payment_id,
         "walkin_customer_id": payment.walkin_customer_id,
@@ -1594,25 +2103,62 @@ async def record_udhar_payment(payment: UdharPaymentCreate, current_user: dict =
     
     return doc
 
+# ==================== OFFLINE SYNC ROUTES ====================
+
+# operation type -> (idempotency scope, payload model, writer)
+SYNC_OPERATIONS = {
+    "collection": ("collections", MilkCollectionCreate, record_collection),
+    "sale": ("sales", SaleCreate, record_sale),
+    "shop_sale": ("sales_shop", ShopSaleCreate, record_shop_sale),
+    "payment": ("payments", PaymentCreate, record_payment),
+}
+
+@api_router.post("/sync/upload")
+async def sync_upload(upload: SyncUpload, current_user: dict = Depends(get_current_user)):
+    """Apply a queue of offline writes in order; each item is idempotent on its own key"""
+    results = []
+    success = 0
+    failed = 0
+
+    for op in upload.operations:
+        item = {"idempotency_key": op.idempotency_key, "type": op.type}
+        try:
+            if op.type not in SYNC_OPERATIONS:
+                raise HTTPException(status_code=400, detail=f"Unknown operation type: {op.type}")
+            scope, model, writer = SYNC_OPERATIONS[op.type]
+            try:
+                data = model(**op.payload)
+            except ValidationError as e:
+                raise HTTPException(status_code=422, detail=e.errors(include_url=False))
+            response = await run_idempotent(scope, op.idempotency_key, current_user, data, lambda: writer(data))
+            item.update({"status": "ok", "status_code": 200, "data": response})
+            success += 1
+        except HTTPException as e:
+            item.update({"status": "error", "status_code": e.status_code, "detail": e.detail})
+            failed += 1
+        except Exception as e:
+            logger.error(f"Sync operation {op.idempotency_key} failed: {e}")
+            item.update({"status": "error", "status_code": 500, "detail": str(e)})
+            failed += 1
+        results.append(item)
+
+    return {"success": success, "failed": failed, "results": results}
+
 
 # ==================== BILLING ROUTES ====================
 
-@api_router.get("/billing/farmer/{farmer_id}")
+@reports_router.get("/billing/farmer/{farmer_id}")
 async def get_farmer_billing(farmer_id: str, start_date: str, end_date: str, current_user: dict = Depends(get_current_user)):
-    farmer = await db.farmers.find_one({"id": farmer_id}, {"_id": 0})
+    period_query = {"farmer_id": farmer_id, "date": {"$gte": start_date, "$lte": end_date}}
+    farmer, collections, payments, opening = await gather_queries(
+        farmer_cache.get(db, farmer_id),
+        milk_collections_read.find(period_query, {"_id": 0}).sort("date", 1).to_list(5000),
+        payments_collection_read.find(period_query, {"_id": 0}).sort("date", 1).to_list(1000),
+        opening_totals(db_read, "farmer", farmer_id, start_date)
+    )
     if not farmer:
         raise HTTPException(status_code=404, detail="Farmer not found")
     
-    collections = await db.milk_collections.find(
-        {"farmer_id": farmer_id, "date": {"$gte": start_date, "$lte": end_date}},
-        {"_id": 0}
-    ).sort("date", 1).to_list(5000)
-    
-    payments = await db.payments.find(
-        {"farmer_id": farmer_id, "date": {"$gte": start_date, "$lte": end_date}},
-        {"_id": 0}
-    ).sort("date", 1).to_list(1000)
-    
     total_quantity = sum(c.get("quantity", 0) for c in collections)
     total_amount = sum(c.get("amount", 0) for c in collections)
     total_paid = sum(p.get("amount", 0) for p in payments)
@@ -1626,19 +2172,21 @@ async def get_farmer_billing(farmer_id: str, start_date: str, end_date: str, cur
             "total_amount": round(total_amount, 2),
             "total_paid": round(total_paid, 2),
             "balance_due": round(total_amount - total_paid, 2),
+            "opening_balance": opening["balance"],
+            "closing_balance": round(opening["balance"] + farmer_balance_change(collections, payments), 2),
             "total_entries": len(collections),
             "start_date": start_date,
             "end_date": end_date
         }
     }
 
-@api_router.get("/billing/customer/{customer_id}")
+@reports_router.get("/billing/customer/{customer_id}")
 async def get_customer_billing(customer_id: str, start_date: str, end_date: str, current_user: dict = Depends(get_current_user)):
     customer = await db.customers.find_one({"id": customer_id}, {"_id": 0})
     if not customer:
         raise HTTPException(status_code=404, detail="Customer not found")
     
-    sales = await db.sales.find(
+    sales = await sales_collection_read.find(
         {"customer_id": customer_id, "date": {"$gte": start_date, "$lte": end_date}, "is_shop_sale": {"$ne": True}},
         {"_id": 0}
     ).sort("date", 1).to_list(5000)
@@ -1773,8 +2321,8 @@ async def get_customer_sales(
     if end_date:
         query.setdefault("date", {})["$lte"] = end_date
     
-    sales = await db.sales.find(query, {"_id": 0}).sort("date", -1).to_list(1000)
-    payments = await db.payments.find({"farmer_id": customer_id}, {"_id": 0}).sort("date", -1).to_list(1000)
+    sales = await sales_collection.find(query, {"_id": 0}).sort("date", -1).to_list(1000)
+    payments = await payments_collection.find({"farmer_id": customer_id}, {"_id": 0}).sort("date", -1).to_list(1000)
     
     return {
         "customer": customer,
@@ -1804,6 +2352,7 @@ async def record_customer_payment(
     
     payment_id = str(uuid.uuid4())
     now = datetime.now(timezone.utc)
+    ensure_open(now.strftime("%Y-%m-%d"))
     
     payment_doc = {
         "id": payment_id,
@@ -1817,7 +2366,8 @@ async def record_customer_payment(
         "created_at": now.isoformat()
     }
     
-    await db.payments.insert_one(payment_doc)
+    await payments_collection.insert_one(payment_doc)
+    dates_changed("payments", payment_doc["date"])
     await db.customers.update_one(
         {"id": customer_id},
         {"$inc": {"total_paid": amount, "balance": -amount}}
@@ -1826,7 +2376,7 @@ async def record_customer_payment(
     updated = await db.customers.find_one({"id": customer_id}, {"_id": 0})
     return {"payment": payment_doc, "customer": updated}
 
-@api_router.get("/bills/customer/thermal/{customer_id}", response_class=HTMLResponse)
+@reports_router.get("/bills/customer/thermal/{customer_id}", response_class=HTMLResponse)
 async def customer_thermal_bill(customer_id: str, start_date: Optional[str] = None, end_date: Optional[str] = None):
     """Generate thermal printer bill for customer"""
     customer = await db.customers.find_one({"id": customer_id}, {"_id": 0})
@@ -1838,67 +2388,22 @@ async def customer_thermal_bill(customer_id: str, start_date: Optional[str] = No
     if not start_date:
         start_date = (datetime.now(timezone.utc) - timedelta(days=30)).strftime("%Y-%m-%d")
     
-    sales = await db.sales.find(
+    sales = await sales_collection_read.find(
         {"customer_id": customer_id, "date": {"$gte": start_date, "$lte": end_date}}, {"_id": 0}
     ).sort("date", 1).to_list(1000)
     
-    payments = await db.payments.find(
+    payments = await payments_collection_read.find(
         {"farmer_id": customer_id, "date": {"$gte": start_date, "$lte": end_date}}, {"_id": 0}
     ).sort("date", 1).to_list(1000)
     
-    settings = await db.settings.find_one({"type": "dairy_info"}, {"_id": 0}) or {}
+    settings = await reference_cache.settings(db)
     dairy_name = settings.get("dairy_name", "Nirbani Dairy")
     dairy_phone = settings.get("phone", "")
     
-    total_amount = sum(s["amount"] for s in sales)
-    total_paid = sum(p["amount"] for p in payments)
-    balance = total_amount - total_paid
-    
-    rows = ""
-    for s in sales:
-        rows += f"<tr><td>{s['date'][5:]}</td><td>{s['product']}</td><td>{s['quantity']}</td><td>{s['rate']}</td><td style='text-align:right'>{s['amount']:.0f}</td></tr>\n"
-    
-    pay_rows = ""
-    for p in payments:
-        pay_rows += f"<tr><td>{p['date'][5:]}</td><td>{p['payment_mode']}</td><td style='text-align:right'>{p['amount']:.0f}</td></tr>\n"
-    
-    ctype = "Wholesale" if customer.get("customer_type") == "wholesale" else "Retail"
-    
-    html = f"""<!DOCTYPE html><html><head><meta charset="utf-8"><meta name="viewport" content="width=58mm">
-<style>
-*{{margin:0;padding:0;box-sizing:border-box}}
-body{{font-family:'Courier New',monospace;font-size:11px;width:58mm;padding:2mm;color:#000}}
-.center{{text-align:center}}.bold{{font-weight:bold}}.line{{border-top:1px dashed #000;margin:3px 0}}
-table{{width:100%;border-collapse:collapse}}
-td,th{{padding:1px 2px;font-size:10px;vertical-align:top}}
-th{{text-align:left;border-bottom:1px solid #000}}
-.right{{text-align:right}}.big{{font-size:14px}}
-@media print{{@page{{size:58mm auto;margin:0}}body{{width:58mm}}}}
-</style></head><body>
-<div class="center bold big">{dairy_name}</div>
-<div class="center" style="font-size:9px">{dairy_phone}</div>
-<div class="line"></div>
-<div class="bold">{customer['name']} ({ctype})</div>
-<div style="font-size:9px">Ph: {customer['phone']}</div>
-{f'<div style="font-size:9px">GST: {customer["gst_number"]}</div>' if customer.get("gst_number") else ''}
-<div style="font-size:9px">{start_date} to {end_date}</div>
-<div class="line"></div>
-<table><tr><th>Date</th><th>Item</th><th>Qty</th><th>Rate</th><th class="right">Amt</th></tr>
-{rows}</table>
-<div class="line"></div>
-<table>
-<tr><td class="bold">Total:</td><td class="right bold">Rs.{total_amount:.0f}</td></tr>
-<tr><td class="bold">Paid:</td><td class="right bold">Rs.{total_paid:.0f}</td></tr>
-<tr><td class="bold">Balance:</td><td class="right bold">Rs.{balance:.0f}</td></tr>
-</table>
-{f'<div class="line"></div><div class="bold" style="font-size:9px">Payments:</div><table><tr><th>Date</th><th>Mode</th><th class="right">Amt</th></tr>{pay_rows}</table>' if payments else ''}
-<div class="line"></div>
-<div class="center" style="font-size:9px;margin-top:3px">Thank You / धन्यवाद</div>
-<div class="center" style="font-size:8px">Printed: {datetime.now(timezone.utc).strftime("%d-%m-%Y %H:%M")}</div>
-</body></html>"""
+    html = await run_cpu(generate_customer_thermal_bill_html, customer, sales, payments, start_date, end_date, dairy_name, dairy_phone)
     return HTMLResponse(content=html)
 
-@api_router.get("/bills/customer/a4/{customer_id}", response_class=HTMLResponse)
+@reports_router.get("/bills/customer/a4/{customer_id}", response_class=HTMLResponse)
 async def customer_a4_invoice(customer_id: str, start_date: Optional[str] = None, end_date: Optional[str] = None):
     """Generate A4 invoice for customer"""
     customer = await db.customers.find_one({"id": customer_id}, {"_id": 0})
@@ -1910,92 +2415,30 @@ async def customer_a4_invoice(customer_id: str, start_date: Optional[str] = None
     if not start_date:
         start_date = (datetime.now(timezone.utc) - timedelta(days=30)).strftime("%Y-%m-%d")
     
-    sales = await db.sales.find(
+    sales = await sales_collection_read.find(
         {"customer_id": customer_id, "date": {"$gte": start_date, "$lte": end_date}}, {"_id": 0}
     ).sort("date", 1).to_list(1000)
     
-    payments = await db.payments.find(
+    payments = await payments_collection_read.find(
         {"farmer_id": customer_id, "date": {"$gte": start_date, "$lte": end_date}}, {"_id": 0}
     ).sort("date", 1).to_list(1000)
     
-    settings = await db.settings.find_one({"type": "dairy_info"}, {"_id": 0}) or {}
+    settings = await reference_cache.settings(db)
     dairy_name = settings.get("dairy_name", "Nirbani Dairy")
     dairy_phone = settings.get("phone", "")
     dairy_address = settings.get("address", "")
     
-    total_amount = sum(s["amount"] for s in sales)
-    total_paid = sum(p["amount"] for p in payments)
-    balance = total_amount - total_paid
-    ctype = "Wholesale / थोक" if customer.get("customer_type") == "wholesale" else "Retail / खुदरा"
-    invoice_no = f"CINV-{customer_id[:8].upper()}-{datetime.now(timezone.utc).strftime('%Y%m%d')}"
-    
-    sale_rows = ""
-    for i, s in enumerate(sales, 1):
-        sale_rows += f"<tr><td>{i}</td><td>{s['date']}</td><td>{s['product'].title()}</td><td>{s['quantity']}</td><td>{s['rate']:.2f}</td><td class='right'>{s['amount']:.2f}</td></tr>"
-    
-    pay_rows = ""
-    for p in payments:
-        pay_rows += f"<tr><td>{p['date']}</td><td>{p.get('payment_mode','cash').upper()}</td><td>{p.get('notes','')}</td><td class='right'>{p['amount']:.2f}</td></tr>"
-    
-    html = f"""<!DOCTYPE html><html><head><meta charset="utf-8">
-<style>
-*{{margin:0;padding:0;box-sizing:border-box}}
-body{{font-family:'Segoe UI',Arial,sans-serif;font-size:12px;color:#1a1a1a;padding:15mm 20mm;max-width:210mm}}
-.header{{display:flex;justify-content:space-between;align-items:flex-start;border-bottom:3px solid #15803d;padding-bottom:12px;margin-bottom:15px}}
-.dairy-name{{font-size:24px;font-weight:bold;color:#15803d}}.dairy-info{{font-size:10px;color:#666;margin-top:4px}}
-.invoice-box{{text-align:right}}.invoice-title{{font-size:20px;color:#15803d;font-weight:bold}}.invoice-no{{font-size:11px;color:#666;margin-top:2px}}
-.info-grid{{display:grid;grid-template-columns:1fr 1fr;gap:15px;margin-bottom:15px}}
-.info-card{{background:#f8faf8;border:1px solid #e5e7eb;border-radius:6px;padding:10px}}
-.info-label{{font-size:9px;color:#888;text-transform:uppercase;letter-spacing:0.5px}}.info-value{{font-size:13px;font-weight:600;margin-top:2px}}
-table{{width:100%;border-collapse:collapse;margin-bottom:15px}}
-th{{background:#15803d;color:white;padding:6px 8px;text-align:left;font-size:10px;text-transform:uppercase}}
-td{{padding:5px 8px;border-bottom:1px solid #eee;font-size:11px}}.right{{text-align:right}}
-tr:nth-child(even){{background:#f9fafb}}
-.summary-grid{{display:grid;grid-template-columns:1fr 1fr 1fr;gap:10px;margin:15px 0}}
-.summary-box{{background:#f0fdf4;border:1px solid #bbf7d0;border-radius:6px;padding:10px;text-align:center}}
-.summary-box.due{{background:#fef2f2;border-color:#fecaca}}
-.summary-label{{font-size:9px;color:#666;text-transform:uppercase}}.summary-value{{font-size:18px;font-weight:bold;color:#15803d;margin-top:2px}}
-.summary-box.due .summary-value{{color:#dc2626}}
-.footer{{margin-top:20px;border-top:2px solid #15803d;padding-top:10px;display:flex;justify-content:space-between;font-size:10px;color:#666}}
-.sig-box{{border-top:1px solid #333;width:150px;text-align:center;padding-top:5px;margin-top:40px;font-size:10px}}
-h3{{color:#15803d;font-size:13px;margin-bottom:8px;padding-bottom:4px;border-bottom:1px solid #d1fae5}}
-@media print{{@page{{size:A4;margin:10mm}}body{{padding:0}}}}
-</style></head><body>
-<div class="header">
-  <div><div class="dairy-name">{dairy_name}</div><div class="dairy-info">{dairy_address}<br>{dairy_phone}</div></div>
-  <div class="invoice-box"><div class="invoice-title">CUSTOMER INVOICE / ग्राहक बिल</div><div class="invoice-no">{invoice_no}</div><div class="invoice-no">{start_date} to {end_date}</div></div>
-</div>
-<div class="info-grid">
-  <div class="info-card"><div class="info-label">Customer / ग्राहक</div><div class="info-value">{customer['name']}</div><div style="font-size:10px;color:#666">Ph: {customer['phone']} | {ctype}</div></div>
-  <div class="info-card"><div class="info-label">Address / पता</div><div class="info-value">{customer.get('address','N/A')}</div>{f'<div style="font-size:10px;color:#666">GST: {customer["gst_number"]}</div>' if customer.get("gst_number") else ''}</div>
-</div>
-<div class="summary-grid">
-  <div class="summary-box"><div class="summary-label">Total Purchase / कुल खरीद</div><div class="summary-value">₹{total_amount:.0f}</div></div>
-  <div class="summary-box"><div class="summary-label">Total Paid / कुल भुगतान</div><div class="summary-value">₹{total_paid:.0f}</div></div>
-  <div class="summary-box {'due' if balance > 0 else ''}"><div class="summary-label">Balance / बकाया</div><div class="summary-value">₹{balance:.0f}</div></div>
-</div>
-<h3>Sales Details / बिक्री विवरण</h3>
-<table><tr><th>#</th><th>Date</th><th>Product</th><th>Qty</th><th>Rate ₹</th><th class="right">Amount ₹</th></tr>
-{sale_rows}
-<tr style="background:#15803d;color:white;font-weight:bold"><td colspan="5">TOTAL</td><td class="right">₹{total_amount:.2f}</td></tr>
-</table>
-{f'<h3>Payments / भुगतान</h3><table><tr><th>Date</th><th>Mode</th><th>Notes</th><th class="right">Amount ₹</th></tr>{pay_rows}<tr style="background:#15803d;color:white;font-weight:bold"><td colspan="3">TOTAL PAID</td><td class="right">₹{total_paid:.2f}</td></tr></table>' if payments else ''}
-<div style="display:flex;justify-content:flex-end;gap:40px;margin-top:30px">
-  <div class="sig-box">Dairy Stamp / डेयरी मुहर</div>
-  <div class="sig-box">Authorized Signature / हस्ताक्षर</div>
-</div>
-<div class="footer"><div>Generated: {datetime.now(timezone.utc).strftime("%d-%m-%Y %H:%M UTC")}</div><div>{dairy_name} | {dairy_phone}</div></div>
-</body></html>"""
+    html = await run_cpu(generate_customer_invoice_html, customer, sales, payments, start_date, end_date, dairy_name, dairy_phone, dairy_address)
     return HTMLResponse(content=html)
 
-@api_router.get("/share/customer-bill/{customer_id}")
+@reports_router.get("/share/customer-bill/{customer_id}")
 async def share_customer_bill(customer_id: str, current_user: dict = Depends(get_current_user)):
     """Generate WhatsApp share link for customer bill"""
     customer = await db.customers.find_one({"id": customer_id}, {"_id": 0})
     if not customer:
         raise HTTPException(status_code=404, detail="Customer not found")
     
-    settings = await db.settings.find_one({"type": "dairy_info"}, {"_id": 0}) or {}
+    settings = await reference_cache.settings(db)
     dairy_name = settings.get("dairy_name", "Nirbani Dairy")
     
     msg = f"*{dairy_name}*\nCustomer: {customer['name']}\nTotal Purchase: ₹{customer.get('total_purchase', 0):.0f}\nPaid: ₹{customer.get('total_paid', 0):.0f}\nBalance: ₹{customer.get('balance', 0):.0f}\nThank you!"
@@ -2026,6 +2469,7 @@ async def create_product(product: ProductCreate, current_user: dict = Depends(ge
     }
     
     await db.products.insert_one(product_doc)
+    reference_changed("products")
     return ProductResponse(**product_doc)
 
 @api_router.get("/products", response_model=List[ProductResponse])
@@ -2073,6 +2517,7 @@ async def create_expense(expense: ExpenseCreate, current_user: dict = Depends(ge
     expense_id = str(uuid.uuid4())
     now = datetime.now(timezone.utc)
     date_str = now.strftime("%Y-%m-%d")
+    ensure_open(date_str)
     
     expense_doc = {
         "id": expense_id,
@@ -2085,6 +2530,8 @@ async def create_expense(expense: ExpenseCreate, current_user: dict = Depends(ge
     }
     
     await db.expenses.insert_one(expense_doc)
+    await pnl_changed("expenses", after=[expense_doc])
+    dates_changed("expenses", date_str)
     return ExpenseResponse(**expense_doc)
 
 @api_router.get("/expenses", response_model=List[ExpenseResponse])
@@ -2140,9 +2587,13 @@ async def get_expense_summary(
 
 @api_router.delete("/expenses/{expense_id}")
 async def delete_expense(expense_id: str, current_user: dict = Depends(get_current_user)):
-    result = await db.expenses.delete_one({"id": expense_id})
-    if result.deleted_count == 0:
+    expense = await db.expenses.find_one({"id": expense_id}, {"_id": 0})
+    if not expense:
         raise HTTPException(status_code=404, detail="Expense not found")
+    ensure_open(expense["date"])
+    await db.expenses.delete_one({"id": expense_id})
+    await pnl_changed("expenses", before=[expense])
+    dates_changed("expenses", expense["date"])
     return {"message": "Expense deleted successfully"}
 
 # ==================== BRANCH MANAGEMENT ROUTES ====================
@@ -2169,16 +2620,17 @@ async def create_branch(branch: BranchCreate, current_user: dict = Depends(get_c
     }
     
     await db.branches.insert_one(branch_doc)
+    reference_changed("branches")
     return BranchResponse(**branch_doc)
 
 @api_router.get("/branches", response_model=List[BranchResponse])
 async def get_branches(current_user: dict = Depends(get_current_user)):
-    branches = await db.branches.find({}, {"_id": 0}).sort("name", 1).to_list(100)
-    return [BranchResponse(**b) for b in branches]
+    branches = await reference_cache.table(db, "branches")
+    return [BranchResponse(**b) for b in sorted(branches.values(), key=lambda b: b["name"])]
 
 @api_router.get("/branches/{branch_id}", response_model=BranchResponse)
 async def get_branch(branch_id: str, current_user: dict = Depends(get_current_user)):
-    branch = await db.branches.find_one({"id": branch_id}, {"_id": 0})
+    branch = await reference_cache.get(db, "branches", branch_id)
     if not branch:
         raise HTTPException(status_code=404, detail="Branch not found")
     return BranchResponse(**branch)
@@ -2199,6 +2651,7 @@ async def update_branch(branch_id: str, branch: BranchCreate, current_user: dict
             "manager_name": branch.manager_name or ""
         }}
     )
+    reference_changed("branches")
     
     updated = await db.branches.find_one({"id": branch_id}, {"_id": 0})
     return BranchResponse(**updated)
@@ -2208,19 +2661,20 @@ async def delete_branch(branch_id: str, current_user: dict = Depends(get_current
     result = await db.branches.delete_one({"id": branch_id})
     if result.deleted_count == 0:
         raise HTTPException(status_code=404, detail="Branch not found")
+    reference_changed("branches")
     return {"message": "Branch deleted successfully"}
 
 @api_router.get("/branches/{branch_id}/stats")
 async def get_branch_stats(branch_id: str, current_user: dict = Depends(get_current_user)):
     """Get statistics for a specific branch"""
-    branch = await db.branches.find_one({"id": branch_id}, {"_id": 0})
+    branch = await reference_cache.get(db, "branches", branch_id)
     if not branch:
         raise HTTPException(status_code=404, detail="Branch not found")
     
     today = datetime.now(timezone.utc).strftime("%Y-%m-%d")
     
     # Get branch collections
-    collections = await db.milk_collections.find(
+    collections = await milk_collections.find(
         {"branch_id": branch_id, "date": today}, {"_id": 0}
     ).to_list(1000)
     
@@ -2248,6 +2702,7 @@ async def bulk_upload_collections(
     current_user: dict = Depends(get_current_user)
 ):
     """Bulk upload milk collections from CSV/Excel data"""
+    ensure_open(utc_today())
     results = {
         "success": 0,
         "failed": 0,
@@ -2257,7 +2712,7 @@ async def bulk_upload_collections(
     for entry in upload.entries:
         try:
             # Find farmer by phone
-            farmer = await db.farmers.find_one({"phone": entry.farmer_phone}, {"_id": 0})
+            farmer = await farmer_cache.get_by_phone(db, entry.farmer_phone)
             if not farmer:
                 results["failed"] += 1
                 results["errors"].append(f"Farmer not found: {entry.farmer_phone}")
@@ -2265,7 +2720,7 @@ async def bulk_upload_collections(
             
             # Check for duplicate
             today = datetime.now(timezone.utc).strftime("%Y-%m-%d")
-            existing = await db.milk_collections.find_one({
+            existing = await milk_collections.find_one({
                 "farmer_id": farmer["id"],
                 "date": today,
                 "shift": entry.shift
@@ -2299,13 +2754,11 @@ async def bulk_upload_collections(
                 "created_at": now.isoformat()
             }
             
-            await db.milk_collections.insert_one(collection_doc)
+            await milk_collections.insert_one(collection_doc)
+            await pnl_changed("milk_collections", after=[collection_doc])
             
             # Update farmer totals
-            await db.farmers.update_one(
-                {"id": farmer["id"]},
-                {"$inc": {"total_milk": entry.quantity, "total_due": amount, "balance": amount}}
-            )
+            await inc_farmer(farmer["id"], {"total_milk": entry.quantity, "total_due": amount, "balance": amount})
             
             results["success"] += 1
             
@@ -2313,6 +2766,10 @@ async def bulk_upload_collections(
             results["failed"] += 1
             results["errors"].append(f"Error processing {entry.farmer_phone}: {str(e)}")
     
+    if results["success"]:
+        dates_changed("milk_collections", utc_today())
+        # Too many rows to stream individually; screens reload instead
+        event_bus.publish("resync", {"reason": "bulk_upload"})
     return results
 
 @api_router.post("/bulk/farmers")
@@ -2357,12 +2814,16 @@ async def bulk_upload_farmers(
             }
             
             await db.farmers.insert_one(farmer_doc)
+            person_changed("farmer", farmer_doc)
             results["success"] += 1
             
         except Exception as e:
             results["failed"] += 1
             results["errors"].append(f"Error adding {farmer_data.name}: {str(e)}")
     
+    if results["success"]:
+        # Too many rows to stream individually; screens reload instead
+        event_bus.publish("resync", {"reason": "bulk_upload"})
     return results
 
 @api_router.get("/bulk/template/collections")
@@ -2387,7 +2848,6 @@ async def bulk_upload_file(
     current_user: dict = Depends(get_current_user)
 ):
     """Upload Excel/CSV file for bulk data import"""
-    import io
     
     if not file.filename:
         raise HTTPException(status_code=400, detail="No file provided")
@@ -2397,27 +2857,9 @@ async def bulk_upload_file(
         raise HTTPException(status_code=400, detail="Only CSV and Excel files are supported")
     
     content = await file.read()
-    rows = []
     
     try:
-        if ext == "csv":
-            import csv
-            text = content.decode("utf-8-sig")
-            reader = csv.DictReader(io.StringIO(text))
-            rows = [dict(row) for row in reader]
-        elif ext in ("xlsx", "xls"):
-            import openpyxl
-            wb = openpyxl.load_workbook(io.BytesIO(content), read_only=True)
-            ws = wb.active
-            headers = [str(cell.value or "").strip().lower() for cell in next(ws.iter_rows(min_row=1, max_row=1))]
-            for row in ws.iter_rows(min_row=2, values_only=True):
-                row_dict = {}
-                for i, val in enumerate(row):
-                    if i < len(headers) and headers[i]:
-                        row_dict[headers[i]] = str(val).strip() if val is not None else ""
-                if any(row_dict.values()):
-                    rows.append(row_dict)
-            wb.close()
+        rows = await run_cpu(parse_upload_rows, content, ext)
     except Exception as e:
         raise HTTPException(status_code=400, detail=f"Error parsing file: {str(e)}")
     
@@ -2427,10 +2869,11 @@ async def bulk_upload_file(
     results = {"success": 0, "failed": 0, "errors": []}
     
     if upload_type == "collections":
+        ensure_open(utc_today())
         for row in rows:
             try:
                 phone = row.get("farmer_phone", row.get("phone", "")).strip()
-                farmer = await db.farmers.find_one({"phone": phone}, {"_id": 0})
+                farmer = await farmer_cache.get_by_phone(db, phone)
                 if not farmer:
                     results["failed"] += 1
                     results["errors"].append(f"Farmer not found: {phone}")
@@ -2443,7 +2886,7 @@ async def bulk_upload_file(
                 snf = float(snf_val) if snf_val else calculate_snf(fat)
                 
                 today = datetime.now(timezone.utc).strftime("%Y-%m-%d")
-                existing = await db.milk_collections.find_one({
+                existing = await milk_collections.find_one({
                     "farmer_id": farmer["id"], "date": today, "shift": shift
                 }, {"_id": 0})
                 
@@ -2457,18 +2900,17 @@ async def bulk_upload_file(
                 collection_id = str(uuid.uuid4())
                 now = datetime.now(timezone.utc)
                 
-                await db.milk_collections.insert_one({
+                collection_doc = {
                     "id": collection_id, "farmer_id": farmer["id"],
                     "farmer_name": farmer["name"], "shift": shift,
                     "quantity": quantity, "fat": fat, "snf": snf,
                     "rate": rate, "amount": amount, "date": today,
                     "created_at": now.isoformat()
-                })
+                }
+                await milk_collections.insert_one(collection_doc)
+                await pnl_changed("milk_collections", after=[collection_doc])
                 
-                await db.farmers.update_one(
-                    {"id": farmer["id"]},
-                    {"$inc": {"total_milk": quantity, "total_due": amount, "balance": amount}}
-                )
+                await inc_farmer(farmer["id"], {"total_milk": quantity, "total_due": amount, "balance": amount})
                 results["success"] += 1
             except Exception as e:
                 results["failed"] += 1
@@ -2491,24 +2933,31 @@ async def bulk_upload_file(
                 
                 farmer_id = str(uuid.uuid4())
                 now = datetime.now(timezone.utc).isoformat()
-                await db.farmers.insert_one({
+                farmer_doc = {
                     "id": farmer_id, "name": name, "phone": phone,
                     "address": row.get("address", ""), "village": row.get("village", ""),
                     "bank_account": row.get("bank_account", ""), "ifsc_code": row.get("ifsc_code", ""),
                     "aadhar_number": row.get("aadhar_number", ""),
                     "total_milk": 0.0, "total_due": 0.0, "total_paid": 0.0, "balance": 0.0,
                     "created_at": now, "is_active": True
-                })
+                }
+                await db.farmers.insert_one(farmer_doc)
+                person_changed("farmer", farmer_doc)
                 results["success"] += 1
             except Exception as e:
                 results["failed"] += 1
                 results["errors"].append(str(e))
     
+    if results["success"]:
+        if upload_type == "collections":
+            dates_changed("milk_collections", utc_today())
+        # Too many rows to stream individually; screens reload instead
+        event_bus.publish("resync", {"reason": "bulk_upload"})
     return results
 
 # ==================== WHATSAPP SHARING ROUTES ====================
 
-@api_router.get("/share/farmer-bill/{farmer_id}")
+@reports_router.get("/share/farmer-bill/{farmer_id}")
 async def get_farmer_bill_share_link(
     farmer_id: str,
     start_date: Optional[str] = None,
@@ -2516,7 +2965,7 @@ async def get_farmer_bill_share_link(
     current_user: dict = Depends(get_current_user)
 ):
     """Generate WhatsApp share link for farmer bill"""
-    farmer = await db.farmers.find_one({"id": farmer_id}, {"_id": 0})
+    farmer = await farmer_cache.get(db, farmer_id)
     if not farmer:
         raise HTTPException(status_code=404, detail="Farmer not found")
     
@@ -2528,11 +2977,11 @@ async def get_farmer_bill_share_link(
         end_date = datetime.now(timezone.utc).strftime("%Y-%m-%d")
     
     # Get collections and calculate totals
-    collections = await db.milk_collections.find(
+    collections = await milk_collections_read.find(
         {"farmer_id": farmer_id, "date": {"$gte": start_date, "$lte": end_date}}, {"_id": 0}
     ).to_list(1000)
     
-    payments = await db.payments.find(
+    payments = await payments_collection_read.find(
         {"farmer_id": farmer_id, "date": {"$gte": start_date, "$lte": end_date}}, {"_id": 0}
     ).to_list(1000)
     
@@ -2575,13 +3024,13 @@ async def get_farmer_bill_share_link(
         }
     }
 
-@api_router.get("/share/daily-report/{date}")
+@reports_router.get("/share/daily-report/{date}")
 async def get_daily_report_share(
     date: str,
     current_user: dict = Depends(get_current_user)
 ):
     """Generate WhatsApp share link for daily report"""
-    collections = await db.milk_collections.find({"date": date}, {"_id": 0}).to_list(1000)
+    collections = await milk_collections_read.find({"date": date}, {"_id": 0}).to_list(1000)
     
     total_quantity = sum(c["quantity"] for c in collections)
     total_amount = sum(c["amount"] for c in collections)
@@ -2627,16 +3076,27 @@ async def get_daily_report_share(
 
 # ==================== DASHBOARD ROUTES ====================
 
+async def pending_payments_total() -> float:
+    """Total balance across all farmers, including buffered deltas"""
+    pipeline = [{"$group": {"_id": None, "total": {"$sum": "$balance"}}}]
+    async with farmer_reads():
+        balance_result = await db.farmers.aggregate(pipeline).to_list(1)
+        total_pending = balance_result[0]["total"] if balance_result else 0
+        if farmer_balance_buffer:
+            total_pending += farmer_balance_buffer.pending_total("balance")
+    return total_pending
+
 @api_router.get("/dashboard/stats", response_model=DashboardStats)
+@singleflight.coalesce()
 async def get_dashboard_stats(current_user: dict = Depends(get_current_user)):
     today = datetime.now(timezone.utc).strftime("%Y-%m-%d")
     
-    # Count farmers
-    total_farmers = await db.farmers.count_documents({})
-    active_farmers = await db.farmers.count_documents({"is_active": True})
-    
-    # Today's collections
-    today_collections = await db.milk_collections.find({"date": today}, {"_id": 0}).to_list(1000)
+    total_farmers, active_farmers, today_collections, total_pending = await gather_queries(
+        db.farmers.count_documents({}),
+        db.farmers.count_documents({"is_active": True}),
+        milk_collections.find({"date": today}, {"_id": 0}).to_list(1000),
+        pending_payments_total()
+    )
     
     today_milk_quantity = sum(c["quantity"] for c in today_collections)
     today_milk_amount = sum(c["amount"] for c in today_collections)
@@ -2651,11 +3111,6 @@ async def get_dashboard_stats(current_user: dict = Depends(get_current_user)):
         avg_fat = 0
         avg_snf = 0
     
-    # Pending payments (total balance across all farmers)
-    pipeline = [{"$group": {"_id": None, "total": {"$sum": "$balance"}}}]
-    balance_result = await db.farmers.aggregate(pipeline).to_list(1)
-    total_pending = balance_result[0]["total"] if balance_result else 0
-    
     return DashboardStats(
         total_farmers=total_farmers,
         active_farmers=active_farmers,
@@ -2681,7 +3136,7 @@ async def get_weekly_stats(current_user: dict = Depends(get_current_user)):
     
     stats = []
     for date in dates:
-        collections = await db.milk_collections.find({"date": date}, {"_id": 0}).to_list(1000)
+        collections = await milk_collections.find({"date": date}, {"_id": 0}).to_list(1000)
         quantity = sum(c["quantity"] for c in collections)
         amount = sum(c["amount"] for c in collections)
         stats.append({
@@ -2693,9 +3148,165 @@ async def get_weekly_stats(current_user: dict = Depends(get_current_user)):
     
     return stats
 
+# ==================== LIVE STREAM ROUTES ====================
+
+SSE_HEARTBEAT_SECONDS = 15
+
+@api_router.post("/stream/ticket")
+async def stream_ticket(current_user: dict = Depends(get_current_user)):
+    """A ticket for opening the live event stream"""
+    return {"ticket": create_stream_ticket(current_user["id"]), "expires_in": STREAM_TICKET_SECONDS}
+
+@api_router.get("/stream/dashboard")
+async def stream_dashboard(request: Request, ticket: str):
+    """Server-Sent Events feed of collection, payment, sale and farmer changes.
+    EventSource can't send headers, so a stream ticket comes as a query parameter
+    instead of the login token."""
+    await user_from_token(ticket, purpose="stream")
+    
+    async def events():
+        # Subscribed only once the response starts, so a client gone before that leaves nothing behind
+        queue = event_bus.subscribe()
+        try:
+            today = datetime.now(timezone.utc).strftime("%Y-%m-%d")
+            yield "retry: 5000\n\n"
+            yield format_sse({"type": "ready", "data": {"today": today}})
+            while True:
+                if await request.is_disconnected():
+                    break
+                try:
+                    event = await asyncio.wait_for(queue.get(), timeout=SSE_HEARTBEAT_SECONDS)
+                except asyncio.TimeoutError:
+                    yield ": keepalive\n\n"
+                    continue
+                yield format_sse(event)
+        finally:
+            event_bus.unsubscribe(queue)
+    
+    return StreamingResponse(
+        events(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
+# ==================== SEARCH ROUTES ====================
+
+@api_router.get("/search/autocomplete")
+async def search_autocomplete(q: str, kind: str = "all", limit: int = 10, current_user: dict = Depends(get_current_user)):
+    """Farmers and customers by name/village prefix, Hindi or English spelling, or phone (full, prefix or last 4 digits)"""
+    if kind != "all" and kind not in SEARCH_KINDS:
+        raise HTTPException(status_code=400, detail=f"kind must be all, {' or '.join(SEARCH_KINDS)}")
+    if not search_service.ready:
+        raise HTTPException(status_code=503, detail="Search index is loading")
+    kinds = SEARCH_KINDS if kind == "all" else (kind,)
+    return search_service.search(q.strip(), kinds, max(1, min(limit, 50)))
+
+# ==================== METRICS ROUTES ====================
+
+@api_router.get("/metrics")
+async def get_metrics(current_user: dict = Depends(get_current_user)):
+    """Runtime counters for caches, coalescing and write batching"""
+    if current_user.get("role") != "admin":
+        raise HTTPException(status_code=403, detail="Only admin can view metrics")
+    return {
+        "singleflight": singleflight.stats(),
+        "report_cache": report_cache.stats(),
+        "admission": admission.stats(),
+        "event_bus": {
+            "subscribers": event_bus.subscriber_count,
+            "published": event_bus.published,
+            "resyncs": event_bus.resyncs
+        },
+        "farmer_cache": farmer_cache.stats(),
+        "reference_cache": reference_cache.stats(),
+        "search": search_service.stats(),
+        "archive": archive_state.stats(),
+        "cache_bus": cache_bus.stats(),
+        "farmer_write_behind": {
+            "flushes": farmer_balance_buffer.flushes,
+            "merged_increments": farmer_balance_buffer.merged_increments
+        } if farmer_balance_buffer else None,
+        "collection_group_commit": {
+            "batches": collection_insert_queue.batches,
+            "documents": collection_insert_queue.documents
+        } if collection_insert_queue else None,
+        "executors": executors.stats()
+    }
+
+# ==================== RECONCILIATION ROUTES ====================
+
+@api_router.post("/admin/reconcile")
+async def reconcile_ledgers(repair: bool = False, entity_type: Optional[str] = None, current_user: dict = Depends(get_current_user)):
+    """Recompute stored farmer/customer/plant totals from entries; repair=true writes them back"""
+    if current_user.get("role") != "admin":
+        raise HTTPException(status_code=403, detail="Only admin can reconcile ledgers")
+    if entity_type and entity_type not in ENTITY_COLLECTIONS:
+        raise HTTPException(status_code=400, detail=f"entity_type must be one of {', '.join(ENTITY_COLLECTIONS)}")
+    entity_types = [entity_type] if entity_type else None
+    if repair:
+        reason = await repair_blocked(db, entity_types)
+        if reason:
+            raise HTTPException(status_code=409, detail=reason)
+    if farmer_balance_buffer:
+        # Report only: write out this worker's buffered increments and hold further
+        # flushes, so stored totals don't move under the comparison
+        await farmer_balance_buffer.flush()
+    async with farmer_reads():
+        return await reconcile(db, repair, entity_types)
+
+# ==================== MIGRATION ROUTES ====================
+
+@api_router.get("/admin/migrations")
+async def get_migrations(current_user: dict = Depends(get_current_user)):
+    """Numbered data migrations and their progress (run them with `python migrations.py run`)"""
+    if current_user.get("role") != "admin":
+        raise HTTPException(status_code=403, detail="Only admin can view migrations")
+    return await migration_status(db)
+
+# ==================== PERIOD CLOSE ROUTES ====================
+
+@api_router.post("/periods/close")
+async def close_accounting_period(close: PeriodCloseCreate, current_user: dict = Depends(get_current_user)):
+    """Snapshot closing balances up to the end of a day or month and lock it against edits"""
+    if current_user.get("role") != "admin":
+        raise HTTPException(status_code=403, detail="Only admin can close periods")
+    try:
+        start_date, end_date = period_bounds(close.period_type, close.period)
+    except ValueError:
+        raise HTTPException(status_code=400, detail="Use period_type 'day' with YYYY-MM-DD or 'month' with YYYY-MM")
+    if end_date > utc_today():
+        raise HTTPException(status_code=400, detail="Cannot close a period that has not ended")
+    try:
+        return await close_period(
+            db, close.period_type, close.period, current_user["email"], lock=lock_period
+        )
+    except (ValueError, DuplicateKeyError) as e:
+        raise HTTPException(status_code=400, detail=str(e) if isinstance(e, ValueError) else "Another close is in progress")
+
+@api_router.get("/periods/closes")
+async def get_period_closes(current_user: dict = Depends(get_current_user)):
+    return await db.period_closes.find({}, {"_id": 0}).sort("end_date", -1).to_list(500)
+
+@api_router.delete("/periods/close/latest")
+async def reopen_latest_period(current_user: dict = Depends(get_current_user)):
+    """Unlock the most recently closed period and drop its snapshots"""
+    if current_user.get("role") != "admin":
+        raise HTTPException(status_code=403, detail="Only admin can reopen periods")
+    latest = await latest_close(db)
+    archived_through = archive_state.archived_through()
+    if latest and archived_through and latest["start_date"] <= archived_through:
+        raise HTTPException(status_code=400, detail=f"Entries through {archived_through} are archived; this period cannot be reopened")
+    reopened = await reopen_latest(db)
+    if not reopened:
+        raise HTTPException(status_code=404, detail="No closed period")
+    previous = await latest_close(db)
+    period_lock_changed(previous["end_date"] if previous else None)
+    return {"message": f"Reopened {reopened['period']}", "closed_through": closed_through}
+
 # ==================== REPORTS ROUTES ====================
 
-@api_router.get("/reports/daily")
+@reports_router.get("/reports/daily")
+@report_cache.cached("daily", sources=("milk_collections", "payments"), period=day_period)
 async def get_daily_report(
     date: Optional[str] = None,
     current_user: dict = Depends(get_current_user)
@@ -2703,8 +3314,8 @@ async def get_daily_report(
     if not date:
         date = datetime.now(timezone.utc).strftime("%Y-%m-%d")
     
-    collections = await db.milk_collections.find({"date": date}, {"_id": 0}).to_list(1000)
-    payments = await db.payments.find({"date": date}, {"_id": 0}).to_list(1000)
+    collections = await milk_collections_read.find({"date": date}, {"_id": 0}).to_list(1000)
+    payments = await payments_collection_read.find({"date": date}, {"_id": 0}).to_list(1000)
     
     total_quantity = sum(c["quantity"] for c in collections)
     total_amount = sum(c["amount"] for c in collections)
@@ -2727,14 +3338,15 @@ async def get_daily_report(
         }
     }
 
-@api_router.get("/reports/farmer/{farmer_id}")
+@reports_router.get("/reports/farmer/{farmer_id}")
 async def get_farmer_report(
     farmer_id: str,
     start_date: Optional[str] = None,
     end_date: Optional[str] = None,
     current_user: dict = Depends(get_current_user)
 ):
-    farmer = await db.farmers.find_one({"id": farmer_id}, {"_id": 0})
+    async with farmer_reads():
+        farmer = with_pending(await db.farmers.find_one({"id": farmer_id}, {"_id": 0}))
     if not farmer:
         raise HTTPException(status_code=404, detail="Farmer not found")
     
@@ -2747,7 +3359,7 @@ async def get_farmer_report(
         else:
             query["date"] = {"$lte": end_date}
     
-    collections = await db.milk_collections.find(query, {"_id": 0}).sort("date", -1).to_list(1000)
+    collections = await milk_collections_read.find(query, {"_id": 0}).sort("date", -1).to_list(1000)
     
     payment_query = {"farmer_id": farmer_id}
     if start_date:
@@ -2758,7 +3370,8 @@ async def get_farmer_report(
         else:
             payment_query["date"] = {"$lte": end_date}
     
-    payments = await db.payments.find(payment_query, {"_id": 0}).sort("date", -1).to_list(1000)
+    payments = await payments_collection_read.find(payment_query, {"_id": 0}).sort("date", -1).to_list(1000)
+    opening = await opening_totals(db_read, "farmer", farmer_id, start_date)
     
     period_milk = sum(c["quantity"] for c in collections)
     period_amount = sum(c["amount"] for c in collections)
@@ -2774,6 +3387,8 @@ async def get_farmer_report(
             "total_amount": round(period_amount, 2),
             "total_paid": round(period_paid, 2),
             "balance": round(period_amount - period_paid, 2),
+            "opening_balance": opening["balance"],
+            "closing_balance": round(opening["balance"] + farmer_balance_change(collections, payments), 2),
             "collection_count": len(collections),
             "payment_count": len(payments)
         }
@@ -2781,7 +3396,8 @@ async def get_farmer_report(
 
 # ==================== ADVANCED REPORTS ====================
 
-@api_router.get("/reports/fat-average")
+@reports_router.get("/reports/fat-average")
+@report_cache.cached("fat_average", sources=("milk_collections",), period=month_to_date_period)
 async def get_fat_average_report(
     start_date: Optional[str] = None,
     end_date: Optional[str] = None,
@@ -2794,7 +3410,7 @@ async def get_fat_average_report(
     if not end_date:
         end_date = datetime.now(timezone.utc).strftime("%Y-%m-%d")
     
-    collections = await db.milk_collections.find(
+    collections = await milk_collections_read.find(
         {"date": {"$gte": start_date, "$lte": end_date}}, {"_id": 0}
     ).to_list(10000)
     
@@ -2842,7 +3458,8 @@ async def get_fat_average_report(
         "report": report
     }
 
-@api_router.get("/reports/farmer-ranking")
+@reports_router.get("/reports/farmer-ranking")
+@report_cache.cached("farmer_ranking", sources=("milk_collections",), period=month_to_date_period)
 async def get_farmer_ranking_report(
     start_date: Optional[str] = None,
     end_date: Optional[str] = None,
@@ -2856,7 +3473,7 @@ async def get_farmer_ranking_report(
     if not end_date:
         end_date = datetime.now(timezone.utc).strftime("%Y-%m-%d")
     
-    collections = await db.milk_collections.find(
+    collections = await milk_collections_read.find(
         {"date": {"$gte": start_date, "$lte": end_date}}, {"_id": 0}
     ).to_list(10000)
     
@@ -2908,7 +3525,9 @@ async def get_farmer_ranking_report(
         "ranking": ranking
     }
 
-@api_router.get("/reports/monthly-summary")
+@reports_router.get("/reports/monthly-summary")
+@report_cache.cached("monthly_summary", sources=("milk_collections", "payments", "sales", "expenses"), period=month_period)
+@singleflight.coalesce()
 async def get_monthly_summary_report(
     month: Optional[str] = None,  # Format: YYYY-MM
     current_user: dict = Depends(get_current_user)
@@ -2927,21 +3546,13 @@ async def get_monthly_summary_report(
         end_date = f"{year}-{int(mon)+1:02d}-01"
     
     # Get all data for the month
-    collections = await db.milk_collections.find(
-        {"date": {"$gte": start_date, "$lt": end_date}}, {"_id": 0}
-    ).to_list(10000)
-    
-    payments = await db.payments.find(
-        {"date": {"$gte": start_date, "$lt": end_date}}, {"_id": 0}
-    ).to_list(10000)
-    
-    sales = await db.sales.find(
-        {"date": {"$gte": start_date, "$lt": end_date}}, {"_id": 0}
-    ).to_list(10000)
-    
-    expenses = await db.expenses.find(
-        {"date": {"$gte": start_date, "$lt": end_date}}, {"_id": 0}
-    ).to_list(10000)
+    month_query = {"date": {"$gte": start_date, "$lt": end_date}}
+    collections, payments, sales, expenses = await gather_queries(
+        milk_collections_read.find(month_query, {"_id": 0}).to_list(10000),
+        payments_collection_read.find(month_query, {"_id": 0}).to_list(10000),
+        sales_collection_read.find(month_query, {"_id": 0}).to_list(10000),
+        db_read.expenses.find(month_query, {"_id": 0}).to_list(10000)
+    )
     
     # Calculate totals
     total_milk = sum(c["quantity"] for c in collections)
@@ -2999,7 +3610,7 @@ async def get_monthly_summary_report(
 
 # ==================== BILL GENERATION ROUTES ====================
 
-@api_router.get("/bills/farmer/{farmer_id}", response_class=HTMLResponse)
+@reports_router.get("/bills/farmer/{farmer_id}", response_class=HTMLResponse)
 async def generate_farmer_bill(
     farmer_id: str,
     start_date: Optional[str] = None,
@@ -3007,7 +3618,7 @@ async def generate_farmer_bill(
     current_user: dict = Depends(get_current_user)
 ):
     """Generate HTML bill for a farmer"""
-    farmer = await db.farmers.find_one({"id": farmer_id}, {"_id": 0})
+    farmer = await farmer_cache.get(db, farmer_id)
     if not farmer:
         raise HTTPException(status_code=404, detail="Farmer not found")
     
@@ -3020,16 +3631,17 @@ async def generate_farmer_bill(
     
     # Get collections
     collection_query = {"farmer_id": farmer_id, "date": {"$gte": start_date, "$lte": end_date}}
-    collections = await db.milk_collections.find(collection_query, {"_id": 0}).sort("date", 1).to_list(1000)
+    collections = await milk_collections_read.find(collection_query, {"_id": 0}).sort("date", 1).to_list(1000)
     
     # Get payments
     payment_query = {"farmer_id": farmer_id, "date": {"$gte": start_date, "$lte": end_date}}
-    payments = await db.payments.find(payment_query, {"_id": 0}).sort("date", 1).to_list(1000)
+    payments = await payments_collection_read.find(payment_query, {"_id": 0}).sort("date", 1).to_list(1000)
     
     # Get settings for dairy info
-    settings = await db.settings.find_one({"type": "dairy_info"}, {"_id": 0}) or {}
+    settings = await reference_cache.settings(db)
     
-    html = generate_farmer_bill_html(
+    html = await run_cpu(
+        generate_farmer_bill_html,
         farmer=farmer,
         collections=collections,
         payments=payments,
@@ -3042,14 +3654,14 @@ async def generate_farmer_bill(
     
     return HTMLResponse(content=html)
 
-@api_router.get("/bills/daily/{date}", response_class=HTMLResponse)
+@reports_router.get("/bills/daily/{date}", response_class=HTMLResponse)
 async def generate_daily_bill(
     date: str,
     current_user: dict = Depends(get_current_user)
 ):
     """Generate HTML daily report"""
-    collections = await db.milk_collections.find({"date": date}, {"_id": 0}).to_list(1000)
-    payments = await db.payments.find({"date": date}, {"_id": 0}).to_list(1000)
+    collections = await milk_collections_read.find({"date": date}, {"_id": 0}).to_list(1000)
+    payments = await payments_collection_read.find({"date": date}, {"_id": 0}).to_list(1000)
     
     total_quantity = sum(c["quantity"] for c in collections)
     total_amount = sum(c["amount"] for c in collections)
@@ -3063,9 +3675,10 @@ async def generate_daily_bill(
         "evening_quantity": evening_qty
     }
     
-    settings = await db.settings.find_one({"type": "dairy_info"}, {"_id": 0}) or {}
+    settings = await reference_cache.settings(db)
     
-    html = generate_daily_report_html(
+    html = await run_cpu(
+        generate_daily_report_html,
         date=date,
         collections=collections,
         payments=payments,
@@ -3091,7 +3704,7 @@ class SMSTemplateSettings(BaseModel):
 
 @api_router.get("/settings/dairy")
 async def get_dairy_settings(current_user: dict = Depends(get_current_user)):
-    settings = await db.settings.find_one({"type": "dairy_info"}, {"_id": 0})
+    settings = await reference_cache.get(db, "settings", "dairy_info")
     if not settings:
         return {
             "dairy_name": "Nirbani Dairy",
@@ -3118,11 +3731,12 @@ async def update_dairy_settings(
         }},
         upsert=True
     )
+    reference_changed("settings")
     return {"message": "Settings updated successfully"}
 
 @api_router.get("/settings/sms-templates")
 async def get_sms_templates(current_user: dict = Depends(get_current_user)):
-    settings = await db.settings.find_one({"type": "sms_templates"}, {"_id": 0})
+    settings = await reference_cache.get(db, "settings", "sms_templates")
     if not settings:
         return {
             "collection_template": "Nirbani Dairy: {farmer_name} जी, आपका {shift} का दूध: मात्रा: {quantity}L | फैट: {fat}% | राशि: ₹{amount}",
@@ -3145,230 +3759,168 @@ async def update_sms_templates(
         }},
         upsert=True
     )
+    reference_changed("settings")
     return {"message": "SMS templates updated successfully"}
 
 # ==================== EXPORT ROUTES ====================
 
-@api_router.get("/export/collections")
+@reports_router.get("/export/collections")
 async def export_collections(
     start_date: Optional[str] = None,
     end_date: Optional[str] = None,
     current_user: dict = Depends(get_current_user)
 ):
     """Export collections as CSV"""
-    import io, csv
     if not start_date:
         start_date = datetime.now(timezone.utc).replace(day=1).strftime("%Y-%m-%d")
     if not end_date:
         end_date = datetime.now(timezone.utc).strftime("%Y-%m-%d")
     
-    collections = await db.milk_collections.find(
+    collections = await milk_collections_read.find(
         {"date": {"$gte": start_date, "$lte": end_date}}, {"_id": 0}
     ).sort("date", 1).to_list(10000)
     
-    output = io.StringIO()
-    writer = csv.writer(output)
-    writer.writerow(["Date", "Farmer", "Shift", "Quantity(L)", "Fat%", "SNF%", "Rate", "Amount"])
-    for c in collections:
-        writer.writerow([c["date"], c["farmer_name"], c["shift"], c["quantity"], c["fat"], c["snf"], c["rate"], c["amount"]])
-    
-    content = output.getvalue()
+    content = await run_cpu(collections_csv, collections)
     return StreamingResponse(
-        io.BytesIO(content.encode("utf-8-sig")),
+        io.BytesIO(content),
         media_type="text/csv",
         headers={"Content-Disposition": f"attachment; filename=collections_{start_date}_to_{end_date}.csv"}
     )
 
-@api_router.get("/export/payments")
+@reports_router.get("/export/payments")
 async def export_payments(
     start_date: Optional[str] = None,
     end_date: Optional[str] = None,
     current_user: dict = Depends(get_current_user)
 ):
     """Export payments as CSV"""
-    import io, csv
     if not start_date:
         start_date = datetime.now(timezone.utc).replace(day=1).strftime("%Y-%m-%d")
     if not end_date:
         end_date = datetime.now(timezone.utc).strftime("%Y-%m-%d")
     
-    payments = await db.payments.find(
+    payments = await payments_collection_read.find(
         {"date": {"$gte": start_date, "$lte": end_date}}, {"_id": 0}
     ).sort("date", 1).to_list(10000)
     
-    output = io.StringIO()
-    writer = csv.writer(output)
-    writer.writerow(["Date", "Farmer", "Amount", "Mode", "Type", "Notes"])
-    for p in payments:
-        writer.writerow([p["date"], p["farmer_name"], p["amount"], p["payment_mode"], p.get("payment_type", "payment"), p.get("notes", "")])
-    
-    content = output.getvalue()
+    content = await run_cpu(payments_csv, payments)
     return StreamingResponse(
-        io.BytesIO(content.encode("utf-8-sig")),
+        io.BytesIO(content),
         media_type="text/csv",
         headers={"Content-Disposition": f"attachment; filename=payments_{start_date}_to_{end_date}.csv"}
     )
 
-@api_router.get("/export/farmers")
+@reports_router.get("/export/farmers")
 async def export_farmers(current_user: dict = Depends(get_current_user)):
     """Export farmers list as CSV"""
-    import io, csv
-    farmers = await db.farmers.find({}, {"_id": 0}).sort("name", 1).to_list(10000)
+    async with farmer_reads():
+        farmers = await db.farmers.find({}, {"_id": 0}).sort("name", 1).to_list(10000)
+        farmers = [with_pending(f) for f in farmers]
     
-    output = io.StringIO()
-    writer = csv.writer(output)
-    writer.writerow(["Name", "Phone", "Village", "Address", "Total Milk(L)", "Total Due", "Total Paid", "Balance", "Active"])
-    for f in farmers:
-        writer.writerow([f["name"], f["phone"], f.get("village",""), f.get("address",""),
-            f["total_milk"], f["total_due"], f["total_paid"], f["balance"], f.get("is_active", True)])
-    
-    content = output.getvalue()
+    content = await run_cpu(farmers_csv, farmers)
     return StreamingResponse(
-        io.BytesIO(content.encode("utf-8-sig")),
+        io.BytesIO(content),
         media_type="text/csv",
         headers={"Content-Disposition": "attachment; filename=farmers_list.csv"}
     )
 
-@api_router.get("/export/sales")
+@reports_router.get("/export/sales")
 async def export_sales(
     start_date: Optional[str] = None,
     end_date: Optional[str] = None,
     current_user: dict = Depends(get_current_user)
 ):
     """Export sales as CSV"""
-    import io, csv
     if not start_date:
         start_date = datetime.now(timezone.utc).replace(day=1).strftime("%Y-%m-%d")
     if not end_date:
         end_date = datetime.now(timezone.utc).strftime("%Y-%m-%d")
     
-    sales = await db.sales.find(
+    sales = await sales_collection_read.find(
         {"date": {"$gte": start_date, "$lte": end_date}}, {"_id": 0}
     ).sort("date", 1).to_list(10000)
     
-    output = io.StringIO()
-    writer = csv.writer(output)
-    writer.writerow(["Date", "Customer", "Product", "Quantity", "Rate", "Amount"])
-    for s in sales:
-        writer.writerow([s["date"], s["customer_name"], s["product"], s["quantity"], s["rate"], s["amount"]])
-    
-    content = output.getvalue()
+    content = await run_cpu(sales_csv, sales)
     return StreamingResponse(
-        io.BytesIO(content.encode("utf-8-sig")),
+        io.BytesIO(content),
         media_type="text/csv",
         headers={"Content-Disposition": f"attachment; filename=sales_{start_date}_to_{end_date}.csv"}
     )
 
-@api_router.get("/export/expenses")
+@reports_router.get("/export/expenses")
 async def export_expenses(
     start_date: Optional[str] = None,
     end_date: Optional[str] = None,
     current_user: dict = Depends(get_current_user)
 ):
     """Export expenses as CSV"""
-    import io, csv
     if not start_date:
         start_date = datetime.now(timezone.utc).replace(day=1).strftime("%Y-%m-%d")
     if not end_date:
         end_date = datetime.now(timezone.utc).strftime("%Y-%m-%d")
     
-    expenses = await db.expenses.find(
+    expenses = await db_read.expenses.find(
         {"date": {"$gte": start_date, "$lte": end_date}}, {"_id": 0}
     ).sort("date", 1).to_list(10000)
     
-    output = io.StringIO()
-    writer = csv.writer(output)
-    writer.writerow(["Date", "Category", "Amount", "Description", "Payment Mode"])
-    for e in expenses:
-        writer.writerow([e["date"], e["category"], e["amount"], e.get("description",""), e["payment_mode"]])
-    
-    content = output.getvalue()
+    content = await run_cpu(expenses_csv, expenses)
     return StreamingResponse(
-        io.BytesIO(content.encode("utf-8-sig")),
+        io.BytesIO(content),
         media_type="text/csv",
         headers={"Content-Disposition": f"attachment; filename=expenses_{start_date}_to_{end_date}.csv"}
     )
 
+@reports_router.get("/export/parquet/{collection}")
+async def export_parquet(
+    collection: str,
+    start_date: Optional[str] = None,
+    end_date: Optional[str] = None,
+    current_user: dict = Depends(get_current_user)
+):
+    """Export a collection as month-partitioned Parquet files in a zip (whole history by default)"""
+    if current_user.get("role") != "admin":
+        raise HTTPException(status_code=403, detail="Only admin can export Parquet snapshots")
+    if collection not in PARQUET_COLLECTIONS:
+        raise HTTPException(status_code=404, detail=f"Unknown export collection: {collection}")
+    
+    # Streamed a month at a time, so a long history doesn't hold the response until the whole zip is built
+    return StreamingResponse(
+        stream_parquet_zip(db_read, collection, start_date, end_date),
+        media_type="application/zip",
+        headers={"Content-Disposition": f'attachment; filename="{collection}_parquet.zip"'}
+    )
+
 # ==================== THERMAL PRINTER BILL ====================
 
-@api_router.get("/bills/thermal/{farmer_id}", response_class=HTMLResponse)
+@reports_router.get("/bills/thermal/{farmer_id}", response_class=HTMLResponse)
 async def thermal_bill(farmer_id: str, start_date: Optional[str] = None, end_date: Optional[str] = None):
     """Generate thermal printer friendly bill (58mm/80mm)"""
-    farmer = await db.farmers.find_one({"id": farmer_id}, {"_id": 0})
-    if not farmer:
-        raise HTTPException(status_code=404, detail="Farmer not found")
-    
     if not end_date:
         end_date = datetime.now(timezone.utc).strftime("%Y-%m-%d")
     if not start_date:
         start_date = (datetime.now(timezone.utc) - timedelta(days=30)).strftime("%Y-%m-%d")
     
-    collections = await db.milk_collections.find(
-        {"farmer_id": farmer_id, "date": {"$gte": start_date, "$lte": end_date}}, {"_id": 0}
-    ).sort("date", 1).to_list(1000)
-    
-    payments = await db.payments.find(
-        {"farmer_id": farmer_id, "date": {"$gte": start_date, "$lte": end_date}}, {"_id": 0}
-    ).sort("date", 1).to_list(1000)
-    
-    settings = await db.settings.find_one({"type": "dairy_info"}, {"_id": 0}) or {}
+    period_query = {"farmer_id": farmer_id, "date": {"$gte": start_date, "$lte": end_date}}
+    farmer, collections, payments, settings = await gather_queries(
+        farmer_cache.get(db, farmer_id),
+        milk_collections_read.find(period_query, {"_id": 0}).sort("date", 1).to_list(1000),
+        payments_collection_read.find(period_query, {"_id": 0}).sort("date", 1).to_list(1000),
+        reference_cache.settings(db)
+    )
+    if not farmer:
+        raise HTTPException(status_code=404, detail="Farmer not found")
     dairy_name = settings.get("dairy_name", "Nirbani Dairy")
     dairy_phone = settings.get("phone", "")
     
-    total_milk = sum(c["quantity"] for c in collections)
-    total_amount = sum(c["amount"] for c in collections)
-    total_paid = sum(p["amount"] for p in payments)
-    balance = total_amount - total_paid
-    
-    rows = ""
-    for c in collections:
-        shift = "AM" if c["shift"] == "morning" else "PM"
-        rows += f"<tr><td>{c['date'][5:]}</td><td>{shift}</td><td>{c['quantity']}</td><td>{c['fat']}</td><td>{c['rate']}</td><td style='text-align:right'>{c['amount']:.0f}</td></tr>\n"
-    
-    pay_rows = ""
-    for p in payments:
-        pay_rows += f"<tr><td>{p['date'][5:]}</td><td>{p['payment_mode']}</td><td style='text-align:right'>{p['amount']:.0f}</td></tr>\n"
-    
-    html = f"""<!DOCTYPE html><html><head><meta charset="utf-8"><meta name="viewport" content="width=58mm">
-<style>
-*{{margin:0;padding:0;box-sizing:border-box}}
-body{{font-family:'Courier New',monospace;font-size:11px;width:58mm;padding:2mm;color:#000}}
-.center{{text-align:center}}.bold{{font-weight:bold}}.line{{border-top:1px dashed #000;margin:3px 0}}
-table{{width:100%;border-collapse:collapse}}
-td,th{{padding:1px 2px;font-size:10px;vertical-align:top}}
-th{{text-align:left;border-bottom:1px solid #000}}
-.right{{text-align:right}}.big{{font-size:14px}}
-@media print{{@page{{size:58mm auto;margin:0}}body{{width:58mm}}}}
-</style></head><body>
-<div class="center bold big">{dairy_name}</div>
-<div class="center" style="font-size:9px">{dairy_phone}</div>
-<div class="line"></div>
-<div class="bold">{farmer['name']}</div>
-<div style="font-size:9px">Ph: {farmer['phone']}</div>
-<div style="font-size:9px">{start_date} to {end_date}</div>
-<div class="line"></div>
-<table><tr><th>Date</th><th>S</th><th>Qty</th><th>Fat</th><th>Rate</th><th class="right">Amt</th></tr>
-{rows}</table>
-<div class="line"></div>
-<table>
-<tr><td class="bold">Total Milk:</td><td class="right bold">{total_milk:.1f} L</td></tr>
-<tr><td class="bold">Total Amt:</td><td class="right bold">Rs.{total_amount:.0f}</td></tr>
-<tr><td class="bold">Paid:</td><td class="right bold">Rs.{total_paid:.0f}</td></tr>
-<tr><td class="bold">Balance:</td><td class="right bold">Rs.{balance:.0f}</td></tr>
-</table>
-{f'<div class="line"></div><div class="bold" style="font-size:9px">Payments:</div><table><tr><th>Date</th><th>Mode</th><th class="right">Amt</th></tr>{pay_rows}</table>' if payments else ''}
-<div class="line"></div>
-<div class="center" style="font-size:9px;margin-top:3px">Thank You / धन्यवाद</div>
-<div class="center" style="font-size:8px">Printed: {datetime.now(timezone.utc).strftime("%d-%m-%Y %H:%M")}</div>
-</body></html>"""
+    html = await run_cpu(generate_thermal_bill_html, farmer, collections, payments, start_date, end_date, dairy_name, dairy_phone)
     return HTMLResponse(content=html)
 
 # ==================== A4 INVOICE ====================
 
-@api_router.get("/bills/a4/{farmer_id}", response_class=HTMLResponse)
+@reports_router.get("/bills/a4/{farmer_id}", response_class=HTMLResponse)
 async def a4_invoice(farmer_id: str, start_date: Optional[str] = None, end_date: Optional[str] = None):
     """Generate A4 professional invoice"""
-    farmer = await db.farmers.find_one({"id": farmer_id}, {"_id": 0})
+    farmer = await farmer_cache.get(db, farmer_id)
     if not farmer:
         raise HTTPException(status_code=404, detail="Farmer not found")
     
@@ -3377,87 +3929,20 @@ async def a4_invoice(farmer_id: str, start_date: Optional[str] = None, end_date:
     if not start_date:
         start_date = (datetime.now(timezone.utc) - timedelta(days=30)).strftime("%Y-%m-%d")
     
-    collections = await db.milk_collections.find(
+    collections = await milk_collections_read.find(
         {"farmer_id": farmer_id, "date": {"$gte": start_date, "$lte": end_date}}, {"_id": 0}
     ).sort("date", 1).to_list(1000)
     
-    payments = await db.payments.find(
+    payments = await payments_collection_read.find(
         {"farmer_id": farmer_id, "date": {"$gte": start_date, "$lte": end_date}}, {"_id": 0}
     ).sort("date", 1).to_list(1000)
     
-    settings = await db.settings.find_one({"type": "dairy_info"}, {"_id": 0}) or {}
+    settings = await reference_cache.settings(db)
     dairy_name = settings.get("dairy_name", "Nirbani Dairy")
     dairy_phone = settings.get("phone", "")
     dairy_address = settings.get("address", "")
     
-    total_milk = sum(c["quantity"] for c in collections)
-    total_amount = sum(c["amount"] for c in collections)
-    avg_fat = sum(c["fat"] * c["quantity"] for c in collections) / total_milk if total_milk > 0 else 0
-    avg_snf = sum(c["snf"] * c["quantity"] for c in collections) / total_milk if total_milk > 0 else 0
-    total_paid = sum(p["amount"] for p in payments)
-    balance = total_amount - total_paid
-    invoice_no = f"INV-{farmer_id[:8].upper()}-{datetime.now(timezone.utc).strftime('%Y%m%d')}"
-    
-    coll_rows = ""
-    for i, c in enumerate(collections, 1):
-        shift_label = "Morning / सुबह" if c["shift"] == "morning" else "Evening / शाम"
-        coll_rows += f"""<tr><td>{i}</td><td>{c['date']}</td><td>{shift_label}</td><td>{c['quantity']:.1f}</td><td>{c['fat']:.1f}</td><td>{c['snf']:.1f}</td><td>{c['rate']:.2f}</td><td class="right">{c['amount']:.2f}</td></tr>"""
-    
-    pay_rows = ""
-    for p in payments:
-        mode = p.get("payment_mode", "cash").upper()
-        pay_rows += f"<tr><td>{p['date']}</td><td>{mode}</td><td>{p.get('notes','')}</td><td class='right'>{p['amount']:.2f}</td></tr>"
-    
-    html = f"""<!DOCTYPE html><html><head><meta charset="utf-8">
-<style>
-*{{margin:0;padding:0;box-sizing:border-box}}
-body{{font-family:'Segoe UI',Arial,sans-serif;font-size:12px;color:#1a1a1a;padding:15mm 20mm;max-width:210mm}}
-.header{{display:flex;justify-content:space-between;align-items:flex-start;border-bottom:3px solid #15803d;padding-bottom:12px;margin-bottom:15px}}
-.dairy-name{{font-size:24px;font-weight:bold;color:#15803d}}.dairy-info{{font-size:10px;color:#666;margin-top:4px}}
-.invoice-box{{text-align:right}}.invoice-title{{font-size:20px;color:#15803d;font-weight:bold}}.invoice-no{{font-size:11px;color:#666;margin-top:2px}}
-.info-grid{{display:grid;grid-template-columns:1fr 1fr;gap:15px;margin-bottom:15px}}
-.info-card{{background:#f8faf8;border:1px solid #e5e7eb;border-radius:6px;padding:10px}}
-.info-label{{font-size:9px;color:#888;text-transform:uppercase;letter-spacing:0.5px}}.info-value{{font-size:13px;font-weight:600;margin-top:2px}}
-table{{width:100%;border-collapse:collapse;margin-bottom:15px}}
-th{{background:#15803d;color:white;padding:6px 8px;text-align:left;font-size:10px;text-transform:uppercase}}
-td{{padding:5px 8px;border-bottom:1px solid #eee;font-size:11px}}.right{{text-align:right}}
-tr:nth-child(even){{background:#f9fafb}}
-.summary-grid{{display:grid;grid-template-columns:1fr 1fr 1fr 1fr;gap:10px;margin:15px 0}}
-.summary-box{{background:#f0fdf4;border:1px solid #bbf7d0;border-radius:6px;padding:10px;text-align:center}}
-.summary-box.due{{background:#fef2f2;border-color:#fecaca}}
-.summary-label{{font-size:9px;color:#666;text-transform:uppercase}}.summary-value{{font-size:18px;font-weight:bold;color:#15803d;margin-top:2px}}
-.summary-box.due .summary-value{{color:#dc2626}}
-.footer{{margin-top:20px;border-top:2px solid #15803d;padding-top:10px;display:flex;justify-content:space-between;font-size:10px;color:#666}}
-.sig-box{{border-top:1px solid #333;width:150px;text-align:center;padding-top:5px;margin-top:40px;font-size:10px}}
-h3{{color:#15803d;font-size:13px;margin-bottom:8px;padding-bottom:4px;border-bottom:1px solid #d1fae5}}
-@media print{{@page{{size:A4;margin:10mm}}body{{padding:0}}}}
-</style></head><body>
-<div class="header">
-  <div><div class="dairy-name">{dairy_name}</div><div class="dairy-info">{dairy_address}<br>{dairy_phone}</div></div>
-  <div class="invoice-box"><div class="invoice-title">INVOICE / बिल</div><div class="invoice-no">{invoice_no}</div><div class="invoice-no">{start_date} to {end_date}</div></div>
-</div>
-<div class="info-grid">
-  <div class="info-card"><div class="info-label">Farmer / किसान</div><div class="info-value">{farmer['name']}</div><div style="font-size:10px;color:#666">Ph: {farmer['phone']}{f" | Village: {farmer.get('village','')}" if farmer.get('village') else ''}</div></div>
-  <div class="info-card"><div class="info-label">Account / Bank</div><div class="info-value">{farmer.get('bank_account','N/A')}</div><div style="font-size:10px;color:#666">IFSC: {farmer.get('ifsc_code','N/A')}</div></div>
-</div>
-<div class="summary-grid">
-  <div class="summary-box"><div class="summary-label">Total Milk / कुल दूध</div><div class="summary-value">{total_milk:.1f} L</div></div>
-  <div class="summary-box"><div class="summary-label">Avg Fat / औसत फैट</div><div class="summary-value">{avg_fat:.1f}%</div></div>
-  <div class="summary-box"><div class="summary-label">Total Amount / कुल राशि</div><div class="summary-value">₹{total_amount:.0f}</div></div>
-  <div class="summary-box {'due' if balance > 0 else ''}"><div class="summary-label">Balance / बकाया</div><div class="summary-value">₹{balance:.0f}</div></div>
-</div>
-<h3>Milk Collection Details / दूध संग्रह विवरण</h3>
-<table><tr><th>#</th><th>Date</th><th>Shift / पाली</th><th>Qty (L)</th><th>Fat %</th><th>SNF %</th><th>Rate ₹/L</th><th class="right">Amount ₹</th></tr>
-{coll_rows}
-<tr style="background:#15803d;color:white;font-weight:bold"><td colspan="3">TOTAL</td><td>{total_milk:.1f}</td><td>{avg_fat:.1f}</td><td>{avg_snf:.1f}</td><td></td><td class="right">₹{total_amount:.2f}</td></tr>
-</table>
-{f'<h3>Payments / भुगतान</h3><table><tr><th>Date</th><th>Mode</th><th>Notes</th><th class="right">Amount ₹</th></tr>{pay_rows}<tr style="background:#15803d;color:white;font-weight:bold"><td colspan="3">TOTAL PAID</td><td class="right">₹{total_paid:.2f}</td></tr></table>' if payments else ''}
-<div style="display:flex;justify-content:flex-end;gap:40px;margin-top:30px">
-  <div class="sig-box">Dairy Stamp / डेयरी मुहर</div>
-  <div class="sig-box">Authorized Signature / हस्ताक्षर</div>
-</div>
-<div class="footer"><div>Generated: {datetime.now(timezone.utc).strftime("%d-%m-%Y %H:%M UTC")}</div><div>{dairy_name} | {dairy_phone}</div></div>
-</body></html>"""
+    html = await run_cpu(generate_farmer_invoice_html, farmer, collections, payments, start_date, end_date, dairy_name, dairy_phone, dairy_address)
     return HTMLResponse(content=html)
 
 # ==================== OCR RATE CHART UPLOAD ====================
@@ -3486,7 +3971,7 @@ async def ocr_rate_chart_upload(
     if ext == "pdf":
         raise HTTPException(status_code=400, detail="Please upload an image (JPG/PNG/WEBP) of the rate chart. PDF OCR coming soon.")
     
-    image_b64 = base64.b64encode(content).decode("utf-8")
+    image_b64 = (await run_in_thread(base64.b64encode, content)).decode("utf-8")
     
     try:
         from emergentintegrations.llm.chat import LlmChat, UserMessage, ImageContent
@@ -3536,6 +4021,7 @@ Return ONLY the JSON array, no markdown, no explanation."""
                         "rate": rate, "created_at": datetime.now(timezone.utc).isoformat()
                     })
                 inserted += 1
+        rate_chart_changed()
         
         return {
             "success": True, "extracted": len(rate_data), "saved": inserted,
@@ -3571,6 +4057,7 @@ async def create_dairy_plant(plant: DairyPlantCreate, current_user: dict = Depen
     }
     await db.dairy_plants.insert_one(plant_doc)
     del plant_doc["_id"]
+    reference_changed("dairy_plants")
     return DairyPlantResponse(**plant_doc)
 
 @api_router.get("/dairy-plants", response_model=List[DairyPlantResponse])
@@ -3593,6 +4080,7 @@ async def update_dairy_plant(plant_id: str, updates: DairyPlantUpdate, current_u
     update_data = {k: v for k, v in updates.model_dump().items() if v is not None}
     if update_data:
         await db.dairy_plants.update_one({"id": plant_id}, {"$set": update_data})
+        reference_changed("dairy_plants")
     updated = await db.dairy_plants.find_one({"id": plant_id}, {"_id": 0})
     return DairyPlantResponse(**updated)
 
@@ -3600,13 +4088,14 @@ async def update_dairy_plant(plant_id: str, updates: DairyPlantUpdate, current_u
 
 @api_router.post("/dispatches", response_model=DispatchResponse)
 async def create_dispatch(dispatch: DispatchCreate, current_user: dict = Depends(get_current_user)):
-    plant = await db.dairy_plants.find_one({"id": dispatch.dairy_plant_id}, {"_id": 0})
+    plant = await reference_cache.get(db, "dairy_plants", dispatch.dairy_plant_id)
     if not plant:
         raise HTTPException(status_code=404, detail="Dairy plant not found")
 
     dispatch_id = str(uuid.uuid4())
     now = datetime.now(timezone.utc)
     date_str = dispatch.date or now.strftime("%Y-%m-%d")
+    ensure_open(date_str)
 
     gross_amount = round(dispatch.quantity_kg * dispatch.rate_per_kg, 2)
     deductions_list = [d.model_dump() for d in (dispatch.deductions or [])]
@@ -3640,6 +4129,8 @@ async def create_dispatch(dispatch: DispatchCreate, current_user: dict = Depends
     }
     await db.dispatches.insert_one(dispatch_doc)
     del dispatch_doc["_id"]
+    await pnl_changed("dispatches", after=[dispatch_doc])
+    dates_changed("dispatches", date_str)
 
     # Update dairy plant totals
     await db.dairy_plants.update_one(
@@ -3678,11 +4169,14 @@ async def delete_dispatch(dispatch_id: str, current_user: dict = Depends(get_cur
     dispatch = await db.dispatches.find_one({"id": dispatch_id}, {"_id": 0})
     if not dispatch:
         raise HTTPException(status_code=404, detail="Dispatch not found")
+    ensure_open(dispatch["date"])
     await db.dairy_plants.update_one(
         {"id": dispatch["dairy_plant_id"]},
         {"$inc": {"total_milk_supplied": -dispatch["quantity_kg"], "total_amount": -dispatch["net_receivable"], "balance": -dispatch["net_receivable"]}}
     )
     await db.dispatches.delete_one({"id": dispatch_id})
+    await pnl_changed("dispatches", before=[dispatch])
+    dates_changed("dispatches", dispatch["date"])
     return {"message": "Dispatch deleted"}
 
 # ==================== SLIP MATCHING ROUTES ====================
@@ -3692,6 +4186,7 @@ async def match_dispatch_slip(dispatch_id: str, slip: SlipMatchCreate, current_u
     dispatch = await db.dispatches.find_one({"id": dispatch_id}, {"_id": 0})
     if not dispatch:
         raise HTTPException(status_code=404, detail="Dispatch not found")
+    ensure_open(dispatch["date"])
 
     fat_diff = round(dispatch["avg_fat"] - slip.slip_fat, 2)
     amount_diff = round(dispatch["net_receivable"] - slip.slip_amount, 2)
@@ -3730,12 +4225,13 @@ async def match_dispatch_slip(dispatch_id: str, slip: SlipMatchCreate, current_u
 
 @api_router.post("/dairy-payments", response_model=DairyPaymentResponse)
 async def create_dairy_payment(payment: DairyPaymentCreate, current_user: dict = Depends(get_current_user)):
-    plant = await db.dairy_plants.find_one({"id": payment.dairy_plant_id}, {"_id": 0})
+    plant = await reference_cache.get(db, "dairy_plants", payment.dairy_plant_id)
     if not plant:
         raise HTTPException(status_code=404, detail="Dairy plant not found")
 
     payment_id = str(uuid.uuid4())
     now = datetime.now(timezone.utc)
+    ensure_open(now.strftime("%Y-%m-%d"))
     payment_doc = {
         "id": payment_id,
         "dairy_plant_id": payment.dairy_plant_id,
@@ -3779,12 +4275,14 @@ async def get_dairy_ledger(plant_id: str, start_date: Optional[str] = None, end_
     if end_date:
         dq.setdefault("date", {})["$lte"] = end_date
 
-    dispatches = await db.dispatches.find(dq, {"_id": 0}).sort("date", -1).to_list(500)
-    payments = await db.dairy_payments.find(dq, {"_id": 0}).sort("date", -1).to_list(500)
+    dispatches = await db_read.dispatches.find(dq, {"_id": 0}).sort("date", -1).to_list(500)
+    payments = await db_read.dairy_payments.find(dq, {"_id": 0}).sort("date", -1).to_list(500)
 
     return {"plant": DairyPlantResponse(**plant).model_dump(), "dispatches": dispatches, "payments": payments}
 
-@api_router.get("/dairy/profit-report")
+@reports_router.get("/dairy/profit-report")
+@report_cache.cached("profit", sources=("dispatches", "milk_collections", "expenses", "sales"), period=profit_period)
+@singleflight.coalesce()
 async def dairy_profit_report(date: Optional[str] = None, start_date: Optional[str] = None, end_date: Optional[str] = None, current_user: dict = Depends(get_current_user)):
     """Calculate real net profit: Dispatch income - Farmer costs - Expenses"""
     if date:
@@ -3796,110 +4294,12 @@ async def dairy_profit_report(date: Optional[str] = None, start_date: Optional[s
     if not end_date:
         end_date = start_date
 
-    # Get dispatch income
-    dispatch_query = {"date": {"$gte": start_date, "$lte": end_date}}
-    dispatches = await db.dispatches.find(dispatch_query, {"_id": 0}).to_list(1000)
-    total_dispatch_amount = sum(d.get("net_receivable", 0) for d in dispatches)
-    total_dispatch_kg = sum(d.get("quantity_kg", 0) for d in dispatches)
-    avg_selling_rate = round(total_dispatch_amount / total_dispatch_kg, 2) if total_dispatch_kg > 0 else 0
-
-    # Get farmer purchase cost
-    collection_query = {"date": {"$gte": start_date, "$lte": end_date}}
-    collections = await db.milk_collections.find(collection_query, {"_id": 0}).to_list(5000)
-    total_farmer_amount = sum(c.get("amount", 0) for c in collections)
-    total_collection_liters = sum(c.get("quantity", 0) for c in collections)
-    total_collection_kg = round(total_collection_liters * 1.03, 2)  # Convert liters to KG
-    avg_buying_rate = round(total_farmer_amount / total_collection_liters, 2) if total_collection_liters > 0 else 0
-
-    # Weighted FAT average from collections
-    weighted_fat = sum(c.get("fat", 0) * c.get("quantity", 0) for c in collections)
-    avg_collection_fat = round(weighted_fat / total_collection_liters, 2) if total_collection_liters > 0 else 0
-    weighted_snf = sum(c.get("snf", 0) * c.get("quantity", 0) for c in collections)
-    avg_collection_snf = round(weighted_snf / total_collection_liters, 2) if total_collection_liters > 0 else 0
-
-    # Dispatch FAT average
-    dispatch_weighted_fat = sum(d.get("avg_fat", 0) * d.get("quantity_kg", 0) for d in dispatches)
-    avg_dispatch_fat = round(dispatch_weighted_fat / total_dispatch_kg, 2) if total_dispatch_kg > 0 else 0
-
-    # Milk loss/gain
-    milk_difference_kg = round(total_collection_kg - total_dispatch_kg, 2)
-    milk_loss_percent = round((milk_difference_kg / total_collection_kg) * 100, 2) if total_collection_kg > 0 else 0
-
-    # Get expenses
-    expense_query = {"date": {"$gte": start_date, "$lte": end_date}}
-    expenses = await db.expenses.find(expense_query, {"_id": 0}).to_list(1000)
-    total_expenses = sum(e.get("amount", 0) for e in expenses)
-    expense_by_category = {}
-    for e in expenses:
-        cat = e.get("category", "other")
-        expense_by_category[cat] = expense_by_category.get(cat, 0) + e.get("amount", 0)
-
-    # Dispatch deductions breakdown
-    total_dispatch_deductions = sum(d.get("total_deduction", 0) for d in dispatches)
+    # Sum of the pre-aggregated day rows instead of every raw entry in the range
+    totals = await range_totals(db_read, start_date, end_date)
+    return profit_report(totals, start_date, end_date)
 
-    # Get retail/shop sales
-    sales_query = {"date": {"$gte": start_date, "$lte": end_date}}
-    sales = await db.sales.find(sales_query, {"_id": 0}).to_list(5000)
-    total_retail_sales = sum(s.get("amount", 0) for s in sales)
-    retail_milk_sales = sum(s.get("amount", 0) for s in sales if s.get("product") == "milk")
-    retail_other_sales = total_retail_sales - retail_milk_sales
-
-    # Calculate profits (include retail sales)
-    total_income = total_dispatch_amount + total_retail_sales
-    gross_margin_per_unit = round(avg_selling_rate - avg_buying_rate, 2)
-    gross_profit = round(total_income - total_farmer_amount, 2)
-    net_profit = round(gross_profit - total_expenses, 2)
-
-    return {
-        "period": {"start_date": start_date, "end_date": end_date},
-        "dispatch": {
-            "total_kg": total_dispatch_kg,
-            "total_amount": total_dispatch_amount,
-            "avg_rate": avg_selling_rate,
-            "avg_fat": avg_dispatch_fat,
-            "total_deductions": total_dispatch_deductions,
-            "count": len(dispatches),
-        },
-        "collection": {
-            "total_liters": total_collection_liters,
-            "total_kg": total_collection_kg,
-            "total_amount": total_farmer_amount,
-            "avg_rate": avg_buying_rate,
-            "avg_fat": avg_collection_fat,
-            "avg_snf": avg_collection_snf,
-            "count": len(collections),
-        },
-        "retail_sales": {
-            "total_amount": total_retail_sales,
-            "milk_sales": retail_milk_sales,
-            "other_sales": retail_other_sales,
-            "count": len(sales),
-        },
-        "milk_tracking": {
-            "collected_kg": total_collection_kg,
-            "dispatched_kg": total_dispatch_kg,
-            "difference_kg": milk_difference_kg,
-            "loss_percent": milk_loss_percent,
-            "alert": milk_loss_percent > 1,
-        },
-        "fat_analysis": {
-            "collection_avg_fat": avg_collection_fat,
-            "dispatch_avg_fat": avg_dispatch_fat,
-            "fat_deviation": round(avg_collection_fat - avg_dispatch_fat, 2),
-        },
-        "expenses": {
-            "total": total_expenses,
-            "by_category": expense_by_category,
-        },
-        "profit": {
-            "total_income": total_income,
-            "gross_margin_per_unit": gross_margin_per_unit,
-            "gross_profit": gross_profit,
-            "net_profit": net_profit,
-        },
-    }
-
-@api_router.get("/dairy/fat-analysis")
+@reports_router.get("/dairy/fat-analysis")
+@report_cache.cached("fat_analysis", sources=("milk_collections",), period=last_30_days_period)
 async def fat_analysis_report(start_date: Optional[str] = None, end_date: Optional[str] = None, current_user: dict = Depends(get_current_user)):
     """Farmer-wise FAT analysis for quality tracking"""
     if not start_date:
@@ -3907,7 +4307,7 @@ async def fat_analysis_report(start_date: Optional[str] = None, end_date: Option
     if not end_date:
         end_date = datetime.now(timezone.utc).strftime("%Y-%m-%d")
 
-    collections = await db.milk_collections.find(
+    collections = await milk_collections_read.find(
         {"date": {"$gte": start_date, "$lte": end_date}}, {"_id": 0}
     ).to_list(10000)
 
@@ -3951,126 +4351,38 @@ async def fat_analysis_report(start_date: Optional[str] = None, end_date: Option
 
 # ==================== DISPATCH BILL / PRINT ROUTES ====================
 
-@api_router.get("/dispatches/{dispatch_id}/bill")
+@reports_router.get("/dispatches/{dispatch_id}/bill")
 async def get_dispatch_bill(dispatch_id: str, current_user: dict = Depends(get_current_user)):
     dispatch = await db.dispatches.find_one({"id": dispatch_id}, {"_id": 0})
     if not dispatch:
         raise HTTPException(status_code=404, detail="Dispatch not found")
-    settings = await db.settings.find_one({"type": "dairy_info"}, {"_id": 0}) or {}
+    settings = await reference_cache.settings(db)
     dairy_name = settings.get("dairy_name", "Nirbani Dairy")
     dairy_phone = settings.get("phone", "")
     dairy_address = settings.get("address", "")
-    d = dispatch
-    ded_rows = ""
-    for ded in d.get("deductions", []):
-        ded_rows += f"<tr><td>{ded['type'].replace('_',' ').title()}</td><td class='right'>-₹{ded['amount']:.2f}</td></tr>"
-    slip_section = ""
-    if d.get("slip_matched"):
-        slip_section = f"""<h3>Dairy Slip Comparison / डेयरी स्लिप तुलना</h3>
-        <table><tr><th></th><th>Your / आपका</th><th>Dairy Slip / डेयरी स्लिप</th><th>Diff / अंतर</th></tr>
-        <tr><td>FAT %</td><td>{d['avg_fat']}</td><td>{d.get('slip_fat','N/A')}</td><td>{d.get('fat_difference',0)}</td></tr>
-        <tr><td>Amount / राशि</td><td>₹{d['net_receivable']:.2f}</td><td>₹{d.get('slip_amount',0):.2f}</td><td>₹{d.get('amount_difference',0):.2f}</td></tr></table>"""
-    html = f"""<!DOCTYPE html><html><head><meta charset="utf-8"><style>
-*{{margin:0;padding:0;box-sizing:border-box}}body{{font-family:'Segoe UI',Arial,sans-serif;font-size:12px;color:#1a1a1a;padding:15mm 20mm;max-width:210mm}}
-.header{{display:flex;justify-content:space-between;align-items:flex-start;border-bottom:3px solid #15803d;padding-bottom:12px;margin-bottom:15px}}
-.dairy-name{{font-size:24px;font-weight:bold;color:#15803d}}.dairy-info{{font-size:10px;color:#666;margin-top:4px}}
-.invoice-box{{text-align:right}}.invoice-title{{font-size:20px;color:#15803d;font-weight:bold}}
-.info-grid{{display:grid;grid-template-columns:1fr 1fr;gap:15px;margin-bottom:15px}}
-.info-card{{background:#f8faf8;border:1px solid #e5e7eb;border-radius:6px;padding:10px}}
-.info-label{{font-size:9px;color:#888;text-transform:uppercase}}.info-value{{font-size:13px;font-weight:600;margin-top:2px}}
-table{{width:100%;border-collapse:collapse;margin-bottom:15px}}
-th{{background:#15803d;color:white;padding:6px 8px;text-align:left;font-size:10px}}td{{padding:5px 8px;border-bottom:1px solid #eee;font-size:11px}}.right{{text-align:right}}
-.summary-grid{{display:grid;grid-template-columns:1fr 1fr 1fr 1fr;gap:10px;margin:15px 0}}
-.summary-box{{background:#f0fdf4;border:1px solid #bbf7d0;border-radius:6px;padding:10px;text-align:center}}
-.summary-label{{font-size:9px;color:#666;text-transform:uppercase}}.summary-value{{font-size:18px;font-weight:bold;color:#15803d;margin-top:2px}}
-h3{{color:#15803d;font-size:13px;margin:12px 0 8px;padding-bottom:4px;border-bottom:1px solid #d1fae5}}
-.sig-box{{border-top:1px solid #333;width:150px;text-align:center;padding-top:5px;margin-top:40px;font-size:10px}}
-@media print{{@page{{size:A4;margin:10mm}}body{{padding:0}}}}
-</style></head><body>
-<div class="header"><div><div class="dairy-name">{dairy_name}</div><div class="dairy-info">{dairy_address}<br>{dairy_phone}</div></div>
-<div class="invoice-box"><div class="invoice-title">DISPATCH BILL / डिस्पैच बिल</div><div style="font-size:11px;color:#666;margin-top:2px">{d['date']}</div></div></div>
-<div class="info-grid">
-<div class="info-card"><div class="info-label">Dairy Plant / डेयरी प्लांट</div><div class="info-value">{d['dairy_plant_name']}</div></div>
-<div class="info-card"><div class="info-label">Tanker / टैंकर</div><div class="info-value">{d.get('tanker_number','N/A')}</div></div>
-</div>
-<div class="summary-grid">
-<div class="summary-box"><div class="summary-label">Quantity / मात्रा</div><div class="summary-value">{d['quantity_kg']} KG</div></div>
-<div class="summary-box"><div class="summary-label">FAT %</div><div class="summary-value">{d['avg_fat']}%</div></div>
-<div class="summary-box"><div class="summary-label">SNF %</div><div class="summary-value">{d['avg_snf']}%</div></div>
-<div class="summary-box"><div class="summary-label">Rate / दर</div><div class="summary-value">₹{d['rate_per_kg']}/KG</div></div>
-</div>
-<h3>Amount Calculation / राशि गणना</h3>
-<table><tr><td>Gross Amount / कुल राशि</td><td class="right" style="font-weight:bold">₹{d['gross_amount']:.2f}</td></tr>
-{ded_rows}
-<tr style="background:#15803d;color:white;font-weight:bold"><td>Net Receivable / शुद्ध प्राप्य</td><td class="right">₹{d['net_receivable']:.2f}</td></tr></table>
-{slip_section}
-<div style="display:flex;justify-content:flex-end;gap:40px;margin-top:30px">
-<div class="sig-box">Dairy Stamp / डेयरी मुहर</div><div class="sig-box">Signature / हस्ताक्षर</div></div>
-</body></html>"""
+    html = await run_cpu(generate_dispatch_bill_html, dispatch, dairy_name, dairy_phone, dairy_address)
     return {"html": html, "dispatch": dispatch}
 
-@api_router.get("/dairy-plants/{plant_id}/statement")
+@reports_router.get("/dairy-plants/{plant_id}/statement")
 async def get_dairy_statement(plant_id: str, start_date: Optional[str] = None, end_date: Optional[str] = None, current_user: dict = Depends(get_current_user)):
-    plant = await db.dairy_plants.find_one({"id": plant_id}, {"_id": 0})
-    if not plant:
-        raise HTTPException(status_code=404, detail="Dairy plant not found")
     if not start_date:
         start_date = (datetime.now(timezone.utc) - timedelta(days=30)).strftime("%Y-%m-%d")
     if not end_date:
         end_date = datetime.now(timezone.utc).strftime("%Y-%m-%d")
     dq = {"dairy_plant_id": plant_id, "date": {"$gte": start_date, "$lte": end_date}}
-    dispatches = await db.dispatches.find(dq, {"_id": 0}).sort("date", 1).to_list(500)
-    payments = await db.dairy_payments.find(dq, {"_id": 0}).sort("date", 1).to_list(500)
-    settings = await db.settings.find_one({"type": "dairy_info"}, {"_id": 0}) or {}
+    reference, dispatches, payments = await gather_queries(
+        reference_cache.snapshot(db, ("settings", "dairy_plants")),
+        db_read.dispatches.find(dq, {"_id": 0}).sort("date", 1).to_list(500),
+        db_read.dairy_payments.find(dq, {"_id": 0}).sort("date", 1).to_list(500)
+    )
+    plant = reference.get("dairy_plants", plant_id)
+    if not plant:
+        raise HTTPException(status_code=404, detail="Dairy plant not found")
+    settings = reference.settings()
     dairy_name = settings.get("dairy_name", "Nirbani Dairy")
     dairy_phone = settings.get("phone", "")
     dairy_address = settings.get("address", "")
-    total_supplied = sum(d["quantity_kg"] for d in dispatches)
-    total_amount = sum(d["net_receivable"] for d in dispatches)
-    total_paid = sum(p["amount"] for p in payments)
-    balance = total_amount - total_paid
-    disp_rows = ""
-    for i, d in enumerate(dispatches, 1):
-        disp_rows += f"<tr><td>{i}</td><td>{d['date']}</td><td>{d.get('tanker_number','')}</td><td>{d['quantity_kg']}</td><td>{d['avg_fat']}%</td><td>₹{d['rate_per_kg']}</td><td class='right'>-₹{d['total_deduction']:.0f}</td><td class='right'>₹{d['net_receivable']:.2f}</td></tr>"
-    pay_rows = ""
-    for p in payments:
-        pay_rows += f"<tr><td>{p['date']}</td><td>{p['payment_mode'].upper()}</td><td>{p.get('reference_number','')}</td><td class='right'>₹{p['amount']:.2f}</td></tr>"
-    html = f"""<!DOCTYPE html><html><head><meta charset="utf-8"><style>
-*{{margin:0;padding:0;box-sizing:border-box}}body{{font-family:'Segoe UI',Arial,sans-serif;font-size:12px;color:#1a1a1a;padding:15mm 20mm;max-width:210mm}}
-.header{{display:flex;justify-content:space-between;align-items:flex-start;border-bottom:3px solid #15803d;padding-bottom:12px;margin-bottom:15px}}
-.dairy-name{{font-size:24px;font-weight:bold;color:#15803d}}.dairy-info{{font-size:10px;color:#666;margin-top:4px}}
-.invoice-box{{text-align:right}}.invoice-title{{font-size:20px;color:#15803d;font-weight:bold}}
-.info-card{{background:#f8faf8;border:1px solid #e5e7eb;border-radius:6px;padding:10px;margin-bottom:15px}}
-.info-label{{font-size:9px;color:#888;text-transform:uppercase}}.info-value{{font-size:13px;font-weight:600;margin-top:2px}}
-table{{width:100%;border-collapse:collapse;margin-bottom:15px}}
-th{{background:#15803d;color:white;padding:6px 8px;text-align:left;font-size:10px}}td{{padding:5px 8px;border-bottom:1px solid #eee;font-size:11px}}.right{{text-align:right}}
-.summary-grid{{display:grid;grid-template-columns:1fr 1fr 1fr 1fr;gap:10px;margin:15px 0}}
-.summary-box{{background:#f0fdf4;border:1px solid #bbf7d0;border-radius:6px;padding:10px;text-align:center}}
-.summary-box.due{{background:#fef2f2;border-color:#fecaca}}
-.summary-label{{font-size:9px;color:#666;text-transform:uppercase}}.summary-value{{font-size:18px;font-weight:bold;color:#15803d;margin-top:2px}}
-.summary-box.due .summary-value{{color:#dc2626}}
-h3{{color:#15803d;font-size:13px;margin:12px 0 8px;padding-bottom:4px;border-bottom:1px solid #d1fae5}}
-.sig-box{{border-top:1px solid #333;width:150px;text-align:center;padding-top:5px;margin-top:40px;font-size:10px}}
-@media print{{@page{{size:A4;margin:10mm}}body{{padding:0}}}}
-</style></head><body>
-<div class="header"><div><div class="dairy-name">{dairy_name}</div><div class="dairy-info">{dairy_address}<br>{dairy_phone}</div></div>
-<div class="invoice-box"><div class="invoice-title">DAIRY STATEMENT / डेयरी विवरण</div><div style="font-size:11px;color:#666;margin-top:2px">{start_date} to {end_date}</div></div></div>
-<div class="info-card"><div class="info-label">Dairy Plant / डेयरी प्लांट</div><div class="info-value">{plant['name']}</div>
-<div style="font-size:10px;color:#666">{plant.get('address','')}{f" | Ph: {plant.get('phone','')}" if plant.get('phone') else ''}</div></div>
-<div class="summary-grid">
-<div class="summary-box"><div class="summary-label">Total Supplied / कुल आपूर्ति</div><div class="summary-value">{total_supplied:.1f} KG</div></div>
-<div class="summary-box"><div class="summary-label">Total Amount / कुल राशि</div><div class="summary-value">₹{total_amount:.0f}</div></div>
-<div class="summary-box"><div class="summary-label">Total Paid / कुल भुगतान</div><div class="summary-value">₹{total_paid:.0f}</div></div>
-<div class="summary-box {'due' if balance > 0 else ''}"><div class="summary-label">Balance / बकाया</div><div class="summary-value">₹{balance:.0f}</div></div>
-</div>
-<h3>Dispatch Details / डिस्पैच विवरण</h3>
-<table><tr><th>#</th><th>Date</th><th>Tanker</th><th>Qty KG</th><th>FAT</th><th>Rate</th><th class="right">Deductions</th><th class="right">Net ₹</th></tr>
-{disp_rows}
-<tr style="background:#15803d;color:white;font-weight:bold"><td colspan="3">TOTAL</td><td>{total_supplied:.1f}</td><td></td><td></td><td></td><td class="right">₹{total_amount:.2f}</td></tr></table>
-{f'<h3>Payments / भुगतान</h3><table><tr><th>Date</th><th>Mode</th><th>Reference</th><th class="right">Amount ₹</th></tr>{pay_rows}<tr style="background:#15803d;color:white;font-weight:bold"><td colspan="3">TOTAL PAID</td><td class="right">₹{total_paid:.2f}</td></tr></table>' if payments else ''}
-<div style="display:flex;justify-content:flex-end;gap:40px;margin-top:30px">
-<div class="sig-box">Dairy Stamp / डेयरी मुहर</div><div class="sig-box">Signature / हस्ताक्षर</div></div>
-</body></html>"""
+    html = await run_cpu(generate_dairy_statement_html, plant, dispatches, payments, start_date, end_date, dairy_name, dairy_phone, dairy_address)
     return {"html": html}
 
 # ==================== HEALTH CHECK ====================
@@ -4086,6 +4398,23 @@ async def health_check():
 # Include the router in the main app
 app.include_router(api_router)
 
+# Report routes stay here unless SERVE_REPORTS=0 (see FARMER TOTALS)
+if SERVE_REPORTS:
+    app.include_router(reports_router)
+
+# Heavy endpoints run in capped lanes. Collections, shop sales, payments and
+# sync match no lane, so they are never queued behind a report or export.
+report_lane = lane_from_env("report", limit=4, max_queue=16)
+export_lane = lane_from_env("export", limit=2, max_queue=8)
+bulk_lane = lane_from_env("bulk", limit=1, max_queue=2)
+admission = AdmissionController([
+    (r"^/api/(reports/|dairy/(profit-report|fat-analysis)|dashboard/weekly-stats|expenses/summary|branches/[^/]+/stats)", "GET", report_lane),
+    (r"^/api/(export/|bills/|share/|billing/|dispatches/[^/]+/bill|dairy-plants/[^/]+/statement)", "GET", export_lane),
+    (r"^/api/(farmers|dairy-plants)/[^/]+/ledger$", "GET", export_lane),
+    (r"^/api/bulk/(collections|farmers|upload-file)$", "POST", bulk_lane),
+])
+app.add_middleware(AdmissionMiddleware, controller=admission)
+
 app.add_middleware(
     CORSMiddleware,
     allow_credentials=True,
@@ -4118,6 +4447,108 @@ async def seed_admin_user():
             await db.users.update_one({"email": admin_email}, {"$set": {"role": "admin"}})
             logger.info("Admin role updated for existing user")
 
+@app.on_event("startup")
+async def create_indexes():
+    global collection_unique_index
+    try:
+        await ensure_idempotency_indexes(db)
+    except Exception as e:
+        logger.warning(f"Could not create idempotency indexes: {e}")
+    
+    try:
+        await ensure_pnl_indexes(db)
+    except Exception as e:
+        logger.warning(f"Could not create daily P&L index: {e}")
+    
+    try:
+        await ensure_period_indexes(db)
+    except Exception as e:
+        logger.warning(f"Could not create period close indexes: {e}")
+    
+    if COLLECTION_LAYOUT != "documents":
+        try:
+            await ensure_layout(db)
+        except Exception as e:
+            logger.warning(f"Could not create {COLLECTION_LAYOUT} milk collections: {e}")
+    
+    # One entry per farmer, date, shift and milk type - replaces the per-request duplicate lookup.
+    # Time-series collections have no unique indexes, so that layout keeps the lookups.
+    try:
+        await milk_collections.create_index(
+            [("farmer_id", 1), ("date", 1), ("shift", 1), ("milk_type", 1)],
+            unique=True, name=UNIQUE_INDEX_NAME
+        )
+        collection_unique_index = True
+    except Exception as e:
+        logger.warning(f"Unique collection index unavailable, using duplicate lookups: {e}")
+
+async def load_shared_state():
+    """
+    State every app serving these routes needs before its first request (the
+    reporting service calls this too): the period lock and the archived months
+    """
+    try:
+        latest = await latest_close(db)
+        set_closed_through(latest["end_date"] if latest else None)
+    except Exception as e:
+        logger.warning(f"Could not load closed periods: {e}")
+    try:
+        # Polled as well as pushed over the cache bus, which may not be running
+        await archive_state.watch(db)
+    except Exception as e:
+        logger.warning(f"Could not load archived months: {e}")
+
+@app.on_event("startup")
+async def load_state():
+    await load_shared_state()
+
+@app.on_event("startup")
+async def warm_reference_cache():
+    try:
+        await reference_cache.warm(db)
+    except Exception as e:
+        logger.warning(f"Could not warm reference cache: {e}")
+
+@app.on_event("startup")
+async def load_search_index():
+    try:
+        await search_service.load(db)
+    except Exception as e:
+        logger.warning(f"Could not load search index, falling back to regex search: {e}")
+
+@app.on_event("startup")
+async def detect_replica_set():
+    global transactions_supported
+    try:
+        hello = await client.admin.command("hello")
+        transactions_supported = bool(hello.get("setName"))
+        if len(hello.get("hosts", [])) > 1:
+            # Reports may now be computed on a lagging secondary; don't cache them right after a write
+            report_cache.replica_settle = float(os.environ.get("REPORT_REPLICA_SETTLE_SECONDS", "5"))
+    except Exception as e:
+        logger.warning(f"Could not detect replica set: {e}")
+
+@app.on_event("startup")
+async def start_cache_bus():
+    # A separate reporting process also needs this process's invalidations
+    if WEB_CONCURRENCY <= 1 and SERVE_REPORTS and os.environ.get("CACHE_BUS", "").lower() not in ("1", "true", "yes"):
+        return
+    # detect_replica_set has already found out whether change streams are available
+    await cache_bus.start(change_streams=transactions_supported)
+    event_bus.relay = lambda event: cache_bus.publish("event", event)
+
+@app.on_event("startup")
+async def start_write_buffers():
+    if farmer_balance_buffer:
+        await farmer_balance_buffer.start()
+
 @app.on_event("shutdown")
 async def shutdown_db_client():
+    if collection_insert_queue:
+        await collection_insert_queue.drain()
+    if farmer_balance_buffer:
+        await farmer_balance_buffer.stop()
+    await archive_state.stop(db)
+    await cache_bus.stop()
+    executors.shutdown()
     client.close()
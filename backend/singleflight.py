@@ -0,0 +1,72 @@
+"""
+Request Coalescing for Nirbani Dairy
+Concurrent identical report requests share one in-flight computation
+instead of each running the same scans
+"""
+import asyncio
+import functools
+import logging
+from typing import Dict, Iterable
+
+logger = logging.getLogger(__name__)
+
+
+class SingleFlight:
+    """
+    At most one running call per key; callers that arrive while it runs
+    await the same result (or exception). Nothing is cached afterwards.
+    """
+
+    def __init__(self):
+        self._inflight: Dict[tuple, asyncio.Task] = {}
+        self.executions: Dict[str, int] = {}
+        self.coalesced: Dict[str, int] = {}
+
+    async def do(self, key: tuple, func):
+        """Run func() for key, or join the call already running for it"""
+        name = key[0]
+        task = self._inflight.get(key)
+        if task is not None:
+            self.coalesced[name] = self.coalesced.get(name, 0) + 1
+        else:
+            self.executions[name] = self.executions.get(name, 0) + 1
+            task = asyncio.ensure_future(func())
+            self._inflight[key] = task
+            task.add_done_callback(lambda _: self._inflight.pop(key, None))
+        # Shielded so one caller disconnecting doesn't cancel the shared work
+        return await asyncio.shield(task)
+
+    def coalesce(self, exclude: Iterable[str] = ("current_user",)):
+        """
+        Decorator for async route handlers. The key is the handler name plus
+        its keyword arguments, minus `exclude` (the user doesn't change the result).
+        """
+        excluded = set(exclude)
+
+        def decorator(handler):
+            @functools.wraps(handler)
+            async def wrapper(*args, **kwargs):
+                params = tuple(sorted(
+                    (name, repr(value)) for name, value in kwargs.items() if name not in excluded
+                ))
+                key = (handler.__name__, args, params)
+                return await self.do(key, lambda: handler(*args, **kwargs))
+            return wrapper
+
+        return decorator
+
+    def stats(self) -> dict:
+        names = sorted(set(self.executions) | set(self.coalesced))
+        return {
+            "in_flight": len(self._inflight),
+            "handlers": {
+                name: {
+                    "executions": self.executions.get(name, 0),
+                    "coalesced": self.coalesced.get(name, 0)
+                }
+                for name in names
+            }
+        }
+
+
+singleflight = SingleFlight()
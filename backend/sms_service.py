@@ -6,7 +6,7 @@ import os
 import http.client
 import json
 import logging
-from typing import Optional
+from typing import List, Optional
 from datetime import datetime
 
 logger = logging.getLogger(__name__)
@@ -190,3 +190,20 @@ def send_payment_sms(
         payment_mode=payment_mode,
         new_balance=new_balance
     )
+
+
+def send_collection_sms_batch(notifications: List[dict]):
+    """
+    Send collection SMS for a whole batch of entries
+
+    Meant to run as a background task after a batch entry response has been
+    returned; one failed SMS never stops the rest of the batch.
+    """
+    sent = 0
+    for notification in notifications:
+        try:
+            send_collection_sms(**notification)
+            sent += 1
+        except Exception as e:
+            logger.warning(f"Failed to send collection SMS to {notification.get('farmer_phone')}: {e}")
+    return sent
@@ -0,0 +1,49 @@
+"""
+Shared fixtures for Nirbani Dairy tests
+Most tests call a running backend at REACT_APP_BACKEND_URL. Tests that run a
+job or a buffer next to the API use the `app` fixture instead: server.py
+started in the test process against a scratch database beside DB_NAME
+(so they need MONGO_URL), logged in as the seeded admin.
+"""
+import os
+import sys
+import uuid
+from pathlib import Path
+
+import pytest
+
+BACKEND_DIR = Path(__file__).resolve().parents[1]
+sys.path.insert(0, str(BACKEND_DIR))
+
+
+@pytest.fixture(scope="session")
+def scratch_db_name():
+    """Point DB_NAME at a throwaway database before server.py is imported"""
+    from dotenv import load_dotenv
+
+    load_dotenv(BACKEND_DIR / '.env')
+    if not os.environ.get("MONGO_URL"):
+        pytest.skip("MONGO_URL is not set")
+    name = f"{os.environ.get('DB_NAME', 'nirbani')}_pytest_{uuid.uuid4().hex[:6]}"
+    os.environ["DB_NAME"] = name
+    # Archive switches are waited for in tests, so poll quickly
+    os.environ.setdefault("ARCHIVE_REFRESH_SECONDS", "0.5")
+    yield name
+    from pymongo import MongoClient
+
+    client = MongoClient(os.environ["MONGO_URL"])
+    client.drop_database(name)
+    client.close()
+
+
+@pytest.fixture(scope="session")
+def app(scratch_db_name):
+    """TestClient of server.app with an admin token"""
+    from fastapi.testclient import TestClient
+    import server
+
+    with TestClient(server.app) as client:
+        res = client.post("/api/auth/login", json={"email": "nirbanidairy@gmal.com", "password": "Nirbani0056!"})
+        assert res.status_code == 200, res.text
+        client.headers.update({"Authorization": f"Bearer {res.json()['access_token']}"})
+        yield client
@@ -0,0 +1,109 @@
+"""
+Archive Tests for Nirbani Dairy
+- Which archived months a query reaches, and the hot collection filter
+- Lookups by id find entries in the hot collection and in archives
+- A month archived by the job (its own process) while the API runs reads
+  back unchanged, with no cache bus between them
+"""
+import os
+import subprocess
+import sys
+import uuid
+
+from archive_service import ArchivedCollection, ArchiveState, _date_condition, _months_touched
+from conftest import BACKEND_DIR
+
+MONTHS = ["2024-01", "2024-02", "2024-03"]
+
+
+def archived_payments(db=None) -> ArchivedCollection:
+    state = ArchiveState()
+    state.apply({"collection": "payments", "through": "2024-03-31", "months": MONTHS})
+    return ArchivedCollection(db if db is not None else {"payments": None}, "payments", state)
+
+
+class TestArchiveQueries:
+    """Routing of queries between the hot collection and the archives"""
+
+    def test_months_touched(self):
+        assert _months_touched(None, MONTHS) == MONTHS
+        assert _months_touched("2024-02-10", MONTHS) == ["2024-02"]
+        assert _months_touched({"$in": ["2024-03-01", "2023-12-31"]}, MONTHS) == ["2024-03"]
+        assert _months_touched({"$gte": "2024-02-01", "$lte": "2024-02-29"}, MONTHS) == ["2024-02"]
+        # Open-ended ranges
+        assert _months_touched({"$gte": "2024-02-15"}, MONTHS) == ["2024-02", "2024-03"]
+        assert _months_touched({"$lt": "2024-02-01"}, MONTHS) == ["2024-01", "2024-02"]
+        # A range across a month boundary reaches both months
+        assert _months_touched({"$gt": "2024-01-31", "$lte": "2024-02-01"}, MONTHS) == ["2024-01", "2024-02"]
+        # Conditions it can't read reach every month rather than miss one
+        assert _months_touched({"$not": {"$lte": "2024-01-31"}}, MONTHS) == MONTHS
+        assert _months_touched({"$gte": "2025-01-01"}, MONTHS) == []
+        print("✓ Date conditions reach exactly the archived months they can match")
+
+    def test_date_condition(self):
+        assert _date_condition({"farmer_id": "f", "date": "2024-01-02"}) == "2024-01-02"
+        assert _date_condition({"$and": [{"farmer_id": "f"}, {"date": {"$gte": "2024-02-01"}}]}) == {"$gte": "2024-02-01"}
+        assert _date_condition({"id": "x"}) is None
+        assert _date_condition(None) is None
+        print("✓ Date condition found at the top level and in $and")
+
+    def test_archives_and_hot_query(self):
+        payments = archived_payments()
+        assert payments.archives_for({"date": {"$gte": "2024-03-01"}}) == ["payments_archive_2024_03"]
+        assert payments.archives_for({"date": "2024-04-01"}) == []
+        assert len(payments.archives_for({"id": "x"})) == 3
+        assert payments.hot_query({"id": "x"}) == {"$and": [{"id": "x"}, {"date": {"$not": {"$lte": "2024-03-31"}}}]}
+        assert ArchivedCollection({"sales": None}, "sales", ArchiveState()).hot_query({"id": "x"}) == {"id": "x"}
+        print("✓ Archives picked by date, archived dates excluded from the hot collection")
+
+    def test_lookup_by_id(self, app):
+        import server
+
+        payments = archived_payments(server.db)
+        archived = {"id": str(uuid.uuid4()), "amount": 10.0, "date": "2024-02-05"}
+        hot = {"id": str(uuid.uuid4()), "amount": 20.0, "date": "2026-01-05"}
+        app.portal.call(server.db.payments_archive_2024_02.insert_one, dict(archived))
+        app.portal.call(server.db.payments.insert_one, dict(hot))
+        try:
+            assert app.portal.call(payments.find_one, {"id": archived["id"]}, {"_id": 0}) == archived
+            assert app.portal.call(payments.find_one, {"id": hot["id"]}, {"_id": 0}) == hot
+            assert app.portal.call(payments.find_one, {"id": "missing"}) is None
+        finally:
+            app.portal.call(server.db.payments_archive_2024_02.drop)
+            app.portal.call(server.db.payments.delete_one, {"id": hot["id"]})
+        print("✓ Lookups by id reach hot and archived entries")
+
+
+class TestArchiveWhileServing:
+    """The running API switches to the archive before the hot entries go"""
+
+    def test_archived_month_reads_back(self, app):
+        farmer = app.post("/api/farmers", json={
+            "name": f"TEST_Archive_{uuid.uuid4().hex[:6]}",
+            "phone": f"7{uuid.uuid4().int % 10**9:09d}",
+            "milk_type": "cow"
+        }).json()
+        for date in ("2024-01-10", "2024-01-20"):
+            res = app.post("/api/collections", json={
+                "farmer_id": farmer["id"], "shift": "morning", "milk_type": "cow",
+                "quantity": 5.0, "fat": 4.0, "rate": 40.0, "date": date
+            })
+            assert res.status_code == 200, res.text
+        res = app.post("/api/periods/close", json={"period_type": "month", "period": "2024-01"})
+        assert res.status_code == 200, res.text
+        params = {"start_date": "2024-01-01", "end_date": "2024-01-31"}
+        before = app.get(f"/api/billing/farmer/{farmer['id']}", params=params).json()
+
+        # The job runs in its own process, as from cron
+        subprocess.run(
+            [sys.executable, "archive_service.py", "run", "--keep-months", "0", "--only", "milk_collections"],
+            cwd=BACKEND_DIR, env=os.environ, check=True, timeout=120
+        )
+
+        after = app.get(f"/api/billing/farmer/{farmer['id']}", params=params).json()
+        assert [c["id"] for c in after["collections"]] == [c["id"] for c in before["collections"]]
+        assert after["summary"] == before["summary"]
+        listed = app.get("/api/collections", params={"date": "2024-01-20"}).json()
+        assert [c["farmer_id"] for c in listed] == [farmer["id"]]
+        assert app.get("/api/metrics").json()["archive"]["milk_collections"]["months"] == 1
+        print("✓ Archived month reads back the same while the API keeps running")
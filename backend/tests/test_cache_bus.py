@@ -0,0 +1,80 @@
+"""
+Cache Bus Tests for Nirbani Dairy
+- Farmer edits reach the collection write path on every worker
+- GET /api/metrics cache_bus counters
+"""
+import pytest
+import requests
+import os
+import time
+import uuid
+
+BASE_URL = os.environ.get('REACT_APP_BACKEND_URL', '').rstrip('/')
+# Cross-worker evictions arrive asynchronously; a change stream delivers well within this
+BUS_DELAY = 0.5
+
+class TestCacheBus:
+    """Cache invalidation across worker processes"""
+
+    @pytest.fixture(autouse=True)
+    def setup(self):
+        """Get auth token and a fixed-rate farmer before each test"""
+        self.session = requests.Session()
+        self.session.headers.update({"Content-Type": "application/json"})
+
+        login_res = self.session.post(f"{BASE_URL}/api/auth/login", json={
+            "email": "test@test.com",
+            "password": "test123"
+        })
+        assert login_res.status_code == 200, f"Login failed: {login_res.text}"
+        token = login_res.json().get("access_token")
+        self.session.headers.update({"Authorization": f"Bearer {token}"})
+
+        res = self.session.post(f"{BASE_URL}/api/farmers", json={
+            "name": f"TEST_Bus_{uuid.uuid4().hex[:6]}",
+            "phone": f"8{uuid.uuid4().int % 10**9:09d}",
+            "milk_type": "cow",
+            "cow_rate": 40
+        })
+        assert res.status_code == 200, res.text
+        self.farmer = res.json()
+        self.created_ids = []
+        yield
+
+        for collection_id in self.created_ids:
+            try:
+                self.session.delete(f"{BASE_URL}/api/collections/{collection_id}")
+            except:
+                pass
+        self.session.delete(f"{BASE_URL}/api/farmers/{self.farmer['id']}")
+
+    def add_collection(self, date):
+        res = self.session.post(f"{BASE_URL}/api/collections", json={
+            "farmer_id": self.farmer["id"], "shift": "morning", "quantity": 2.0,
+            "fat": 4.0, "milk_type": "cow", "date": date
+        })
+        assert res.status_code == 200, res.text
+        self.created_ids.append(res.json()["id"])
+        return res.json()
+
+    def test_rate_change_reaches_all_workers(self):
+        """After a farmer's rate changes, new entries use it whichever worker serves them"""
+        # Several entries so the old rate is cached on as many workers as possible
+        for day in range(1, 5):
+            assert self.add_collection(f"2020-04-0{day}")["rate"] == 40
+
+        res = self.session.put(f"{BASE_URL}/api/farmers/{self.farmer['id']}", json={"cow_rate": 55})
+        assert res.status_code == 200
+        time.sleep(BUS_DELAY)
+
+        for day in range(5, 9):
+            assert self.add_collection(f"2020-04-0{day}")["rate"] == 55
+        print("✓ Updated farmer rate used for all later entries")
+
+    def test_cache_bus_metrics(self):
+        """Bus counters are exported (mode is None when running a single worker)"""
+        stats = self.session.get(f"{BASE_URL}/api/metrics").json()["cache_bus"]
+        assert stats["mode"] in (None, "change_stream", "tailing")
+        for key in ("sent", "received", "send_errors"):
+            assert key in stats
+        print(f"✓ Cache bus mode: {stats['mode']}")
@@ -0,0 +1,66 @@
+"""
+Shift Batch Entry Tests for Nirbani Dairy
+- POST /api/collections/batch (bulk pricing, per-row results, duplicate rows)
+"""
+import pytest
+import requests
+import os
+
+BASE_URL = os.environ.get('REACT_APP_BACKEND_URL', '').rstrip('/')
+
+class TestCollectionBatch:
+    """Batch milk entry for a whole shift"""
+
+    @pytest.fixture(autouse=True)
+    def setup(self):
+        """Get auth token and farmers before each test"""
+        self.session = requests.Session()
+        self.session.headers.update({"Content-Type": "application/json"})
+
+        login_res = self.session.post(f"{BASE_URL}/api/auth/login", json={
+            "email": "test@test.com",
+            "password": "test123"
+        })
+        assert login_res.status_code == 200, f"Login failed: {login_res.text}"
+        token = login_res.json().get("access_token")
+        self.session.headers.update({"Authorization": f"Bearer {token}"})
+
+        farmers = self.session.get(f"{BASE_URL}/api/farmers").json()
+        assert len(farmers) > 0, "No farmers found in database"
+        self.farmer = farmers[0]
+
+        self.created_ids = []
+        yield
+
+        for collection_id in self.created_ids:
+            try:
+                self.session.delete(f"{BASE_URL}/api/collections/{collection_id}")
+            except:
+                pass
+
+    def test_batch_per_row_results(self):
+        """Valid, duplicate and unknown-farmer rows are reported individually"""
+        entry = {"farmer_id": self.farmer["id"], "shift": "morning", "quantity": 2.5,
+                 "fat": 4.2, "milk_type": "cow", "rate": 40, "date": "2020-01-01"}
+        res = self.session.post(f"{BASE_URL}/api/collections/batch", json={"entries": [
+            entry,
+            entry,
+            {**entry, "farmer_id": "TEST_missing_farmer"},
+        ]})
+        assert res.status_code == 200, res.text
+        data = res.json()
+        statuses = [r["status"] for r in data["results"]]
+        assert statuses == ["ok", "error", "error"]
+        created = data["results"][0]["collection"]
+        self.created_ids.append(created["id"])
+
+        assert created["amount"] == 100.0
+        assert created["farmer_name"] == self.farmer["name"]
+        assert data["success"] == 1 and data["failed"] == 2
+        print(f"✓ Batch entry created {created['id']} and rejected duplicate/unknown rows")
+
+    def test_batch_empty_rejected(self):
+        """Empty batches are rejected"""
+        res = self.session.post(f"{BASE_URL}/api/collections/batch", json={"entries": []})
+        assert res.status_code == 400
+        print("✓ Empty batch rejected")
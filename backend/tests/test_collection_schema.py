@@ -0,0 +1,168 @@
+"""
+Collection Response Shape Tests for Nirbani Dairy
+Milk collections read back with the same fields and types in every
+COLLECTION_LAYOUT (documents, timeseries, compact)
+- Compact copies keep exact timestamps and the farmer name an entry was made
+  under, through the migration and a later rename
+- Entries go into the time-series layout without a transaction, even where
+  the server supports them
+"""
+import pytest
+import requests
+import os
+import uuid
+
+from collection_store import (
+    COMPACT_COLLECTION, TIMESERIES_COLLECTION, CompactCollection, TimeSeriesCollection, ensure_timeseries,
+    from_compact, migrate, to_compact
+)
+
+BASE_URL = os.environ.get('REACT_APP_BACKEND_URL', '').rstrip('/')
+
+class TestCollectionSchema:
+    """Dates, money and names come back as the API always returned them"""
+
+    @pytest.fixture(autouse=True)
+    def setup(self):
+        """Get auth token and a farmer before each test"""
+        self.session = requests.Session()
+        self.session.headers.update({"Content-Type": "application/json"})
+
+        login_res = self.session.post(f"{BASE_URL}/api/auth/login", json={
+            "email": "test@test.com",
+            "password": "test123"
+        })
+        assert login_res.status_code == 200, f"Login failed: {login_res.text}"
+        token = login_res.json().get("access_token")
+        self.session.headers.update({"Authorization": f"Bearer {token}"})
+
+        self.farmer = self.session.post(f"{BASE_URL}/api/farmers", json={
+            "name": f"TEST_Schema_{uuid.uuid4().hex[:6]}",
+            "phone": f"6{uuid.uuid4().int % 10**9:09d}",
+            "milk_type": "cow"
+        }).json()
+        self.collection_ids = []
+        yield
+
+        for collection_id in self.collection_ids:
+            self.session.delete(f"{BASE_URL}/api/collections/{collection_id}")
+        self.session.delete(f"{BASE_URL}/api/farmers/{self.farmer['id']}")
+
+    def add(self, **fields):
+        res = self.session.post(f"{BASE_URL}/api/collections", json={
+            "farmer_id": self.farmer["id"], "shift": "morning", "milk_type": "cow",
+            "quantity": 7.3, "fat": 4.1, "rate": 41.37, "date": "2020-05-10", **fields
+        })
+        assert res.status_code == 200, res.text
+        self.collection_ids.append(res.json()["id"])
+        return res.json()
+
+    def test_read_back_shape(self):
+        created = self.add()
+        listed = self.session.get(f"{BASE_URL}/api/collections", params={"date": "2020-05-10"}).json()
+        entry = next(c for c in listed if c["id"] == created["id"])
+        assert entry["date"] == "2020-05-10"
+        assert entry["farmer_name"] == self.farmer["name"]
+        assert entry["rate"] == pytest.approx(41.37)
+        assert entry["amount"] == round(7.3 * 41.37, 2)
+        assert isinstance(entry["created_at"], str) and entry["created_at"].startswith(created["created_at"][:19])
+        print("✓ Collection reads back with plain date, money, name and timestamp")
+
+    def test_update_keeps_money_exact(self):
+        created = self.add(date="2020-05-11")
+        res = self.session.put(f"{BASE_URL}/api/collections/{created['id']}", json={"quantity": 3.33, "date": "2020-05-12"})
+        assert res.status_code == 200, res.text
+        updated = res.json()
+        assert updated["date"] == "2020-05-12"
+        assert updated["amount"] == round(3.33 * 41.37, 2)
+        assert updated["farmer_name"] == self.farmer["name"]
+        print(f"✓ Updated entry amount {updated['amount']}")
+
+
+class TestCompactRoundTrip:
+    """Documents through the compact layout and back"""
+
+    def test_timestamp_keeps_microseconds(self):
+        doc = {"id": "c1", "farmer_id": "f1", "farmer_name": "Ramesh", "date": "2020-05-10",
+               "rate": 41.37, "amount": 302.0, "created_at": "2020-05-10T06:30:01.123456+00:00"}
+        stored = to_compact(doc)
+        assert "farmer_name" not in stored and stored["created_us"] == 456
+        # As read back from BSON, which keeps milliseconds
+        stored["created_at"] = stored["created_at"].replace(microsecond=123000, tzinfo=None)
+        assert from_compact(stored, {"f1": "Ramesh"}) == doc
+        assert to_compact(doc, "Ramesh Kumar")["farmer_name"] == "Ramesh"
+        print("✓ created_at read back to the microsecond, old names kept")
+
+    def test_rename_keeps_history(self, app, monkeypatch):
+        import server
+
+        db = server.db
+        compact = CompactCollection(db)
+        farmer = app.post("/api/farmers", json={
+            "name": f"TEST_Rename_{uuid.uuid4().hex[:6]}",
+            "phone": f"7{uuid.uuid4().int % 10**9:09d}",
+            "milk_type": "cow"
+        }).json()
+
+        def entry(date, name):
+            return {"id": str(uuid.uuid4()), "farmer_id": farmer["id"], "farmer_name": name, "shift": "morning",
+                    "milk_type": "cow", "quantity": 5.0, "fat": 4.0, "snf": 8.5, "rate": 40.0, "amount": 200.0,
+                    "date": date, "created_at": f"{date}T06:30:00.250001+00:00"}
+
+        # Made before an earlier rename, and under the current name
+        older, made = entry("2020-06-01", "TEST Old Name"), entry("2020-06-02", farmer["name"])
+        app.portal.call(db.milk_collections.insert_many, [dict(older), dict(made)])
+        try:
+            app.portal.call(migrate, db, "compact", 1000, lambda message: None)
+            monkeypatch.setattr(server, "COLLECTION_LAYOUT", "compact")
+            monkeypatch.setattr(server, "milk_collections", compact)
+            res = app.put(f"/api/farmers/{farmer['id']}", json={"name": f"{farmer['name']} Renamed"})
+            assert res.status_code == 200, res.text
+            renamed = res.json()["name"]
+            after = entry("2020-06-03", renamed)
+            app.portal.call(compact.insert_one, dict(after))
+
+            async def read_back():
+                return await compact.find({"farmer_id": farmer["id"]}, {"_id": 0}).sort("date", 1).to_list(None)
+
+            assert app.portal.call(read_back) == [older, made, after]
+        finally:
+            app.portal.call(db[COMPACT_COLLECTION].drop)
+            app.portal.call(db.milk_collections.delete_many, {"farmer_id": farmer["id"]})
+            app.delete(f"/api/farmers/{farmer['id']}")
+        print("✓ Entries keep the name they were made under across the migration and a rename")
+
+
+class TestTimeSeriesEntry:
+    """Single entries in the time-series layout on a replica set"""
+
+    def test_record_without_transaction(self, app, monkeypatch):
+        import server
+
+        db = server.db
+        store = TimeSeriesCollection(db)
+        app.portal.call(ensure_timeseries, db)
+        farmer = app.post("/api/farmers", json={
+            "name": f"TEST_Series_{uuid.uuid4().hex[:6]}",
+            "phone": f"8{uuid.uuid4().int % 10**9:09d}",
+            "milk_type": "cow"
+        }).json()
+
+        def no_sessions():
+            raise AssertionError("time-series entries must not be written in a transaction")
+
+        monkeypatch.setattr(server, "milk_collections", store)
+        monkeypatch.setattr(server, "transactions_supported", True)
+        monkeypatch.setattr(server, "farmer_balance_buffer", None)
+        monkeypatch.setattr(server.client, "start_session", no_sessions)
+        entry = server.MilkCollectionCreate(farmer_id=farmer["id"], shift="morning", milk_type="cow",
+                                            quantity=4.0, fat=4.0, rate=40.0, date="2020-07-01")
+        try:
+            created = app.portal.call(server.record_collection, entry)
+            stored = app.portal.call(store.find_one, {"id": created.id}, {"_id": 0})
+            assert stored["date"] == "2020-07-01" and stored["quantity"] == 4.0
+            assert app.get(f"/api/farmers/{farmer['id']}").json()["balance"] == 160.0
+        finally:
+            app.portal.call(db[TIMESERIES_COLLECTION].drop)
+            app.delete(f"/api/farmers/{farmer['id']}")
+        print("✓ Time-series entry inserted and farmer totals applied without a transaction")
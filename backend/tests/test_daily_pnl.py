@@ -0,0 +1,131 @@
+"""
+Daily P&L Tests for Nirbani Dairy
+- Profit report from daily_pnl rows matches totals computed from the raw entries
+- Updates and deletes move the day rows back
+"""
+import pytest
+import requests
+import os
+import random
+import uuid
+
+BASE_URL = os.environ.get('REACT_APP_BACKEND_URL', '').rstrip('/')
+# Isolated range so other tests' entries don't land in the compared periods
+DAYS = [f"1999-03-{day:02d}" for day in range(1, 29)]
+
+class TestDailyPnl:
+    """Profit report as a sum over day rows"""
+
+    @pytest.fixture(autouse=True)
+    def setup(self):
+        """Get auth token, a farmer, a customer and a dairy plant before each test"""
+        self.session = requests.Session()
+        self.session.headers.update({"Content-Type": "application/json"})
+
+        login_res = self.session.post(f"{BASE_URL}/api/auth/login", json={
+            "email": "test@test.com",
+            "password": "test123"
+        })
+        assert login_res.status_code == 200, f"Login failed: {login_res.text}"
+        token = login_res.json().get("access_token")
+        self.session.headers.update({"Authorization": f"Bearer {token}"})
+
+        suffix = uuid.uuid4().hex[:6]
+        self.farmer = self.session.post(f"{BASE_URL}/api/farmers", json={
+            "name": f"TEST_Pnl_{suffix}",
+            "phone": f"7{uuid.uuid4().int % 10**9:09d}",
+            "milk_type": "cow"
+        }).json()
+        self.customer = self.session.post(f"{BASE_URL}/api/customers", json={
+            "name": f"TEST_Pnl_{suffix}",
+            "phone": f"7{uuid.uuid4().int % 10**9:09d}"
+        }).json()
+        self.plant = self.session.post(f"{BASE_URL}/api/dairy-plants", json={
+            "name": f"TEST_Pnl_Plant_{suffix}"
+        }).json()
+        self.collections, self.sales, self.dispatches = {}, {}, {}
+        yield
+
+        for collection_id in self.collections:
+            self.session.delete(f"{BASE_URL}/api/collections/{collection_id}")
+        for dispatch_id in self.dispatches:
+            self.session.delete(f"{BASE_URL}/api/dispatches/{dispatch_id}")
+        # Also deletes the customer's sales
+        self.session.delete(f"{BASE_URL}/api/customers/{self.customer['id']}")
+        self.session.delete(f"{BASE_URL}/api/farmers/{self.farmer['id']}")
+
+    def expected(self, start, end):
+        """Report totals computed directly from the entries still in place"""
+        def in_range(docs):
+            return [d for d in docs.values() if start <= d["date"] <= end]
+        collections, sales, dispatches = in_range(self.collections), in_range(self.sales), in_range(self.dispatches)
+        return {
+            ("collection", "total_amount"): sum(c["amount"] for c in collections),
+            ("collection", "total_liters"): sum(c["quantity"] for c in collections),
+            ("collection", "count"): len(collections),
+            ("retail_sales", "total_amount"): sum(s["amount"] for s in sales),
+            ("retail_sales", "milk_sales"): sum(s["amount"] for s in sales if s["product"] == "milk"),
+            ("retail_sales", "count"): len(sales),
+            ("dispatch", "total_amount"): sum(d["net_receivable"] for d in dispatches),
+            ("dispatch", "total_kg"): sum(d["quantity_kg"] for d in dispatches),
+            ("dispatch", "total_deductions"): sum(d["total_deduction"] for d in dispatches),
+            ("dispatch", "count"): len(dispatches),
+        }
+
+    def assert_matches(self, start, end):
+        report = self.session.get(f"{BASE_URL}/api/dairy/profit-report", params={
+            "start_date": start, "end_date": end
+        }).json()
+        for (section, field), value in self.expected(start, end).items():
+            assert report[section][field] == pytest.approx(value, abs=0.01), (start, end, section, field)
+
+    def test_report_matches_raw_entries(self):
+        """Random entries, edits and deletes; random sub-ranges agree with the raw sums"""
+        rng = random.Random(40)
+        slots = rng.sample([(day, shift) for day in DAYS for shift in ("morning", "evening")], 20)
+        for day, shift in slots:
+            res = self.session.post(f"{BASE_URL}/api/collections", json={
+                "farmer_id": self.farmer["id"], "shift": shift, "milk_type": "cow", "date": day,
+                "quantity": round(rng.uniform(1, 20), 1), "fat": round(rng.uniform(3, 7), 1)
+            })
+            assert res.status_code == 200, res.text
+            self.collections[res.json()["id"]] = res.json()
+        for _ in range(12):
+            res = self.session.post(f"{BASE_URL}/api/sales", json={
+                "customer_id": self.customer["id"], "date": rng.choice(DAYS),
+                "product": rng.choice(["milk", "paneer", "ghee"]),
+                "quantity": round(rng.uniform(1, 5), 1), "rate": rng.choice([50, 60, 400])
+            })
+            assert res.status_code == 200, res.text
+            self.sales[res.json()["id"]] = res.json()
+        for _ in range(6):
+            res = self.session.post(f"{BASE_URL}/api/dispatches", json={
+                "dairy_plant_id": self.plant["id"], "date": rng.choice(DAYS),
+                "quantity_kg": round(rng.uniform(100, 500), 1), "avg_fat": round(rng.uniform(3, 6), 1),
+                "avg_snf": 8.5, "rate_per_kg": 42,
+                "deductions": [{"type": "transport", "amount": round(rng.uniform(0, 200), 2)}]
+            })
+            assert res.status_code == 200, res.text
+            self.dispatches[res.json()["id"]] = res.json()
+        print(f"✓ Created {len(self.collections)} collections, {len(self.sales)} sales, {len(self.dispatches)} dispatches")
+
+        # Edits move entries between days and change amounts
+        for collection_id in rng.sample(list(self.collections), 4):
+            res = self.session.put(f"{BASE_URL}/api/collections/{collection_id}", json={"quantity": round(rng.uniform(1, 20), 1)})
+            assert res.status_code == 200, res.text
+            self.collections[collection_id] = res.json()
+        for sale_id in rng.sample(list(self.sales), 3):
+            res = self.session.put(f"{BASE_URL}/api/sales/{sale_id}", json={"date": rng.choice(DAYS), "direct_amount": 123.45})
+            assert res.status_code == 200, res.text
+            self.sales[sale_id] = {**self.sales[sale_id], **res.json()}
+        for docs, path in ((self.collections, "collections"), (self.sales, "sales"), (self.dispatches, "dispatches")):
+            for doc_id in rng.sample(list(docs), 2):
+                assert self.session.delete(f"{BASE_URL}/api/{path}/{doc_id}").status_code == 200
+                del docs[doc_id]
+        print("✓ Edited and deleted entries")
+
+        self.assert_matches(DAYS[0], DAYS[-1])
+        for _ in range(8):
+            start, end = sorted(rng.sample(DAYS, 2))
+            self.assert_matches(start, end)
+        print("✓ Profit report matches raw totals over random ranges")
@@ -0,0 +1,147 @@
+"""
+Farmer Cache Tests for Nirbani Dairy
+- Payments and bills use a farmer's static fields from the cache
+- Renaming a farmer is visible to the next payment and bill
+- A load overtaken by an invalidation isn't kept (farmers and the rate chart)
+"""
+import asyncio
+
+import pytest
+import requests
+import os
+import uuid
+
+from cache_service import FarmerCache, RateChartCache
+
+BASE_URL = os.environ.get('REACT_APP_BACKEND_URL', '').rstrip('/')
+
+class TestFarmerCache:
+    """Cached farmer fields follow farmer edits"""
+
+    @pytest.fixture(autouse=True)
+    def setup(self):
+        """Get auth token and a farmer before each test"""
+        self.session = requests.Session()
+        self.session.headers.update({"Content-Type": "application/json"})
+
+        login_res = self.session.post(f"{BASE_URL}/api/auth/login", json={
+            "email": "test@test.com",
+            "password": "test123"
+        })
+        assert login_res.status_code == 200, f"Login failed: {login_res.text}"
+        token = login_res.json().get("access_token")
+        self.session.headers.update({"Authorization": f"Bearer {token}"})
+
+        self.farmer = self.session.post(f"{BASE_URL}/api/farmers", json={
+            "name": f"TEST_Cache_{uuid.uuid4().hex[:6]}",
+            "phone": f"6{uuid.uuid4().int % 10**9:09d}",
+            "milk_type": "cow"
+        }).json()
+        self.payments = []
+        yield
+
+        for payment_id in self.payments:
+            self.session.delete(f"{BASE_URL}/api/payments/{payment_id}")
+        self.session.delete(f"{BASE_URL}/api/farmers/{self.farmer['id']}")
+
+    def pay(self):
+        res = self.session.post(f"{BASE_URL}/api/payments", json={
+            "farmer_id": self.farmer["id"], "amount": 10.0, "payment_mode": "cash"
+        })
+        assert res.status_code == 200, res.text
+        self.payments.append(res.json()["id"])
+        return res.json()
+
+    def test_rename_visible_to_payment_and_bill(self):
+        """Payment and bill after a rename carry the new name"""
+        assert self.pay()["farmer_name"] == self.farmer["name"]
+        new_name = self.farmer["name"] + "_Renamed"
+        res = self.session.put(f"{BASE_URL}/api/farmers/{self.farmer['id']}", json={"name": new_name})
+        assert res.status_code == 200
+        new_name = res.json()["name"]
+
+        assert self.pay()["farmer_name"] == new_name
+        bill = self.session.get(f"{BASE_URL}/api/bills/farmer/{self.farmer['id']}")
+        assert bill.status_code == 200
+        assert new_name in bill.text
+        print("✓ Renamed farmer used by the next payment and bill")
+
+    def test_billing_balances_from_entries(self):
+        """Billing summary still reflects payments made after the farmer was cached"""
+        self.session.get(f"{BASE_URL}/api/bills/farmer/{self.farmer['id']}")
+        payment = self.pay()
+        data = self.session.get(f"{BASE_URL}/api/billing/farmer/{self.farmer['id']}", params={
+            "start_date": payment["date"], "end_date": payment["date"]
+        }).json()
+        assert data["farmer"]["id"] == self.farmer["id"]
+        assert data["summary"]["total_paid"] == pytest.approx(10.0)
+        print("✓ Billing totals come from entries, not the cache")
+
+    def test_deleted_farmer_not_served(self):
+        self.session.get(f"{BASE_URL}/api/bills/farmer/{self.farmer['id']}")
+        assert self.session.delete(f"{BASE_URL}/api/farmers/{self.farmer['id']}").status_code == 200
+        assert self.session.post(f"{BASE_URL}/api/payments", json={
+            "farmer_id": self.farmer["id"], "amount": 10.0, "payment_mode": "cash"
+        }).status_code == 404
+        print("✓ Deleted farmer dropped from the cache")
+
+
+class _SlowCollection:
+    """Reads that wait for `release`, so an invalidation can land mid-load"""
+
+    def __init__(self, doc: dict):
+        self.doc = doc
+        self.release: asyncio.Event = None
+
+    async def find_one(self, query, projection=None):
+        await self.release.wait()
+        return dict(self.doc)
+
+    async def _find(self):
+        await self.release.wait()
+        yield dict(self.doc)
+
+    def find(self, query, projection=None):
+        return self._find()
+
+
+class TestCacheLoadRace:
+    """Invalidation while a cache load is in flight"""
+
+    def run_race(self, load, invalidate, collection):
+        async def scenario():
+            collection.release = asyncio.Event()
+            task = asyncio.ensure_future(load())
+            await asyncio.sleep(0)
+            invalidate()
+            collection.release.set()
+            return await task
+
+        return asyncio.run(scenario())
+
+    def test_farmer_load_overtaken(self):
+        cache = FarmerCache()
+        farmers = _SlowCollection({"id": "f1", "name": "Old Name", "phone": "9000000001"})
+        db = type("Db", (), {"farmers": farmers})()
+
+        assert self.run_race(lambda: cache.get(db, "f1"), lambda: cache.invalidate("f1"), farmers)["name"] == "Old Name"
+        assert cache.stats()["size"] == 0
+        self.run_race(lambda: cache.get_many(db, ["f1"]), lambda: cache.invalidate("f1"), farmers)
+        assert cache.stats()["size"] == 0
+
+        # Without an invalidation the load is kept
+        farmers.doc["name"] = "New Name"
+        assert self.run_race(lambda: cache.get(db, "f1"), lambda: None, farmers)["name"] == "New Name"
+        assert cache.stats()["size"] == 1
+        print("✓ Farmer loads overtaken by an invalidation are not cached")
+
+    def test_rate_chart_load_overtaken(self):
+        cache = RateChartCache()
+        charts = _SlowCollection({"entries": [{"fat": 4.0, "rate": 40.0}]})
+        db = type("Db", (), {"rate_charts": charts})()
+
+        assert self.run_race(lambda: cache.entries(db), cache.invalidate, charts) == [{"fat": 4.0, "rate": 40.0}]
+        assert not cache._loaded
+        self.run_race(lambda: cache.entries(db), lambda: None, charts)
+        assert cache._loaded
+        print("✓ Rate chart load overtaken by an invalidation is not cached")
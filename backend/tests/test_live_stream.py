@@ -0,0 +1,96 @@
+"""
+Live Dashboard Stream Tests for Nirbani Dairy
+- POST /api/stream/ticket, GET /api/stream/dashboard (ticket auth, ready event, collection events)
+"""
+import pytest
+import requests
+import os
+import json
+import threading
+
+BASE_URL = os.environ.get('REACT_APP_BACKEND_URL', '').rstrip('/')
+
+def read_events(response, stop_type, events):
+    """Collect SSE events until an event of stop_type arrives"""
+    event_type = None
+    for line in response.iter_lines(decode_unicode=True):
+        if line.startswith("event: "):
+            event_type = line[len("event: "):]
+        elif line.startswith("data: ") and event_type:
+            events.append((event_type, json.loads(line[len("data: "):])))
+            if event_type == stop_type:
+                return
+
+class TestLiveStream:
+    """Server-Sent Events feed for dashboards"""
+
+    @pytest.fixture(autouse=True)
+    def setup(self):
+        """Get auth token and a farmer before each test"""
+        self.session = requests.Session()
+        self.session.headers.update({"Content-Type": "application/json"})
+
+        login_res = self.session.post(f"{BASE_URL}/api/auth/login", json={
+            "email": "test@test.com",
+            "password": "test123"
+        })
+        assert login_res.status_code == 200, f"Login failed: {login_res.text}"
+        self.token = login_res.json().get("access_token")
+        self.session.headers.update({"Authorization": f"Bearer {self.token}"})
+
+        farmers = self.session.get(f"{BASE_URL}/api/farmers").json()
+        assert len(farmers) > 0, "No farmers found in database"
+        self.farmer = farmers[0]
+
+        self.created_ids = []
+        yield
+
+        for collection_id in self.created_ids:
+            try:
+                self.session.delete(f"{BASE_URL}/api/collections/{collection_id}")
+            except:
+                pass
+
+    def ticket(self):
+        res = self.session.post(f"{BASE_URL}/api/stream/ticket")
+        assert res.status_code == 200, res.text
+        return res.json()["ticket"]
+
+    def test_stream_requires_valid_ticket(self):
+        """Invalid tickets are rejected before the stream opens"""
+        res = requests.get(f"{BASE_URL}/api/stream/dashboard", params={"ticket": "invalid"}, timeout=10)
+        assert res.status_code == 401
+        print("✓ Stream rejects invalid ticket")
+
+    def test_stream_rejects_access_token(self):
+        """The login token isn't a stream ticket, and a ticket isn't a login token"""
+        res = requests.get(f"{BASE_URL}/api/stream/dashboard", params={"ticket": self.token}, timeout=10)
+        assert res.status_code == 401
+        res = requests.get(f"{BASE_URL}/api/farmers", headers={"Authorization": f"Bearer {self.ticket()}"})
+        assert res.status_code == 401
+        print("✓ Access tokens and stream tickets aren't interchangeable")
+
+    def test_stream_pushes_collection_created(self):
+        """A new collection is pushed to open streams"""
+        events = []
+        with requests.get(f"{BASE_URL}/api/stream/dashboard", params={"ticket": self.ticket()},
+                          stream=True, timeout=30) as stream:
+            assert stream.status_code == 200
+            assert stream.headers["content-type"].startswith("text/event-stream")
+
+            read_events(stream, "ready", events)
+            reader = threading.Thread(target=read_events, args=(stream, "collection.created", events))
+            reader.start()
+
+            res = self.session.post(f"{BASE_URL}/api/collections", json={
+                "farmer_id": self.farmer["id"], "shift": "evening", "quantity": 1.5,
+                "fat": 4.0, "milk_type": "cow", "rate": 40, "date": "2020-02-01"
+            })
+            assert res.status_code == 200, res.text
+            self.created_ids.append(res.json()["id"])
+            reader.join(timeout=15)
+
+        created = [data for event_type, data in events if event_type == "collection.created"]
+        assert any(data["id"] == self.created_ids[0] for data in created)
+        assert events[0][0] == "ready" and "today" in events[0][1]
+        print(f"✓ Stream pushed collection {self.created_ids[0]}")
@@ -0,0 +1,63 @@
+"""
+Metrics Endpoint Tests for Nirbani Dairy
+- GET /api/metrics (request coalescing, admission and executor counters)
+"""
+import pytest
+import requests
+import os
+from concurrent.futures import ThreadPoolExecutor
+
+BASE_URL = os.environ.get('REACT_APP_BACKEND_URL', '').rstrip('/')
+
+class TestMetrics:
+    """Runtime counters"""
+
+    @pytest.fixture(autouse=True)
+    def setup(self):
+        """Get auth token before each test"""
+        self.session = requests.Session()
+        self.session.headers.update({"Content-Type": "application/json"})
+
+        login_res = self.session.post(f"{BASE_URL}/api/auth/login", json={
+            "email": "test@test.com",
+            "password": "test123"
+        })
+        assert login_res.status_code == 200, f"Login failed: {login_res.text}"
+        token = login_res.json().get("access_token")
+        self.session.headers.update({"Authorization": f"Bearer {token}"})
+
+    def test_concurrent_dashboard_requests_counted(self):
+        """Concurrent identical dashboard requests all succeed and show up in the counters"""
+        with ThreadPoolExecutor(max_workers=8) as pool:
+            responses = list(pool.map(lambda _: self.session.get(f"{BASE_URL}/api/dashboard/stats"), range(8)))
+        assert all(r.status_code == 200 for r in responses)
+        assert len({r.text for r in responses}) == 1
+
+        res = self.session.get(f"{BASE_URL}/api/metrics")
+        assert res.status_code == 200, res.text
+        counters = res.json()["singleflight"]["handlers"]["get_dashboard_stats"]
+        assert counters["executions"] + counters["coalesced"] >= 8
+        print(f"✓ Dashboard stats: {counters['executions']} executions, {counters['coalesced']} coalesced")
+
+    def test_admission_lanes_exported(self):
+        """Report requests pass through the report lane and show up in its counters"""
+        res = self.session.get(f"{BASE_URL}/api/reports/daily")
+        assert res.status_code == 200
+
+        lanes = self.session.get(f"{BASE_URL}/api/metrics").json()["admission"]
+        assert {"report", "export", "bulk"} <= set(lanes)
+        assert lanes["report"]["admitted"] >= 1
+        for key in ("queue_depth", "avg_wait_ms", "max_wait_ms", "rejected"):
+            assert key in lanes["report"]
+        print(f"✓ Report lane: {lanes['report']['admitted']} admitted, {lanes['report']['rejected']} rejected")
+
+    def test_exports_run_on_worker_pool(self):
+        """CSV exports are rendered off the event loop and counted in executor stats"""
+        before = self.session.get(f"{BASE_URL}/api/metrics").json()["executors"]
+        res = self.session.get(f"{BASE_URL}/api/export/farmers")
+        assert res.status_code == 200
+        assert res.content.startswith(b"\xef\xbb\xbf")
+
+        after = self.session.get(f"{BASE_URL}/api/metrics").json()["executors"]
+        assert after["cpu_tasks"] + after["thread_tasks"] > before["cpu_tasks"] + before["thread_tasks"]
+        print(f"✓ Executors: {after['cpu_workers']} workers, {after['cpu_tasks']} CPU tasks")
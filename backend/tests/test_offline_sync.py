@@ -0,0 +1,98 @@
+"""
+Offline Sync & Idempotency Tests for Nirbani Dairy
+- Idempotency-Key header on POST /api/payments, /api/sales/shop
+- A key reused with a different body is refused (422)
+- POST /api/sync/upload (ordered batch with per-item results)
+"""
+import uuid
+import pytest
+import requests
+import os
+
+BASE_URL = os.environ.get('REACT_APP_BACKEND_URL', '').rstrip('/')
+
+class TestOfflineSync:
+    """Idempotent replays and batch upload of queued offline writes"""
+
+    @pytest.fixture(autouse=True)
+    def setup(self):
+        """Get auth token and a farmer before each test"""
+        self.session = requests.Session()
+        self.session.headers.update({"Content-Type": "application/json"})
+
+        login_res = self.session.post(f"{BASE_URL}/api/auth/login", json={
+            "email": "test@test.com",
+            "password": "test123"
+        })
+        assert login_res.status_code == 200, f"Login failed: {login_res.text}"
+        token = login_res.json().get("access_token")
+        self.session.headers.update({"Authorization": f"Bearer {token}"})
+
+        farmers = self.session.get(f"{BASE_URL}/api/farmers").json()
+        assert len(farmers) > 0, "No farmers found in database"
+        self.farmer_id = farmers[0]["id"]
+
+        self.created_payment_ids = []
+        self.created_sale_ids = []
+        yield
+
+        for payment_id in self.created_payment_ids:
+            try:
+                self.session.delete(f"{BASE_URL}/api/payments/{payment_id}")
+            except:
+                pass
+        for sale_id in self.created_sale_ids:
+            try:
+                self.session.delete(f"{BASE_URL}/api/sales/{sale_id}")
+            except:
+                pass
+
+    def test_payment_replay_returns_original(self):
+        """Retrying POST /api/payments with the same key does not double-count"""
+        key = str(uuid.uuid4())
+        payload = {"farmer_id": self.farmer_id, "amount": 1, "payment_mode": "cash", "notes": "TEST_idempotent"}
+        before = self.session.get(f"{BASE_URL}/api/farmers/{self.farmer_id}").json()
+
+        first = self.session.post(f"{BASE_URL}/api/payments", json=payload, headers={"Idempotency-Key": key})
+        second = self.session.post(f"{BASE_URL}/api/payments", json=payload, headers={"Idempotency-Key": key})
+        assert first.status_code == 200, first.text
+        assert second.status_code == 200, second.text
+        assert first.json()["id"] == second.json()["id"]
+        self.created_payment_ids.append(first.json()["id"])
+
+        after = self.session.get(f"{BASE_URL}/api/farmers/{self.farmer_id}").json()
+        assert round(after["total_paid"] - before["total_paid"], 2) == 1
+        print("✓ Replayed payment returned original response without re-executing")
+
+    def test_key_reused_with_other_body(self):
+        """The same Idempotency-Key with a different body is refused, not replayed"""
+        key = str(uuid.uuid4())
+        payload = {"farmer_id": self.farmer_id, "amount": 1, "payment_mode": "cash", "notes": "TEST_idempotent"}
+        first = self.session.post(f"{BASE_URL}/api/payments", json=payload, headers={"Idempotency-Key": key})
+        assert first.status_code == 200, first.text
+        self.created_payment_ids.append(first.json()["id"])
+
+        other = self.session.post(f"{BASE_URL}/api/payments", json={**payload, "amount": 2},
+                                  headers={"Idempotency-Key": key})
+        assert other.status_code == 422, other.text
+        print("✓ Reused key with a different body refused")
+
+    def test_sync_upload_per_item_results(self):
+        """POST /api/sync/upload applies items in order and reports each one"""
+        key = str(uuid.uuid4())
+        res = self.session.post(f"{BASE_URL}/api/sync/upload", json={"operations": [
+            {"idempotency_key": key, "type": "shop_sale",
+             "payload": {"product": "milk", "quantity": 1, "rate": 60, "notes": "TEST_sync"}},
+            {"idempotency_key": key, "type": "shop_sale",
+             "payload": {"product": "milk", "quantity": 1, "rate": 60, "notes": "TEST_sync"}},
+            {"idempotency_key": str(uuid.uuid4()), "type": "unknown", "payload": {}},
+            {"idempotency_key": str(uuid.uuid4()), "type": "payment", "payload": {"farmer_id": self.farmer_id}},
+        ]})
+        assert res.status_code == 200, res.text
+        data = res.json()
+        results = data["results"]
+        assert [r["status_code"] for r in results] == [200, 200, 400, 422]
+        assert results[0]["data"]["id"] == results[1]["data"]["id"]
+        assert data["success"] == 2 and data["failed"] == 2
+        self.created_sale_ids.append(results[0]["data"]["id"])
+        print("✓ Sync upload returned per-item results and deduplicated the replay")
@@ -0,0 +1,115 @@
+"""
+Parquet Export Tests for Nirbani Dairy
+- GET /api/export/parquet/{collection} returns a zip of month partitions
+  (<collection>/month=YYYY-MM/part-0.parquet) with typed columns
+- Date bounds take archived months from the archives record, and the
+  streamed zip holds archived and hot months alike
+"""
+import io
+import zipfile
+
+import pyarrow.parquet as pq
+import pytest
+import requests
+import os
+import uuid
+
+from parquet_export import date_bounds, stream_zip
+
+BASE_URL = os.environ.get('REACT_APP_BACKEND_URL', '').rstrip('/')
+
+class TestParquetExport:
+    """Month-partitioned Parquet snapshots"""
+
+    @pytest.fixture(autouse=True)
+    def setup(self):
+        """Get auth token and a farmer with collections in two months"""
+        self.session = requests.Session()
+        self.session.headers.update({"Content-Type": "application/json"})
+
+        login_res = self.session.post(f"{BASE_URL}/api/auth/login", json={
+            "email": "test@test.com",
+            "password": "test123"
+        })
+        assert login_res.status_code == 200, f"Login failed: {login_res.text}"
+        token = login_res.json().get("access_token")
+        self.session.headers.update({"Authorization": f"Bearer {token}"})
+
+        self.farmer = self.session.post(f"{BASE_URL}/api/farmers", json={
+            "name": f"TEST_Parquet_{uuid.uuid4().hex[:6]}",
+            "phone": f"6{uuid.uuid4().int % 10**9:09d}",
+            "milk_type": "cow"
+        }).json()
+        self.collection_ids = []
+        for date in ("2019-03-30", "2019-04-02"):
+            res = self.session.post(f"{BASE_URL}/api/collections", json={
+                "farmer_id": self.farmer["id"], "shift": "morning", "milk_type": "cow",
+                "quantity": 6.5, "fat": 4.2, "rate": 40.0, "date": date
+            })
+            assert res.status_code == 200, res.text
+            self.collection_ids.append(res.json()["id"])
+        yield
+
+        for collection_id in self.collection_ids:
+            self.session.delete(f"{BASE_URL}/api/collections/{collection_id}")
+        self.session.delete(f"{BASE_URL}/api/farmers/{self.farmer['id']}")
+
+    def test_export_month_partitions(self):
+        res = self.session.get(f"{BASE_URL}/api/export/parquet/milk_collections", params={
+            "start_date": "2019-03-01", "end_date": "2019-04-30"
+        })
+        assert res.status_code == 200, res.text
+        assert res.headers["content-type"] == "application/zip"
+        archive = zipfile.ZipFile(io.BytesIO(res.content))
+        names = sorted(archive.namelist())
+        assert names == ["milk_collections/month=2019-03/part-0.parquet",
+                         "milk_collections/month=2019-04/part-0.parquet"]
+
+        table = pq.read_table(io.BytesIO(archive.read(names[0])))
+        assert str(table.schema.field("date").type) == "date32[day]"
+        assert str(table.schema.field("quantity").type) == "double"
+        assert str(table.schema.field("created_at").type) == "timestamp[us, tz=UTC]"
+        rows = [row for row in table.to_pylist() if row["id"] in self.collection_ids]
+        assert len(rows) == 1 and rows[0]["quantity"] == 6.5
+        assert rows[0]["farmer_name"] == self.farmer["name"]
+        print(f"✓ Exported {names} with typed columns")
+
+    def test_unknown_collection(self):
+        res = self.session.get(f"{BASE_URL}/api/export/parquet/users")
+        assert res.status_code == 404
+        print("✓ Users can't be exported")
+
+
+class TestExportStream:
+    """Bounds and streaming over an archived month and the hot collection"""
+
+    def test_archived_and_hot_months(self, app, monkeypatch):
+        import server
+        from archive_service import archive_state
+
+        db = server.db
+        tag = f"TEST_Stream_{uuid.uuid4().hex[:6]}"
+        archived = {"id": str(uuid.uuid4()), "date": "2019-01-15", "farmer_id": tag, "amount": 10.0}
+        hot = {"id": str(uuid.uuid4()), "date": "2019-02-03", "farmer_id": tag, "amount": 20.0}
+        app.portal.call(db.payments_archive_2019_01.insert_one, dict(archived))
+        app.portal.call(db.payments.insert_one, dict(hot))
+        monkeypatch.setitem(archive_state.months, "payments", ["2019-01"])
+        monkeypatch.setitem(archive_state.through, "payments", "2019-01-31")
+
+        async def export():
+            return b"".join([chunk async for chunk in stream_zip(db, "payments", "2019-01-01", "2019-02-28")])
+
+        try:
+            first, last = app.portal.call(date_bounds, db, "payments")
+            # The archived month counts from its first day without being read
+            assert first == "2019-01-01" and last >= "2019-02-03"
+            archive = zipfile.ZipFile(io.BytesIO(app.portal.call(export)))
+            assert sorted(archive.namelist()) == ["payments/month=2019-01/part-0.parquet",
+                                                  "payments/month=2019-02/part-0.parquet"]
+            ids = [row["id"] for name in archive.namelist()
+                   for row in pq.read_table(io.BytesIO(archive.read(name))).to_pylist()]
+            assert archived["id"] in ids and hot["id"] in ids
+        finally:
+            app.portal.call(db.payments_archive_2019_01.drop)
+            app.portal.call(db.payments.delete_one, {"id": hot["id"]})
+        print("✓ Streamed zip holds the archived and the hot month")
@@ -0,0 +1,142 @@
+"""
+Period Close Tests for Nirbani Dairy
+- POST /api/periods/close snapshots balances and locks the period
+- Opening/closing balances on farmer billing and ledger
+- DELETE /api/periods/close/latest reopens
+- A close locks the period before it aggregates and unlocks it if it fails
+"""
+import pytest
+import requests
+import os
+import uuid
+
+BASE_URL = os.environ.get('REACT_APP_BACKEND_URL', '').rstrip('/')
+# A month no other test writes to
+CLOSED_MONTH = "1998-01"
+
+class TestPeriodClose:
+    """Closing balance snapshots and period locks"""
+
+    @pytest.fixture(autouse=True)
+    def setup(self):
+        """Get auth token and a farmer with entries either side of the month end"""
+        self.session = requests.Session()
+        self.session.headers.update({"Content-Type": "application/json"})
+
+        login_res = self.session.post(f"{BASE_URL}/api/auth/login", json={
+            "email": "test@test.com",
+            "password": "test123"
+        })
+        assert login_res.status_code == 200, f"Login failed: {login_res.text}"
+        token = login_res.json().get("access_token")
+        self.session.headers.update({"Authorization": f"Bearer {token}"})
+
+        if self.session.get(f"{BASE_URL}/api/periods/closes").json():
+            pytest.skip("Periods are already closed on this database")
+
+        self.farmer = self.session.post(f"{BASE_URL}/api/farmers", json={
+            "name": f"TEST_Close_{uuid.uuid4().hex[:6]}",
+            "phone": f"6{uuid.uuid4().int % 10**9:09d}",
+            "milk_type": "cow"
+        }).json()
+        self.collections = []
+        for date in ("1998-01-10", "1998-01-20", "1998-02-05"):
+            res = self.add_collection(date)
+            assert res.status_code == 200, res.text
+            self.collections.append(res.json())
+        self.closed = False
+        yield
+
+        if self.closed:
+            self.session.delete(f"{BASE_URL}/api/periods/close/latest")
+        for collection in self.collections:
+            self.session.delete(f"{BASE_URL}/api/collections/{collection['id']}")
+        self.session.delete(f"{BASE_URL}/api/farmers/{self.farmer['id']}")
+
+    def add_collection(self, date, shift="morning"):
+        return self.session.post(f"{BASE_URL}/api/collections", json={
+            "farmer_id": self.farmer["id"], "shift": shift, "milk_type": "cow",
+            "quantity": 10.0, "fat": 4.0, "date": date
+        })
+
+    def close_month(self):
+        res = self.session.post(f"{BASE_URL}/api/periods/close", json={"period_type": "month", "period": CLOSED_MONTH})
+        assert res.status_code == 200, res.text
+        self.closed = True
+        return res.json()
+
+    def test_close_locks_period(self):
+        """Entries dated in a closed period can't be added, edited or deleted"""
+        close = self.close_month()
+        assert close["status"] == "closed"
+        assert close["end_date"] == "1998-01-31"
+        assert close["snapshots"]["farmer"] >= 1
+        print(f"✓ Closed {CLOSED_MONTH}: {close['snapshots']}")
+
+        assert self.add_collection("1998-01-25", shift="evening").status_code == 400
+        january = self.collections[0]["id"]
+        assert self.session.delete(f"{BASE_URL}/api/collections/{january}").status_code == 400
+        assert self.session.put(f"{BASE_URL}/api/collections/{january}", json={"quantity": 12}).status_code == 400
+        # Moving a later entry into the closed month is a change to it as well
+        february = self.collections[2]["id"]
+        assert self.session.put(f"{BASE_URL}/api/collections/{february}", json={"date": "1998-01-30"}).status_code == 400
+        print("✓ Closed period rejects writes")
+
+        res = self.session.post(f"{BASE_URL}/api/periods/close", json={"period_type": "month", "period": CLOSED_MONTH})
+        assert res.status_code == 400
+        print("✓ Closing the same period twice rejected")
+
+    def test_opening_balance_from_snapshot(self):
+        """Billing for the next month starts from the closed month's balance"""
+        self.close_month()
+        january_amount = self.collections[0]["amount"] + self.collections[1]["amount"]
+
+        summary = self.session.get(f"{BASE_URL}/api/billing/farmer/{self.farmer['id']}", params={
+            "start_date": "1998-02-01", "end_date": "1998-02-28"
+        }).json()["summary"]
+        assert summary["opening_balance"] == pytest.approx(january_amount, abs=0.01)
+        assert summary["closing_balance"] == pytest.approx(january_amount + self.collections[2]["amount"], abs=0.01)
+        print(f"✓ Opening balance {summary['opening_balance']}, closing {summary['closing_balance']}")
+
+        ledger = self.session.get(f"{BASE_URL}/api/farmers/{self.farmer['id']}/ledger", params={
+            "start_date": "1998-01-15"
+        }).json()["summary"]
+        assert ledger["opening_balance"] == pytest.approx(self.collections[0]["amount"], abs=0.01)
+        print("✓ Opening balance mid-period adds entries before the start date")
+
+    def test_reopen_unlocks(self):
+        """Reopening the latest close allows edits again"""
+        self.close_month()
+        res = self.session.delete(f"{BASE_URL}/api/periods/close/latest")
+        assert res.status_code == 200
+        assert res.json()["closed_through"] is None
+        self.closed = False
+
+        res = self.session.put(f"{BASE_URL}/api/collections/{self.collections[0]['id']}", json={"quantity": 12})
+        assert res.status_code == 200
+        print("✓ Reopened period accepts edits")
+
+
+class TestFailedClose:
+    """A close that fails part way leaves no record and no lock behind"""
+
+    def test_failed_close_unlocks(self, app, monkeypatch):
+        import period_service
+        import server
+
+        if app.get("/api/periods/closes").json():
+            pytest.skip("Periods are already closed on this database")
+        locked_while_aggregating = []
+
+        async def failing_totals(*args, **kwargs):
+            locked_while_aggregating.append(server.closed_through)
+            raise RuntimeError("aggregation failed")
+
+        monkeypatch.setattr(period_service, "entity_totals", failing_totals)
+        with pytest.raises(RuntimeError):
+            app.post("/api/periods/close", json={"period_type": "month", "period": "1997-02"})
+
+        assert locked_while_aggregating == ["1997-02-28"]
+        assert server.closed_through is None
+        assert app.get("/api/periods/closes").json() == []
+        print("✓ Locked before aggregating, unlocked and unrecorded after the failure")
@@ -0,0 +1,83 @@
+"""
+Ledger Reconciliation Tests for Nirbani Dairy
+- Deleting advance/deduction payments reverts them by type
+- POST /api/admin/reconcile report
+"""
+import pytest
+import requests
+import os
+import uuid
+
+BASE_URL = os.environ.get('REACT_APP_BACKEND_URL', '').rstrip('/')
+
+class TestReconcile:
+    """Stored totals vs totals recomputed from entries"""
+
+    @pytest.fixture(autouse=True)
+    def setup(self):
+        """Get auth token and a farmer with one collection before each test"""
+        self.session = requests.Session()
+        self.session.headers.update({"Content-Type": "application/json"})
+
+        login_res = self.session.post(f"{BASE_URL}/api/auth/login", json={
+            "email": "test@test.com",
+            "password": "test123"
+        })
+        assert login_res.status_code == 200, f"Login failed: {login_res.text}"
+        token = login_res.json().get("access_token")
+        self.session.headers.update({"Authorization": f"Bearer {token}"})
+
+        self.farmer = self.session.post(f"{BASE_URL}/api/farmers", json={
+            "name": f"TEST_Reconcile_{uuid.uuid4().hex[:6]}",
+            "phone": f"6{uuid.uuid4().int % 10**9:09d}",
+            "milk_type": "cow"
+        }).json()
+        res = self.session.post(f"{BASE_URL}/api/collections", json={
+            "farmer_id": self.farmer["id"], "shift": "morning", "milk_type": "cow",
+            "quantity": 10.0, "fat": 4.0, "date": "2020-03-15"
+        })
+        assert res.status_code == 200, res.text
+        self.collection = res.json()
+        yield
+
+        self.session.delete(f"{BASE_URL}/api/collections/{self.collection['id']}")
+        self.session.delete(f"{BASE_URL}/api/farmers/{self.farmer['id']}")
+
+    def get_farmer(self):
+        return self.session.get(f"{BASE_URL}/api/farmers/{self.farmer['id']}").json()
+
+    @pytest.mark.parametrize("payment_type", ["payment", "advance", "deduction"])
+    def test_delete_payment_reverts_by_type(self, payment_type):
+        """Creating then deleting a payment of any type leaves the totals unchanged"""
+        before = self.get_farmer()
+        res = self.session.post(f"{BASE_URL}/api/payments", json={
+            "farmer_id": self.farmer["id"], "amount": 75.0, "payment_mode": "cash", "payment_type": payment_type
+        })
+        assert res.status_code == 200, res.text
+        assert self.session.delete(f"{BASE_URL}/api/payments/{res.json()['id']}").status_code == 200
+
+        after = self.get_farmer()
+        for field in ("total_due", "total_paid", "balance"):
+            assert after[field] == pytest.approx(before[field], abs=0.01), field
+        print(f"✓ Deleting a {payment_type} reverts farmer totals")
+
+    def test_reconcile_report(self):
+        """Report-only run lists every entity type with counts"""
+        res = self.session.post(f"{BASE_URL}/api/admin/reconcile")
+        assert res.status_code == 200, res.text
+        report = res.json()
+        for entity_type in ("farmer", "customer", "walkin_customer", "dairy_plant"):
+            result = report[entity_type]
+            assert result["checked"] >= 0
+            assert result["repaired"] == 0
+            assert all(sample["id"] != self.farmer["id"] for sample in result["samples"])
+        assert report["farmer"]["checked"] >= 1
+        counts = ", ".join(f"{entity_type} {result['mismatched']}/{result['checked']}" for entity_type, result in report.items())
+        print(f"✓ Reconcile mismatches: {counts}")
+
+    def test_reconcile_single_type(self):
+        res = self.session.post(f"{BASE_URL}/api/admin/reconcile", params={"entity_type": "dairy_plant"})
+        assert res.status_code == 200
+        assert list(res.json()) == ["dairy_plant"]
+        assert self.session.post(f"{BASE_URL}/api/admin/reconcile", params={"entity_type": "bogus"}).status_code == 400
+        print("✓ Reconcile limited to one entity type")
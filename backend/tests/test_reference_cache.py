@@ -0,0 +1,76 @@
+"""
+Reference Cache Tests for Nirbani Dairy
+- Settings, branch and dairy plant edits are visible straight after the write
+- Sales still move product stock
+"""
+import pytest
+import requests
+import os
+import uuid
+
+BASE_URL = os.environ.get('REACT_APP_BACKEND_URL', '').rstrip('/')
+
+class TestReferenceCache:
+    """Cached reference data follows its write handlers"""
+
+    @pytest.fixture(autouse=True)
+    def setup(self):
+        """Get auth token before each test"""
+        self.session = requests.Session()
+        self.session.headers.update({"Content-Type": "application/json"})
+
+        login_res = self.session.post(f"{BASE_URL}/api/auth/login", json={
+            "email": "test@test.com",
+            "password": "test123"
+        })
+        assert login_res.status_code == 200, f"Login failed: {login_res.text}"
+        token = login_res.json().get("access_token")
+        self.session.headers.update({"Authorization": f"Bearer {token}"})
+        yield
+
+    def test_settings_update_visible(self):
+        """A saved dairy name is returned by the next read"""
+        original = self.session.get(f"{BASE_URL}/api/settings/dairy").json()
+        name = f"TEST_Dairy_{uuid.uuid4().hex[:6]}"
+        try:
+            res = self.session.put(f"{BASE_URL}/api/settings/dairy", json={**original, "dairy_name": name})
+            assert res.status_code == 200
+            assert self.session.get(f"{BASE_URL}/api/settings/dairy").json()["dairy_name"] == name
+            print("✓ Settings update visible on next read")
+        finally:
+            self.session.put(f"{BASE_URL}/api/settings/dairy", json={
+                "dairy_name": original.get("dairy_name", "Nirbani Dairy"),
+                "dairy_phone": original.get("dairy_phone", ""),
+                "dairy_address": original.get("dairy_address", ""),
+                "sms_enabled": original.get("sms_enabled", False)
+            })
+
+    def test_branch_edits_visible(self):
+        """Create, rename and delete a branch"""
+        code = f"T{uuid.uuid4().hex[:5]}".upper()
+        branch = self.session.post(f"{BASE_URL}/api/branches", json={"name": "TEST_Branch", "code": code}).json()
+        try:
+            assert branch["id"] in [b["id"] for b in self.session.get(f"{BASE_URL}/api/branches").json()]
+            self.session.put(f"{BASE_URL}/api/branches/{branch['id']}", json={"name": "TEST_Branch_Renamed", "code": code})
+            assert self.session.get(f"{BASE_URL}/api/branches/{branch['id']}").json()["name"] == "TEST_Branch_Renamed"
+        finally:
+            self.session.delete(f"{BASE_URL}/api/branches/{branch['id']}")
+        assert self.session.get(f"{BASE_URL}/api/branches/{branch['id']}").status_code == 404
+        print("✓ Branch create/rename/delete visible straight away")
+
+    def test_plant_rename_used_by_dispatch(self):
+        """A dispatch right after renaming a plant carries the new name"""
+        plant = self.session.post(f"{BASE_URL}/api/dairy-plants", json={"name": f"TEST_Plant_{uuid.uuid4().hex[:6]}"}).json()
+        new_name = plant["name"] + "_Renamed"
+        self.session.put(f"{BASE_URL}/api/dairy-plants/{plant['id']}", json={"name": new_name})
+        res = self.session.post(f"{BASE_URL}/api/dispatches", json={
+            "dairy_plant_id": plant["id"], "quantity_kg": 100, "avg_fat": 4.0, "avg_snf": 8.5, "rate_per_kg": 40
+        })
+        assert res.status_code == 200, res.text
+        dispatch = res.json()
+        self.session.delete(f"{BASE_URL}/api/dispatches/{dispatch['id']}")
+        assert dispatch["dairy_plant_name"] == new_name
+        assert self.session.post(f"{BASE_URL}/api/dispatches", json={
+            "dairy_plant_id": str(uuid.uuid4()), "quantity_kg": 1, "avg_fat": 4.0, "avg_snf": 8.5, "rate_per_kg": 40
+        }).status_code == 404
+        print("✓ Dispatch uses the renamed plant")
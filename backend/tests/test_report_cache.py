@@ -0,0 +1,113 @@
+"""
+Report Cache Tests for Nirbani Dairy
+- Cached reports reflect writes to dates inside their range
+- Only ranges inside a locked period are cached without expiry
+"""
+import asyncio
+import time
+
+import pytest
+import requests
+import os
+
+from report_cache import ReportCache
+
+BASE_URL = os.environ.get('REACT_APP_BACKEND_URL', '').rstrip('/')
+REPORT_DATE = "2020-03-15"
+
+class TestReportCache:
+    """Write-aware report caching"""
+
+    @pytest.fixture(autouse=True)
+    def setup(self):
+        """Get auth token and a farmer before each test"""
+        self.session = requests.Session()
+        self.session.headers.update({"Content-Type": "application/json"})
+
+        login_res = self.session.post(f"{BASE_URL}/api/auth/login", json={
+            "email": "test@test.com",
+            "password": "test123"
+        })
+        assert login_res.status_code == 200, f"Login failed: {login_res.text}"
+        token = login_res.json().get("access_token")
+        self.session.headers.update({"Authorization": f"Bearer {token}"})
+
+        farmers = self.session.get(f"{BASE_URL}/api/farmers").json()
+        assert len(farmers) > 0, "No farmers found in database"
+        self.farmer = farmers[0]
+
+        self.created_ids = []
+        yield
+
+        for collection_id in self.created_ids:
+            try:
+                self.session.delete(f"{BASE_URL}/api/collections/{collection_id}")
+            except:
+                pass
+
+    def add_collection(self, shift):
+        res = self.session.post(f"{BASE_URL}/api/collections", json={
+            "farmer_id": self.farmer["id"], "shift": shift, "quantity": 3.0,
+            "fat": 4.0, "milk_type": "cow", "rate": 40, "date": REPORT_DATE
+        })
+        assert res.status_code == 200, res.text
+        self.created_ids.append(res.json()["id"])
+
+    def daily_count(self):
+        res = self.session.get(f"{BASE_URL}/api/reports/daily", params={"date": REPORT_DATE})
+        assert res.status_code == 200
+        return res.json()["summary"]["collection_count"]
+
+    def test_past_day_report_sees_new_entries(self):
+        """A cached past-day report is refreshed when an entry lands on that day"""
+        before = self.daily_count()
+        assert self.daily_count() == before
+
+        self.add_collection("morning")
+        assert self.daily_count() == before + 1
+
+        self.add_collection("evening")
+        assert self.daily_count() == before + 2
+        print(f"✓ Daily report for {REPORT_DATE} tracked new entries ({before} -> {before + 2})")
+
+    def test_past_month_summary_sees_deletes(self):
+        """Deleting an entry drops the cached monthly summary that contains it"""
+        self.add_collection("morning")
+        month = REPORT_DATE[:7]
+        first = self.session.get(f"{BASE_URL}/api/reports/monthly-summary", params={"month": month}).json()
+
+        self.session.delete(f"{BASE_URL}/api/collections/{self.created_ids.pop()}")
+        second = self.session.get(f"{BASE_URL}/api/reports/monthly-summary", params={"month": month}).json()
+
+        assert second["collection"]["entries"] == first["collection"]["entries"] - 1
+        print("✓ Monthly summary reflects deleted entry")
+
+
+class TestReportCacheExpiry:
+    """Which cached ranges expire"""
+
+    def test_only_locked_ranges_kept(self):
+        lock = {"through": "2020-01-31"}
+        cache = ReportCache(today_ttl=0.05, max_stale=0, locked_through=lambda: lock["through"])
+        computed = []
+
+        async def compute():
+            computed.append(1)
+            return len(computed)
+
+        async def read(start, end):
+            return await cache.get_or_compute(("report", start, end), start, end, ("milk_collections",), compute)
+
+        async def scenario():
+            # A past month that was never locked expires like today's ranges
+            assert await read("2020-02-01", "2020-02-29") == 1
+            assert await read("2020-01-01", "2020-01-31") == 2
+            time.sleep(0.1)
+            assert await read("2020-02-01", "2020-02-29") == 3
+            assert await read("2020-01-01", "2020-01-31") == 2
+            # Reopening January ends its indefinite caching
+            lock["through"] = None
+            assert await read("2020-01-01", "2020-01-31") == 4
+
+        asyncio.run(scenario())
+        print("✓ Locked ranges kept, unlocked past ranges expire")
@@ -0,0 +1,78 @@
+"""
+Search Tests for Nirbani Dairy
+- GET /api/search/autocomplete by name prefix, Hindi/English spelling and phone
+- Farmer and customer list search goes through the same index
+"""
+import pytest
+import requests
+import os
+import uuid
+
+BASE_URL = os.environ.get('REACT_APP_BACKEND_URL', '').rstrip('/')
+
+class TestSearch:
+    """Autocomplete over farmers and customers"""
+
+    @pytest.fixture(autouse=True)
+    def setup(self):
+        """Get auth token and a farmer with a Hindi name before each test"""
+        self.session = requests.Session()
+        self.session.headers.update({"Content-Type": "application/json"})
+
+        login_res = self.session.post(f"{BASE_URL}/api/auth/login", json={
+            "email": "test@test.com",
+            "password": "test123"
+        })
+        assert login_res.status_code == 200, f"Login failed: {login_res.text}"
+        token = login_res.json().get("access_token")
+        self.session.headers.update({"Authorization": f"Bearer {token}"})
+
+        self.phone = f"6{uuid.uuid4().int % 10**9:09d}"
+        res = self.session.post(f"{BASE_URL}/api/farmers", json={
+            "name": "भगवान खटाना", "phone": self.phone, "village": "सुल्तानपुर", "milk_type": "cow"
+        })
+        if res.status_code == 400:
+            pytest.skip(f"Test farmer already exists: {res.text}")
+        assert res.status_code == 200, res.text
+        self.farmer = res.json()
+        yield
+
+        self.session.delete(f"{BASE_URL}/api/farmers/{self.farmer['id']}")
+
+    def autocomplete(self, q, kind="farmer"):
+        res = self.session.get(f"{BASE_URL}/api/search/autocomplete", params={"q": q, "kind": kind, "limit": 50})
+        assert res.status_code == 200, res.text
+        return [result["id"] for result in res.json()]
+
+    def test_latin_finds_devanagari(self):
+        """A Hindi name is found when typed in English"""
+        assert self.farmer["id"] in self.autocomplete("bhagwan khat")
+        assert self.farmer["id"] in self.autocomplete("भगवान")
+        assert self.farmer["id"] in self.autocomplete("sultanpur")
+        print("✓ Devanagari farmer found by Latin and Hindi queries")
+
+    def test_phone(self):
+        """Full number, prefix and last four digits"""
+        assert self.autocomplete(self.phone)[0] == self.farmer["id"]
+        assert self.farmer["id"] in self.autocomplete(self.phone[:7])
+        assert self.farmer["id"] in self.autocomplete(self.phone[-4:])
+        print("✓ Farmer found by phone, phone prefix and last 4 digits")
+
+    def test_index_follows_writes(self):
+        """Renames and deletes show up in search straight away"""
+        res = self.session.put(f"{BASE_URL}/api/farmers/{self.farmer['id']}", json={"village": "Kishangarh"})
+        assert res.status_code == 200
+        assert self.farmer["id"] in self.autocomplete("kishan")
+        assert self.farmer["id"] not in self.autocomplete("sultanpur")
+
+        farmers = self.session.get(f"{BASE_URL}/api/farmers", params={"search": "bhagwan khatana"}).json()
+        assert self.farmer["id"] in [f["id"] for f in farmers]
+
+        self.session.delete(f"{BASE_URL}/api/farmers/{self.farmer['id']}")
+        assert self.farmer["id"] not in self.autocomplete("bhagwan khat")
+        print("✓ Search index follows updates and deletes")
+
+    def test_kind_validation(self):
+        res = self.session.get(f"{BASE_URL}/api/search/autocomplete", params={"q": "a", "kind": "plant"})
+        assert res.status_code == 400
+        print("✓ Unknown kind rejected")
@@ -0,0 +1,106 @@
+"""
+Write Batching Tests for Nirbani Dairy
+- Collections buffered by the farmer write-behind show up in the balance
+  before they are flushed, and a flush applies one merged $inc
+- Group-committed inserts come back one by one, duplicates included
+- Write-behind stays off when another process serves reports or requests
+"""
+import asyncio
+import os
+import subprocess
+import sys
+import uuid
+
+import pytest
+from pymongo.errors import DuplicateKeyError
+
+from batching import GroupCommitQueue, IncrementCoalescer
+from conftest import BACKEND_DIR
+
+
+class TestWriteBatching:
+    """Write-behind farmer totals and group-committed inserts"""
+
+    @pytest.fixture(autouse=True)
+    def setup(self, app):
+        """A farmer on the scratch database"""
+        import server
+
+        self.server = server
+        self.app = app
+        res = app.post("/api/farmers", json={
+            "name": f"TEST_Batch_{uuid.uuid4().hex[:6]}",
+            "phone": f"5{uuid.uuid4().int % 10**9:09d}",
+            "milk_type": "cow"
+        })
+        assert res.status_code == 200, res.text
+        self.farmer = res.json()
+        yield
+        app.delete(f"/api/farmers/{self.farmer['id']}")
+
+    def add(self, date, quantity):
+        res = self.app.post("/api/collections", json={
+            "farmer_id": self.farmer["id"], "shift": "morning", "milk_type": "cow",
+            "quantity": quantity, "fat": 4.0, "rate": 40.0, "date": date
+        })
+        assert res.status_code == 200, res.text
+        return res.json()
+
+    def stored_farmer(self):
+        return self.app.portal.call(self.server.db.farmers.find_one, {"id": self.farmer["id"]}, {"_id": 0})
+
+    def test_buffered_collections_in_balance(self, monkeypatch):
+        # Long interval: nothing flushes unless the test asks
+        buffer = IncrementCoalescer(self.server.db.farmers, flush_interval=3600, max_pending=1000)
+        monkeypatch.setattr(self.server, "farmer_balance_buffer", buffer)
+        self.add("2026-01-05", 10.0)
+        self.add("2026-01-06", 5.0)
+
+        assert self.stored_farmer()["balance"] == 0
+        assert buffer.pending(self.farmer["id"]) == {"total_milk": 15.0, "total_due": 600.0, "balance": 600.0}
+        farmer = self.app.get(f"/api/farmers/{self.farmer['id']}").json()
+        assert farmer["balance"] == 600.0 and farmer["total_milk"] == 15.0
+
+        self.app.portal.call(buffer.flush)
+        stored = self.stored_farmer()
+        assert stored["balance"] == 600.0 and stored["total_milk"] == 15.0
+        assert buffer.flushes == 1 and buffer.pending(self.farmer["id"]) == {}
+        print("✓ Buffered collections counted before the flush, one merged $inc after")
+
+    def test_group_commit(self):
+        queue = GroupCommitQueue(self.server.db.milk_collections, max_wait=0.05)
+        docs = [{
+            "id": str(uuid.uuid4()), "farmer_id": self.farmer["id"], "shift": shift, "milk_type": "cow",
+            "quantity": 1.0, "fat": 4.0, "snf": 9.0, "rate": 40.0, "amount": 40.0, "date": "2026-01-07",
+            "created_at": "2026-01-07T06:00:00+00:00"
+        } for shift in ("morning", "evening", "morning")]
+
+        async def insert_all():
+            return await asyncio.gather(*(queue.insert(dict(doc)) for doc in docs), return_exceptions=True)
+
+        results = self.app.portal.call(insert_all)
+        assert [r["id"] for r in results[:2]] == [docs[0]["id"], docs[1]["id"]]
+        # Same farmer, date, shift and milk type as the first
+        assert isinstance(results[2], DuplicateKeyError)
+        assert queue.batches == 1 and queue.documents == 3
+        self.app.portal.call(self.server.db.milk_collections.delete_many, {"id": {"$in": [d["id"] for d in docs[:2]]}})
+        print("✓ Three inserts in one batch, the duplicate rejected on its own")
+
+
+class TestWriteBehindProcesses:
+    """FARMER_WRITE_BEHIND only takes effect in a single process that also serves reports"""
+
+    @pytest.mark.parametrize("env, enabled", [
+        ({}, True),
+        ({"SERVE_REPORTS": "0"}, False),
+        ({"WEB_CONCURRENCY": "2"}, False),
+    ])
+    def test_buffer_enabled(self, scratch_db_name, env, enabled):
+        result = subprocess.run(
+            [sys.executable, "-c", "import server; print(server.farmer_balance_buffer is not None)"],
+            cwd=BACKEND_DIR, capture_output=True, text=True, timeout=60,
+            env={**os.environ, "FARMER_WRITE_BEHIND": "1", "SERVE_REPORTS": "1", "WEB_CONCURRENCY": "1", **env}
+        )
+        assert result.returncode == 0, result.stderr
+        assert result.stdout.strip().splitlines()[-1] == str(enabled)
+        print(f"✓ Write-behind {'on' if enabled else 'off'} with {env or 'one process serving reports'}")
@@ -0,0 +1,92 @@
+import { useEffect, useRef } from "react"
+
+const BACKEND_URL = process.env.REACT_APP_BACKEND_URL
+
+const EVENT_TYPES = [
+  "ready",
+  "resync",
+  "collection.created",
+  "collection.updated",
+  "collection.deleted",
+  "payment.created",
+  "payment.deleted",
+  "sale.created",
+  "sale.deleted",
+  "farmer.created",
+  "farmer.deleted",
+]
+
+const RECONNECT_MS = 5000
+
+// Stream tickets last a minute and only open the stream, so the login token
+// never ends up in a URL (and in proxy or access logs)
+async function fetchStreamTicket(token) {
+  const res = await fetch(`${BACKEND_URL}/api/stream/ticket`, {
+    method: "POST",
+    headers: { Authorization: `Bearer ${token}` },
+  })
+  if (!res.ok) throw new Error(`Stream ticket request failed: ${res.status}`)
+  return (await res.json()).ticket
+}
+
+// Subscribes to the server's live event stream; onEvent(type, data) runs for every event.
+// A dropped stream is reopened with a fresh ticket, and every (re)connect starts with "ready".
+function useLiveEvents(onEvent) {
+  const handlerRef = useRef(onEvent)
+  handlerRef.current = onEvent
+
+  useEffect(() => {
+    const token = localStorage.getItem("auth_token")
+    if (!token || typeof EventSource === "undefined") return undefined
+
+    let source = null
+    let retryTimer = null
+    let closed = false
+
+    const reconnect = () => {
+      if (closed) return
+      clearTimeout(retryTimer)
+      retryTimer = setTimeout(connect, RECONNECT_MS)
+    }
+
+    async function connect() {
+      let ticket
+      try {
+        ticket = await fetchStreamTicket(token)
+      } catch (error) {
+        console.error("Live events unavailable:", error)
+        reconnect()
+        return
+      }
+      if (closed) return
+
+      source = new EventSource(
+        `${BACKEND_URL}/api/stream/dashboard?ticket=${encodeURIComponent(ticket)}`
+      )
+      EVENT_TYPES.forEach((type) => {
+        source.addEventListener(type, (e) => {
+          try {
+            handlerRef.current(type, JSON.parse(e.data))
+          } catch (error) {
+            console.error("Bad live event:", error)
+          }
+        })
+      })
+      // The browser would retry with the same, by then expired, ticket
+      source.onerror = () => {
+        source.close()
+        reconnect()
+      }
+    }
+
+    connect()
+
+    return () => {
+      closed = true
+      clearTimeout(retryTimer)
+      if (source) source.close()
+    }
+  }, [])
+}
+
+export { useLiveEvents }
@@ -1,6 +1,7 @@
-import React, { useState, useEffect } from 'react';
+import React, { useState, useEffect, useRef } from 'react';
 import { useAuth } from '../context/AuthContext';
 import { collectionAPI, farmerAPI } from '../lib/api';
+import { useLiveEvents } from '../hooks/use-live-events';
 import { formatCurrency, formatNumber, calculateSNF, getTodayDate } from '../lib/utils';
 import { Card, CardContent, CardHeader, CardTitle } from '../components/ui/card';
 import { Button } from '../components/ui/button';
@@ -74,6 +75,27 @@ const CollectionPage = () => {
         }
     };
 
+    // Keep the list in step with entries made on other screens
+    const streamConnected = useRef(false);
+    useLiveEvents((type, data) => {
+        if (type === 'collection.created' && data.date === selectedDate) {
+            setAllCollections(prev => prev.some(c => c.id === data.id) ? prev : [data, ...prev]);
+        } else if (type === 'collection.updated') {
+            setAllCollections(prev => {
+                const rest = prev.filter(c => c.id !== data.after.id);
+                return data.after.date === selectedDate ? [data.after, ...rest] : rest;
+            });
+        } else if (type === 'collection.deleted') {
+            setAllCollections(prev => prev.filter(c => c.id !== data.id));
+        } else if (type === 'resync') {
+            fetchData();
+        } else if (type === 'ready') {
+            // Entries made while the stream was down only show up on a refetch
+            if (streamConnected.current) fetchData();
+            streamConnected.current = true;
+        }
+    });
+
     // Calculate stats
     const morningData = allCollections.filter(c => c.shift === 'morning');
     const eveningData = allCollections.filter(c => c.shift === 'evening');
@@ -1,7 +1,8 @@
-import React, { useState, useEffect } from 'react';
+import React, { useState, useEffect, useRef } from 'react';
 import { Link } from 'react-router-dom';
 import { useAuth } from '../context/AuthContext';
 import { dashboardAPI } from '../lib/api';
+import { useLiveEvents } from '../hooks/use-live-events';
 import { formatCurrency, formatNumber, getTodayDate } from '../lib/utils';
 import { Card, CardContent, CardHeader, CardTitle } from '../components/ui/card';
 import { Button } from '../components/ui/button';
@@ -44,6 +45,60 @@ const DashboardPage = () => {
         }
     };
 
+    // Live updates: apply each change to the stats instead of re-fetching them
+    const serverToday = useRef(null);
+    const applyCollection = (prev, c, sign) => {
+        if (!prev || c.date !== serverToday.current) return prev;
+        const count = prev.collections_count + sign;
+        const avg = (field, value) => count > 0
+            ? (prev[field] * prev.collections_count + sign * value) / count
+            : 0;
+        return {
+            ...prev,
+            today_milk_quantity: prev.today_milk_quantity + sign * c.quantity,
+            today_milk_amount: prev.today_milk_amount + sign * c.amount,
+            today_morning_quantity: prev.today_morning_quantity + (c.shift === 'morning' ? sign * c.quantity : 0),
+            today_evening_quantity: prev.today_evening_quantity + (c.shift === 'evening' ? sign * c.quantity : 0),
+            avg_fat: avg('avg_fat', c.fat),
+            avg_snf: avg('avg_snf', c.snf),
+            collections_count: count,
+        };
+    };
+    const addPending = (prev, delta) => prev && { ...prev, total_pending_payments: prev.total_pending_payments + delta };
+
+    useLiveEvents((type, data) => {
+        switch (type) {
+            case 'ready':
+                // A reconnect may have missed events
+                if (serverToday.current) fetchData();
+                serverToday.current = data.today;
+                break;
+            case 'collection.created':
+                setStats(prev => addPending(applyCollection(prev, data, 1), data.amount));
+                break;
+            case 'collection.deleted':
+                setStats(prev => addPending(applyCollection(prev, data, -1), -data.amount));
+                break;
+            case 'collection.updated':
+                setStats(prev => addPending(
+                    applyCollection(applyCollection(prev, data.before, -1), data.after, 1),
+                    data.after.amount - data.before.amount
+                ));
+                break;
+            case 'payment.created':
+            case 'payment.deleted':
+                setStats(prev => addPending(prev, data.balance_delta));
+                break;
+            case 'farmer.created':
+            case 'farmer.deleted':
+            case 'resync':
+                fetchData();
+                break;
+            default:
+                break;
+        }
+    });
+
     const texts = {
         greeting: language === 'hi' ? 'नमस्ते!' : 'Hello!',
         todayCollection: language === 'hi' ? 'आज का संग्रह' : "Today's Collection",